@@ -3,14 +3,27 @@ API keys and role helpers for Adsbot
 
 - Loads ADMIN and USER API keys from environment variables
 - Provides `get_role(api_key)` helper returning 'admin', 'user', or None
+- Optionally loads a key registry file (`API_KEYS_FILE`) with per-key roles
+  and quota tiers, reloaded automatically when the file changes
 
 SECURITY: Do NOT commit secrets into the repository. Store keys in a secret manager
 or environment variables. If a key was exposed (e.g. pasted in chat), rotate it
 immediately in your provider dashboard.
 """
 
+import hashlib
+import json
+import logging
 import os
-from typing import Set, Optional
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Set
+
+if TYPE_CHECKING:
+    from .rate_limiter import RateLimitPolicy
+
+logger = logging.getLogger(__name__)
 
 # Optional: load variables from a local `.env` when present (development convenience).
 # We import `load_dotenv` if available, but do not require it at runtime.
@@ -37,14 +50,180 @@ USER_ENV = "USER_API_KEYS"    # comma-separated normal user keys
 ADMIN_KEYS: Set[str] = _load_keys_from_env(ADMIN_ENV)
 USER_KEYS: Set[str] = _load_keys_from_env(USER_ENV)
 
+# Bumped on every reload so callers caching roles know when to drop them
+KEYS_VERSION: int = 0
+
 
 def reload_keys() -> None:
     """Reload keys from environment (call after changing env vars at runtime).
     Useful for long running processes that update env vars via external means.
     """
-    global ADMIN_KEYS, USER_KEYS
+    global ADMIN_KEYS, USER_KEYS, KEYS_VERSION
     ADMIN_KEYS = _load_keys_from_env(ADMIN_ENV)
     USER_KEYS = _load_keys_from_env(USER_ENV)
+    KEYS_VERSION += 1
+    if REGISTRY is not None:
+        REGISTRY.reload()
+
+
+# -------------------------
+# Key registry (file-backed)
+# -------------------------
+#
+# File format (JSON):
+#
+#   {
+#     "tiers": {
+#       "free":    {"max_requests": 5,   "window_seconds": 60},
+#       "partner": {"max_requests": 600, "window_seconds": 60, "mode": "slowdown"}
+#     },
+#     "keys": [
+#       {"sha256": "<hex digest of the key>", "role": "user", "tier": "partner", "name": "acme"},
+#       {"sha256": "...", "role": "user", "max_requests": 50, "window_seconds": 60}
+#     ]
+#   }
+#
+# Only SHA-256 digests are stored, so the file itself holds no usable secret.
+# Keys without a tier or explicit limits use the limiter's own settings.
+
+REGISTRY_ENV = "API_KEYS_FILE"
+
+
+def hash_key(api_key: str) -> str:
+    """Registry lookup digest of an API key (hex SHA-256)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class KeyInfo:
+    """Role and quota of one API key; `policy` None means the limiter default."""
+
+    role: str
+    tier: Optional[str] = None
+    policy: Optional["RateLimitPolicy"] = None
+    name: Optional[str] = None
+
+
+class KeyRegistry:
+    def __init__(self, path: str, *, check_interval: float = 2.0, clock=time.monotonic):
+        """Create a registry backed by the JSON file at `path`.
+
+        Args:
+            path: registry file (see format above)
+            check_interval: minimum seconds between file change checks
+            clock: monotonic time source, overridable in tests
+        """
+        self.path = path
+        self.check_interval = float(check_interval)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index: Dict[str, KeyInfo] = {}
+        self._stamp = None
+        self._next_check = 0.0
+        self.reload()
+
+    def _read(self) -> Dict[str, KeyInfo]:
+        from .rate_limiter import RateLimitPolicy
+
+        with open(self.path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        tiers = {}
+        for tier, limits in (data.get("tiers") or {}).items():
+            tiers[tier] = RateLimitPolicy(
+                int(limits["max_requests"]), int(limits["window_seconds"]), limits.get("mode", "block")
+            )
+
+        index: Dict[str, KeyInfo] = {}
+        for entry in data.get("keys") or ():
+            digest = entry.get("sha256") or hash_key(entry["key"])
+            tier = entry.get("tier")
+            if tier is not None and tier not in tiers:
+                raise ValueError(f"unknown tier {tier!r} in {self.path}")
+            policy = tiers.get(tier)
+            if "max_requests" in entry:
+                # Per-key override of the tier limits
+                policy = RateLimitPolicy(
+                    int(entry["max_requests"]),
+                    int(entry.get("window_seconds", policy.window_seconds if policy else 60)),
+                    entry.get("mode", policy.mode if policy else "block"),
+                )
+            index[digest.lower()] = KeyInfo(entry.get("role", "user"), tier, policy, entry.get("name"))
+        return index
+
+    def reload(self) -> bool:
+        """Re-read the file if it changed; returns True when the index changed.
+
+        A missing or invalid file keeps the previous index.
+        """
+        global KEYS_VERSION
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            logger.warning(f"API key registry unavailable, keeping previous keys: {e}")
+            return False
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return False
+        try:
+            index = self._read()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"API key registry invalid, keeping previous keys: {e}")
+            return False
+
+        with self._lock:
+            old = self._index
+            self._stamp = stamp
+            changed = {d for d in index.keys() | old.keys() if index.get(d) != old.get(d)}
+            if not changed:
+                return False
+            # Swap in one assignment: readers never see a half-built index
+            self._index = index
+            KEYS_VERSION += 1
+        logger.info(f"API key registry reloaded: {len(index)} keys, {len(changed)} changed")
+        return True
+
+    def maybe_reload(self) -> bool:
+        """Reload at most once every `check_interval` seconds."""
+        now = self._clock()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        return self.reload()
+
+    def lookup(self, api_key: str) -> Optional[KeyInfo]:
+        return self._index.get(hash_key(api_key))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+REGISTRY: Optional[KeyRegistry] = KeyRegistry(os.environ[REGISTRY_ENV]) if os.getenv(REGISTRY_ENV) else None
+
+_ADMIN_INFO = KeyInfo("admin")
+_USER_INFO = KeyInfo("user")
+
+
+def check_registry() -> None:
+    """Pick up registry file changes (cheap; rate-limited by the registry)."""
+    if REGISTRY is not None:
+        REGISTRY.maybe_reload()
+
+
+def get_key_info(api_key: str) -> Optional[KeyInfo]:
+    """Return role and quota for api_key, or None if unknown.
+
+    Environment keys take precedence and use the limiter's default quota;
+    other keys are looked up in the registry file when configured.
+    """
+    if not api_key:
+        return None
+    if api_key in ADMIN_KEYS:
+        return _ADMIN_INFO
+    if api_key in USER_KEYS:
+        return _USER_INFO
+    if REGISTRY is not None:
+        return REGISTRY.lookup(api_key)
+    return None
 
 
 def get_role(api_key: str) -> Optional[str]:
@@ -55,13 +234,8 @@ def get_role(api_key: str) -> Optional[str]:
       - 'user' for normal keys
       - None if key unknown
     """
-    if not api_key:
-        return None
-    if api_key in ADMIN_KEYS:
-        return "admin"
-    if api_key in USER_KEYS:
-        return "user"
-    return None
+    info = get_key_info(api_key)
+    return info.role if info is not None else None
 
 
 def is_admin(api_key: str) -> bool:
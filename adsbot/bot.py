@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 from datetime import datetime
 from typing import Optional
@@ -42,6 +43,7 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
+from telegram.error import BadRequest, Forbidden
 
 # Workaround: APScheduler expects pytz timezone objects; on some systems
 # get_localzone() returns a zoneinfo tzinfo which APScheduler rejects.
@@ -62,6 +64,22 @@ except Exception:
 
 from .config import Config
 from .db import create_session_factory, session_scope
+from .callback_router import CallbackRouter
+from .db_executor import DBExecutor, run_in_session
+from .flood_control import install_flood_guard
+from .listing_index import ListingIndex, decode_cursor, encode_cursor
+from .metrics import (
+    REGISTRY as METRICS,
+    TimedHTTPXRequest,
+    install_db_timing,
+    instrument_application,
+    start_metrics_server,
+)
+from .persistence import persistence_from_url
+from .render_cache import RenderCache, render_menu
+from .send_queue import SendQueue, bulk_send_kwargs
+from .task_queue import SQLiteTaskStore, TaskQueue, enqueue_task, task
+from .update_processor import PerChatUpdateProcessor
 from .models import OfferType
 from .services import (
     add_campaign,
@@ -73,60 +91,17 @@ from .services import (
     summarize_user,
 )
 from .inside_ads_services import (
-    add_transaction,
     create_campaign_purchase,
     get_campaign_performance,
     get_user_balance,
     get_user_statistics,
     list_available_channels_for_ads,
 )
-from .payments import PaymentProcessor
-from .notifications import (
-    NotificationDispatcher,
-    NotificationType,
-    NotificationPreferences,
-)
-from .campaigns import (
-    AdvancedCampaignManager,
-    TargetingSettings,
-    BudgetSettings,
-    PaymentModel,
-)
-from .analytics import (
-    PerformanceForecast,
-    CampaignAnalytics,
-    BudgetOptimizer,
-    SmartRecommendations,
-)
-from .ai_content import (
-    AIContentGenerator,
-    ContentType,
-    ToneType,
-    ContentRequest,
-    ContentTemplateLibrary,
-)
-from .campaign_analyzer import (
-    CampaignAnalyzer,
-    ChannelAnalysis,
-)
-from .analytics import (
-    EditorAnalytics,
-    AdvertiserAnalytics,
-    PlatformAnalytics,
-    ReportExporter,
-)
-from .scheduler import (
-    init_scheduler,
-    stop_scheduler,
-    get_scheduler_status,
-)
-from .verification import (
-    IdentityVerification,
-    RiskScorer,
-    DisputeResolver,
-    AccountSecurity,
-)
 
+# Feature modules (payments, notifications, analytics, AI content, ...) are
+# imported inside the handlers that use them: most updates are menu clicks,
+# and startup shouldn't pay for modules (and SDKs) a process may never touch.
+# tests/test_import_budget.py keeps it that way.
 
 logger = logging.getLogger(__name__)
 
@@ -309,7 +284,21 @@ async def open_menu(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     if query:
         await query.answer()
-        await query.edit_message_text("Scegli un'azione:", reply_markup=MENU_BUTTONS)
+        await render_menu(query, context, "Scegli un'azione:", reply_markup=MENU_BUTTONS)
+
+
+def _load_user_channels(session, user_data):
+    user = ensure_user(
+        session,
+        telegram_id=user_data.id,
+        username=user_data.username,
+        first_name=user_data.first_name,
+        language_code=user_data.language_code,
+    )
+    
+    # Prendi i canali dell'utente
+    from .models import Channel
+    return session.query(Channel).filter_by(user_id=user.id).all()
 
 
 async def stats(update: Update, context: CallbackContext) -> None:
@@ -322,23 +311,12 @@ async def stats(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     await safe_query_answer(query)
     
-    with with_session(context) as session:
-        user = ensure_user(
-            session,
-            telegram_id=user_data.id,
-            username=user_data.username,
-            first_name=user_data.first_name,
-            language_code=user_data.language_code,
-        )
-        
-        # Prendi i canali dell'utente
-        from .models import Channel
-        channels = session.query(Channel).filter_by(user_id=user.id).all()
+    channels = await run_in_session(context, _load_user_channels, user_data, user_id=user_data.id)
     
     if not channels:
         text = "📊 **Statistiche**\n\nNon hai ancora aggiunto canali. Aggiungi un canale per visualizzare le sue statistiche."
         if query:
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
+            await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("➕ Aggiungi Canale", callback_data="menu:add_channel")],
                 [InlineKeyboardButton("◀️ Indietro", callback_data="menu:main")],
             ]))
@@ -363,7 +341,7 @@ async def stats(update: Update, context: CallbackContext) -> None:
     keyboard.append([InlineKeyboardButton("◀️ Indietro", callback_data="menu:main")])
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup(keyboard))
     else:
         await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
@@ -2314,7 +2292,7 @@ async def insideads_main_menu(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     if query:
         await query.answer()
-        await query.edit_message_text("Menu Principale - AdsBot Marketplace", reply_markup=MAIN_MENU_BUTTONS)
+        await render_menu(query, context, "Menu Principale - AdsBot Marketplace", reply_markup=MAIN_MENU_BUTTONS)
     else:
         await update.message.reply_text("Menu Principale - AdsBot Marketplace", reply_markup=MAIN_MENU_BUTTONS)
 
@@ -2324,7 +2302,9 @@ async def insideads_earn_menu(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     if query:
         await query.answer()
-        await query.edit_message_text(
+        await render_menu(
+            query,
+            context,
             "💰 Guadagna - Scegli come monetizzare il tuo canale:",
             reply_markup=EARN_MENU_BUTTONS,
         )
@@ -3005,7 +2985,7 @@ async def insideads_buy_menu(update: Update, context: CallbackContext) -> None:
     ]
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup(keyboard))
     else:
         await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
@@ -3021,7 +3001,7 @@ async def insideads_exchange_menu(update: Update, context: CallbackContext) -> N
             "Un unico pool comune, non interfierisce con i pagamenti.\n\n"
             "Totalmente gratuito!"
         )
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("📊 Metriche", callback_data="insideads:exchange:metrics")],
             [InlineKeyboardButton("➕ Configura scambio", callback_data="insideads:exchange:setup")],
             [InlineKeyboardButton("◀️ Indietro", callback_data="insideads:main")],
@@ -3060,7 +3040,7 @@ async def insideads_stats_menu(update: Update, context: CallbackContext) -> None
     )
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("📈 Pubblicit\u00e0", callback_data="insideads:stats:ads")],
             [InlineKeyboardButton("💵 Monetizzazione", callback_data="insideads:stats:monetization")],
             [InlineKeyboardButton("◀️ Indietro", callback_data="insideads:main")],
@@ -3254,7 +3234,7 @@ async def insideads_account_menu(update: Update, context: CallbackContext) -> No
     )
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("💳 Transazioni", callback_data="insideads:account:transactions")],
             [InlineKeyboardButton("⚙️ Impostazioni", callback_data="insideads:account:settings")],
             [InlineKeyboardButton("◀️ Indietro", callback_data="insideads:main")],
@@ -3268,7 +3248,7 @@ async def insideads_account_menu(update: Update, context: CallbackContext) -> No
 
 
 async def insideads_account_transactions(update: Update, context: CallbackContext) -> None:
-    """Show user transactions."""
+    """Show user transactions, one page at a time (newest first)."""
     query = update.callback_query
     user_data = update.effective_user
     if not user_data:
@@ -3277,6 +3257,10 @@ async def insideads_account_transactions(update: Update, context: CallbackContex
     if query:
         await query.answer()
     
+    # insideads:account:transactions[:<id ultima riga della pagina precedente>]
+    parts = query.data.split(":") if query and query.data else []
+    before_id = int(parts[3]) if len(parts) > 3 else None
+    
     with with_session(context) as session:
         user = ensure_user(
             session,
@@ -3285,21 +3269,35 @@ async def insideads_account_transactions(update: Update, context: CallbackContex
             first_name=user_data.first_name,
             language_code=user_data.language_code,
         )
-        from .inside_ads_services import get_recent_transactions
-        transactions = get_recent_transactions(session, user, days=30)
+        from .inside_ads_services import get_transactions_page
+        transactions, next_cursor = get_transactions_page(session, user, before_id=before_id)
     
     text = "💳 Transazioni\n\n"
     if not transactions:
         text += "Nessuna transazione ancora."
     else:
-        for tx in transactions[:5]:
+        # Saldo al bordo della pagina: già salvato sulla riga, nessun ricalcolo
+        if transactions[0].balance_after is not None:
+            text += f"Saldo: ${transactions[0].balance_after:.2f}\n\n"
+        for tx in transactions:
             symbol = "+" if tx.transaction_type in ("earn", "refund") else "-"
-            text += f"{symbol}${tx.amount:.2f} - {tx.description}\n"
+            text += f"{symbol}${tx.amount:.2f} - {tx.description}"
+            if tx.balance_after is not None:
+                text += f" (saldo ${tx.balance_after:.2f})"
+            text += "\n"
+    
+    keyboard = []
+    navigation = []
+    if before_id is not None:
+        navigation.append(InlineKeyboardButton("⏫ Più recenti", callback_data="insideads:account:transactions"))
+    if next_cursor is not None:
+        navigation.append(InlineKeyboardButton("⬇️ Meno recenti", callback_data=f"insideads:account:transactions:{next_cursor}"))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("◀️ Indietro", callback_data="insideads:account")])
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("◀️ Indietro", callback_data="insideads:account")],
-        ]))
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 
 async def insideads_account_settings(update: Update, context: CallbackContext) -> None:
@@ -3402,21 +3400,7 @@ async def purchase_campaign_provider(update: Update, context: CallbackContext) -
         
         context.user_data["budget"] = budget
         
-        # Check balance
-        user_data = update.effective_user
-        with session_scope(context.bot_data["session_factory"]) as session:
-            from .models import User
-            ensure_user(session, user_data)
-            user = session.query(User).filter_by(user_id=user_data.id).first()
-            balance = get_user_balance(session, user)
-            
-            if balance.balance < budget:
-                await update.message.reply_text(
-                    f"❌ Saldo insufficiente.\n\nTuo saldo: ${balance.balance:.2f}\nBudget richiesto: ${budget:.2f}"
-                )
-                return SELECT_PAYMENT_PROVIDER
-        
-        # Show payment providers
+        # Il budget si paga con Stripe/PayPal, non con il saldo: nessun controllo sul saldo
         buttons = [
             [InlineKeyboardButton("💳 Stripe", callback_data="purchase:payment:stripe")],
             [InlineKeyboardButton("🅿️ PayPal", callback_data="purchase:payment:paypal")],
@@ -3438,8 +3422,99 @@ async def purchase_campaign_provider(update: Update, context: CallbackContext) -
         return SELECT_PAYMENT_PROVIDER
 
 
+def _payment_processor(context: CallbackContext):
+    """AsyncPaymentProcessor condiviso (un solo pool HTTP verso i provider)."""
+    if "payment_processor" not in context.bot_data:
+        from .payments import AsyncPaymentProcessor
+
+        context.bot_data["payment_processor"] = AsyncPaymentProcessor.from_env()
+    return context.bot_data["payment_processor"]
+
+
+def _campaign_payment_keyboard(campaign_payment_id: int, approval_url: Optional[str]) -> InlineKeyboardMarkup:
+    """Pulsanti di un pagamento campagna in attesa: pagina del provider e verifica."""
+    buttons = []
+    if approval_url:
+        buttons.append([InlineKeyboardButton("💳 Completa il pagamento", url=approval_url)])
+    buttons.append([InlineKeyboardButton("🔄 Verifica pagamento", callback_data=f"purchase:verify:{campaign_payment_id}")])
+    buttons.append([InlineKeyboardButton("🏠 Menu principale", callback_data="insideads:main")])
+    return InlineKeyboardMarkup(buttons)
+
+
+def _campaign_payment_booked_text(booking: dict) -> str:
+    return (
+        f"✅ Campagna acquistata con successo!\n\n"
+        f"Campagna: {booking['campaign_name']}\n"
+        f"Canale: @{booking['channel_handle']}\n"
+        f"Budget: ${booking['amount']:.2f}\n\n"
+        f"ID Transazione: {booking['provider_payment_id']}"
+    )
+
+
+def _book_confirmed_campaign_payment(session, campaign_payment_id: int, confirmed: bool) -> dict:
+    """Contabilizza il pagamento se il provider lo ha confermato; dati per risposta e notifiche."""
+    from .inside_ads_services import book_campaign_payment
+    from .models import CampaignPayment, User
+
+    booked = confirmed and book_campaign_payment(session, campaign_payment_id)
+    payment = session.get(CampaignPayment, campaign_payment_id)
+    return {
+        "booked": booked,
+        "status": payment.status,
+        "buyer_chat_id": session.get(User, payment.user_id).telegram_id,
+        "seller_chat_id": payment.channel.owner.telegram_id,
+        "campaign_name": payment.campaign_name,
+        "channel_handle": payment.channel.handle,
+        "amount": payment.amount,
+        "provider": payment.provider,
+        "provider_payment_id": payment.provider_payment_id,
+    }
+
+
+async def _notify_campaign_booked(context: CallbackContext, booking: dict) -> None:
+    from .inside_ads_services import CAMPAIGN_SELLER_SHARE
+
+    await enqueue_task(
+        context,
+        "notify_campaign_purchased",
+        buyer_chat_id=booking["buyer_chat_id"],
+        seller_chat_id=booking["seller_chat_id"],
+        campaign_name=booking["campaign_name"],
+        channel_handle=booking["channel_handle"],
+        seller_earning=round(booking["amount"] * CAMPAIGN_SELLER_SHARE, 2),
+    )
+
+
+@task("notify_campaign_purchased")
+async def notify_campaign_purchased(
+    context: CallbackContext,
+    buyer_chat_id: int,
+    seller_chat_id: int,
+    campaign_name: str,
+    channel_handle: str,
+    seller_earning: float,
+) -> None:
+    """Avvisa acquirente e proprietario del canale di una campagna pagata."""
+    from .notifications import NotificationDispatcher, NotificationType
+
+    dispatcher = NotificationDispatcher(context.bot)
+    await dispatcher.send_notification(
+        buyer_chat_id,
+        NotificationType.CAMPAIGN_PURCHASED,
+        {"campaign_name": campaign_name, "channel_handle": channel_handle},
+    )
+    await dispatcher.send_notification(
+        seller_chat_id,
+        NotificationType.CAMPAIGN_EARNED,
+        {"amount": seller_earning, "channel_handle": channel_handle},
+    )
+
+
 async def purchase_campaign_confirm(update: Update, context: CallbackContext) -> int:
     """User selected payment provider - process payment."""
+    from .inside_ads_services import CONFIRMED_PAYMENT_STATUSES, record_campaign_payment
+    from .models import Channel, PaymentStatus
+
     query = update.callback_query
     await query.answer()
     
@@ -3447,87 +3522,63 @@ async def purchase_campaign_confirm(update: Update, context: CallbackContext) ->
     provider = data[2]
     
     user_data = update.effective_user
+    budget = context.user_data["budget"]
+    campaign_name = context.user_data["campaign_name"]
+    channel_id = context.user_data["selected_channel_id"]
     
     try:
-        with session_scope(context.bot_data["session_factory"]) as session:
-            from .models import User, Channel
-            
-            ensure_user(session, user_data)
-            user = session.query(User).filter_by(user_id=user_data.id).first()
-            channel = session.query(Channel).filter_by(id=context.user_data["selected_channel_id"]).first()
-            
-            # Process payment through payment processor
-            payment_processor = PaymentProcessor()
-            budget = context.user_data["budget"]
-            campaign_name = context.user_data["campaign_name"]
-            
-            # Create payment
-            payment_result = payment_processor.process_payment(
-                provider=provider,
-                amount=int(budget * 100),  # Convert to cents
-                currency="usd",
-                description=f"Campaign: {campaign_name} on {channel.handle}",
-                customer_email=user_data.username or "unknown@example.com"
-            )
-            
-            if not payment_result or payment_result.get("status") not in ("succeeded", "pending", "created"):
-                await query.edit_message_text(
-                    f"❌ Errore nel pagamento.\n\n{payment_result.get('error', 'Unknown error') if payment_result else 'Unknown error'}"
-                )
-                return ConversationHandler.END
-            
-            # Record transaction
-            add_transaction(
-                session,
-                user,
-                "spend",
-                budget,
-                f"Campaign purchase on {channel.handle}",
-                reference_id=channel.id
+        # Chiamata al provider fuori dalla transazione DB; una chiave per messaggio
+        # di conferma, così un tocco ripetuto riceve lo stesso pagamento
+        payment_result = await _payment_processor(context).process_payment(
+            provider=provider,
+            amount=budget,
+            currency="usd",
+            description=f"Campaign: {campaign_name} on {context.user_data.get('selected_channel_handle', channel_id)}",
+            customer_email=user_data.username or "unknown@example.com",
+            idempotency_key=f"campaign:{user_data.id}:{query.message.message_id if query.message else query.id}",
+        )
+        provider_payment_id = payment_result and (payment_result.get("payment_intent_id") or payment_result.get("payment_id"))
+        if not provider_payment_id:
+            await query.edit_message_text(
+                f"❌ Errore nel pagamento.\n\n{payment_result.get('error', 'Unknown error') if payment_result else 'Unknown error'}"
             )
-            
-            # Log purchase
-            seller = channel.owner
-            seller_earning = budget * 0.8
-            add_transaction(
+            return ConversationHandler.END
+        
+        # Registrato una volta per id del provider; contabilizzato solo se già incassato
+        with session_scope(context.bot_data["session_factory"]) as session:
+            user = ensure_user(
                 session,
-                seller,
-                "earn",
-                seller_earning,
-                f"Ad revenue from campaign '{campaign_name}'",
-                reference_id=channel.id
+                telegram_id=user_data.id,
+                username=user_data.username,
+                first_name=user_data.first_name,
+                language_code=user_data.language_code,
             )
-            
-            # Send notifications
-            notification_dispatcher = NotificationDispatcher(context.bot)
-            await notification_dispatcher.send_notification(
-                user.user_id,
-                NotificationType.CAMPAIGN_PURCHASED,
-                {
-                    "campaign_name": campaign_name,
-                    "channel_handle": channel.handle,
-                }
+            channel = session.get(Channel, channel_id)
+            campaign_payment = record_campaign_payment(
+                session, user, channel, campaign_name, budget, provider, provider_payment_id
             )
-            
-            await notification_dispatcher.send_notification(
-                seller.user_id,
-                NotificationType.CAMPAIGN_EARNED,
-                {
-                    "amount": seller_earning,
-                    "channel_handle": channel.handle,
-                }
+            booking = _book_confirmed_campaign_payment(
+                session, campaign_payment.id, payment_result.get("status") in CONFIRMED_PAYMENT_STATUSES
             )
-            
+            campaign_payment_id = campaign_payment.id
+        
+        if booking["booked"]:
+            await _notify_campaign_booked(context, booking)
+        if booking["status"] == PaymentStatus.completed:
             await query.edit_message_text(
-                f"✅ Campagna acquistata con successo!\n\n"
-                f"Campagna: {campaign_name}\n"
-                f"Canale: @{channel.handle}\n"
-                f"Budget: ${budget:.2f}\n\n"
-                f"ID Transazione: {payment_result.get('payment_intent_id', 'N/A')}",
+                _campaign_payment_booked_text(booking),
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("🏠 Menu principale", callback_data="insideads:main")],
                 ])
             )
+        else:
+            await query.edit_message_text(
+                f"⏳ Pagamento creato, in attesa di conferma.\n\n"
+                f"Campagna: {campaign_name}\n"
+                f"Budget: ${budget:.2f}\n\n"
+                f"Completa il pagamento e poi premi \"Verifica pagamento\".",
+                reply_markup=_campaign_payment_keyboard(campaign_payment_id, payment_result.get("approval_url")),
+            )
             
     except Exception as e:
         logger.error(f"Payment processing error: {e}")
@@ -3538,6 +3589,54 @@ async def purchase_campaign_confirm(update: Update, context: CallbackContext) ->
     return ConversationHandler.END
 
 
+async def purchase_campaign_verify(update: Update, context: CallbackContext) -> None:
+    """Verifica presso il provider un pagamento campagna in attesa e, se incassato, lo contabilizza."""
+    from .inside_ads_services import CONFIRMED_PAYMENT_STATUSES
+    from .models import CampaignPayment, PaymentStatus, User
+
+    query = update.callback_query
+    await query.answer()
+    campaign_payment_id = context.callback_args["payment_id"]
+    
+    try:
+        with session_scope(context.bot_data["session_factory"]) as session:
+            payment = session.get(CampaignPayment, campaign_payment_id)
+            buyer = payment and session.get(User, payment.user_id)
+            if buyer is None or buyer.telegram_id != update.effective_user.id:
+                await query.edit_message_text("❌ Pagamento non trovato.")
+                return
+            provider, provider_payment_id = payment.provider, payment.provider_payment_id
+        
+        verified = await _payment_processor(context).verify_payment(provider, provider_payment_id)
+        with session_scope(context.bot_data["session_factory"]) as session:
+            booking = _book_confirmed_campaign_payment(
+                session, campaign_payment_id, bool(verified) and verified.get("status") in CONFIRMED_PAYMENT_STATUSES
+            )
+        
+        if booking["booked"]:
+            await _notify_campaign_booked(context, booking)
+        if booking["status"] == PaymentStatus.completed:
+            await query.edit_message_text(
+                _campaign_payment_booked_text(booking),
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🏠 Menu principale", callback_data="insideads:main")],
+                ])
+            )
+        else:
+            await query.edit_message_text(
+                f"⏳ Pagamento non ancora confermato dal provider.\n\n"
+                f"Campagna: {booking['campaign_name']}\n"
+                f"Budget: ${booking['amount']:.2f}",
+                reply_markup=_campaign_payment_keyboard(campaign_payment_id, None),
+            )
+    except BadRequest:
+        # Messaggio invariato (verifica ripetuta senza novità)
+        pass
+    except Exception as e:
+        logger.error(f"Payment verification error: {e}")
+        await query.edit_message_text("❌ Errore durante la verifica del pagamento.\n\nTentare di nuovo più tardi.")
+
+
 # Advanced campaign management handlers
 async def campaign_management_menu(update: Update, context: CallbackContext) -> None:
     """Show campaign management menu."""
@@ -3608,6 +3707,8 @@ async def campaign_create_multi(update: Update, context: CallbackContext) -> Non
 
 async def campaign_forecast(update: Update, context: CallbackContext) -> None:
     """Show performance forecast."""
+    from .analytics import PerformanceForecast
+
     query = update.callback_query
     user_data = update.effective_user
     if not user_data:
@@ -3683,6 +3784,8 @@ async def campaign_forecast(update: Update, context: CallbackContext) -> None:
 
 async def campaign_ai_optimize(update: Update, context: CallbackContext) -> None:
     """Apply AI optimization."""
+    from .analytics import SmartRecommendations
+
     query = update.callback_query
     user_data = update.effective_user
     if not user_data:
@@ -3955,6 +4058,8 @@ async def ai_generate_post_start(update: Update, context: CallbackContext) -> in
 
 async def ai_tone_selected(update: Update, context: CallbackContext) -> int:
     """Process tone selection and show platform choice."""
+    from .ai_content import ToneType
+
     query = update.callback_query
     await query.answer()
 
@@ -3980,6 +4085,8 @@ async def ai_tone_selected(update: Update, context: CallbackContext) -> int:
 
 async def ai_generate_content(update: Update, context: CallbackContext) -> int:
     """Generate and display AI content."""
+    from .ai_content import AIContentGenerator, ToneType
+
     query = update.callback_query
     await query.answer()
 
@@ -4528,6 +4635,7 @@ Cosa vuoi fare ora?
 # FASE 2: EDITOR MARKETPLACE - Notifiche e Accettazione Ordini (Task 12)
 # ============================================================================
 
+@task("notify_new_order")
 async def marketplace_editor_notify_new_order(
     context: CallbackContext,
     editor_user_id: int,
@@ -4563,9 +4671,12 @@ async def marketplace_editor_notify_new_order(
             text=text,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown",
+            **bulk_send_kwargs(context.bot),
         )
         logger.info(f"✅ Notifica inviata al editor {editor_user_id} per ordine #{order_id}")
-    except Exception as e:
+    except (BadRequest, Forbidden) as e:
+        # Editore irraggiungibile: inutile riprovare. Gli altri errori
+        # (rete, timeout) risalgono e la coda riprova l'invio.
         logger.error(f"❌ Errore invio notifica editore {editor_user_id}: {e}")
 
 
@@ -4647,6 +4758,7 @@ async def marketplace_editor_accept_order(update: Update, context: CallbackConte
             chat_id=advertiser_id,
             text=advertiser_text,
             parse_mode="Markdown",
+            **bulk_send_kwargs(context.bot),
         )
     except Exception as e:
         logger.warning(f"Notifica inserzionista non inviata: {e}")
@@ -4743,6 +4855,7 @@ async def marketplace_editor_reject_order(update: Update, context: CallbackConte
             chat_id=advertiser_id,
             text=advertiser_text,
             parse_mode="Markdown",
+            **bulk_send_kwargs(context.bot),
         )
     except Exception as e:
         logger.warning(f"Notifica rifiuto non inviata a inserzionista: {e}")
@@ -4885,8 +4998,28 @@ async def marketplace_editor_view_order(update: Update, context: CallbackContext
 # FASE 2: ADVERTISER MARKETPLACE - Catalogo Inserzionista
 # ============================================================================
 
+CATALOG_PAGE_SIZE = 5
+CATALOG_PATTERN = r"^marketplace:advertiser:catalog(:(next|prev):[^:]+:\d+)?$"
+
+
+async def _catalog_index(context: CallbackContext) -> ListingIndex:
+    # L'indice è costruito all'avvio; senza (es. nei test) lo si carica dal DB
+    if "listing_index" in context.bot_data:
+        index = context.bot_data["listing_index"]
+        if isinstance(index, ListingIndex):
+            # Modifiche fatte da altri worker o con SQL diretto: ricarica se serve
+            if index.refresh_due():
+                await run_in_session(context, index.refresh)
+            return index
+    return await run_in_session(context, ListingIndex.load)
+
+
 async def marketplace_advertiser_catalog(update: Update, context: CallbackContext) -> None:
-    """Show advertiser marketplace catalog with available channels."""
+    """Show advertiser marketplace catalog with available channels.
+
+    Pages come from the in-memory listing index; "next"/"prev" buttons carry
+    the keyset cursor of the page edge (`...:catalog:next:<value>:<id>`).
+    """
     query = update.callback_query
     user_data = update.effective_user
     if not user_data:
@@ -4898,45 +5031,41 @@ async def marketplace_advertiser_catalog(update: Update, context: CallbackContex
     # Se viene da un filtro, recupera i filtri dal contesto
     filters_text = context.user_data.get("marketplace_filters_text", "Nessun filtro attivo")
     
-    with with_session(context) as session:
-        from .models import ChannelListing, Channel, ChannelState
-        from sqlalchemy import and_, or_
-        
-        # Costruisci query base per i canali disponibili
-        query_channels = session.query(ChannelListing).filter(
-            ChannelListing.is_available == True
-        )
-        
-        # Applica filtri se presenti nel contesto
-        if "category" in context.user_data:
-            query_channels = query_channels.filter(
-                ChannelListing.category == context.user_data["category"]
-            )
-        
-        if "min_price" in context.user_data:
-            query_channels = query_channels.filter(
-                ChannelListing.suggested_price >= context.user_data["min_price"]
-            )
-        
-        if "max_price" in context.user_data:
-            query_channels = query_channels.filter(
-                ChannelListing.suggested_price <= context.user_data["max_price"]
-            )
-        
-        if "min_reach" in context.user_data:
-            query_channels = query_channels.filter(
-                ChannelListing.reach_24h >= context.user_data["min_reach"]
-            )
-        
-        channels = query_channels.limit(10).all()
+    catalog_filters = {
+        name: context.user_data[name]
+        for name in ("category", "min_price", "max_price", "min_reach")
+        if name in context.user_data
+    }
+    after = before = None
+    if query and query.data and query.data.count(":") == 5:
+        # marketplace:advertiser:catalog:<next|prev>:<valore>:<id>
+        direction, cursor = query.data.split(":", 4)[3:]
+        try:
+            key = decode_cursor(cursor)
+        except ValueError:
+            key = None
+        if direction == "next":
+            after = key
+        else:
+            before = key
+    
+    index = await _catalog_index(context)
+    page = index.page(
+        sort="price",
+        after=after,
+        before=before,
+        limit=CATALOG_PAGE_SIZE,
+        **catalog_filters,
+    )
+    total = index.count(**catalog_filters)
     
     text = (
         f"🛍️ Catalogo Inserzionista\n\n"
         f"Filtri attivi: {filters_text}\n\n"
-        f"Canali disponibili: {len(channels)}\n\n"
+        f"Canali disponibili: {total}\n\n"
     )
     
-    if not channels:
+    if not page.entries:
         text += "❌ Nessun canale disponibile con i filtri selezionati."
         keyboard = [
             [InlineKeyboardButton("🔍 Modifica Filtri", callback_data="marketplace:advertiser:filter")],
@@ -4945,24 +5074,36 @@ async def marketplace_advertiser_catalog(update: Update, context: CallbackContex
     else:
         # Crea lista di canali
         keyboard = []
-        for channel in channels[:5]:  # Mostra max 5 canali per pagina
-            channel_name = f"@{channel.channel_handle}" if channel.channel_handle else f"#{channel.id}"
-            price_str = f"€{channel.suggested_price:.2f}" if channel.suggested_price else "Offerta"
-            reach_str = f"{channel.reach_24h:,}" if channel.reach_24h else "N/A"
+        for listing in page.entries:
+            channel_name = f"@{listing.handle}" if listing.handle else f"#{listing.id}"
+            reach_str = f"{listing.reach:,}" if listing.reach else "N/A"
             
-            button_text = f"📺 {channel_name[:15]} | €{channel.suggested_price:.1f} | 👁️ {reach_str}"
+            button_text = f"📺 {channel_name[:15]} | €{listing.price:.1f} | 👁️ {reach_str}"
             keyboard.append([
                 InlineKeyboardButton(
                     button_text, 
-                    callback_data=f"marketplace:advertiser:view:{channel.id}"
+                    callback_data=f"marketplace:advertiser:view:{listing.id}"
                 )
             ])
         
+        paging = []
+        if page.has_prev:
+            paging.append(InlineKeyboardButton(
+                "⬅️ Precedenti",
+                callback_data=f"marketplace:advertiser:catalog:prev:{encode_cursor(page.first_key)}",
+            ))
+        if page.has_next:
+            paging.append(InlineKeyboardButton(
+                "Successivi ➡️",
+                callback_data=f"marketplace:advertiser:catalog:next:{encode_cursor(page.last_key)}",
+            ))
+        if paging:
+            keyboard.append(paging)
         keyboard.append([InlineKeyboardButton("🔍 Modifica Filtri", callback_data="marketplace:advertiser:filter")])
         keyboard.append([InlineKeyboardButton("◀️ Indietro", callback_data="insideads:buy")])
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup(keyboard))
     else:
         await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
@@ -4989,7 +5130,7 @@ async def marketplace_advertiser_filter(update: Update, context: CallbackContext
     ]
     
     if query:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await render_menu(query, context, text, reply_markup=InlineKeyboardMarkup(keyboard))
     else:
         await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
@@ -5022,18 +5163,18 @@ async def marketplace_advertiser_view_channel_details(update: Update, context: C
     text = (
         f"📺 Dettagli Canale\n\n"
         f"**Informazioni:**\n"
-        f"• Nome: @{channel_listing.channel_handle}\n"
+        f"• Nome: @{channel.handle}\n"
         f"• Categoria: {channel_listing.category or 'N/A'}\n"
-        f"• Titolo: {channel_listing.title or 'N/A'}\n\n"
+        f"• Titolo: {channel.title or 'N/A'}\n\n"
         f"**Metriche:**\n"
         f"• 👥 Iscritti: {channel_listing.subscribers:,}\n"
         f"• 👁️ Visualizzazioni (24h): {channel_listing.reach_24h:,}\n"
         f"• ⭐ Qualità: {quality_score}/5.0\n"
         f"• 🔥 Engagement: {engagement_rate:.1f}%\n\n"
         f"**Prezzo:**\n"
-        f"• 💰 Suggerito: €{channel_listing.suggested_price:.2f}\n"
-        f"• Min: €{getattr(channel_listing, 'min_price', channel_listing.suggested_price * 0.8):.2f}\n"
-        f"• Max: €{getattr(channel_listing, 'max_price', channel_listing.suggested_price * 1.2):.2f}\n"
+        f"• 💰 Suggerito: €{channel_listing.price:.2f}\n"
+        f"• Min: €{getattr(channel_listing, 'min_price', channel_listing.price * 0.8):.2f}\n"
+        f"• Max: €{getattr(channel_listing, 'max_price', channel_listing.price * 1.2):.2f}\n"
     )
     
     keyboard = [
@@ -5060,8 +5201,8 @@ async def marketplace_advertiser_create_order(update: Update, context: CallbackC
     with with_session(context) as session:
         from .models import ChannelListing
         channel_listing = session.query(ChannelListing).filter_by(id=channel_id).first()
-        context.user_data["order_channel_name"] = channel_listing.channel_handle if channel_listing else "Sconosciuto"
-        context.user_data["order_channel_price"] = channel_listing.suggested_price if channel_listing else 0
+        context.user_data["order_channel_name"] = channel_listing.channel.handle if channel_listing else "Sconosciuto"
+        context.user_data["order_channel_price"] = channel_listing.price if channel_listing else 0
     
     text = (
         f"📝 Crea Ordine - Step 1/4\n\n"
@@ -5162,6 +5303,36 @@ async def marketplace_advertiser_order_content_received(update: Update, context:
     return MARKETPLACE_ORDER_REVIEW
 
 
+def _create_marketplace_order(session, user_data, order_request):
+    """Buy the listing of `order_request` for the Telegram user `user_data`.
+
+    Returns the result of `purchase_listing`, plus "user", "channel_handle"
+    and "seller_chat_id" (read here, while the session is still open).
+    """
+    from .inside_ads_services import purchase_listing
+
+    user = ensure_user(
+        session,
+        telegram_id=user_data.id,
+        username=user_data.username,
+        first_name=user_data.first_name,
+        language_code=user_data.language_code,
+    )
+    result = purchase_listing(
+        session,
+        user,
+        order_request["channel_id"],
+        content=order_request["content"],
+        duration_hours=order_request["duration"],
+        expected_price=order_request.get("price"),
+    )
+    listing = result["listing"]
+    result["user"] = user
+    result["channel_handle"] = listing.channel.handle if listing else None
+    result["seller_chat_id"] = listing.user.telegram_id if listing else None
+    return result
+
+
 async def marketplace_advertiser_order_confirm(update: Update, context: CallbackContext) -> int:
     """Step 4: Process payment and create order."""
     query = update.callback_query
@@ -5174,111 +5345,66 @@ async def marketplace_advertiser_order_confirm(update: Update, context: Callback
     if not user_data:
         return ConversationHandler.END
     
-    with with_session(context) as session:
-        from .models import (
-            User, MarketplaceOrder, OrderState, ChannelListing,
-            Payment, PaymentStatus, MoneyTransaction
-        )
-        from datetime import datetime, timedelta
-        
-        # Recupera utente
-        user = ensure_user(
-            session,
-            telegram_id=user_data.id,
-            username=user_data.username,
-            first_name=user_data.first_name,
-            language_code=user_data.language_code,
-        )
-        
-        # Recupera canale
-        channel_listing = session.query(ChannelListing).filter_by(
-            id=context.user_data["order_channel_id"]
-        ).first()
-        
-        if not channel_listing:
-            await query.edit_message_text("❌ Canale non trovato")
-            return ConversationHandler.END
-        
-        # Controlla saldo
-        from .inside_ads_services import get_user_balance
-        balance = get_user_balance(session, user)
-        total_price = context.user_data["order_channel_price"]
-        
-        if balance < total_price:
-            text = (
-                f"❌ Saldo insufficiente\n\n"
-                f"Saldo: €{balance:.2f}\n"
-                f"Necessari: €{total_price:.2f}\n"
-                f"Mancano: €{total_price - balance:.2f}"
-            )
-            keyboard = [
-                [InlineKeyboardButton("💰 Ricarica Saldo", callback_data="insideads:account:topup")],
-                [InlineKeyboardButton("◀️ Indietro", callback_data="marketplace:advertiser:catalog")],
-            ]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            return ConversationHandler.END
-        
-        # Crea ordine
-        now = datetime.now()
-        order = MarketplaceOrder(
-            advertiser_id=user.id,
-            channel_listing_id=channel_listing.id,
-            status=OrderState.PENDING,
-            content_text=context.user_data.get("order_content", ""),
-            duration_hours=context.user_data.get("order_duration", 24),
-            created_at=now,
-            created_by_user_id=user.id,
-        )
-        session.add(order)
-        session.flush()  # Genera l'ID dell'ordine
-        
-        # Crea pagamento
-        payment = Payment(
-            order_id=order.id,
-            amount=total_price,
-            commission_rate=0.10,  # 10% commission
-            status=PaymentStatus.PAID,
-            payment_date=now,
-            created_by_user_id=user.id,
-        )
-        session.add(payment)
-        
-        # Registra transazione
-        transaction = MoneyTransaction(
-            from_user_id=user.id,
-            to_user_id=channel_listing.user_id,
-            amount=total_price * 0.9,  # 90% all'editore
-            transaction_type="ORDER_PAYMENT",
-            order_id=order.id,
-            created_at=now,
-            created_by_user_id=user.id,
+    order_request = {
+        "channel_id": context.user_data["order_channel_id"],
+        "content": context.user_data.get("order_content", ""),
+        "duration": context.user_data.get("order_duration", 24),
+        # Prezzo mostrato e confermato: se l'editore lo ha cambiato non si addebita
+        "price": context.user_data.get("order_channel_price"),
+    }
+    # Saldo riservato e ordine scritto in un'unica transazione (vedi purchase_listing)
+    result = await run_in_session(
+        context, _create_marketplace_order, user_data, order_request, user_id=user_data.id
+    )
+    outcome, balance, order_id = result["outcome"], result["balance"], result["order_id"]
+    
+    if outcome == "not_found":
+        await query.edit_message_text("❌ Canale non trovato")
+        return ConversationHandler.END
+    
+    total_price = result["listing"].price
+    if outcome == "price_changed":
+        old_price = context.user_data.get("order_channel_price") or 0
+        context.user_data["order_channel_price"] = total_price
+        text = (
+            f"⚠️ Il prezzo del canale è cambiato\n\n"
+            f"Prezzo confermato: €{old_price:.2f}\n"
+            f"Nuovo prezzo: €{total_price:.2f}\n\n"
+            f"Non è stato addebitato nulla. Vuoi confermare l'ordine al nuovo prezzo?"
         )
-        session.add(transaction)
-        
-        # Deduci dal saldo dell'inserzionista
-        from .inside_ads_services import add_transaction as add_trans
-        add_trans(
-            session,
-            user_id=user.id,
-            amount=-total_price,
-            transaction_type="ORDER_PAYMENT",
-            description=f"Pagamento ordine per @{channel_listing.channel_handle}",
+        keyboard = [
+            [InlineKeyboardButton("✅ Conferma e Paga", callback_data="marketplace:advertiser:order:confirm")],
+            [InlineKeyboardButton("❌ Annulla", callback_data="marketplace:advertiser:catalog")],
+        ]
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return MARKETPLACE_ORDER_REVIEW
+    
+    if outcome == "insufficient_balance":
+        text = (
+            f"❌ Saldo insufficiente\n\n"
+            f"Saldo: €{balance:.2f}\n"
+            f"Necessari: €{total_price:.2f}\n"
+            f"Mancano: €{total_price - balance:.2f}"
         )
-        
-        session.commit()
-        
-        order_id = order.id
-        editor_user_id = channel_listing.user_id
-        content_preview = context.user_data.get("order_content", "")[:100]
+        keyboard = [
+            [InlineKeyboardButton("💰 Ricarica Saldo", callback_data="insideads:account:topup")],
+            [InlineKeyboardButton("◀️ Indietro", callback_data="marketplace:advertiser:catalog")],
+        ]
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return ConversationHandler.END
     
-    # Notifica l'editore del nuovo ordine (TASK 12)
+    content_preview = order_request["content"][:100]
+    
+    # Notifica l'editore del nuovo ordine (TASK 12), in background:
+    # l'ordine è già committato e l'inserzionista non aspetta l'invio
     try:
-        await marketplace_editor_notify_new_order(
-            context=context,
-            editor_user_id=editor_user_id,
+        await enqueue_task(
+            context,
+            "notify_new_order",
+            editor_user_id=result["seller_chat_id"],
             order_id=order_id,
-            advertiser_username=user.username,
-            channel_name=channel_listing.channel_handle,
+            advertiser_username=result["user"].username,
+            channel_name=result["channel_handle"],
             price=total_price,
             duration=context.user_data.get("order_duration", 24),
             content_preview=content_preview,
@@ -5315,6 +5441,26 @@ async def marketplace_advertiser_order_confirm(update: Update, context: Callback
 # TASK 14 - VERIFICA ADMIN CANALE (FASE 6)
 # ============================================================================
 
+@task("audit_log")
+async def record_admin_audit(context, user_id: int, action: str, details: str, status: str, created_at: str) -> None:
+    """Scrive una riga di AdminAuditLog (task in background)."""
+
+    def _write(session):
+        from .models import AdminAuditLog
+
+        session.add(
+            AdminAuditLog(
+                user_id=user_id,
+                action=action,
+                details=details,
+                status=status,
+                created_at=datetime.fromisoformat(created_at),
+            )
+        )
+
+    await run_in_session(context, _write)
+
+
 async def verify_channel_admin(user_id: int, channel_id: int, context: CallbackContext) -> dict:
     """
     Verifica che l'utente sia admin del canale Telegram prima della registrazione editore.
@@ -5351,19 +5497,17 @@ async def verify_channel_admin(user_id: int, channel_id: int, context: CallbackC
         # Log verification attempt
         logger.info(f"Verifica admin - User: {user_id}, Channel: {channel_id}, Is Admin: {is_admin}")
         
-        # Save to database for audit trail
+        # Save to database for audit trail (in background)
         try:
-            with with_session(context) as session:
-                from .models import AdminAuditLog
-                audit = AdminAuditLog(
-                    user_id=user_id,
-                    action="CHANNEL_ADMIN_VERIFICATION",
-                    details=str(verification_log),
-                    status="SUCCESS" if is_admin else "FAILED",
-                    created_at=datetime.now(),
-                )
-                session.add(audit)
-                session.commit()
+            await enqueue_task(
+                context,
+                "audit_log",
+                user_id=user_id,
+                action="CHANNEL_ADMIN_VERIFICATION",
+                details=str(verification_log),
+                status="SUCCESS" if is_admin else "FAILED",
+                created_at=datetime.now().isoformat(),
+            )
         except Exception as audit_error:
             logger.error(f"Errore nel logging verifica admin: {audit_error}")
         
@@ -5730,9 +5874,53 @@ async def admin_platform_stats(update: Update, context: CallbackContext) -> None
 def build_application(config: Config) -> Application:
     """Configure the bot application and handlers."""
 
-    application = Application.builder().token(config.bot_token).build()
+    if config.concurrent_updates > 1:
+        # Different chats run concurrently, each chat's updates stay ordered
+        concurrent_updates = PerChatUpdateProcessor(config.concurrent_updates, config.chat_queue_size)
+    else:
+        concurrent_updates = 1
+    builder = (
+        Application.builder()
+        .token(config.bot_token)
+        .concurrent_updates(concurrent_updates)
+        # Bounded: a full queue pushes back on the webhook / poller
+        .update_queue(asyncio.Queue(maxsize=max(0, config.update_queue_size)))
+        # Every outgoing call is paced to Telegram's limits; replies go first
+        .rate_limiter(SendQueue())
+        # Bot API round trips are charged to the handler making them (metrics)
+        .request(TimedHTTPXRequest(connection_pool_size=256))
+    )
+    if config.bot_api_url:
+        builder = builder.base_url(config.bot_api_url)
+    # Side effects handed over by handlers run on the event loop, after the reply
+    task_store = SQLiteTaskStore(config.task_queue_path) if config.task_queue_path else None
+    task_queue = TaskQueue(workers=config.task_workers, store=task_store)
+    builder = builder.post_init(_post_init).post_stop(_post_stop)
+    if config.persistence_url:
+        # Conversation state survives restarts; workers sharing it need
+        # persistence_refresh, or each one overwrites the others' user_data
+        builder = builder.persistence(
+            persistence_from_url(config.persistence_url, refresh=config.persistence_refresh)
+        )
+    application = builder.build()
+    persistent = application.persistence is not None
     session_factory = create_session_factory(config)
     application.bot_data["session_factory"] = session_factory
+    # Blocking DB work of the hottest handlers runs on a pool sized to the engine
+    application.bot_data["db_executor"] = DBExecutor(session_factory)
+    # Catalogo in memoria, aggiornato ad ogni commit che tocca un listing
+    with session_scope(session_factory) as session:
+        listing_index = ListingIndex.load(session)
+    listing_index.install(session_factory)
+    application.bot_data["listing_index"] = listing_index
+    # Menu re-renders identical to what the message already shows are skipped
+    application.bot_data["render_cache"] = RenderCache()
+    application.bot_data["task_queue"] = task_queue
+    # Job periodici (liquidazione escrow, ...) avviati con il bot in post_init
+    application.bot_data["scheduler_jobs"] = [name.strip() for name in config.scheduler_jobs.split(",") if name.strip()]
+
+    # Drop floods (e.g. repeated button taps) before any handler touches the DB
+    install_flood_guard(application)
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -5751,6 +5939,8 @@ def build_application(config: Config) -> Application:
                 ],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
+            name="add_channel",
+            persistent=persistent,
         )
     )
 
@@ -5775,6 +5965,8 @@ def build_application(config: Config) -> Application:
                 ],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
+            name="goal",
+            persistent=persistent,
         )
     )
 
@@ -5801,6 +5993,8 @@ def build_application(config: Config) -> Application:
                 ],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
+            name="offer",
+            persistent=persistent,
         )
     )
 
@@ -5837,6 +6031,8 @@ def build_application(config: Config) -> Application:
                 ],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
+            name="campaign",
+            persistent=persistent,
         )
     )
 
@@ -5851,67 +6047,78 @@ def build_application(config: Config) -> Application:
                 TEMPLATE_CONTENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, template_content)],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
+            name="template",
+            persistent=persistent,
         )
     )
 
-    application.add_handler(CallbackQueryHandler(stats, pattern=r"^menu:stats$"))
-    application.add_handler(CallbackQueryHandler(show_channel_stats, pattern=r"^stats:channel:\d+$"))
-    application.add_handler(CallbackQueryHandler(show_channel_campaigns, pattern=r"^stats:campaigns:\d+$"))
-    application.add_handler(CallbackQueryHandler(confirm_add_channel, pattern=r"^confirm_add_channel:\d+$"))
-    application.add_handler(CallbackQueryHandler(cancel_add_channel, pattern=r"^cancel_add_channel$"))
-    application.add_handler(CallbackQueryHandler(open_menu, pattern=r"^menu:home$"))
+    # Menu callbacks: one handler routing by callback_data prefix (see callback_router.py).
+    # Kept at this position so the conversations registered above keep precedence.
+    menu_router = CallbackRouter()
+    menu_router.add("menu:stats", stats)
+    menu_router.add("stats:channel:{channel_id:int}", show_channel_stats)
+    menu_router.add("stats:campaigns:{channel_id:int}", show_channel_campaigns)
+    menu_router.add("confirm_add_channel:{channel_id:int}", confirm_add_channel)
+    menu_router.add("cancel_add_channel", cancel_add_channel)
+    menu_router.add("menu:home", open_menu)
 
     # Inside Ads handlers
-    application.add_handler(CallbackQueryHandler(insideads_main_menu, pattern=r"^insideads:main$"))
-    application.add_handler(CallbackQueryHandler(insideads_earn_menu, pattern=r"^insideads:earn$"))
-    application.add_handler(CallbackQueryHandler(insideads_earn_editor, pattern=r"^insideads:earn:editor$"))
-    
+    menu_router.add("insideads:main", insideads_main_menu)
+    menu_router.add("insideads:earn", insideads_earn_menu)
+    menu_router.add("insideads:earn:editor", insideads_earn_editor)
+
     # Marketplace Editor handlers
-    application.add_handler(CallbackQueryHandler(marketplace_editor_menu, pattern=r"^marketplace:editor:menu$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_register_channel, pattern=r"^marketplace:editor:register_channel$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_set_price, pattern=r"^marketplace:editor:set_price:\d+$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_confirm_price, pattern=r"^marketplace:editor:confirm_price:\d+:[\d.]+$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_my_channels, pattern=r"^marketplace:editor:my_channels$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_pending_orders, pattern=r"^marketplace:editor:pending_orders$"))
-    
+    menu_router.add("marketplace:editor:menu", marketplace_editor_menu)
+    menu_router.add("marketplace:editor:register_channel", marketplace_editor_register_channel)
+    menu_router.add("marketplace:editor:set_price:{channel_id:int}", marketplace_editor_set_price)
+    menu_router.add("marketplace:editor:confirm_price:{channel_id:int}:{price:float}", marketplace_editor_confirm_price)
+    menu_router.add("marketplace:editor:my_channels", marketplace_editor_my_channels)
+    menu_router.add("marketplace:editor:pending_orders", marketplace_editor_pending_orders)
+
     # Old offer handlers (deprecated, but kept for compatibility)
-    application.add_handler(CallbackQueryHandler(offer_editor_view, pattern=r"^offer:editor:view:\d+$"))
-    application.add_handler(CallbackQueryHandler(offer_editor_accept, pattern=r"^offer:editor:accept:\d+$"))
-    application.add_handler(CallbackQueryHandler(offer_editor_select_channel, pattern=r"^offer:editor:select_channel:\d+:\d+$"))
-    application.add_handler(CallbackQueryHandler(offer_editor_verify, pattern=r"^offer:editor:verify:\d+:\d+$"))
-    
-    application.add_handler(CallbackQueryHandler(insideads_buy_menu, pattern=r"^insideads:buy$"))
-    application.add_handler(CallbackQueryHandler(insideads_buy_create, pattern=r"^insideads:buy:create$"))
-    application.add_handler(CallbackQueryHandler(insideads_buy_list, pattern=r"^insideads:buy:list$"))
-    application.add_handler(CallbackQueryHandler(insideads_exchange_menu, pattern=r"^insideads:exchange$"))
-    application.add_handler(CallbackQueryHandler(insideads_exchange_metrics, pattern=r"^insideads:exchange:metrics$"))
-    application.add_handler(CallbackQueryHandler(insideads_exchange_setup, pattern=r"^insideads:exchange:setup$"))
-    application.add_handler(CallbackQueryHandler(insideads_stats_menu, pattern=r"^insideads:stats$"))
-    application.add_handler(CallbackQueryHandler(insideads_stats_ads, pattern=r"^insideads:stats:ads$"))
-    application.add_handler(CallbackQueryHandler(insideads_stats_monetization, pattern=r"^insideads:stats:monetization$"))
-    application.add_handler(CallbackQueryHandler(insideads_account_menu, pattern=r"^insideads:account$"))
-    application.add_handler(CallbackQueryHandler(insideads_account_transactions, pattern=r"^insideads:account:transactions$"))
-    application.add_handler(CallbackQueryHandler(insideads_account_settings, pattern=r"^insideads:account:settings$"))
+    menu_router.add("offer:editor:view:{offer_id:int}", offer_editor_view)
+    menu_router.add("offer:editor:accept:{offer_id:int}", offer_editor_accept)
+    menu_router.add("offer:editor:select_channel:{offer_id:int}:{channel_id:int}", offer_editor_select_channel)
+    menu_router.add("offer:editor:verify:{offer_id:int}:{channel_id:int}", offer_editor_verify)
+
+    menu_router.add("insideads:buy", insideads_buy_menu)
+    menu_router.add("insideads:buy:create", insideads_buy_create)
+    menu_router.add("insideads:buy:list", insideads_buy_list)
+    menu_router.add("insideads:exchange", insideads_exchange_menu)
+    menu_router.add("insideads:exchange:metrics", insideads_exchange_metrics)
+    menu_router.add("insideads:exchange:setup", insideads_exchange_setup)
+    menu_router.add("insideads:stats", insideads_stats_menu)
+    menu_router.add("insideads:stats:ads", insideads_stats_ads)
+    menu_router.add("insideads:stats:monetization", insideads_stats_monetization)
+    menu_router.add("insideads:account", insideads_account_menu)
+    menu_router.add("insideads:account:transactions", insideads_account_transactions)
+    menu_router.add("insideads:account:transactions:{before_id:int}", insideads_account_transactions)
+    menu_router.add("insideads:account:settings", insideads_account_settings)
 
     # Advanced campaign handlers
-    application.add_handler(CallbackQueryHandler(campaign_management_menu, pattern=r"^campaign:menu$"))
-    application.add_handler(CallbackQueryHandler(campaign_create_multi, pattern=r"^campaign:create_multi$"))
-    application.add_handler(CallbackQueryHandler(campaign_forecast, pattern=r"^campaign:forecast$"))
-    application.add_handler(CallbackQueryHandler(campaign_ai_optimize, pattern=r"^campaign:ai_optimize$"))
-    application.add_handler(CallbackQueryHandler(campaign_suggestions, pattern=r"^campaign:suggestions$"))
+    menu_router.add("campaign:menu", campaign_management_menu)
+    menu_router.add("campaign:create_multi", campaign_create_multi)
+    menu_router.add("campaign:forecast", campaign_forecast)
+    menu_router.add("campaign:ai_optimize", campaign_ai_optimize)
+    menu_router.add("campaign:suggestions", campaign_suggestions)
 
     # Marketplace Advertiser handlers (FASE 2)
-    application.add_handler(CallbackQueryHandler(marketplace_advertiser_catalog, pattern=r"^marketplace:advertiser:catalog$"))
-    application.add_handler(CallbackQueryHandler(marketplace_advertiser_filter, pattern=r"^marketplace:advertiser:filter$"))
-    application.add_handler(CallbackQueryHandler(marketplace_advertiser_view_channel_details, pattern=r"^marketplace:advertiser:view:\d+$"))
+    menu_router.add("marketplace:advertiser:catalog", marketplace_advertiser_catalog)
+    menu_router.add("marketplace:advertiser:catalog:{direction:next|prev}:{value:str}:{listing_id:int}", marketplace_advertiser_catalog)
+    menu_router.add("marketplace:advertiser:filter", marketplace_advertiser_filter)
+    menu_router.add("marketplace:advertiser:view:{listing_id:int}", marketplace_advertiser_view_channel_details)
 
     # Marketplace Editor handlers - Notifications (FASE 2 Task 12)
-    application.add_handler(CallbackQueryHandler(marketplace_editor_accept_order, pattern=r"^marketplace:editor:accept_order:\d+$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_reject_order, pattern=r"^marketplace:editor:reject_order:\d+$"))
-    
+    menu_router.add("marketplace:editor:accept_order:{order_id:int}", marketplace_editor_accept_order)
+    menu_router.add("marketplace:editor:reject_order:{order_id:int}", marketplace_editor_reject_order)
+
+    # Pagamenti campagna in attesa di conferma del provider
+    menu_router.add("purchase:verify:{payment_id:int}", purchase_campaign_verify)
+
     # Marketplace Editor handlers - Order Management (FASE 2 Task 13)
-    application.add_handler(CallbackQueryHandler(marketplace_editor_incoming_orders, pattern=r"^marketplace:editor:incoming_orders$"))
-    application.add_handler(CallbackQueryHandler(marketplace_editor_view_order, pattern=r"^marketplace:editor:view_order:\d+$"))
+    menu_router.add("marketplace:editor:incoming_orders", marketplace_editor_incoming_orders)
+    menu_router.add("marketplace:editor:view_order:{order_id:int}", marketplace_editor_view_order)
+    application.add_handler(menu_router)
 
     # Purchase campaign conversation handler
     application.add_handler(
@@ -5938,6 +6145,8 @@ def build_application(config: Config) -> Application:
                 CallbackQueryHandler(insideads_buy_menu, pattern=r"^insideads:buy$"),
                 CommandHandler("cancel", cancel),
             ],
+            name="purchase_campaign",
+            persistent=persistent,
         )
     )
 
@@ -5960,9 +6169,11 @@ def build_application(config: Config) -> Application:
                 ],
             },
             fallbacks=[
-                CallbackQueryHandler(marketplace_advertiser_catalog, pattern=r"^marketplace:advertiser:catalog$"),
+                CallbackQueryHandler(marketplace_advertiser_catalog, pattern=CATALOG_PATTERN),
                 CommandHandler("cancel", cancel),
             ],
+            name="marketplace_order",
+            persistent=persistent,
         )
     )
 
@@ -5994,6 +6205,8 @@ def build_application(config: Config) -> Application:
                 CallbackQueryHandler(open_menu, pattern=r"^menu:main$"),
                 CommandHandler("cancel", cancel),
             ],
+            name="ai_campaign",
+            persistent=persistent,
         )
     )
 
@@ -6016,41 +6229,102 @@ def build_application(config: Config) -> Application:
                 CallbackQueryHandler(generate_post_menu, pattern=r"^ai:menu$"),
                 CommandHandler("cancel", cancel),
             ],
+            name="ai_post",
+            persistent=persistent,
         )
     )
 
+    # Registered after the AI conversation, whose entry points (ai:menu) win over these
+    late_router = CallbackRouter()
     # AI Content Callbacks
-    application.add_handler(CallbackQueryHandler(generate_post_menu, pattern=r"^ai:menu$"))
-    application.add_handler(CallbackQueryHandler(ai_generate_post_start, pattern=r"^ai:generate_(post|headline|ad|campaign)$"))
-    
+    late_router.add("ai:menu", generate_post_menu)
+    late_router.add("ai:{kind:generate_post|generate_headline|generate_ad|generate_campaign}", ai_generate_post_start)
+
     # Upgrade/Payment Callbacks
-    application.add_handler(CallbackQueryHandler(upgrade_plan_selected, pattern=r"^upgrade:premium$"))
-    application.add_handler(CallbackQueryHandler(upgrade_paypal, pattern=r"^upgrade:paypal:premium$"))
-    application.add_handler(CallbackQueryHandler(upgrade_test, pattern=r"^upgrade:test:premium$"))
-    application.add_handler(CallbackQueryHandler(upgrade_confirmed, pattern=r"^upgrade:confirmed:premium$"))
+    late_router.add("upgrade:premium", upgrade_plan_selected)
+    late_router.add("upgrade:paypal:premium", upgrade_paypal)
+    late_router.add("upgrade:test:premium", upgrade_test)
+    late_router.add("upgrade:confirmed:premium", upgrade_confirmed)
 
     # Task 14 - Channel Admin Verification Handlers
-    application.add_handler(CallbackQueryHandler(editor_register_verify_admin, pattern=r"^marketplace:editor:verify_admin$"))
+    late_router.add("marketplace:editor:verify_admin", editor_register_verify_admin)
 
     # Task 15 - Editor Order History Handler
-    application.add_handler(CallbackQueryHandler(marketplace_editor_order_history, pattern=r"^marketplace:editor:order_history$"))
+    late_router.add("marketplace:editor:order_history", marketplace_editor_order_history)
 
     # FASE 3 - Admin Panel Handlers
-    application.add_handler(CallbackQueryHandler(admin_main_menu, pattern=r"^admin:main$"))
-    application.add_handler(CallbackQueryHandler(admin_approve_channels, pattern=r"^admin:approve_channels$"))
-    application.add_handler(CallbackQueryHandler(admin_approve_channel_action, pattern=r"^admin:approve_channel:\d+$"))
-    application.add_handler(CallbackQueryHandler(admin_suspend_user, pattern=r"^admin:suspend_users$"))
-    application.add_handler(CallbackQueryHandler(admin_manage_disputes, pattern=r"^admin:manage_disputes$"))
-    application.add_handler(CallbackQueryHandler(admin_view_audit_logs, pattern=r"^admin:audit_logs$"))
-    application.add_handler(CallbackQueryHandler(admin_platform_stats, pattern=r"^admin:statistics$"))
+    late_router.add("admin:main", admin_main_menu)
+    late_router.add("admin:approve_channels", admin_approve_channels)
+    late_router.add("admin:approve_channel:{channel_id:int}", admin_approve_channel_action)
+    late_router.add("admin:suspend_users", admin_suspend_user)
+    late_router.add("admin:manage_disputes", admin_manage_disputes)
+    late_router.add("admin:audit_logs", admin_view_audit_logs)
+    late_router.add("admin:statistics", admin_platform_stats)
+    application.add_handler(late_router)
+
+    # Latency histograms per handler (wall, DB, Telegram, OpenAI time)
+    instrument_application(application)
+    install_db_timing()
+    _register_metric_collectors(application)
 
     return application
 
 
+async def _post_init(application: Application) -> None:
+    await application.bot_data["task_queue"].start(application)
+    if application.bot_data["scheduler_jobs"]:
+        from .scheduler import init_scheduler
+
+        init_scheduler(application.bot_data["session_factory"], jobs=application.bot_data["scheduler_jobs"])
+
+
+async def _post_stop(application: Application) -> None:
+    if application.bot_data["scheduler_jobs"]:
+        from .scheduler import stop_scheduler
+
+        # Waits for a running job (e.g. a settlement batch) off the event loop
+        await asyncio.to_thread(stop_scheduler)
+    # Side effects still queued go out while the bot can still send
+    await application.bot_data["task_queue"].stop()
+    if "payment_processor" in application.bot_data:
+        await application.bot_data["payment_processor"].aclose()
+
+
+def _register_metric_collectors(application: Application) -> None:
+    bot_data = application.bot_data
+
+    def collect():
+        gauges = {}
+        for name, value in bot_data["db_executor"].stats().items():
+            gauges[f"adsbot_db_executor_{name}"] = value
+        for name, value in bot_data["render_cache"].stats().items():
+            gauges[f"adsbot_render_cache_{name}"] = value
+        for name, value in bot_data["task_queue"].stats().items():
+            gauges[f"adsbot_task_queue_{name}"] = value
+        gauges["adsbot_flood_guard_dropped"] = bot_data["flood_guard"].dropped
+        gauges["adsbot_update_queue_size"] = application.update_queue.qsize()
+        send_queue = application.bot.rate_limiter
+        if isinstance(send_queue, SendQueue):
+            stats = send_queue.stats()
+            for name in ("sent", "retried", "waiting", "paused_for"):
+                gauges[f"adsbot_send_queue_{name}"] = stats[name]
+        return gauges
+
+    METRICS.add_collector("application", collect)
+
+
 def run() -> None:
     logging.basicConfig(level=logging.INFO)
     config = Config.load()
     application = build_application(config)
+    if config.metrics_port:
+        start_metrics_server(config.metrics_host, config.metrics_port)
+    if config.bot_mode == "webhook":
+        from .webhook import run_webhook
+
+        logger.info("Starting Adsbot (webhook)...")
+        asyncio.run(run_webhook(application, config))
+        return
     logger.info("Starting Adsbot...")
     application.run_polling()
 
@@ -0,0 +1,216 @@
+"""Table-driven routing of callback queries.
+
+A `CallbackQueryHandler` per button means PTB runs every regex in turn for
+each callback query. `CallbackRouter` is a single handler instead: routes
+are declared as colon-separated templates, `callback_data` is split once,
+and the route is found by dict lookup on its literal prefix, so routing
+cost doesn't grow with the number of menus.
+
+Templates mix literal segments and typed arguments:
+
+    router.add("admin:main", admin_main_menu)
+    router.add("admin:approve_channel:{channel_id:int}", admin_approve_channel_action)
+    router.add("marketplace:editor:confirm_price:{channel_id:int}:{price:float}", ...)
+    router.add("offer:deposit:{action:increase|decrease|confirm}", ...)
+
+Argument types are `int`, `float`, `str` (any non-empty segment) or a
+`|`-separated list of choices. The parsed, converted arguments are available
+to the callback as `context.callback_args` (a dict).
+
+Two routes that could match the same `callback_data` are rejected when they
+are added (`ValueError`), so the order of `add` calls never matters.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+_PARAM = re.compile(r"^\{(\w+):([^{}]+)\}$")
+_FLOAT = re.compile(r"^-?[\d.]+$")
+# Colons separate segments, except inside "{name:type}"
+_SEPARATOR = re.compile(r":(?![^{]*\})")
+
+
+class _Param:
+    __slots__ = ("name", "kind", "choices")
+
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        if spec in ("int", "float", "str"):
+            self.kind = spec
+            self.choices: frozenset = frozenset()
+        else:
+            self.kind = "choice"
+            self.choices = frozenset(spec.split("|"))
+            if "" in self.choices or any(":" in c for c in self.choices):
+                raise ValueError(f"invalid choices for {name!r}: {spec!r}")
+
+    def accepts(self, text: str) -> bool:
+        if self.kind == "int":
+            return text.isascii() and text.isdigit()
+        if self.kind == "float":
+            if not _FLOAT.match(text):
+                return False
+            try:
+                float(text)
+            except ValueError:
+                return False
+            return True
+        if self.kind == "str":
+            return bool(text)
+        return text in self.choices
+
+    def convert(self, text: str) -> Any:
+        if self.kind == "int":
+            return int(text)
+        if self.kind == "float":
+            return float(text)
+        return text
+
+    def overlaps(self, other: "_Param") -> bool:
+        if "str" in (self.kind, other.kind):
+            return True
+        if self.kind == "choice" and other.kind == "choice":
+            return bool(self.choices & other.choices)
+        if self.kind == "choice":
+            return any(other.accepts(c) for c in self.choices)
+        if other.kind == "choice":
+            return any(self.accepts(c) for c in other.choices)
+        # int/float: "1" is both
+        return True
+
+    def __repr__(self) -> str:
+        spec = "|".join(sorted(self.choices)) if self.kind == "choice" else self.kind
+        return f"{{{self.name}:{spec}}}"
+
+
+Segment = Union[str, _Param]
+
+
+def _segment_overlap(a: Segment, b: Segment) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return a == b
+    if isinstance(a, str):
+        return b.accepts(a)
+    if isinstance(b, str):
+        return a.accepts(b)
+    return a.overlaps(b)
+
+
+class Route:
+    __slots__ = ("template", "callback", "segments", "prefix")
+
+    def __init__(self, template: str, callback: Callable):
+        self.template = template
+        self.callback = callback
+        self.segments: Tuple[Segment, ...] = tuple(self._parse(template))
+        prefix: List[str] = []
+        for segment in self.segments:
+            if not isinstance(segment, str):
+                break
+            prefix.append(segment)
+        if not prefix:
+            raise ValueError(f"route {template!r} must start with a literal segment")
+        self.prefix = tuple(prefix)
+
+    @staticmethod
+    def _parse(template: str):
+        names = set()
+        for part in _SEPARATOR.split(template):
+            match = _PARAM.match(part)
+            if match:
+                name, spec = match.groups()
+                if name in names:
+                    raise ValueError(f"duplicate argument {name!r} in route {template!r}")
+                names.add(name)
+                yield _Param(name, spec)
+            elif not part or "{" in part or "}" in part:
+                raise ValueError(f"invalid segment {part!r} in route {template!r}")
+            else:
+                yield part
+
+    def match(self, parts: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """Typed arguments if `parts` (the split callback_data) fit this route."""
+        if len(parts) != len(self.segments):
+            return None
+        args = {}
+        for segment, part in zip(self.segments[len(self.prefix):], parts[len(self.prefix):]):
+            if isinstance(segment, str):
+                if segment != part:
+                    return None
+            elif segment.accepts(part):
+                args[segment.name] = segment.convert(part)
+            else:
+                return None
+        return args
+
+    def overlaps(self, other: "Route") -> bool:
+        return len(self.segments) == len(other.segments) and all(
+            _segment_overlap(a, b) for a, b in zip(self.segments, other.segments)
+        )
+
+    def __repr__(self) -> str:
+        return f"Route({self.template!r})"
+
+
+class CallbackRouter(BaseHandler[Update, Any]):
+    """One PTB handler dispatching callback queries through a route table."""
+
+    __slots__ = ("routes", "_table", "_max_prefix")
+
+    def __init__(self, routes: Optional[Dict[str, Callable]] = None, block: bool = True):
+        super().__init__(self._unrouted, block=block)
+        self.routes: List[Route] = []
+        # literal prefix -> routes sharing it (differing in arity/argument types)
+        self._table: Dict[Tuple[str, ...], List[Route]] = {}
+        self._max_prefix = 0
+        for template, callback in (routes or {}).items():
+            self.add(template, callback)
+
+    @staticmethod
+    async def _unrouted(update: Update, context: Any) -> None:  # pragma: no cover - never selected
+        return None
+
+    def add(self, template: str, callback: Callable) -> Route:
+        """Register `callback` for `template`; raises ValueError on overlap."""
+        route = Route(template, callback)
+        for existing in self.routes:
+            if route.overlaps(existing):
+                raise ValueError(f"route {template!r} overlaps {existing.template!r}")
+        self.routes.append(route)
+        self._table.setdefault(route.prefix, []).append(route)
+        self._max_prefix = max(self._max_prefix, len(route.prefix))
+        return route
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        """Route and typed arguments for `data`, or None."""
+        parts = data.split(":")
+        for size in range(min(len(parts), self._max_prefix), 0, -1):
+            for route in self._table.get(tuple(parts[:size]), ()):
+                args = route.match(parts)
+                if args is not None:
+                    return route, args
+        return None
+
+    def check_update(self, update: object) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        return self.resolve(data)
+
+    async def handle_update(self, update, application, check_result, context):
+        route, args = check_result
+        context.callback_args = args
+        return await route.callback(update, context)
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+
+__all__ = ["CallbackRouter", "Route"]
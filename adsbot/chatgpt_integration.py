@@ -6,6 +6,8 @@ import logging
 from dataclasses import dataclass
 from typing import Optional
 
+from .metrics import track_time
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,13 +52,14 @@ class ChatGPTCampaignGenerator:
 {image_prompt}
 High quality, modern design, suitable for social media promotion."""
             
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=enhanced_prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
+            with track_time("openai"):
+                response = self.client.images.generate(
+                    model="dall-e-3",
+                    prompt=enhanced_prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1
+                )
             
             image_url = response.data[0].url
             logger.info(f"✓ Image generated successfully: {image_url[:50]}...")
@@ -104,15 +107,16 @@ Genera una campagna pubblicitaria completa ESCLUSIVAMENTE IN ITALIANO con il seg
 IMPORTANTE: Rispondi SOLO con il JSON valido. Tutti i testi (title, description, cta_text, keywords, target_audience, image_prompt) devono essere ESCLUSIVAMENTE in italiano.
 Senza markdown, senza commenti, solo JSON."""
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an expert social media campaign strategist."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4,
-                max_tokens=500
-            )
+            with track_time("openai"):
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are an expert social media campaign strategist."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.4,
+                    max_tokens=500
+                )
             
             response_text = response.choices[0].message.content.strip()
             
@@ -212,15 +216,16 @@ IMPORTANTE: Rispondi SOLO con il JSON valido. Tutto il contenuto (title, descrip
 Senza markdown, senza commenti, solo JSON.
 Assicurati che sia ottimizzato per Telegram e segua il tono {tone}."""
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an expert Telegram advertising campaign strategist specializing in Italian content optimization."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4,
-                max_tokens=500
-            )
+            with track_time("openai"):
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are an expert Telegram advertising campaign strategist specializing in Italian content optimization."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.4,
+                    max_tokens=500
+                )
             
             response_text = response.choices[0].message.content.strip()
             
@@ -22,6 +22,38 @@ class Config:
     bot_token: str
     database_url: str = "sqlite:///adsbot.db"
     openai_api_key: str = ""
+    # Update delivery: "polling" or "webhook"
+    bot_mode: str = "polling"
+    # Updates processed at the same time (1 = strictly sequential); updates
+    # of one chat always run in order, at most chat_queue_size per chat
+    concurrent_updates: int = 1
+    chat_queue_size: int = 20
+    # Updates buffered before the webhook answers 503 (0 = unbounded)
+    update_queue_size: int = 1000
+    webhook_url: str = ""
+    webhook_path: str = "/telegram"
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8443
+    webhook_secret: str = ""
+    webhook_max_connections: int = 40
+    # Prometheus-format /metrics endpoint (0 = disabled)
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    # Bot API endpoint ("" = api.telegram.org), e.g. a local Bot API server
+    bot_api_url: str = ""
+    # Background side-effect jobs: workers, and a SQLite file keeping queued
+    # jobs across restarts ("" = in memory only)
+    task_workers: int = 4
+    task_queue_path: str = ""
+    # Conversation/user state store: "sqlite:///path" or "redis://host:port/db"
+    # ("" = in memory, lost on restart)
+    persistence_url: str = ""
+    # Re-read a user's/chat's state written by another worker before each
+    # update: needed when several workers share persistence_url
+    persistence_refresh: bool = False
+    # Background jobs started with the bot (names from adsbot.scheduler's
+    # SchedulerConfig.JOBS, comma separated; "" = no scheduler)
+    scheduler_jobs: str = "escrow_settlement"
 
     @classmethod
     def load(cls) -> "Config":
@@ -33,7 +65,37 @@ class Config:
 
         db_url = os.getenv("DATABASE_URL", cls.database_url_from_path())
         openai_key = os.getenv("OPENAI_API_KEY", "")
-        return cls(bot_token=token, database_url=db_url, openai_api_key=openai_key)
+
+        bot_mode = os.getenv("BOT_MODE", cls.bot_mode).lower()
+        if bot_mode not in ("polling", "webhook"):
+            raise RuntimeError(f"Invalid BOT_MODE {bot_mode!r}: use 'polling' or 'webhook'")
+        webhook_url = os.getenv("WEBHOOK_URL", "")
+        if bot_mode == "webhook" and not webhook_url:
+            raise RuntimeError("Missing WEBHOOK_URL environment variable (required with BOT_MODE=webhook)")
+
+        return cls(
+            bot_token=token,
+            database_url=db_url,
+            openai_api_key=openai_key,
+            bot_mode=bot_mode,
+            concurrent_updates=int(os.getenv("BOT_CONCURRENT_UPDATES", cls.concurrent_updates)),
+            chat_queue_size=int(os.getenv("BOT_CHAT_QUEUE_SIZE", cls.chat_queue_size)),
+            update_queue_size=int(os.getenv("BOT_UPDATE_QUEUE_SIZE", cls.update_queue_size)),
+            webhook_url=webhook_url,
+            webhook_path=os.getenv("WEBHOOK_PATH", cls.webhook_path),
+            webhook_listen=os.getenv("WEBHOOK_LISTEN", cls.webhook_listen),
+            webhook_port=int(os.getenv("WEBHOOK_PORT", cls.webhook_port)),
+            webhook_secret=os.getenv("WEBHOOK_SECRET", ""),
+            webhook_max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", cls.webhook_max_connections)),
+            metrics_host=os.getenv("METRICS_HOST", cls.metrics_host),
+            metrics_port=int(os.getenv("METRICS_PORT", cls.metrics_port)),
+            bot_api_url=os.getenv("BOT_API_URL", ""),
+            task_workers=int(os.getenv("TASK_WORKERS", cls.task_workers)),
+            task_queue_path=os.getenv("TASK_QUEUE_PATH", ""),
+            persistence_url=os.getenv("PERSISTENCE_URL", ""),
+            persistence_refresh=os.getenv("PERSISTENCE_REFRESH", "").lower() in ("1", "true", "yes"),
+            scheduler_jobs=os.getenv("SCHEDULER_JOBS", cls.scheduler_jobs),
+        )
 
     @staticmethod
     def database_url_from_path() -> str:
@@ -0,0 +1,178 @@
+"""Run blocking database work off the event loop.
+
+The data layer is synchronous (SQLAlchemy `Session`), so a handler doing
+`with session_scope(...)` blocks the whole bot while its queries run.
+`DBExecutor` runs such units of work on a bounded `ThreadPoolExecutor` sized
+to the engine's connection pool (more threads would only wait for a
+connection), and serializes work per Telegram user so one user's updates are
+applied in order.
+
+Usage from a handler:
+
+    def _load_channels(session, user_id):
+        return session.query(Channel).filter_by(user_id=user_id).all()
+
+    channels = await run_in_session(context, _load_channels, user.id, user_id=user.id)
+
+Objects returned from the worker thread are detached from their session;
+the session factory uses `expire_on_commit=False`, so loaded attributes stay
+readable, but lazy relationships must be loaded inside the unit of work.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from sqlalchemy.orm import sessionmaker
+
+from .db import session_scope
+
+T = TypeVar("T")
+
+# Used when the engine pool does not report a size (e.g. NullPool)
+DEFAULT_WORKERS = 5
+
+
+def pool_size_for(session_factory: sessionmaker) -> int:
+    """Number of connections the factory's engine pool keeps open."""
+    bind = session_factory.kw.get("bind")
+    size = getattr(getattr(bind, "pool", None), "size", None)
+    if callable(size):
+        try:
+            return max(1, int(size()))
+        except (TypeError, ValueError):
+            pass
+    return DEFAULT_WORKERS
+
+
+class _UserLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class DBExecutor:
+    def __init__(self, session_factory: sessionmaker, max_workers: Optional[int] = None):
+        """Create an executor for units of work on `session_factory`.
+
+        Args:
+            session_factory: factory used to open one session per unit of work
+            max_workers: worker threads (default: the engine pool size)
+        """
+        self.session_factory = session_factory
+        self.max_workers = int(max_workers or pool_size_for(session_factory))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        self._user_locks: Dict[Any, _UserLock] = {}
+
+        # Metrics (updated from worker threads)
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def _call(self, submitted: float, fn: Callable[..., T], args, kwargs) -> T:
+        started = time.perf_counter()
+        waited = started - submitted
+        with self._stats_lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._stats_lock:
+                self.running -= 1
+                self.run_total += time.perf_counter() - started
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    async def run(self, fn: Callable[..., T], *args, user_id: Any = None, **kwargs) -> T:
+        """Run `fn(*args, **kwargs)` on a worker thread and return its result.
+
+        Calls sharing a `user_id` run one at a time, in call order.
+        """
+        if user_id is None:
+            return await self._submit(fn, args, kwargs)
+
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            entry = self._user_locks[user_id] = _UserLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                return await self._submit(fn, args, kwargs)
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                # Nobody else waiting for this user: drop the lock
+                self._user_locks.pop(user_id, None)
+
+    async def _submit(self, fn, args, kwargs):
+        with self._stats_lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        # Like asyncio.to_thread: the worker sees the caller's context vars
+        # (e.g. the metrics of the handler it works for)
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._pool, context.run, self._call, time.perf_counter(), fn, args, kwargs
+        )
+
+    async def run_in_session(self, fn: Callable[..., T], *args, user_id: Any = None, **kwargs) -> T:
+        """Like `run`, passing a fresh transactional session as first argument."""
+        return await self.run(self._in_session, fn, args, kwargs, user_id=user_id)
+
+    def _in_session(self, fn, args, kwargs):
+        with session_scope(self.session_factory) as session:
+            return fn(session, *args, **kwargs)
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of queue depth and wait/run times (seconds)."""
+        with self._stats_lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_avg": self.wait_total / finished if finished else 0.0,
+                "wait_max": self.wait_max,
+                "run_avg": self.run_total / finished if finished else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+async def run_in_session(context, fn: Callable[..., T], *args, user_id: Any = None, **kwargs) -> T:
+    """Run `fn(session, *args, **kwargs)` for a handler.
+
+    Uses the application's `DBExecutor` (`bot_data["db_executor"]`) when
+    installed; otherwise runs inline on the event loop, as before.
+    """
+    executor = context.bot_data["db_executor"] if "db_executor" in context.bot_data else None
+    if isinstance(executor, DBExecutor):
+        return await executor.run_in_session(fn, *args, user_id=user_id, **kwargs)
+    with session_scope(context.bot_data["session_factory"]) as session:
+        return fn(session, *args, **kwargs)
+
+
+__all__ = ["DBExecutor", "pool_size_for", "run_in_session"]
@@ -1,4 +1,4 @@
-"""Synchronous Flask decorator wrapper for the async rate limiter.
+"""Synchronous Flask decorator wrapper for the rate limiters.
 
 Usage:
 
@@ -11,40 +11,91 @@ limiter = RedisRateLimiter(window_seconds=60, max_requests=5)
 @rate_limit(limiter)
 def my_endpoint():
     return 'ok'
+
+Limiters exposing `increment_and_check_sync` (in-memory, SQLite) are called
+directly on the request thread. Async-only limiters (Redis) run on a single
+long-lived event loop shared by all worker threads, instead of creating and
+tearing down a loop per request; this also keeps the redis.asyncio
+connection pool bound to one loop so connections are reused.
 """
 
 from functools import wraps
 import asyncio
-from typing import Callable
+import threading
+import time
+from typing import Callable, Optional, Tuple
 
 from adsbot import api_keys
 
+# Upper bound for a single limiter call made through the background loop.
+LIMITER_TIMEOUT = 2.0
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared limiter event loop, starting its thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="rate-limit-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def check_sync(limiter, api_key: str, policy=None) -> Tuple[bool, int, Optional[int], Optional[float]]:
+    """Run one limiter check from synchronous code.
+
+    Returns (allowed, remaining, retry_after_or_None, slowdown_or_None) for
+    every backend; limiters returning three values get slowdown None.
+    `policy` (a per-key quota) is only passed on when set.
+    """
+    args = (api_key,) if policy is None else (api_key, policy)
+    sync_check = getattr(limiter, "increment_and_check_sync", None)
+    if sync_check is not None:
+        result = sync_check(*args)
+    else:
+        future = asyncio.run_coroutine_threadsafe(limiter.increment_and_check(*args), _background_loop())
+        result = future.result(timeout=LIMITER_TIMEOUT)
+
+    if len(result) == 3:
+        allowed, remaining, retry_after = result
+        return allowed, remaining, retry_after, None
+    return tuple(result)  # type: ignore[return-value]
+
 
 def rate_limit(limiter):
     """Return a Flask-compatible decorator that enforces rate limits.
 
-    `limiter` must expose an async method `increment_and_check(api_key)` that
-    returns (allowed: bool, remaining: int, retry_after_or_none: Optional[int]).
+    `limiter` is any Adsbot rate limiter: either with a native
+    `increment_and_check_sync(api_key)` or an async
+    `increment_and_check(api_key)`. Blocked keys get 429 + Retry-After;
+    in slowdown mode the response is delayed and carries
+    X-Rate-Limit-Slowdown.
     """
 
     def decorator(f: Callable):
         @wraps(f)
         def wrapper(*args, **kwargs):
             # Flask exposes request in globals; import here to avoid top-level dependency
-            from flask import request, jsonify
+            from flask import request, jsonify, make_response
 
             api_key = request.headers.get("X-API-Key") or request.args.get("api_key")
-            role = api_keys.get_role(api_key) if api_key else None
-            if role == "admin":
-                return f(*args, **kwargs)
-            if role != "user":
+            if api_key:
+                api_keys.check_registry()
+            info = api_keys.get_key_info(api_key) if api_key else None
+            if info is None:
                 # Unknown key: let the endpoint handle authentication, or reject here
                 return f(*args, **kwargs)
+            if info.role == "admin":
+                return f(*args, **kwargs)
 
-            # Call the async limiter from sync context
             try:
-                allowed, remaining, retry_after = asyncio.run(limiter.increment_and_check(api_key))
-            except Exception as e:
+                allowed, remaining, retry_after, slowdown = check_sync(limiter, api_key, info.policy)
+            except Exception:
                 # If limiter fails, allow by default to avoid denying service
                 return f(*args, **kwargs)
 
@@ -54,9 +105,15 @@ def rate_limit(limiter):
                 resp.headers["Retry-After"] = str(retry_after)
                 return resp
 
-            # Apply slowdown if present (sleep before responding)
-            # Note: slowdown is applied by the async limiter; Flask caller sees delay in response time
-            return f(*args, **kwargs)
+            # Slowdown: the worker thread waits, the endpoint runs afterwards
+            if slowdown:
+                time.sleep(float(slowdown))
+
+            resp = make_response(f(*args, **kwargs))
+            resp.headers["X-Rate-Limit-Remaining"] = str(remaining)
+            if slowdown:
+                resp.headers["X-Rate-Limit-Slowdown"] = str(slowdown)
+            return resp
 
         return wrapper
 
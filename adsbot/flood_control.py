@@ -0,0 +1,122 @@
+"""Per-user flood protection for the Telegram Application.
+
+`FloodGuard` runs as a `TypeHandler` in group -1, i.e. before every other
+handler. Each Telegram user gets a token bucket (default: bursts of 5,
+refilled at 1 update/second). Updates over the limit are dropped before any
+handler opens a DB session or edits a message:
+
+- callback queries get a bare `answer()` (so the client stops its spinner)
+  and nothing else;
+- messages are not handled, but the user gets a short "slow down" reply,
+  at most once every `notice_interval` seconds, so fast typing isn't met
+  with silence.
+
+Usage:
+
+    install_flood_guard(application)
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop, CallbackContext, TypeHandler
+
+from .memory_rate_limiter import TokenBucketRateLimiter
+
+logger = logging.getLogger(__name__)
+
+FLOOD_BURST = 5
+FLOOD_RATE = 1.0
+FLOOD_GROUP = -1
+# At most one "slow down" reply per user in this many seconds
+FLOOD_NOTICE_INTERVAL = 10.0
+FLOOD_NOTICE = "⏳ Stai inviando messaggi troppo velocemente: attendi qualche secondo e riprova."
+
+
+class FloodGuard:
+    def __init__(
+        self,
+        limiter=None,
+        *,
+        burst: int = FLOOD_BURST,
+        rate: float = FLOOD_RATE,
+        notice_interval: float = FLOOD_NOTICE_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create a flood guard.
+
+        Args:
+            limiter: any adsbot rate limiter keyed by Telegram user id
+                (default: `TokenBucketRateLimiter(capacity=burst, refill_rate=rate)`)
+            burst: updates a user may send back to back
+            rate: sustained updates per second per user
+            notice_interval: seconds between two "slow down" replies to
+                the same user for dropped messages
+            clock: monotonic time source, overridable in tests
+        """
+        if limiter is None:
+            limiter = TokenBucketRateLimiter(capacity=burst, refill_rate=rate)
+        self.limiter = limiter
+        self._sync = getattr(self.limiter, "increment_and_check_sync", None)
+        self.dropped = 0
+        self.notice_interval = notice_interval
+        self._clock = clock
+        # User id -> when the last "slow down" reply was sent
+        self._notified: Dict[int, float] = {}
+
+    async def _allowed(self, user_id: int) -> bool:
+        key = str(user_id)
+        if self._sync is not None:
+            return self._sync(key)[0]
+        return (await self.limiter.increment_and_check(key))[0]
+
+    async def __call__(self, update: object, context: CallbackContext) -> None:
+        if not isinstance(update, Update):
+            return
+        user = update.effective_user
+        if user is None or await self._allowed(user.id):
+            return
+
+        self.dropped += 1
+        query = update.callback_query
+        if query is not None:
+            try:
+                await query.answer()
+            except TelegramError:
+                # Query too old or already answered: nothing to do
+                pass
+        elif update.message is not None and self._should_notify(user.id):
+            try:
+                await update.message.reply_text(FLOOD_NOTICE)
+            except TelegramError as e:
+                logger.debug(f"Flood notice to user {user.id} failed: {e}")
+        logger.debug(f"Flood guard dropped update {update.update_id} from user {user.id}")
+        raise ApplicationHandlerStop
+
+    def _should_notify(self, user_id: int) -> bool:
+        now = self._clock()
+        if len(self._notified) > 10_000:
+            # Forget users whose window is over
+            self._notified = {k: t for k, t in self._notified.items() if now - t < self.notice_interval}
+        last = self._notified.get(user_id)
+        if last is not None and now - last < self.notice_interval:
+            return False
+        self._notified[user_id] = now
+        return True
+
+
+def install_flood_guard(application: Application, guard: Optional[FloodGuard] = None) -> FloodGuard:
+    """Register `guard` (or a default `FloodGuard`) ahead of all handlers."""
+    if guard is None:
+        guard = FloodGuard()
+    application.add_handler(TypeHandler(Update, guard), group=FLOOD_GROUP)
+    application.bot_data["flood_guard"] = guard
+    return guard
+
+
+__all__ = ["FloodGuard", "install_flood_guard"]
@@ -3,9 +3,11 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, select, tuple_, update
 
+from . import ledger
 from .models import (
     User,
     Channel,
@@ -16,6 +18,16 @@ from .models import (
     AdvertisementMetrics,
 )
 
+# Share of a marketplace order kept by the platform
+MARKETPLACE_COMMISSION = 0.10
+
+# Share of a campaign budget paid to the channel owner (the rest goes to the platform)
+CAMPAIGN_SELLER_SHARE = 0.8
+
+# Provider payment statuses meaning the money has been collected
+# (Stripe intent "succeeded", PayPal payment executed: "approved")
+CONFIRMED_PAYMENT_STATUSES = ("succeeded", "approved")
+
 
 def get_or_create_balance(session: Session, user: User) -> UserBalance:
     """Get or create user balance record."""
@@ -33,6 +45,15 @@ def get_user_balance(session: Session, user: User) -> float:
     return balance.balance
 
 
+# Ledger account on the other side of each add_transaction type
+_COUNTER_ACCOUNTS = {
+    "earn": ledger.PLATFORM,
+    "refund": ledger.PLATFORM,
+    "spend": ledger.PLATFORM,
+    "withdrawal": ledger.EXTERNAL,
+}
+
+
 def add_transaction(
     session: Session,
     user: User,
@@ -41,24 +62,34 @@ def add_transaction(
     description: str,
     reference_id: int | None = None,
 ) -> Transaction:
-    """Create a transaction record and update user balance."""
-    balance = get_or_create_balance(session, user)
-    
-    # Update balance (earn/refund = positive, spend = negative)
-    if transaction_type in ("earn", "refund"):
-        balance.balance += amount
-    elif transaction_type == "spend":
-        balance.balance -= amount
-    elif transaction_type == "withdrawal":
-        balance.balance -= amount
-    
-    balance.updated_at = datetime.utcnow()
-    
+    """Create a transaction record and post it to the user's ledger account.
+
+    earn/refund credit the user, spend/withdrawal debit it (raising
+    `ledger.InsufficientFunds` rather than going below zero); the cached
+    balance is updated in the same commit.
+    """
+    wallet = ledger.user_account(session, user.id)
+    if transaction_type in _COUNTER_ACCOUNTS and ledger.to_minor(amount):
+        amount_minor = ledger.to_minor(amount)
+        if transaction_type in ("spend", "withdrawal"):
+            amount_minor = -amount_minor
+        ledger.post(
+            session,
+            transaction_type,
+            [
+                (wallet, amount_minor),
+                (ledger.system_account(session, _COUNTER_ACCOUNTS[transaction_type]), -amount_minor),
+            ],
+            description=description,
+            reference_id=reference_id,
+        )
+
     # Create transaction record
     transaction = Transaction(
         user_id=user.id,
         transaction_type=transaction_type,
         amount=amount,
+        balance_after=ledger.from_minor(wallet.balance_minor),
         description=description,
         reference_id=reference_id,
     )
@@ -78,6 +109,44 @@ def get_recent_transactions(session: Session, user: User, days: int = 30) -> lis
     )
 
 
+# Rows per page of the transaction statement
+TRANSACTIONS_PAGE_SIZE = 10
+
+
+def get_transactions_page(
+    session: Session,
+    user: User,
+    before_id: int | None = None,
+    limit: int = TRANSACTIONS_PAGE_SIZE,
+) -> tuple[list[Transaction], int | None]:
+    """One page of the user's transactions, newest first.
+
+    Keyset pagination on (user_id, created_at, id): the page starts right
+    after transaction `before_id` (the last row of the previous page) and
+    is read from the (user_id, created_at, id) index, so every page costs
+    the same however long the history is. Each row carries the balance
+    after it (`balance_after`), so the page boundaries' running balance
+    needs no replay.
+
+    Returns (rows, cursor of the next page or None on the last page).
+    """
+    stmt = select(Transaction).where(Transaction.user_id == user.id)
+    if before_id is not None:
+        boundary = session.execute(
+            select(Transaction.created_at, Transaction.id).where(
+                Transaction.id == before_id, Transaction.user_id == user.id
+            )
+        ).first()
+        if boundary is not None:
+            stmt = stmt.where(tuple_(Transaction.created_at, Transaction.id) < tuple_(*boundary))
+    rows = list(
+        session.scalars(stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1))
+    )
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
 def get_user_campaigns(session: Session, user: User) -> list[Campaign]:
     """Get all campaigns for user's channels."""
     return (
@@ -221,6 +290,208 @@ def create_campaign_purchase(
     }
 
 
+def purchase_listing(
+    session: Session,
+    buyer: User,
+    listing_id: int,
+    content: str,
+    duration_hours: int = 24,
+    expected_price: Optional[float] = None,
+) -> dict:
+    """Buy a post on a marketplace listing, paying from the buyer's balance.
+
+    The price moves from the buyer's ledger account to escrow; the posting
+    is a conditional UPDATE (balance >= price), so concurrent purchases
+    can't overdraw the balance. The order, its escrow payment and the ledger
+    rows are flushed in the caller's transaction: the caller commits them
+    together with the rest of its unit of work (nothing is committed or
+    rolled back here). When the balance is too low nothing is left behind
+    and the caller's earlier writes are untouched.
+
+    Args:
+        expected_price: price the buyer confirmed; if the listing's price
+            is different now nothing is bought ("price_changed")
+
+    Returns a dict with "outcome" ("ok", "not_found", "price_changed" or
+    "insufficient_balance"), "balance" (after the purchase, or the current
+    one when it is too low), "order_id" and "listing".
+    """
+    from .models import ChannelListing, MarketplaceOrder, MoneyTransaction, OrderStatus, Payment, PaymentStatus
+
+    # Row locked (PostgreSQL) so the price can't change before the order is written
+    listing = session.get(ChannelListing, listing_id, with_for_update=True)
+    if listing is None or not listing.is_active:
+        return {"outcome": "not_found", "balance": None, "order_id": None, "listing": None}
+
+    price = listing.price
+    if expected_price is not None and ledger.to_minor(price) != ledger.to_minor(expected_price):
+        return {"outcome": "price_changed", "balance": None, "order_id": None, "listing": listing}
+    platform_fee = round(price * MARKETPLACE_COMMISSION, 2)
+    now = datetime.utcnow()
+    account = ledger.user_account(session, buyer.id)
+    order = MarketplaceOrder(
+        seller_id=listing.user_id,
+        buyer_id=buyer.id,
+        channel_id=listing.channel_id,
+        channel_listing_id=listing.id,
+        price=price,
+        duration_hours=duration_hours,
+        status=OrderStatus.pending,
+        content_text=content,
+        platform_fee=platform_fee,
+        created_at=now,
+    )
+    session.add(order)
+    session.flush()
+    description = f"Ordine #{order.id} sul canale {listing.channel.handle}"
+    price_minor = ledger.to_minor(price)
+    try:
+        ledger.post(
+            session,
+            "order_payment",
+            [(account, -price_minor), (ledger.system_account(session, ledger.ESCROW), price_minor)],
+            description=description,
+            order_id=order.id,
+            now=now,
+        )
+    except ledger.InsufficientFunds:
+        # The refused posting wrote nothing: drop the order, keep the caller's work
+        session.delete(order)
+        session.flush()
+        balance = ledger.from_minor(ledger.balance_of(session, account.id))
+        return {"outcome": "insufficient_balance", "balance": balance, "order_id": None, "listing": listing}
+    balance = ledger.from_minor(account.balance_minor)
+
+    payment = Payment(
+        order_id=order.id,
+        amount=price,
+        platform_fee=platform_fee,
+        seller_amount=price - platform_fee,
+        payment_method="balance",
+        status=PaymentStatus.escrow_held,
+        created_at=now,
+        processing_started_at=now,
+    )
+    session.add(payment)
+    session.flush()
+    session.add(MoneyTransaction(
+        user_id=buyer.id,
+        transaction_type="order_payment",
+        amount=-price,
+        balance_after=balance,
+        order_id=order.id,
+        payment_id=payment.id,
+        description=description,
+        created_at=now,
+    ))
+    session.add(Transaction(
+        user_id=buyer.id,
+        transaction_type="spend",
+        amount=price,
+        balance_after=balance,
+        description=description,
+        reference_id=order.id,
+        created_at=now,
+    ))
+    session.flush()
+    return {"outcome": "ok", "balance": balance, "order_id": order.id, "listing": listing}
+
+
+def record_campaign_payment(
+    session: Session,
+    buyer: User,
+    channel: Channel,
+    campaign_name: str,
+    amount: float,
+    provider: str,
+    provider_payment_id: str,
+):
+    """Register a campaign payment created at `provider`, pending until it is confirmed.
+
+    One row per provider payment id: a repeated tap or a retry gets the same
+    provider payment back (same idempotency key) and so the row already
+    recorded, not a second one. Flushed, not committed.
+    """
+    from .models import CampaignPayment, PaymentStatus
+
+    payment = session.scalar(
+        select(CampaignPayment).where(CampaignPayment.provider_payment_id == provider_payment_id)
+    )
+    if payment is None:
+        payment = CampaignPayment(
+            user_id=buyer.id,
+            channel_id=channel.id,
+            campaign_name=campaign_name,
+            amount=amount,
+            provider=provider,
+            provider_payment_id=provider_payment_id,
+            status=PaymentStatus.pending,
+        )
+        session.add(payment)
+        session.flush()
+    return payment
+
+
+def book_campaign_payment(session: Session, payment_id: int) -> bool:
+    """Book a campaign payment the provider has confirmed.
+
+    The budget comes in from outside (EXTERNAL ledger account): the channel
+    owner gets `CAMPAIGN_SELLER_SHARE` of it, the platform the rest, and the
+    buyer's history records the spend. The pending -> completed switch is a
+    conditional UPDATE, so a payment is booked once however many times it
+    is confirmed. Flushed in the caller's transaction, not committed.
+
+    Returns True if the payment was booked now, False if it wasn't pending
+    (already booked, or unknown).
+    """
+    from .models import CampaignPayment, PaymentStatus
+
+    now = datetime.utcnow()
+    claimed = session.execute(
+        update(CampaignPayment)
+        .where(CampaignPayment.id == payment_id, CampaignPayment.status == PaymentStatus.pending)
+        .values(status=PaymentStatus.completed, completed_at=now)
+        .execution_options(synchronize_session="fetch")
+    ).rowcount
+    if not claimed:
+        return False
+
+    payment = session.get(CampaignPayment, payment_id)
+    channel = payment.channel
+    total = ledger.to_minor(payment.amount)
+    seller_minor = ledger.to_minor(payment.amount * CAMPAIGN_SELLER_SHARE)
+    wallet = ledger.user_account(session, channel.user_id)
+    legs = [(ledger.system_account(session, ledger.EXTERNAL), -total), (wallet, seller_minor)]
+    if total - seller_minor:
+        legs.append((ledger.system_account(session, ledger.PLATFORM), total - seller_minor))
+    description = f"Campagna '{payment.campaign_name}' su {channel.handle}"
+    ledger.post(session, "campaign_payment", legs, description=description, reference_id=payment.id, now=now)
+
+    buyer_balance = ledger.from_minor(ledger.user_account(session, payment.user_id).balance_minor)
+    session.add_all([
+        Transaction(
+            user_id=payment.user_id,
+            transaction_type="spend",
+            amount=payment.amount,
+            balance_after=buyer_balance,
+            description=f"{description} ({payment.provider})",
+            reference_id=payment.id,
+            created_at=now,
+        ),
+        Transaction(
+            user_id=channel.user_id,
+            transaction_type="earn",
+            amount=ledger.from_minor(seller_minor),
+            balance_after=ledger.from_minor(wallet.balance_minor),
+            description=description,
+            reference_id=payment.id,
+            created_at=now,
+        ),
+    ])
+    session.flush()
+    return True
+
+
 def list_available_channels_for_ads(session: Session, min_subscribers: int = 100) -> list[Channel]:
     """List channels available for advertising (with monetization enabled)."""
     # In a real scenario, filter by channels that opted into ad network
@@ -0,0 +1,427 @@
+"""Append-only double-entry ledger.
+
+Every movement of money is a `LedgerTransaction` whose `LedgerEntry` rows
+sum to zero, in integer minor units (cents): money leaving one account
+always lands in another one (a user's wallet, the escrow, the platform, the
+outside world). Entries are never updated or deleted; a correction is a new
+transaction.
+
+Balances are projections of the entries:
+
+- `LedgerAccount.balance_minor` is the current balance, updated by `post`
+  with one conditional UPDATE per account in the same DB transaction as the
+  entries, so reading it is a primary-key lookup and a user account can't
+  go below zero even when purchases race;
+- `post_bulk` does the same for postings touching many accounts (e.g. a
+  settlement crediting hundreds of sellers) with one UPDATE and one
+  INSERT, whatever the number of accounts;
+- every `CHECKPOINT_INTERVAL` entries of an account a `LedgerCheckpoint`
+  stores the running balance, so `balance_at` (any past moment) replays at
+  most that many entries from the nearest checkpoint;
+- `UserBalance.balance` mirrors user accounts for the code that reads it.
+
+User accounts are opened on first use, with an opening entry carrying the
+balance the user had in `UserBalance` before the ledger existed.
+
+Usage:
+
+    buyer = user_account(session, user.id)
+    post(session, "order_payment", [(buyer, -1500), (system_account(session, ESCROW), 1500)])
+    session.commit()
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, case, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import LedgerAccount, LedgerCheckpoint, LedgerEntry, LedgerTransaction, UserBalance
+
+# Entries of one account between two checkpoints (bounds `balance_at` replay)
+CHECKPOINT_INTERVAL = 100
+
+# System accounts (allowed to go negative)
+ESCROW = "escrow"  # Paid orders not settled yet
+PLATFORM = "platform"  # Commissions earned, payouts and refunds made
+EXTERNAL = "external"  # Money outside the bot: deposits and withdrawals
+OPENING = "opening"  # Balances carried over from UserBalance
+
+Leg = Tuple[LedgerAccount, int]
+
+
+class LedgerError(ValueError):
+    """Invalid posting, or an attempt to change recorded entries."""
+
+
+class InsufficientFunds(LedgerError):
+    """A posting would take an account without overdraft below zero."""
+
+
+def to_minor(amount: float) -> int:
+    """Amount in currency units -> integer cents (half up)."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_minor(amount_minor: int) -> float:
+    return amount_minor / 100
+
+
+def _ensure_account(session: Session, code: str, **values) -> Tuple[LedgerAccount, bool]:
+    """Get account `code`, creating it; returns (account, created here)."""
+    account = session.scalar(select(LedgerAccount).where(LedgerAccount.code == code))
+    if account is not None:
+        return account, False
+    stmt = _insert_accounts(session, [dict(code=code, **values)])
+    created = session.execute(stmt).rowcount == 1
+    account = session.scalar(select(LedgerAccount).where(LedgerAccount.code == code))
+    return account, created
+
+
+def _insert_accounts(session: Session, rows: Sequence[dict]):
+    """INSERT of new (empty) accounts, skipping codes that already exist."""
+    now = datetime.utcnow()
+    rows = [dict(balance_minor=0, entry_count=0, created_at=now, **row) for row in rows]
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(LedgerAccount).values(rows)
+    # Two sessions opening the same account: the second one waits for the
+    # first to commit, then inserts nothing and reads its row
+    return dialect_insert(LedgerAccount).values(rows).on_conflict_do_nothing(index_elements=["code"])
+
+
+def system_account(session: Session, code: str) -> LedgerAccount:
+    """Get (or open) the system account `code`, e.g. `ESCROW`."""
+    account, _ = _ensure_account(session, code, allow_negative=True)
+    return account
+
+
+def user_account(session: Session, user_id: int) -> LedgerAccount:
+    """Get (or open) the wallet account of user `user_id` (a `User.id`)."""
+    account, created = _ensure_account(session, f"user:{user_id}", user_id=user_id, allow_negative=False)
+    if created:
+        opening = to_minor(session.scalar(select(UserBalance.balance).where(UserBalance.user_id == user_id)) or 0)
+        if opening:
+            post(
+                session,
+                "opening_balance",
+                [(system_account(session, OPENING), -opening), (account, opening)],
+                description="Saldo iniziale",
+            )
+    return account
+
+
+def user_accounts(session: Session, user_ids: Iterable[int]) -> Dict[int, LedgerAccount]:
+    """`user_account` for many users at once: {user id: wallet account}.
+
+    One SELECT, then one INSERT for the missing accounts and one
+    `post_bulk` carrying their opening balances.
+    """
+    user_ids = set(user_ids)
+    codes = [f"user:{user_id}" for user_id in user_ids]
+    accounts = {
+        account.user_id: account
+        for account in session.scalars(select(LedgerAccount).where(LedgerAccount.code.in_(codes)))
+    }
+    missing = sorted(user_ids - accounts.keys())
+    if not missing:
+        return accounts
+    created = set(session.scalars(
+        _insert_accounts(
+            session, [dict(code=f"user:{user_id}", user_id=user_id, allow_negative=False) for user_id in missing]
+        ).returning(LedgerAccount.user_id)
+    ))
+    for account in session.scalars(
+        select(LedgerAccount).where(LedgerAccount.code.in_([f"user:{user_id}" for user_id in missing]))
+    ):
+        accounts[account.user_id] = account
+    openings = [
+        (accounts[user_id], to_minor(balance))
+        for user_id, balance in session.execute(
+            select(UserBalance.user_id, UserBalance.balance).where(UserBalance.user_id.in_(created))
+        )
+        if balance and to_minor(balance)
+    ]
+    if openings:
+        post_bulk(
+            session,
+            "opening_balance",
+            [(system_account(session, OPENING), -sum(amount for _, amount in openings)), *openings],
+            description="Saldo iniziale",
+        )
+    return accounts
+
+
+def post(
+    session: Session,
+    kind: str,
+    legs: Sequence[Leg],
+    description: str = "",
+    order_id: Optional[int] = None,
+    reference_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> LedgerTransaction:
+    """Record a balanced transaction and update the balances of its accounts.
+
+    Args:
+        session: session whose transaction the posting joins (not committed here)
+        kind: transaction kind, e.g. "deposit", "order_payment"
+        legs: (account, signed amount in minor units); amounts must sum to zero
+        description: human readable description
+        order_id: marketplace order the money moves for, if any
+        reference_id: other referenced object (campaign, channel, ...)
+        now: timestamp of the transaction (default: utcnow)
+
+    Raises:
+        LedgerError: the legs are empty, zero, non-integer or unbalanced
+        InsufficientFunds: an account without overdraft would go below zero;
+            nothing is written (balances already moved are put back)
+    """
+    _check_legs(kind, legs)
+    now = now or datetime.utcnow()
+
+    # Same account order in every posting: concurrent postings lock rows alike
+    applied = []
+    for account, amount in sorted(legs, key=lambda leg: leg[0].id):
+        if not _move(session, account, amount, 1, guard=amount < 0 and not account.allow_negative):
+            # Put back the legs already applied: a refused posting writes nothing
+            for done, done_amount in applied:
+                _move(session, done, -done_amount, -1)
+            raise InsufficientFunds(f"Insufficient funds on {account.code} for {from_minor(-amount):.2f}")
+        applied.append((account, amount))
+
+    transaction = LedgerTransaction(
+        kind=kind, description=description, order_id=order_id, reference_id=reference_id, created_at=now
+    )
+    session.add(transaction)
+    session.flush()
+    for account, amount in applied:
+        entry = LedgerEntry(transaction_id=transaction.id, account_id=account.id, amount_minor=amount, created_at=now)
+        session.add(entry)
+        if account.entry_count % CHECKPOINT_INTERVAL == 0:
+            session.flush()
+            session.add(LedgerCheckpoint(
+                account_id=account.id, entry_id=entry.id, balance_minor=account.balance_minor, created_at=now
+            ))
+        if account.user_id is not None:
+            _mirror_user_balance(session, account.user_id, account.balance_minor, now)
+    session.flush()
+    return transaction
+
+
+def _move(session: Session, account: LedgerAccount, amount: int, entries: int, guard: bool = False) -> bool:
+    """Add `amount` and `entries` to the cached projection of `account`.
+
+    With `guard`, only if the balance stays >= 0 (conditional UPDATE);
+    returns False when it would not.
+    """
+    stmt = update(LedgerAccount).where(LedgerAccount.id == account.id)
+    if guard:
+        stmt = stmt.where(LedgerAccount.balance_minor >= -amount)
+    row = session.execute(
+        stmt.values(
+            balance_minor=LedgerAccount.balance_minor + amount,
+            entry_count=LedgerAccount.entry_count + entries,
+        )
+        .returning(LedgerAccount.balance_minor, LedgerAccount.entry_count)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return False
+    set_committed_value(account, "balance_minor", row[0])
+    set_committed_value(account, "entry_count", row[1])
+    return True
+
+
+def post_bulk(
+    session: Session,
+    kind: str,
+    legs: Sequence[Leg],
+    description: str = "",
+    order_id: Optional[int] = None,
+    reference_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> LedgerTransaction:
+    """Record a balanced transaction over many accounts in a fixed number of statements.
+
+    Same result as `post`, but the balances are updated by one UPDATE (a
+    CASE on the account id), the entries and checkpoints are inserted by
+    one multi-row INSERT each and the mirrored `UserBalance` rows by one
+    executemany, so the cost in round trips doesn't grow with the number of
+    accounts.
+
+    Each account appears at most once, and only accounts allowing a
+    negative balance can be debited: there is no per-account funds check
+    (use `post` for that).
+
+    Raises:
+        LedgerError: invalid or unbalanced legs, an account listed twice or
+            a debit on an account without overdraft
+    """
+    _check_legs(kind, legs)
+    accounts = {account.id: account for account, _ in legs}
+    if len(accounts) != len(legs):
+        raise LedgerError(f"{kind}: an account appears more than once in a bulk posting")
+    for account, amount in legs:
+        if amount < 0 and not account.allow_negative:
+            raise LedgerError(f"{kind}: {account.code} can't be debited by a bulk posting, use post()")
+
+    now = now or datetime.utcnow()
+    transaction = LedgerTransaction(
+        kind=kind, description=description, order_id=order_id, reference_id=reference_id, created_at=now
+    )
+    session.add(transaction)
+    session.flush()
+
+    deltas = {account.id: amount for account, amount in legs}
+    rows = session.execute(
+        update(LedgerAccount)
+        .where(LedgerAccount.id.in_(deltas))
+        .values(
+            balance_minor=LedgerAccount.balance_minor + case(deltas, value=LedgerAccount.id),
+            entry_count=LedgerAccount.entry_count + 1,
+        )
+        .returning(LedgerAccount.id, LedgerAccount.balance_minor, LedgerAccount.entry_count)
+        .execution_options(synchronize_session=False)
+    ).all()
+    inserted = session.execute(
+        insert(LedgerEntry).returning(LedgerEntry.id, LedgerEntry.account_id),
+        [
+            dict(transaction_id=transaction.id, account_id=account_id, amount_minor=amount, created_at=now)
+            for account_id, amount in sorted(deltas.items())
+        ],
+    )
+    entry_ids = {account_id: entry_id for entry_id, account_id in inserted}
+
+    checkpoints = []
+    user_balances = {}
+    for account_id, balance, entry_count in rows:
+        account = accounts[account_id]
+        set_committed_value(account, "balance_minor", balance)
+        set_committed_value(account, "entry_count", entry_count)
+        if entry_count % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append(
+                dict(account_id=account_id, entry_id=entry_ids[account_id], balance_minor=balance, created_at=now)
+            )
+        if account.user_id is not None:
+            user_balances[account.user_id] = balance
+    if checkpoints:
+        session.execute(insert(LedgerCheckpoint), checkpoints)
+    if user_balances:
+        _mirror_user_balances(session, user_balances, now)
+    return transaction
+
+
+def _check_legs(kind: str, legs: Sequence[Leg]) -> None:
+    if len(legs) < 2:
+        raise LedgerError("A ledger transaction needs at least two entries")
+    for _, amount in legs:
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount == 0:
+            raise LedgerError(f"Invalid entry amount {amount!r}: use non-zero integer minor units")
+    if sum(amount for _, amount in legs) != 0:
+        raise LedgerError(f"Unbalanced {kind} transaction: entries sum to {sum(a for _, a in legs)}")
+
+
+def _mirror_user_balance(session: Session, user_id: int, balance_minor: int, now: datetime) -> None:
+    updated = session.execute(
+        update(UserBalance)
+        .where(UserBalance.user_id == user_id)
+        .values(balance=from_minor(balance_minor), updated_at=now)
+    )
+    if updated.rowcount == 0:
+        session.add(UserBalance(user_id=user_id, balance=from_minor(balance_minor), updated_at=now))
+
+
+def _mirror_user_balances(session: Session, balances: Dict[int, int], now: datetime) -> None:
+    """`_mirror_user_balance` for many users: one executemany UPDATE, one INSERT for the missing rows."""
+    table = UserBalance.__table__
+    existing = set(session.scalars(select(UserBalance.user_id).where(UserBalance.user_id.in_(balances))))
+    if existing:
+        session.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("b_user_id"))
+            .values(balance=bindparam("b_balance"), updated_at=now),
+            [{"b_user_id": user_id, "b_balance": from_minor(balances[user_id])} for user_id in existing],
+        )
+    missing = [
+        dict(user_id=user_id, balance=from_minor(balance), updated_at=now)
+        for user_id, balance in balances.items()
+        if user_id not in existing
+    ]
+    if missing:
+        session.execute(insert(UserBalance), missing)
+
+
+def balance_of(session: Session, account_id: int) -> int:
+    """Current balance (minor units), from the cached projection."""
+    return session.scalar(select(LedgerAccount.balance_minor).where(LedgerAccount.id == account_id)) or 0
+
+
+def balance_at(session: Session, account_id: int, at: datetime) -> int:
+    """Balance (minor units) of an account at time `at`.
+
+    Starts from the last checkpoint taken by then and adds the entries
+    recorded after it, at most `CHECKPOINT_INTERVAL` of them.
+    """
+    checkpoint = session.scalar(
+        select(LedgerCheckpoint)
+        .where(LedgerCheckpoint.account_id == account_id, LedgerCheckpoint.created_at <= at)
+        .order_by(LedgerCheckpoint.entry_id.desc())
+        .limit(1)
+    )
+    base, after = (checkpoint.balance_minor, checkpoint.entry_id) if checkpoint else (0, 0)
+    delta = session.scalar(
+        select(func.coalesce(func.sum(LedgerEntry.amount_minor), 0)).where(
+            LedgerEntry.account_id == account_id,
+            LedgerEntry.id > after,
+            LedgerEntry.created_at <= at,
+        )
+    )
+    return base + int(delta)
+
+
+def replay_balance(session: Session, account_id: int) -> int:
+    """Balance recomputed from every entry of the account (for audits)."""
+    total = session.scalar(
+        select(func.coalesce(func.sum(LedgerEntry.amount_minor), 0)).where(LedgerEntry.account_id == account_id)
+    )
+    return int(total)
+
+
+@event.listens_for(LedgerTransaction, "before_update")
+@event.listens_for(LedgerTransaction, "before_delete")
+@event.listens_for(LedgerEntry, "before_update")
+@event.listens_for(LedgerEntry, "before_delete")
+@event.listens_for(LedgerCheckpoint, "before_update")
+@event.listens_for(LedgerCheckpoint, "before_delete")
+def _append_only(mapper, connection, target):
+    raise LedgerError(f"{type(target).__name__} rows are append-only: post a correcting transaction instead")
+
+
+__all__ = [
+    "CHECKPOINT_INTERVAL",
+    "ESCROW",
+    "EXTERNAL",
+    "InsufficientFunds",
+    "LedgerError",
+    "OPENING",
+    "PLATFORM",
+    "balance_at",
+    "balance_of",
+    "from_minor",
+    "post",
+    "post_bulk",
+    "replay_balance",
+    "system_account",
+    "to_minor",
+    "user_account",
+    "user_accounts",
+]
@@ -0,0 +1,418 @@
+"""In-memory index of marketplace listings for catalog browsing.
+
+Holds every active and available `ChannelListing` as a small entry, with
+sorted arrays of keyset keys per sort order ("price" ascending, "reach"
+descending), one set of arrays per category plus one for all categories.
+A catalog page is a bisect into the right array followed by a short scan,
+so browsing costs no DB query.
+
+Pagination is keyset-based: a cursor is the `(sort value, listing id)` key
+of the first/last entry on the page, which stays valid while listings are
+added or removed (no skipped or repeated rows as with OFFSET).
+
+The index follows the database through SQLAlchemy session events: listings
+flushed in a session are applied when that session commits (see
+`ListingIndex.install`). Those events only see this process's ORM sessions:
+other workers sharing the database, bulk `update()`/`delete()` statements
+and raw SQL go unnoticed. To bound how stale the catalog can get,
+`refresh` (called by the catalog handler when `refresh_due()`) compares a
+cheap version stamp of the table (row count, max `updated_at`, max id)
+every `check_interval` seconds and rebuilds the index when it changed, and
+rebuilds it anyway every `reload_interval` seconds (changes that don't
+touch `updated_at`, channel renames).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import sessionmaker
+
+from .models import Channel, ChannelListing
+
+SORTS = ("price", "reach")
+
+# Seconds between two checks of the listings table's version stamp
+STALE_CHECK_INTERVAL = 30.0
+# Seconds after which the index is rebuilt even if the stamp didn't change
+RELOAD_INTERVAL = 600.0
+
+Key = Tuple[float, int]
+
+
+class ListingEntry:
+    __slots__ = ("id", "channel_id", "user_id", "price", "reach", "subscribers", "quality", "category", "handle", "title")
+
+    def __init__(
+        self,
+        id: int,
+        channel_id: int,
+        user_id: int,
+        price: float,
+        reach: int = 0,
+        subscribers: int = 0,
+        quality: float = 0.5,
+        category: Optional[str] = None,
+        handle: Optional[str] = None,
+        title: Optional[str] = None,
+    ):
+        self.id = id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.price = float(price or 0.0)
+        self.reach = int(reach or 0)
+        self.subscribers = int(subscribers or 0)
+        self.quality = float(quality if quality is not None else 0.5)
+        self.category = category
+        self.handle = handle
+        self.title = title
+
+    def key(self, sort: str) -> Key:
+        # Reach is browsed highest first: negate so every array is ascending
+        if sort == "price":
+            return (self.price, self.id)
+        return (-self.reach, self.id)
+
+    @classmethod
+    def from_listing(cls, listing: ChannelListing, channel: Optional[Channel] = None) -> "ListingEntry":
+        return cls(
+            id=listing.id,
+            channel_id=listing.channel_id,
+            user_id=listing.user_id,
+            price=listing.price,
+            reach=listing.reach_24h,
+            subscribers=listing.subscribers,
+            quality=listing.quality_score,
+            category=listing.category,
+            handle=channel.handle if channel is not None else None,
+            title=channel.title if channel is not None else None,
+        )
+
+
+class _Bucket:
+    __slots__ = ("keys",)
+
+    def __init__(self):
+        self.keys: Dict[str, List[Key]] = {sort: [] for sort in SORTS}
+
+    def add(self, entry: ListingEntry) -> None:
+        for sort, keys in self.keys.items():
+            insort(keys, entry.key(sort))
+
+    def remove(self, entry: ListingEntry) -> None:
+        for sort, keys in self.keys.items():
+            key = entry.key(sort)
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def __len__(self) -> int:
+        return len(self.keys["price"])
+
+
+class CatalogPage:
+    """One page of entries plus the cursors to reach its neighbours."""
+
+    __slots__ = ("entries", "sort", "has_prev", "has_next")
+
+    def __init__(self, entries: List[ListingEntry], sort: str, has_prev: bool, has_next: bool):
+        self.entries = entries
+        self.sort = sort
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def first_key(self) -> Optional[Key]:
+        return self.entries[0].key(self.sort) if self.entries else None
+
+    @property
+    def last_key(self) -> Optional[Key]:
+        return self.entries[-1].key(self.sort) if self.entries else None
+
+
+class ListingIndex:
+    def __init__(
+        self,
+        entries: Iterable[ListingEntry] = (),
+        *,
+        check_interval: float = STALE_CHECK_INTERVAL,
+        reload_interval: float = RELOAD_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create an index of `entries`.
+
+        Args:
+            entries: listings to index
+            check_interval: seconds between version stamp checks (`refresh`)
+            reload_interval: seconds after which `refresh` rebuilds anyway
+            clock: monotonic time source, overridable in tests
+        """
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._entries: Dict[int, ListingEntry] = {}
+        self._all = _Bucket()
+        self._categories: Dict[Optional[str], _Bucket] = {}
+        for entry in entries:
+            self._add(entry)
+        self.check_interval = check_interval
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._checked_at = self._loaded_at = clock()
+        self._stamp: Optional[tuple] = None
+        self.reloads = 0
+
+    # -------------------------
+    # Maintenance
+    # -------------------------
+
+    def _add(self, entry: ListingEntry) -> None:
+        self._entries[entry.id] = entry
+        self._all.add(entry)
+        self._categories.setdefault(entry.category, _Bucket()).add(entry)
+
+    def _remove(self, listing_id: int) -> None:
+        entry = self._entries.pop(listing_id, None)
+        if entry is None:
+            return
+        self._all.remove(entry)
+        bucket = self._categories.get(entry.category)
+        if bucket is not None:
+            bucket.remove(entry)
+            if not len(bucket):
+                del self._categories[entry.category]
+
+    def upsert(self, entry: ListingEntry) -> None:
+        with self._lock:
+            self._remove(entry.id)
+            self._add(entry)
+
+    def remove(self, listing_id: int) -> None:
+        with self._lock:
+            self._remove(listing_id)
+
+    def get(self, listing_id: int) -> Optional[ListingEntry]:
+        return self._entries.get(listing_id)
+
+    def categories(self) -> List[Optional[str]]:
+        with self._lock:
+            return sorted(self._categories, key=lambda c: (c is None, c or ""))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -------------------------
+    # Queries
+    # -------------------------
+
+    @staticmethod
+    def _matches(entry: ListingEntry, min_price, max_price, min_reach) -> bool:
+        if min_price is not None and entry.price < min_price:
+            return False
+        if max_price is not None and entry.price > max_price:
+            return False
+        if min_reach is not None and entry.reach < min_reach:
+            return False
+        return True
+
+    def _range(self, keys: List[Key], sort: str, min_price, max_price, min_reach) -> Tuple[int, int]:
+        """Slice of `keys` that can satisfy the filter on the sort column."""
+        lo, hi = 0, len(keys)
+        if sort == "price":
+            if min_price is not None:
+                lo = bisect_left(keys, (min_price, -1))
+            if max_price is not None:
+                hi = bisect_right(keys, (max_price, float("inf")))
+        elif min_reach is not None:
+            hi = bisect_right(keys, (-min_reach, float("inf")))
+        return lo, hi
+
+    def page(
+        self,
+        *,
+        sort: str = "price",
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_reach: Optional[int] = None,
+        after: Optional[Key] = None,
+        before: Optional[Key] = None,
+        limit: int = 5,
+    ) -> CatalogPage:
+        """Return up to `limit` entries after (or before) a keyset cursor.
+
+        `category=None` browses every category. Filters on the sort column
+        are resolved by bisect; the others are checked while scanning.
+        """
+        if sort not in SORTS:
+            raise ValueError(f"unknown sort: {sort}")
+        with self._lock:
+            bucket = self._all if category is None else self._categories.get(category)
+            if bucket is None:
+                return CatalogPage([], sort, False, False)
+            keys = bucket.keys[sort]
+            lo, hi = self._range(keys, sort, min_price, max_price, min_reach)
+            entries = self._entries
+
+            found: List[ListingEntry] = []
+            if before is not None:
+                i = min(hi, bisect_left(keys, before)) - 1
+                while i >= lo and len(found) < limit:
+                    entry = entries[keys[i][1]]
+                    if self._matches(entry, min_price, max_price, min_reach):
+                        found.append(entry)
+                    i -= 1
+                found.reverse()
+                has_prev = any(
+                    self._matches(entries[keys[j][1]], min_price, max_price, min_reach) for j in range(i, lo - 1, -1)
+                )
+                return CatalogPage(found, sort, has_prev, True)
+
+            i = max(lo, bisect_right(keys, after)) if after is not None else lo
+            while i < hi and len(found) < limit:
+                entry = entries[keys[i][1]]
+                if self._matches(entry, min_price, max_price, min_reach):
+                    found.append(entry)
+                i += 1
+            has_next = any(
+                self._matches(entries[keys[j][1]], min_price, max_price, min_reach) for j in range(i, hi)
+            )
+            return CatalogPage(found, sort, after is not None, has_next)
+
+    def count(
+        self,
+        *,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_reach: Optional[int] = None,
+    ) -> int:
+        """Number of entries matching the filter."""
+        with self._lock:
+            bucket = self._all if category is None else self._categories.get(category)
+            if bucket is None:
+                return 0
+            keys = bucket.keys["price"]
+            lo, hi = self._range(keys, "price", min_price, max_price, None)
+            if min_reach is None:
+                return hi - lo
+            return sum(1 for j in range(lo, hi) if self._entries[keys[j][1]].reach >= min_reach)
+
+    # -------------------------
+    # Database integration
+    # -------------------------
+
+    @staticmethod
+    def _load_entries(session) -> List[ListingEntry]:
+        rows = (
+            session.query(ChannelListing, Channel)
+            .join(Channel, Channel.id == ChannelListing.channel_id)
+            .filter(ChannelListing.is_active == True, ChannelListing.is_available == True)  # noqa: E712
+            .all()
+        )
+        return [ListingEntry.from_listing(listing, channel) for listing, channel in rows]
+
+    @staticmethod
+    def _version_stamp(session) -> tuple:
+        """Changes whenever a listing is added, deleted or updated with `updated_at`."""
+        return tuple(session.execute(
+            select(func.count(ChannelListing.id), func.max(ChannelListing.updated_at), func.max(ChannelListing.id))
+        ).one())
+
+    @classmethod
+    def load(cls, session, **kwargs) -> "ListingIndex":
+        """Build the index from every active, available listing."""
+        stamp = cls._version_stamp(session)
+        index = cls(cls._load_entries(session), **kwargs)
+        index._stamp = stamp
+        return index
+
+    def refresh_due(self) -> bool:
+        """Whether `refresh` would query the database now."""
+        return self._clock() - self._checked_at >= self.check_interval
+
+    def refresh(self, session, force: bool = False) -> bool:
+        """Rebuild the index if the listings changed behind its back.
+
+        Checks the version stamp (one aggregate query) at most every
+        `check_interval` seconds and reloads when it differs from the one
+        seen at the last load, or when the last load is older than
+        `reload_interval`. Returns True when the index was rebuilt.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            # Another handler is already refreshing
+            return False
+        try:
+            return self._refresh(session, force)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, session, force: bool) -> bool:
+        now = self._clock()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        # Read before the rows: a change landing in between shows up next time
+        stamp = self._version_stamp(session)
+        if not force and stamp == self._stamp and now - self._loaded_at < self.reload_interval:
+            return False
+        fresh = ListingIndex(self._load_entries(session))
+        with self._lock:
+            self._entries, self._all, self._categories = fresh._entries, fresh._all, fresh._categories
+        self._stamp = stamp
+        self._loaded_at = now
+        self.reloads += 1
+        return True
+
+    def install(self, session_factory: sessionmaker) -> None:
+        """Keep the index in sync with listings committed through `session_factory`."""
+
+        @event.listens_for(session_factory, "after_flush")
+        def _collect(session, flush_context):
+            changes = session.info.setdefault("listing_index_changes", {})
+            for obj in session.deleted:
+                if isinstance(obj, ChannelListing):
+                    changes[obj.id] = None
+            for obj in list(session.new) + list(session.dirty):
+                if not isinstance(obj, ChannelListing):
+                    continue
+                if obj.is_active and obj.is_available:
+                    channel = session.get(Channel, obj.channel_id)
+                    changes[obj.id] = ListingEntry.from_listing(obj, channel)
+                else:
+                    changes[obj.id] = None
+
+        @event.listens_for(session_factory, "after_commit")
+        def _apply(session):
+            changes = session.info.pop("listing_index_changes", None)
+            if not changes:
+                return
+            with self._lock:
+                for listing_id, entry in changes.items():
+                    self._remove(listing_id)
+                    if entry is not None:
+                        self._add(entry)
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _discard(session):
+            session.info.pop("listing_index_changes", None)
+
+
+def encode_cursor(key: Key) -> str:
+    """callback_data form of a keyset key ("value:id").
+
+    `repr` round-trips floats exactly, so the cursor lands on the same key.
+    """
+    value, listing_id = key
+    return f"{value!r}:{listing_id}"
+
+
+def decode_cursor(text: str) -> Key:
+    value, listing_id = text.rsplit(":", 1)
+    return (float(value), int(listing_id))
+
+
+__all__ = ["CatalogPage", "ListingEntry", "ListingIndex", "decode_cursor", "encode_cursor"]
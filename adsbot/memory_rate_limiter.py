@@ -0,0 +1,471 @@
+"""In-memory rate limiter for single-process deployments.
+
+Same fixed-window semantics and return values as `RedisRateLimiter`, without
+a network or disk round trip per request.
+
+Design:
+- Key space split into N stripes; each stripe owns a dict shard and a lock,
+  so unrelated keys rarely contend.
+- Per-key state is a small `__slots__` object (window start, count, block).
+- Expired keys are removed by a hashed timer wheel (one bucket per second),
+  swept lazily from the request path; no background thread is needed.
+- Optional periodic JSON snapshot to disk so a restart keeps active blocks
+  and counters (warm restart).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .rate_limiter import RateLimitCheck, RateLimitPolicy, slowdown_delay
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyState:
+    __slots__ = ("window_start", "count", "blocked_until", "expires_tick")
+
+    def __init__(self, window_start: int, count: int = 0, blocked_until: int = 0):
+        self.window_start = window_start
+        self.count = count
+        self.blocked_until = blocked_until
+        self.expires_tick = 0
+
+
+class _Stripe:
+    __slots__ = ("lock", "table", "wheel")
+
+    def __init__(self, wheel_slots: int):
+        self.lock = threading.Lock()
+        self.table: Dict[str, _KeyState] = {}
+        self.wheel: List[Set[str]] = [set() for _ in range(wheel_slots)]
+
+
+class InMemoryRateLimiter:
+    def __init__(
+        self,
+        *,
+        window_seconds: int = 60,
+        max_requests: int = 5,
+        mode: str = "block",
+        stripes: int = 64,
+        wheel_slots: int = 128,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """Create an in-memory rate limiter.
+
+        Args:
+            window_seconds: size of fixed window in seconds
+            max_requests: allowed requests per window before blocking
+            mode: 'block' or 'slowdown' (see `RedisRateLimiter`)
+            stripes: number of lock stripes (rounded up to a power of two)
+            wheel_slots: number of one-second buckets in the expiry wheel
+            snapshot_path: JSON file used to restore/persist state (optional)
+            snapshot_interval: seconds between background snapshots (optional)
+            clock: time source, overridable in tests
+        """
+        self.window = int(window_seconds)
+        self.max_requests = int(max_requests)
+        if mode not in ("block", "slowdown"):
+            raise ValueError("mode must be 'block' or 'slowdown'")
+        self.mode = mode
+        self._clock = clock
+
+        size = 1
+        while size < max(1, int(stripes)):
+            size <<= 1
+        self._mask = size - 1
+        self._wheel_slots = max(1, int(wheel_slots))
+        self._stripes = [_Stripe(self._wheel_slots) for _ in range(size)]
+
+        self._sweep_lock = threading.Lock()
+        self._last_swept_tick = int(self._clock())
+
+        self.snapshot_path = snapshot_path
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread: Optional[threading.Thread] = None
+        if snapshot_path:
+            self.load_snapshot()
+            if snapshot_interval:
+                self._snapshot_thread = threading.Thread(
+                    target=self._snapshot_loop,
+                    args=(float(snapshot_interval),),
+                    name="rate-limiter-snapshot",
+                    daemon=True,
+                )
+                self._snapshot_thread.start()
+
+    # -------------------------
+    # Internals
+    # -------------------------
+
+    def _window_start(self, now: Optional[float] = None, window: Optional[int] = None) -> int:
+        if now is None:
+            now = self._clock()
+        window = window or self.window
+        return int(now // window) * window
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) & self._mask]
+
+    def _schedule(self, stripe: _Stripe, key: str, state: _KeyState, expires: int) -> None:
+        """Put key in the wheel bucket of its expiry tick. Caller holds the lock."""
+        if expires != state.expires_tick:
+            state.expires_tick = expires
+            stripe.wheel[expires % self._wheel_slots].add(key)
+
+    def _maybe_sweep(self, now: int) -> None:
+        if now <= self._last_swept_tick:
+            return
+        # Only one caller sweeps; everybody else keeps serving requests.
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self.sweep(now)
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self, now: Optional[int] = None) -> int:
+        """Advance the timer wheel up to `now` and drop expired keys.
+
+        Returns the number of keys removed.
+        """
+        if now is None:
+            now = int(self._clock())
+        start = self._last_swept_tick + 1
+        # A full revolution visits every bucket once; no need to go further.
+        start = max(start, now - self._wheel_slots + 1)
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                for tick in range(start, now + 1):
+                    slot = tick % self._wheel_slots
+                    bucket = stripe.wheel[slot]
+                    if not bucket:
+                        continue
+                    keep = set()
+                    for key in bucket:
+                        state = stripe.table.get(key)
+                        if state is None:
+                            continue
+                        if state.expires_tick <= now:
+                            del stripe.table[key]
+                            removed += 1
+                        elif state.expires_tick % self._wheel_slots == slot:
+                            # Due on a later revolution of the wheel.
+                            keep.add(key)
+                    stripe.wheel[slot] = keep
+        self._last_swept_tick = max(self._last_swept_tick, now)
+        return removed
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    async def increment_and_check(
+        self, api_key: str, policy: Optional[RateLimitPolicy] = None
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Increment counter for api_key and check status.
+
+        Returns (allowed, remaining, retry_after_seconds_or_None, slowdown_seconds_or_None),
+        with the same meaning as `RedisRateLimiter.increment_and_check`; `policy`
+        overrides the limiter's own window/limit/mode for this call.
+        """
+        return self.increment_and_check_sync(api_key, policy)
+
+    def increment_and_check_sync(
+        self, api_key: str, policy: Optional[RateLimitPolicy] = None
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Synchronous variant of `increment_and_check` (no event loop needed)."""
+        if policy is None:
+            window, max_requests, mode = self.window, self.max_requests, self.mode
+        else:
+            window, max_requests, mode = policy.window_seconds, policy.max_requests, policy.mode
+        now = int(self._clock())
+        self._maybe_sweep(now)
+        window_start = self._window_start(now, window)
+        stripe = self._stripe(api_key)
+
+        with stripe.lock:
+            state = stripe.table.get(api_key)
+            if state is None:
+                state = _KeyState(window_start)
+                stripe.table[api_key] = state
+            elif state.blocked_until > now:
+                return False, 0, state.blocked_until - now, None
+            if state.window_start != window_start:
+                state.window_start = window_start
+                state.count = 0
+            state.count += 1
+            cur = state.count
+
+            if cur > max_requests and mode == "block":
+                state.blocked_until = now + window
+                self._schedule(stripe, api_key, state, max(window_start + window, state.blocked_until))
+                return False, 0, window, None
+            self._schedule(stripe, api_key, state, max(window_start + window, state.blocked_until))
+
+        if cur > max_requests:
+            return True, 0, None, slowdown_delay(cur - max_requests)
+        return True, max(0, max_requests - cur), None, None
+
+    async def increment_and_check_many(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Evaluate several limits atomically; see `RedisRateLimiter.increment_and_check_many`."""
+        return self.increment_and_check_many_sync(checks)
+
+    def increment_and_check_many_sync(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Synchronous variant of `increment_and_check_many`."""
+        if not checks:
+            return True, 0, None, None
+        now = int(self._clock())
+        self._maybe_sweep(now)
+
+        resolved = []
+        for dimension, key, policy in checks:
+            if policy is None:
+                policy = RateLimitPolicy(self.max_requests, self.window, self.mode)
+            name = f"{dimension}:{key}"
+            resolved.append((name, self._stripe(name), policy))
+
+        # Lock every stripe involved, in a fixed order to avoid deadlocks
+        locks = sorted({id(stripe): stripe for _, stripe, _ in resolved}.items())
+        for _, stripe in locks:
+            stripe.lock.acquire()
+        try:
+            retry_after = 0
+            for name, stripe, _ in resolved:
+                state = stripe.table.get(name)
+                if state is not None and state.blocked_until > now:
+                    retry_after = max(retry_after, state.blocked_until - now)
+            if retry_after:
+                return False, 0, retry_after, None
+
+            remaining = None
+            blocked = 0
+            over = 0
+            for name, stripe, policy in resolved:
+                window = policy.window_seconds
+                window_start = self._window_start(now, window)
+                state = stripe.table.get(name)
+                if state is None:
+                    state = stripe.table[name] = _KeyState(window_start)
+                if state.window_start != window_start:
+                    state.window_start = window_start
+                    state.count = 0
+                state.count += 1
+                rem = max(0, policy.max_requests - state.count)
+                remaining = rem if remaining is None else min(remaining, rem)
+                if state.count > policy.max_requests:
+                    if policy.mode == "block":
+                        state.blocked_until = now + window
+                        blocked = max(blocked, window)
+                    else:
+                        over = max(over, state.count - policy.max_requests)
+                self._schedule(stripe, name, state, max(window_start + window, state.blocked_until))
+        finally:
+            for _, stripe in locks:
+                stripe.lock.release()
+
+        if blocked:
+            return False, 0, blocked, None
+        return True, remaining or 0, None, slowdown_delay(over) if over else None
+
+    async def is_blocked(self, api_key: str) -> Optional[int]:
+        """Return seconds until unblocked or None."""
+        now = int(self._clock())
+        stripe = self._stripe(api_key)
+        with stripe.lock:
+            state = stripe.table.get(api_key)
+            if state is None or state.blocked_until <= now:
+                return None
+            return state.blocked_until - now
+
+    def __len__(self) -> int:
+        return sum(len(stripe.table) for stripe in self._stripes)
+
+    # -------------------------
+    # Snapshot (warm restart)
+    # -------------------------
+
+    def save_snapshot(self, path: Optional[str] = None) -> int:
+        """Write live state to `path` (default: `snapshot_path`) atomically.
+
+        Returns the number of keys written.
+        """
+        path = path or self.snapshot_path
+        if not path:
+            raise ValueError("no snapshot path configured")
+        now = int(self._clock())
+        entries = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key, state in stripe.table.items():
+                    if state.expires_tick > now:
+                        entries[key] = [state.window_start, state.count, state.blocked_until, state.expires_tick]
+
+        payload = {"window": self.window, "saved_at": now, "keys": entries}
+        target = Path(path)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, separators=(",", ":"))
+        os.replace(tmp, target)
+        return len(entries)
+
+    def load_snapshot(self, path: Optional[str] = None) -> int:
+        """Restore state saved by `save_snapshot`, skipping expired keys.
+
+        Returns the number of keys restored; a missing or unreadable file
+        restores nothing.
+        """
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rate limiter snapshot unreadable, starting cold: {e}")
+            return 0
+        if int(payload.get("window", 0)) != self.window:
+            # Counters from a different window size are meaningless.
+            return 0
+
+        now = int(self._clock())
+        restored = 0
+        for key, (window_start, count, blocked_until, expires) in payload.get("keys", {}).items():
+            if int(expires) <= now:
+                continue
+            state = _KeyState(int(window_start), int(count), int(blocked_until))
+            stripe = self._stripe(key)
+            with stripe.lock:
+                stripe.table[key] = state
+                self._schedule(stripe, key, state, int(expires))
+            restored += 1
+        return restored
+
+    def _snapshot_loop(self, interval: float) -> None:
+        while not self._snapshot_stop.wait(interval):
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.warning(f"Rate limiter snapshot failed: {e}")
+
+    def close(self) -> None:
+        """Stop the snapshot thread and write a final snapshot if configured."""
+        self._snapshot_stop.set()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join(timeout=5)
+            self._snapshot_thread = None
+        if self.snapshot_path:
+            self.save_snapshot()
+
+
+class TokenBucketRateLimiter:
+    """Per-key token bucket with the same interface as `InMemoryRateLimiter`.
+
+    Each key holds up to `capacity` tokens refilled at `refill_rate` tokens
+    per second; a request spends one token. Unlike a fixed window this allows
+    short bursts while keeping the sustained rate bounded, which suits
+    interactive traffic (e.g. Telegram button taps).
+    """
+
+    def __init__(
+        self,
+        *,
+        capacity: int = 5,
+        refill_rate: float = 1.0,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create a token bucket limiter.
+
+        Args:
+            capacity: maximum burst size (tokens per key)
+            refill_rate: tokens added per second
+            max_keys: idle (full) buckets are pruned past this many keys
+            clock: monotonic time source, overridable in tests
+        """
+        if capacity < 1 or refill_rate <= 0:
+            raise ValueError("capacity must be >= 1 and refill_rate positive")
+        self.capacity = int(capacity)
+        self.refill_rate = float(refill_rate)
+        self.max_keys = int(max_keys)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> [tokens, last_refill]
+        self._buckets: Dict[str, List[float]] = {}
+
+    def _prune(self, now: float) -> None:
+        full = [
+            key
+            for key, (tokens, last) in self._buckets.items()
+            if tokens + (now - last) * self.refill_rate >= self.capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+
+    async def increment_and_check(
+        self, api_key: str, policy: Optional[RateLimitPolicy] = None
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Spend one token of api_key; see `increment_and_check_sync`."""
+        return self.increment_and_check_sync(api_key, policy)
+
+    def increment_and_check_sync(
+        self, api_key: str, policy: Optional[RateLimitPolicy] = None
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Spend one token of api_key.
+
+        Returns (allowed, remaining_tokens, retry_after_seconds_or_None, None).
+        A `policy` maps to capacity=max_requests and
+        refill_rate=max_requests/window_seconds for this call.
+        """
+        if policy is None:
+            capacity, rate = self.capacity, self.refill_rate
+        else:
+            capacity = policy.max_requests
+            rate = policy.max_requests / policy.window_seconds
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[api_key] = [float(capacity), now]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                return False, 0, max(1, math.ceil((1 - bucket[0]) / rate)), None
+            bucket[0] -= 1
+            return True, int(bucket[0]), None, None
+
+    async def is_blocked(self, api_key: str) -> Optional[int]:
+        """Return seconds until a token is available, or None."""
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                return None
+            tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_rate)
+        if tokens >= 1:
+            return None
+        return max(1, math.ceil((1 - tokens) / self.refill_rate))
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+__all__ = ["InMemoryRateLimiter", "TokenBucketRateLimiter"]
@@ -0,0 +1,346 @@
+"""Latency histograms for handlers and jobs, exported in Prometheus text format.
+
+Every handler registered by `build_application` (and every scheduler job) is
+timed by `instrument_application` / `timed_job`. Besides wall time, each run
+accumulates the time spent in three kinds of I/O while it was active:
+
+- "db": SQL statements (SQLAlchemy cursor events), including those run on
+  the `DBExecutor` pool, which carries the handler's context over;
+- "telegram": Bot API HTTP requests (`TimedHTTPXRequest`);
+- "openai": OpenAI calls, wrapped in `track_time("openai")`.
+
+The attribution uses a context variable, so concurrent handlers don't mix
+up their numbers. Values go into fixed-bucket histograms
+(`adsbot_handler_seconds{handler,component}`), exported together with
+estimated p50/p95/p99 by `MetricsRegistry.render()` and served on
+`http://<host>:<port>/metrics` by `start_metrics_server`.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Seconds; the last bucket is +Inf
+BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+COMPONENTS = ("wall", "db", "telegram", "openai")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding rank q."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # +Inf bucket: best we know is its lower bound
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, component: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get((name, component))
+            if histogram is None:
+                histogram = self._histograms[(name, component)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def histogram(self, name: str, component: str = "wall") -> Optional[Histogram]:
+        return self._histograms.get((name, component))
+
+    def add_collector(self, name: str, collector: Callable[[], Dict[str, float]]) -> None:
+        """Register (or replace) a callable returning extra gauges ({metric_name: value})."""
+        self._collectors[name] = collector
+
+    def render(self) -> str:
+        """Prometheus text exposition of all histograms and gauges."""
+        lines = [
+            "# HELP adsbot_handler_seconds Handler and job latency by component.",
+            "# TYPE adsbot_handler_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP adsbot_handler_seconds_quantile Estimated latency quantiles.",
+            "# TYPE adsbot_handler_seconds_quantile gauge",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for (name, component), histogram in items:
+                labels = f'handler="{_escape(name)}",component="{component}"'
+                cumulative = 0
+                for bound, n in zip(self.buckets, histogram.counts):
+                    cumulative += n
+                    lines.append(f'adsbot_handler_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'adsbot_handler_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"adsbot_handler_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"adsbot_handler_seconds_count{{{labels}}} {histogram.count}")
+                for q in QUANTILES:
+                    quantile_lines.append(
+                        f'adsbot_handler_seconds_quantile{{{labels},quantile="{q}"}} {histogram.quantile(q):.6f}'
+                    )
+        lines.extend(quantile_lines)
+        for collector in list(self._collectors.values()):
+            try:
+                gauges = collector()
+            except Exception as e:  # a broken collector must not break /metrics
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for metric, value in sorted(gauges.items()):
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+
+# -------------------------
+# Time attribution
+# -------------------------
+
+
+class _Timing:
+    __slots__ = ("components", "lock", "parent")
+
+    def __init__(self, parent: Optional["_Timing"] = None):
+        self.components = dict.fromkeys(COMPONENTS[1:], 0.0)
+        self.lock = threading.Lock()
+        # A handler calling another handler: I/O counts for both
+        self.parent = parent
+
+    def add(self, component: str, seconds: float) -> None:
+        with self.lock:
+            self.components[component] = self.components.get(component, 0.0) + seconds
+
+
+_current: contextvars.ContextVar[Optional[_Timing]] = contextvars.ContextVar("adsbot_timing", default=None)
+
+
+def add_time(component: str, seconds: float) -> None:
+    """Charge `seconds` of `component` I/O to the running handler, if any."""
+    timing = _current.get()
+    while timing is not None:
+        timing.add(component, seconds)
+        timing = timing.parent
+
+
+@contextmanager
+def track_time(component: str):
+    """Time a block as `component` I/O of the running handler."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(component, time.perf_counter() - started)
+
+
+@contextmanager
+def measure(name: str, registry: Optional[MetricsRegistry] = None):
+    """Record wall time and I/O breakdown of the enclosed block under `name`."""
+    registry = registry or REGISTRY
+    timing = _Timing(_current.get())
+    token = _current.set(timing)
+    started = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        wall = time.perf_counter() - started
+        _current.reset(token)
+        registry.observe(name, "wall", wall)
+        for component, seconds in timing.components.items():
+            registry.observe(name, component, seconds)
+
+
+def timed_handler(callback: Callable, name: Optional[str] = None, registry: Optional[MetricsRegistry] = None):
+    """Wrap an async PTB callback so each call is measured."""
+    if getattr(callback, "__adsbot_timed__", False):
+        return callback
+    name = name or getattr(callback, "__name__", None) or type(callback).__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with measure(name, registry):
+            return await callback(update, context)
+
+    wrapper.__adsbot_timed__ = True
+    return wrapper
+
+
+def timed_job(name: str, func: Callable, registry: Optional[MetricsRegistry] = None):
+    """Wrap a (sync) scheduler job so each run is measured as `job:<name>`."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure(f"job:{name}", registry):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+# -------------------------
+# Installation
+# -------------------------
+
+
+def _iter_handlers(handlers: Iterable[Any]):
+    from telegram.ext import ConversationHandler
+
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _iter_handlers(state_handlers)
+            yield from _iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_application(application, registry: Optional[MetricsRegistry] = None) -> int:
+    """Time every handler callback registered on `application` so far.
+
+    Call after all handlers are added. CallbackRouter routes are timed one by
+    one. Returns the number of callbacks wrapped.
+    """
+    from .callback_router import CallbackRouter
+
+    wrapped = 0
+    for group in application.handlers.values():
+        for handler in _iter_handlers(group):
+            if isinstance(handler, CallbackRouter):
+                for route in handler.routes:
+                    route.callback = timed_handler(route.callback, registry=registry)
+                    wrapped += 1
+            elif hasattr(handler, "callback"):
+                handler.callback = timed_handler(handler.callback, registry=registry)
+                wrapped += 1
+    return wrapped
+
+
+_db_timing_installed = False
+
+
+def install_db_timing() -> None:
+    """Charge SQL statement time to the running handler (all engines)."""
+    global _db_timing_installed
+    if _db_timing_installed:
+        return
+    _db_timing_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("adsbot_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("adsbot_query_start")
+        if starts:
+            add_time("db", time.perf_counter() - starts.pop())
+
+    @event.listens_for(Engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("adsbot_query_start"):
+            add_time("db", time.perf_counter() - conn.info["adsbot_query_start"].pop())
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest charging Bot API round trips to the running handler."""
+
+    async def do_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            add_time("telegram", time.perf_counter() - started)
+
+
+# -------------------------
+# /metrics endpoint
+# -------------------------
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9464, registry: Optional[MetricsRegistry] = None):
+    """Serve `registry.render()` on http://host:port/metrics from a daemon thread."""
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802 - http.server API
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa: A002 - silence request log
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="adsbot-metrics", daemon=True).start()
+    logger.info(f"Metrics available on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+__all__ = [
+    "BUCKETS",
+    "Histogram",
+    "MetricsRegistry",
+    "REGISTRY",
+    "TimedHTTPXRequest",
+    "add_time",
+    "install_db_timing",
+    "instrument_application",
+    "measure",
+    "start_metrics_server",
+    "timed_handler",
+    "timed_job",
+    "track_time",
+]
@@ -1,25 +1,233 @@
 """ASGI middleware for FastAPI that enforces API key rate limits.
 
 Usage: add `app.add_middleware(RateLimitMiddleware, limiter=limiter)` where
-`limiter` is an instance of `RedisRateLimiter` from `adsbot.rate_limiter`.
+`limiter` is a rate limiter from `adsbot.rate_limiter` or
+`adsbot.memory_rate_limiter`.
+
+Per-route limits are configured with a policy table compiled once at startup:
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=limiter,
+        routes=[
+            RoutePolicy("/ai/generate", max_requests=2, window_seconds=60),
+            RoutePolicy("/reports", max_requests=10, window_seconds=60, mode="slowdown"),
+        ],
+    )
+
+Requests not matching any route prefix use the limiter's own settings, or
+the key's quota tier when it comes from the key registry
+(`adsbot.api_keys.KeyRegistry`).
+
+Per-IP and global limits can be added with `ip_policy` / `global_policy`.
+When more than one dimension applies, all of them are evaluated in a single
+`increment_and_check_many` call (one Redis round trip or one SQLite
+transaction) and the most restrictive verdict wins.
+
+In slowdown mode over-limit requests wait in a leaky-bucket queue per key
+and route (`adsbot.slowdown_queue.LeakyBucketQueue`), released at the rate
+allowed by the slowdown limit that applies (route, tier or default);
+when a key's queue is full, or the request would wait more than the queue's
+`max_wait` (10s by default), it gets 429 with Retry-After immediately.
 """
 
 from __future__ import annotations
 
 import json
-from typing import Callable, Optional
+from dataclasses import dataclass
+from urllib.parse import unquote_plus
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 from starlette.types import ASGIApp, Receive, Scope, Send
 
 from adsbot import api_keys
-from .rate_limiter import RedisRateLimiter
-import asyncio
+from .rate_limiter import RateLimitCheck, RateLimitPolicy, RedisRateLimiter
+from .slowdown_queue import LeakyBucketQueue
+
+_API_KEY_HEADER = b"x-api-key"
+_API_KEY_PARAM = b"api_key="
+
+# Upper bound on cached api_key -> KeyInfo entries (cleared when exceeded)
+ROLE_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """Rate limit for every path under `prefix`.
+
+    Prefixes match whole path segments: "/ai" matches "/ai" and "/ai/x",
+    not "/aix". `mode` selects the limiter algorithm ('block' or
+    'slowdown'); roles in `exempt_roles` are never limited on this route.
+    """
+
+    prefix: str
+    max_requests: int
+    window_seconds: int
+    mode: str = "block"
+    exempt_roles: FrozenSet[str] = frozenset({"admin"})
+
+
+class _CompiledRoute:
+    __slots__ = ("prefix", "prefix_slash", "policy", "exempt_roles", "key_suffix")
+
+    def __init__(self, route: RoutePolicy):
+        self.prefix = route.prefix.rstrip("/") or "/"
+        self.prefix_slash = self.prefix if self.prefix.endswith("/") else self.prefix + "/"
+        self.policy = RateLimitPolicy(route.max_requests, route.window_seconds, route.mode)
+        self.exempt_roles = frozenset(route.exempt_roles)
+        # Route counters are separate from the key's global counter
+        self.key_suffix = "@" + self.prefix
+
+    def matches(self, path: str) -> bool:
+        return path == self.prefix or path.startswith(self.prefix_slash)
+
+
+def _first_segment(path: str) -> str:
+    end = path.find("/", 1)
+    return path[1:end] if end != -1 else path[1:]
+
+
+def compile_routes(routes: Iterable[RoutePolicy]) -> Dict[str, Tuple[_CompiledRoute, ...]]:
+    """Index route policies by first path segment, longest prefix first."""
+    table: Dict[str, List[_CompiledRoute]] = {}
+    seen = set()
+    for route in routes:
+        compiled = _CompiledRoute(route)
+        if compiled.prefix in seen:
+            raise ValueError(f"duplicate rate limit route prefix: {compiled.prefix}")
+        seen.add(compiled.prefix)
+        segment = "" if compiled.prefix == "/" else _first_segment(compiled.prefix)
+        table.setdefault(segment, []).append(compiled)
+    return {
+        segment: tuple(sorted(entries, key=lambda r: len(r.prefix), reverse=True))
+        for segment, entries in table.items()
+    }
 
 
 class RateLimitMiddleware:
-    def __init__(self, app: ASGIApp, *, limiter: RedisRateLimiter):
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        limiter: RedisRateLimiter,
+        routes: Optional[Iterable[RoutePolicy]] = None,
+        ip_policy: Optional[RateLimitPolicy] = None,
+        global_policy: Optional[RateLimitPolicy] = None,
+        slowdown_queue: Optional[LeakyBucketQueue] = None,
+    ):
         self.app = app
         self.limiter = limiter
+        self._routes = compile_routes(routes or ())
+        self.ip_policy = ip_policy
+        self.global_policy = global_policy
+        # Multi-dimension configs always go through increment_and_check_many
+        # so each counter lives under the same name on every request.
+        self._multi = bool(self._routes or ip_policy or global_policy)
+        if self._multi and not hasattr(limiter, "increment_and_check_many"):
+            raise TypeError(f"{type(limiter).__name__} does not support multi-dimensional limits")
+        if slowdown_queue is None:
+            # Default release rate: the limiter's own limit (policies pass theirs)
+            window = getattr(limiter, "window", 60) or 60
+            max_requests = getattr(limiter, "max_requests", 1) or 1
+            slowdown_queue = LeakyBucketQueue(rate=max_requests / window)
+        self.slowdown_queue = slowdown_queue
+        self._keys: Dict[str, Optional[api_keys.KeyInfo]] = {}
+        self._keys_version = api_keys.KEYS_VERSION
+
+    def _find_api_key(self, scope: Scope) -> Optional[str]:
+        # ASGI header names are already lowercase bytes: no decoding needed
+        for name, value in scope.get("headers") or ():
+            if name == _API_KEY_HEADER:
+                return value.decode("latin-1")
+
+        qs = scope.get("query_string") or b""
+        start = qs.find(_API_KEY_PARAM)
+        while start != -1:
+            if start == 0 or qs[start - 1:start] == b"&":
+                start += len(_API_KEY_PARAM)
+                end = qs.find(b"&", start)
+                # Same value as request.query_params: "%2B" -> "+", "+" -> " "
+                return unquote_plus(qs[start:end if end != -1 else None].decode("latin-1"))
+            start = qs.find(_API_KEY_PARAM, start + 1)
+        return None
+
+    def _key_info(self, api_key: str) -> Optional[api_keys.KeyInfo]:
+        api_keys.check_registry()
+        if self._keys_version != api_keys.KEYS_VERSION or len(self._keys) >= ROLE_CACHE_SIZE:
+            self._keys.clear()
+            self._keys_version = api_keys.KEYS_VERSION
+        try:
+            return self._keys[api_key]
+        except KeyError:
+            info = self._keys[api_key] = api_keys.get_key_info(api_key)
+            return info
+
+    def _route(self, path: str) -> Optional[_CompiledRoute]:
+        routes = self._routes
+        if not routes:
+            return None
+        for route in routes.get(_first_segment(path), ()):
+            if route.matches(path):
+                return route
+        for route in routes.get("", ()):
+            return route
+        return None
+
+    def _checks(
+        self, scope: Scope, api_key: Optional[str], info: Optional[api_keys.KeyInfo]
+    ) -> List[RateLimitCheck]:
+        """Dimensions that apply to this request (empty when exempt)."""
+        role = info.role if info is not None else None
+        route = self._route(scope.get("path", "/"))
+        exempt = route.exempt_roles if route is not None else ("admin",)
+        if role in exempt:
+            return []
+
+        checks: List[RateLimitCheck] = []
+        if role is not None:
+            if role != "admin":
+                # Admins are exempt from the per-key limit
+                checks.append(("key", api_key, info.policy))
+            if route is not None:
+                checks.append(("route", api_key + route.key_suffix, route.policy))
+        if self.ip_policy is not None:
+            client = scope.get("client")
+            if client:
+                checks.append(("ip", client[0], self.ip_policy))
+        if self.global_policy is not None:
+            checks.append(("global", "*", self.global_policy))
+        return checks
+
+    def _slowdown_rate(self, checks: List[RateLimitCheck]) -> Optional[float]:
+        """Release rate (requests/second) of the slowest slowdown limit among `checks`.
+
+        None when only the limiter's own limit applies (the queue's default rate).
+        """
+        rates = [
+            policy.max_requests / policy.window_seconds
+            for _, _, policy in checks
+            if policy is not None and policy.mode == "slowdown"
+        ]
+        return min(rates) if rates else None
+
+    @staticmethod
+    def _client_ip(scope: Scope) -> str:
+        client = scope.get("client")
+        return client[0] if client else "-"
+
+    @staticmethod
+    async def _reject(send: Send, retry_after) -> None:
+        # Return 429
+        headers_out = [(b"content-type", b"application/json"), (b"retry-after", str(retry_after).encode())]
+
+        body = json.dumps({"detail": "Rate limit exceeded", "retry_after": retry_after}).encode()
+
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": headers_out,
+        })
+        await send({"type": "http.response.body", "body": body})
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         # Only handle HTTP requests
@@ -27,51 +235,45 @@ class RateLimitMiddleware:
             await self.app(scope, receive, send)
             return
 
-        headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
-
-        # Extract API key from header or querystring
-        api_key = headers.get("x-api-key")
-        if not api_key:
-            # try querystring
-            qs = scope.get("query_string", b"").decode()
-            for part in qs.split("&"):
-                if part.startswith("api_key="):
-                    api_key = part.split("=", 1)[1]
-                    break
-
-        role = api_keys.get_role(api_key) if api_key else None
-        # Admins are exempt
-        if role == "admin":
-            await self.app(scope, receive, send)
-            return
+        api_key = self._find_api_key(scope)
+        info = self._key_info(api_key) if api_key else None
 
-        # If unknown key, treat as unauthenticated and pass through (or could reject)
-        if role != "user":
-            await self.app(scope, receive, send)
-            return
+        if not self._multi:
+            # If unknown key, treat as unauthenticated and pass through (or could reject)
+            # Admins are exempt
+            if info is None or info.role == "admin":
+                await self.app(scope, receive, send)
+                return
+            checks = [("key", api_key, info.policy)]
+            if info.policy is not None:
+                result = await self.limiter.increment_and_check(api_key, info.policy)
+            else:
+                result = await self.limiter.increment_and_check(api_key)
+        else:
+            checks = self._checks(scope, api_key, info)
+            if not checks:
+                await self.app(scope, receive, send)
+                return
+            result = await self.limiter.increment_and_check_many(checks)
 
-        # Rate limit users
-        allowed, remaining, retry_after, slowdown = await self.limiter.increment_and_check(api_key)
+        if len(result) == 3:
+            # Limiters without slowdown (SQLite called without a policy)
+            result = (*result, None)
+        allowed, remaining, retry_after, slowdown = result
         if not allowed:
-            # Return 429
-            headers_out = [(b"content-type", b"application/json"), (b"retry-after", str(retry_after).encode())]
-
-            body = json.dumps({"detail": "Rate limit exceeded", "retry_after": retry_after}).encode()
-
-            await send({
-                "type": "http.response.start",
-                "status": 429,
-                "headers": headers_out,
-            })
-            await send({"type": "http.response.body", "body": body})
+            await self._reject(send, retry_after)
             return
 
-        # If slowdown mode returned a delay, apply it before continuing
+        # Slowdown: wait in the key's leaky-bucket queue for this route instead
+        # of sleeping for the full backoff; a full queue is rejected straight away.
         if slowdown:
-            try:
-                await asyncio.sleep(float(slowdown))
-            except Exception:
-                pass
+            route = self._route(scope.get("path", "/"))
+            queue_key = (api_key or self._client_ip(scope), route.prefix if route is not None else None)
+            released, waited = await self.slowdown_queue.wait(queue_key, self._slowdown_rate(checks))
+            if not released:
+                await self._reject(send, LeakyBucketQueue.retry_after_header(waited))
+                return
+            slowdown = round(waited, 3)
 
         # Add remaining and slowdown header and continue
         async def send_wrapper(message):
@@ -87,4 +289,4 @@ class RateLimitMiddleware:
         await self.app(scope, receive, send_wrapper)
 
 
-__all__ = ["RateLimitMiddleware"]
+__all__ = ["RateLimitMiddleware", "RoutePolicy", "compile_routes"]
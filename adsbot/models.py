@@ -4,7 +4,7 @@ import enum
 from datetime import datetime, date
 from typing import Optional
 
-from sqlalchemy import Column, Date, DateTime, Enum, Float, ForeignKey, Integer, String, Text, JSON, Boolean
+from sqlalchemy import BigInteger, Column, Date, DateTime, Enum, Float, ForeignKey, Index, Integer, String, Text, JSON, Boolean
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -225,11 +225,24 @@ class UserBalance(Base):
 class Transaction(Base):
     """Cronologia transazioni (guadagni, spese, pagamenti)."""
     __tablename__ = "transactions"
+    # Estratto conto paginato per (user_id, created_at, id); su PostgreSQL
+    # l'indice include anche le colonne mostrate (index-only scan)
+    __table_args__ = (
+        Index(
+            "ix_transactions_user_id_created_at_id",
+            "user_id",
+            "created_at",
+            "id",
+            postgresql_include=["transaction_type", "amount", "balance_after"],
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     transaction_type: Mapped[str] = mapped_column(String(50))  # "earn", "spend", "refund", "withdrawal"
     amount: Mapped[float] = mapped_column(Float)
+    # Saldo dopo la transazione (NULL per righe precedenti alla migrazione)
+    balance_after: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     description: Mapped[str] = mapped_column(Text)
     reference_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # campaign_id, offer_id, ecc.
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -364,6 +377,26 @@ class Payment(Base):
     order: Mapped["MarketplaceOrder"] = relationship("MarketplaceOrder")
 
 
+class CampaignPayment(Base):
+    """Pagamento di una campagna presso un provider esterno (Stripe, PayPal)."""
+    __tablename__ = "campaign_payments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)  # Acquirente
+    channel_id: Mapped[int] = mapped_column(ForeignKey("channels.id"))
+    campaign_name: Mapped[str] = mapped_column(String(255))
+    amount: Mapped[float] = mapped_column(Float)
+    provider: Mapped[str] = mapped_column(String(20))  # "stripe", "paypal"
+    # Id del provider: un pagamento è registrato (e contabilizzato) una volta sola
+    provider_payment_id: Mapped[str] = mapped_column(String(255), unique=True)
+    # pending finché il provider non conferma l'incasso, poi completed
+    status: Mapped[PaymentStatus] = mapped_column(Enum(PaymentStatus), default=PaymentStatus.pending)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    channel: Mapped[Channel] = relationship("Channel")
+
+
 class MoneyTransaction(Base):
     """Tracciamento di OGNI movimento di denaro."""
     __tablename__ = "money_transactions"
@@ -387,6 +420,89 @@ class MoneyTransaction(Base):
     payment: Mapped[Optional["Payment"]] = relationship("Payment")
 
 
+# ============================================================================
+# LEDGER (PARTITA DOPPIA)
+# ============================================================================
+
+class LedgerAccount(Base):
+    """Conto del ledger; il saldo è una proiezione delle scritture."""
+    __tablename__ = "ledger_accounts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    code: Mapped[str] = mapped_column(String(64), unique=True)  # "user:<id>", "escrow", "platform", ...
+    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"), nullable=True, index=True)
+    currency: Mapped[str] = mapped_column(String(10), default="EUR")
+    allow_negative: Mapped[bool] = mapped_column(Boolean, default=False)  # Solo conti di sistema
+
+    # Proiezione in cache, aggiornata nella stessa transazione delle scritture
+    balance_minor: Mapped[int] = mapped_column(BigInteger, default=0)  # Centesimi
+    entry_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class LedgerTransaction(Base):
+    """Movimento bilanciato: la somma delle sue scritture è zero."""
+    __tablename__ = "ledger_transactions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50))  # "deposit", "order_payment", "earn", "refund", ...
+    description: Mapped[str] = mapped_column(Text, default="")
+    order_id: Mapped[Optional[int]] = mapped_column(ForeignKey("marketplace_orders.id"), nullable=True, index=True)
+    reference_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+    entries: Mapped[list["LedgerEntry"]] = relationship("LedgerEntry", back_populates="transaction")
+
+
+class LedgerEntry(Base):
+    """Scrittura (append-only): importo con segno su un conto, in centesimi."""
+    __tablename__ = "ledger_entries"
+    __table_args__ = (Index("ix_ledger_entries_account_id_id", "account_id", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    transaction_id: Mapped[int] = mapped_column(ForeignKey("ledger_transactions.id"), index=True)
+    account_id: Mapped[int] = mapped_column(ForeignKey("ledger_accounts.id"))
+    amount_minor: Mapped[int] = mapped_column(BigInteger)  # > 0 accredito, < 0 addebito
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    transaction: Mapped[LedgerTransaction] = relationship("LedgerTransaction", back_populates="entries")
+    account: Mapped[LedgerAccount] = relationship("LedgerAccount")
+
+
+class LedgerCheckpoint(Base):
+    """Saldo di un conto dopo una certa scrittura: punto di partenza del replay."""
+    __tablename__ = "ledger_checkpoints"
+    __table_args__ = (Index("ix_ledger_checkpoints_account_id_entry_id", "account_id", "entry_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    account_id: Mapped[int] = mapped_column(ForeignKey("ledger_accounts.id"))
+    entry_id: Mapped[int] = mapped_column(Integer)  # Ultima scrittura inclusa
+    balance_minor: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class SettlementRun(Base):
+    """Esecuzione del job di liquidazione escrow, con il punto a cui è arrivata."""
+    __tablename__ = "settlement_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), default="running")  # "running", "completed", "failed"
+    cutoff: Mapped[datetime] = mapped_column(DateTime)  # Ordini maturati entro questo istante
+    batch_size: Mapped[int] = mapped_column(Integer)
+
+    # Checkpoint: ultimo Payment.id esaminato, aggiornato con ogni batch
+    last_payment_id: Mapped[int] = mapped_column(Integer, default=0)
+    batches: Mapped[int] = mapped_column(Integer, default=0)
+    payments_settled: Mapped[int] = mapped_column(Integer, default=0)
+    amount_minor: Mapped[int] = mapped_column(BigInteger, default=0)  # Rilasciato dall'escrow
+    fees_minor: Mapped[int] = mapped_column(BigInteger, default=0)  # Di cui commissioni
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 # ============================================================================
 # DISPUTE & ADMIN MODELS
 # ============================================================================
@@ -9,6 +9,8 @@ from telegram import Bot
 from telegram.constants import ParseMode
 from telegram.error import TelegramError
 
+from .send_queue import bulk_send_kwargs
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,6 +50,7 @@ class NotificationDispatcher:
                 chat_id=user_id,
                 text=message,
                 parse_mode=ParseMode.HTML,
+                **bulk_send_kwargs(self.bot),
             )
             logger.info(f"Notification sent to {user_id}: {notification_type.value}")
             return True
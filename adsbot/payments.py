@@ -1,10 +1,30 @@
-"""Payment integration for Stripe and PayPal."""
+"""Payment integration for Stripe and PayPal.
+
+Two flavours:
+
+- `StripePaymentHandler` / `PayPalPaymentHandler` / `PaymentProcessor` use
+  the providers' synchronous SDKs (optional dependencies); they block the
+  calling thread, so keep them to scripts and admin tools;
+- `AsyncStripeClient` / `AsyncPayPalClient` / `AsyncPaymentProcessor` talk
+  to the REST APIs directly over one shared, pooled `httpx.AsyncClient`
+  (`ProviderHTTP`), with timeouts, retries and an idempotency key per
+  operation, so a retried request can never charge twice. Handlers use
+  these: a payment call never blocks the event loop.
+
+`scripts/fake_payment_provider.py` serves the subset of both APIs used here
+for tests and benchmarks (point STRIPE_API_BASE / PAYPAL_API_BASE at it).
+"""
 
 from __future__ import annotations
 
+import asyncio
 import os
 import logging
-from typing import Optional
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import httpx
 
 logger = logging.getLogger(__name__)
 
@@ -213,3 +233,348 @@ class PaymentProcessor:
             return {"provider": "paypal", "payment_id": payment_id}
         else:
             return None
+
+
+# -------------------------
+# Async REST clients
+# -------------------------
+
+STRIPE_API_BASE = "https://api.stripe.com"
+PAYPAL_API_BASES = {"sandbox": "https://api-m.sandbox.paypal.com", "live": "https://api-m.paypal.com"}
+
+# Worth another attempt: rate limited or a transient provider failure
+RETRY_STATUSES = frozenset({409, 429, 500, 502, 503, 504})
+
+
+class PaymentError(Exception):
+    """A provider call failed (after retries, when retrying made sense)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ProviderHTTP:
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        attempts: int = 3,
+        backoff: float = 0.25,
+        max_backoff: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """Pooled HTTP client shared by the provider clients.
+
+        Args:
+            timeout: seconds allowed for reading a response (and writing the request)
+            connect_timeout: seconds allowed to open a connection
+            max_connections: connections open at the same time, all providers
+            max_keepalive: idle connections kept for reuse
+            attempts: tries per call (transport errors and RETRY_STATUSES)
+            backoff: wait before the second try, doubled on each retry
+            max_backoff: upper bound of a wait, Retry-After included
+            transport: custom httpx transport (tests)
+        """
+        self.attempts = max(1, int(attempts))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            transport=transport,
+        )
+        self.retried = 0
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        idempotency_header: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send a request, retrying transient failures.
+
+        With `idempotency_header` every attempt carries the same key
+        (`idempotency_key`, or a new random one), so the provider applies a
+        retried POST at most once.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        if idempotency_header:
+            headers[idempotency_header] = idempotency_key or uuid.uuid4().hex
+        attempt = 1
+        while True:
+            try:
+                response = await self._client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self.attempts:
+                    raise PaymentError(f"{method} {url} failed: {type(e).__name__}: {e}") from e
+                delay = self._delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.attempts:
+                    return response
+                delay = self._delay(attempt, response.headers.get("Retry-After"))
+            self.retried += 1
+            logger.warning(f"Payment provider call {method} {url} failed (attempt {attempt}), retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _raise_for_status(response: httpx.Response, provider: str) -> Dict[str, Any]:
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = {}
+    if response.is_success:
+        return payload
+    error = payload.get("error")
+    if isinstance(error, dict):  # Stripe
+        message = error.get("message") or error.get("type")
+    else:  # PayPal
+        message = payload.get("message") or payload.get("error_description") or error
+    raise PaymentError(f"{provider} error {response.status_code}: {message or response.text[:200]}", response.status_code)
+
+
+class AsyncStripeClient:
+    """Stripe PaymentIntents and refunds over the REST API."""
+
+    def __init__(self, api_key: str, http: ProviderHTTP, base_url: str = STRIPE_API_BASE):
+        self.api_key = api_key
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+
+    async def _call(self, method: str, path: str, idempotency_key: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        response = await self.http.request(
+            method,
+            f"{self.base_url}{path}",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            # Stripe replays the first response for a key it has already seen
+            idempotency_header="Idempotency-Key" if method == "POST" else None,
+            idempotency_key=idempotency_key,
+            **kwargs,
+        )
+        return _raise_for_status(response, "Stripe")
+
+    async def create_payment_intent(
+        self,
+        amount_cents: int,
+        customer_email: str,
+        description: str,
+        currency: str = "usd",
+        idempotency_key: Optional[str] = None,
+    ) -> dict:
+        """Create a payment intent; same result dict as `StripePaymentHandler`."""
+        data = {"amount": str(int(amount_cents)), "currency": currency, "description": description}
+        if customer_email and "@" in customer_email:
+            data["receipt_email"] = customer_email
+        intent = await self._call("POST", "/v1/payment_intents", idempotency_key, data=data)
+        return {
+            "client_secret": intent.get("client_secret"),
+            "payment_intent_id": intent["id"],
+            "status": intent.get("status"),
+        }
+
+    async def retrieve_payment_intent(self, payment_intent_id: str) -> dict:
+        intent = await self._call("GET", f"/v1/payment_intents/{payment_intent_id}")
+        return {"status": intent.get("status"), "amount": intent.get("amount"), "currency": intent.get("currency")}
+
+    async def refund_payment(
+        self, payment_intent_id: str, amount_cents: Optional[int] = None, idempotency_key: Optional[str] = None
+    ) -> bool:
+        data = {"payment_intent": payment_intent_id}
+        if amount_cents is not None:
+            data["amount"] = str(int(amount_cents))
+        refund = await self._call("POST", "/v1/refunds", idempotency_key, data=data)
+        return refund.get("status") in ("succeeded", "pending")
+
+
+class AsyncPayPalClient:
+    """PayPal Payments (v1) over the REST API, with a cached OAuth token."""
+
+    def __init__(self, client_id: str, client_secret: str, http: ProviderHTTP, base_url: Optional[str] = None, mode: str = "sandbox"):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.http = http
+        self.base_url = (base_url or PAYPAL_API_BASES.get(mode, PAYPAL_API_BASES["sandbox"])).rstrip("/")
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def _access_token(self) -> str:
+        async with self._token_lock:
+            if self._token is None or time.monotonic() >= self._token_expires:
+                response = await self.http.request(
+                    "POST",
+                    f"{self.base_url}/v1/oauth2/token",
+                    auth=(self.client_id, self.client_secret),
+                    data={"grant_type": "client_credentials"},
+                )
+                payload = _raise_for_status(response, "PayPal")
+                self._token = payload["access_token"]
+                # Renew a minute early
+                self._token_expires = time.monotonic() + max(0, int(payload.get("expires_in", 0)) - 60)
+            return self._token
+
+    async def _call(self, method: str, path: str, idempotency_key: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        token = await self._access_token()
+        response = await self.http.request(
+            method,
+            f"{self.base_url}{path}",
+            headers={"Authorization": f"Bearer {token}"},
+            idempotency_header="PayPal-Request-Id" if method == "POST" else None,
+            idempotency_key=idempotency_key,
+            **kwargs,
+        )
+        if response.status_code == 401:
+            # Token revoked or expired early: fetch a new one next time
+            self._token = None
+        return _raise_for_status(response, "PayPal")
+
+    async def create_payment(
+        self,
+        amount: float,
+        currency: str,
+        description: str,
+        return_url: str,
+        cancel_url: str,
+        idempotency_key: Optional[str] = None,
+    ) -> dict:
+        """Create a payment; same result dict as `PayPalPaymentHandler`."""
+        payment = await self._call(
+            "POST",
+            "/v1/payments/payment",
+            idempotency_key,
+            json={
+                "intent": "sale",
+                "payer": {"payment_method": "paypal"},
+                "redirect_urls": {"return_url": return_url, "cancel_url": cancel_url},
+                "transactions": [
+                    {"amount": {"total": f"{amount:.2f}", "currency": currency.upper()}, "description": description}
+                ],
+            },
+        )
+        approval_url = next((link["href"] for link in payment.get("links", []) if link.get("rel") == "approval_url"), None)
+        if approval_url is None:
+            raise PaymentError(f"PayPal payment {payment.get('id')} has no approval link")
+        return {"payment_id": payment["id"], "approval_url": approval_url, "status": "created"}
+
+    async def get_payment(self, payment_id: str) -> dict:
+        """Current state of a payment ("created" until executed, then "approved")."""
+        payment = await self._call("GET", f"/v1/payments/payment/{payment_id}")
+        return {"payment_id": payment["id"], "status": payment.get("state")}
+
+    async def execute_payment(self, payment_id: str, payer_id: str, idempotency_key: Optional[str] = None) -> dict:
+        payment = await self._call(
+            "POST", f"/v1/payments/payment/{payment_id}/execute", idempotency_key, json={"payer_id": payer_id}
+        )
+        return {
+            "payment_id": payment["id"],
+            "status": payment.get("state"),
+            "amount": payment["transactions"][0]["amount"]["total"],
+        }
+
+
+class AsyncPaymentProcessor:
+    """Async counterpart of `PaymentProcessor`; providers without credentials are disabled."""
+
+    def __init__(
+        self,
+        stripe_client: Optional[AsyncStripeClient] = None,
+        paypal_client: Optional[AsyncPayPalClient] = None,
+        http: Optional[ProviderHTTP] = None,
+    ):
+        self.stripe = stripe_client
+        self.paypal = paypal_client
+        self.http = http
+
+    @classmethod
+    def from_env(cls, http: Optional[ProviderHTTP] = None) -> "AsyncPaymentProcessor":
+        """Configure from STRIPE_API_KEY, PAYPAL_CLIENT_ID/SECRET/MODE and the *_API_BASE overrides."""
+        http = http or ProviderHTTP(timeout=float(os.getenv("PAYMENT_HTTP_TIMEOUT", "10")))
+        stripe_key = os.getenv("STRIPE_API_KEY")
+        paypal_id = os.getenv("PAYPAL_CLIENT_ID")
+        paypal_secret = os.getenv("PAYPAL_CLIENT_SECRET")
+        stripe_client = (
+            AsyncStripeClient(stripe_key, http, os.getenv("STRIPE_API_BASE", STRIPE_API_BASE)) if stripe_key else None
+        )
+        paypal_client = (
+            AsyncPayPalClient(
+                paypal_id,
+                paypal_secret,
+                http,
+                base_url=os.getenv("PAYPAL_API_BASE") or None,
+                mode=os.getenv("PAYPAL_MODE", "sandbox"),
+            )
+            if paypal_id and paypal_secret
+            else None
+        )
+        return cls(stripe_client, paypal_client, http)
+
+    async def process_payment(
+        self,
+        provider: str,
+        amount: float,
+        currency: str,
+        customer_email: str,
+        description: str,
+        idempotency_key: Optional[str] = None,
+        **kwargs,
+    ) -> Optional[dict]:
+        """Process payment with specified provider (None if it fails or isn't configured).
+
+        Pass an `idempotency_key` tied to what is being bought (e.g. the
+        order id) so that a repeated tap can't create a second payment.
+        """
+        try:
+            if provider == "stripe" and self.stripe is not None:
+                return await self.stripe.create_payment_intent(
+                    int(round(amount * 100)), customer_email, description, currency, idempotency_key
+                )
+            if provider == "paypal" and self.paypal is not None:
+                return await self.paypal.create_payment(
+                    amount,
+                    currency,
+                    description,
+                    kwargs.get("return_url", ""),
+                    kwargs.get("cancel_url", ""),
+                    idempotency_key,
+                )
+        except PaymentError as e:
+            logger.error(f"{provider} payment failed: {e}")
+            return None
+        logger.error(f"Payment provider not available: {provider}")
+        return None
+
+    async def verify_payment(self, provider: str, payment_id: str) -> Optional[dict]:
+        """Verify payment status."""
+        if provider == "stripe" and self.stripe is not None:
+            try:
+                return await self.stripe.retrieve_payment_intent(payment_id)
+            except PaymentError as e:
+                logger.error(f"Stripe verification failed: {e}")
+                return None
+        if provider == "paypal" and self.paypal is not None:
+            try:
+                return await self.paypal.get_payment(payment_id)
+            except PaymentError as e:
+                logger.error(f"PayPal verification failed: {e}")
+                return None
+        return None
+
+    async def aclose(self) -> None:
+        if self.http is not None:
+            await self.http.aclose()
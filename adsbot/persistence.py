@@ -0,0 +1,324 @@
+"""Durable conversation state for the bot (SQLite or Redis).
+
+`StatePersistence` is a `telegram.ext.BasePersistence` that keeps
+user_data, chat_data, callback data and the states of persistent
+`ConversationHandler`s in a SQLite file or a Redis server, so a restart
+doesn't lose in-flight flows and several bot workers can share state.
+
+Writes are batched (write-behind): the Application hands over changed
+entries every `update_interval` seconds, they are buffered in memory and
+written in one transaction (one SQLite transaction / one Redis MULTI) every
+`flush_interval` seconds, off the event loop. Values are pickled, like
+PTB's own `PicklePersistence`.
+
+With `refresh=True` each update re-reads its user's and chat's entry when
+another worker wrote a newer version, so workers behind one bot token can
+hand a user over to each other.
+
+Usage:
+
+    persistence = persistence_from_url("sqlite:///adsbot_state.db")
+    application = Application.builder().token(token).persistence(persistence).build()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# (kind, key, pickled value or None to delete)
+_Write = Tuple[str, str, Optional[bytes]]
+
+
+class SQLiteStateStore:
+    """Key/value rows `(kind, key) -> (data, version)` in one SQLite table."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bot_state (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data BLOB NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+
+    def load(self, kind: str) -> Dict[str, Tuple[bytes, int]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, data, version FROM bot_state WHERE kind = ?", (kind,)).fetchall()
+        return {key: (data, version) for key, data, version in rows}
+
+    def load_one(self, kind: str, key: str) -> Optional[Tuple[bytes, int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM bot_state WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def write(self, batch: Iterable[_Write]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for kind, key, data in batch:
+                    if data is None:
+                        self._conn.execute("DELETE FROM bot_state WHERE kind = ? AND key = ?", (kind, key))
+                    else:
+                        self._conn.execute(
+                            """
+                            INSERT INTO bot_state (kind, key, data) VALUES (?, ?, ?)
+                            ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data, version = version + 1
+                            """,
+                            (kind, key, data),
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStateStore:
+    """Same layout in Redis: one hash of values and one of versions per kind."""
+
+    def __init__(self, client, prefix: str = "adsbot:state"):
+        self.client = client
+        self.prefix = prefix
+
+    def _keys(self, kind: str) -> Tuple[str, str]:
+        return f"{self.prefix}:{kind}", f"{self.prefix}:{kind}:version"
+
+    def load(self, kind: str) -> Dict[str, Tuple[bytes, int]]:
+        data_key, version_key = self._keys(kind)
+        data = self.client.hgetall(data_key)
+        versions = self.client.hgetall(version_key)
+        result = {}
+        for key, value in data.items():
+            key = key.decode() if isinstance(key, bytes) else key
+            version = versions.get(key.encode(), versions.get(key, 1))
+            result[key] = (value, int(version))
+        return result
+
+    def load_one(self, kind: str, key: str) -> Optional[Tuple[bytes, int]]:
+        data_key, version_key = self._keys(kind)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(data_key, key)
+        pipe.hget(version_key, key)
+        value, version = pipe.execute()
+        return (value, int(version or 1)) if value is not None else None
+
+    def write(self, batch: Iterable[_Write]) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        for kind, key, data in batch:
+            data_key, version_key = self._keys(kind)
+            if data is None:
+                pipe.hdel(data_key, key)
+                pipe.hdel(version_key, key)
+            else:
+                pipe.hset(data_key, key, data)
+                pipe.hincrby(version_key, key, 1)
+        pipe.execute()
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def _dump(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _conversation_key(key: Tuple) -> str:
+    return json.dumps(list(key))
+
+
+class StatePersistence(BasePersistence):
+    def __init__(
+        self,
+        store,
+        *,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 5,
+        flush_interval: float = 5,
+        refresh: bool = False,
+    ):
+        """Create a persistence on `store` (`SQLiteStateStore` or `RedisStateStore`).
+
+        Args:
+            store: storage backend
+            store_data: which kinds of data to persist (default: all but
+                bot_data, which holds process-local objects such as the
+                session factory)
+            update_interval: seconds between hand-overs from the Application
+            flush_interval: seconds between batched writes to the store
+            refresh: re-read user/chat data written by other workers
+        """
+        if store_data is None:
+            store_data = PersistenceInput(bot_data=False)
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.store = store
+        self.flush_interval = float(flush_interval)
+        self.refresh = refresh
+        self._pending: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.flushes = 0
+
+    # -------------------------
+    # Write-behind buffer
+    # -------------------------
+
+    def _queue(self, kind: str, key: str, value: Any) -> None:
+        try:
+            self._pending[(kind, key)] = None if value is None else _dump(value)
+        except Exception as e:
+            logger.error(f"Persistence: cannot serialize {kind} {key!r}, not saved: {e}")
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        writes: List[_Write] = [(kind, key, data) for (kind, key), data in batch.items()]
+        try:
+            await asyncio.to_thread(self.store.write, writes)
+        except Exception as e:
+            # Keep the data for the next flush unless newer values arrived meanwhile
+            logger.error(f"Persistence flush failed ({len(writes)} entries): {e}")
+            for entry, data in batch.items():
+                self._pending.setdefault(entry, data)
+            return
+        for kind, key, data in writes:
+            if data is None:
+                self._versions.pop((kind, key), None)
+            else:
+                self._versions[(kind, key)] = self._versions.get((kind, key), 0) + 1
+        self.writes += len(writes)
+        self.flushes += 1
+
+    async def flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._write_pending()
+        await asyncio.to_thread(self.store.close)
+
+    # -------------------------
+    # Loading
+    # -------------------------
+
+    def _load_ids(self, kind: str) -> Dict[int, Any]:
+        result = {}
+        for key, (data, version) in self.store.load(kind).items():
+            result[int(key)] = pickle.loads(data)
+            self._versions[(kind, key)] = version
+        return result
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await asyncio.to_thread(self._load_ids, "user")
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await asyncio.to_thread(self._load_ids, "chat")
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        row = await asyncio.to_thread(self.store.load_one, "bot", "")
+        return pickle.loads(row[0]) if row else {}
+
+    async def get_callback_data(self):
+        row = await asyncio.to_thread(self.store.load_one, "callback", "")
+        return pickle.loads(row[0]) if row else None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        rows = await asyncio.to_thread(self.store.load, f"conv:{name}")
+        return {tuple(json.loads(key)): pickle.loads(data) for key, (data, _) in rows.items()}
+
+    # -------------------------
+    # Updates (buffered)
+    # -------------------------
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        self._queue(f"conv:{name}", _conversation_key(key), new_state)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._queue("user", str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._queue("chat", str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._queue("bot", "", data)
+
+    async def update_callback_data(self, data) -> None:
+        self._queue("callback", "", data)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._queue("chat", str(chat_id), None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue("user", str(user_id), None)
+
+    # -------------------------
+    # Refresh (multi-worker)
+    # -------------------------
+
+    async def _refresh(self, kind: str, key: str, data: Dict[Any, Any]) -> None:
+        if not self.refresh or (kind, key) in self._pending:
+            return
+        row = await asyncio.to_thread(self.store.load_one, kind, key)
+        if (kind, key) in self._pending:
+            # Changed locally while loading: the local copy wins
+            return
+        if row is None or row[1] <= self._versions.get((kind, key), 0):
+            return
+        # Another worker wrote a newer version: replace in place
+        data.clear()
+        data.update(pickle.loads(row[0]))
+        self._versions[(kind, key)] = row[1]
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        await self._refresh("user", str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        await self._refresh("chat", str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        return None
+
+
+def persistence_from_url(url: str, **kwargs) -> StatePersistence:
+    """Build a `StatePersistence` from "sqlite:///path" or "redis://host:port/db"."""
+    if url.startswith("sqlite:///"):
+        return StatePersistence(SQLiteStateStore(url[len("sqlite:///"):]), **kwargs)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except Exception:  # pragma: no cover - redis is optional
+            raise RuntimeError("redis package is required for Redis persistence")
+        return StatePersistence(RedisStateStore(redis.Redis.from_url(url)), **kwargs)
+    raise ValueError(f"unsupported persistence URL: {url}")
+
+
+__all__ = ["RedisStateStore", "SQLiteStateStore", "StatePersistence", "persistence_from_url"]
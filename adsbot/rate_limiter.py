@@ -10,16 +10,90 @@ This module accepts a redis client instance (redis.asyncio.Redis) for testabilit
 from __future__ import annotations
 
 import time
-from typing import Optional, Tuple
-
-try:
-    import redis.asyncio as aioredis
-except Exception:  # pragma: no cover - import issues on systems without redis
-    aioredis = None  # type: ignore
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
 
 from adsbot import api_keys
 
 
+def slowdown_delay(over: int) -> float:
+    """Delay for the `over`-th request past the limit in slowdown mode.
+
+    Exponential backoff with base 1.5: 0.5 * (1.5 ^ (over - 1)), capped at 10s.
+    """
+    return float(min(10.0, 0.5 * (1.5 ** (over - 1))))
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Limit applied to one counter: N requests per fixed window.
+
+    `mode` is the over-limit algorithm: 'block' rejects until one full
+    window has passed, 'slowdown' keeps allowing with a growing delay.
+    """
+
+    max_requests: int
+    window_seconds: int
+    mode: str = "block"
+
+    def __post_init__(self):
+        if self.mode not in ("block", "slowdown"):
+            raise ValueError("mode must be 'block' or 'slowdown'")
+
+
+# (dimension, key, policy): e.g. ("ip", "10.0.0.1", RateLimitPolicy(100, 60)).
+# A None policy means "use the limiter's own window/limit/mode".
+RateLimitCheck = Tuple[str, str, Optional[RateLimitPolicy]]
+
+# Evaluates every check in one round trip. KEYS holds a (count, blocked)
+# pair per check; ARGV is `now` followed by (window, max, mode) per check.
+# Blocks are checked for all dimensions before any counter is touched, so
+# a request rejected by one dimension does not consume the others.
+_MANY_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n = #KEYS / 2
+local retry = 0
+for i = 1, n do
+  local b = redis.call('GET', KEYS[2 * i])
+  if b then
+    local ts = tonumber(b) or 0
+    if ts > now then
+      if ts - now > retry then retry = ts - now end
+    else
+      redis.call('DEL', KEYS[2 * i])
+    end
+  end
+end
+if retry > 0 then
+  return {0, 0, retry, 0}
+end
+local remaining = -1
+local blocked = 0
+local over = 0
+for i = 1, n do
+  local window = tonumber(ARGV[3 * i - 1])
+  local max_requests = tonumber(ARGV[3 * i])
+  local cur = redis.call('INCR', KEYS[2 * i - 1])
+  redis.call('EXPIRE', KEYS[2 * i - 1], window + 5)
+  local rem = max_requests - cur
+  if rem < 0 then rem = 0 end
+  if remaining < 0 or rem < remaining then remaining = rem end
+  if cur > max_requests then
+    if ARGV[3 * i + 1] == 'block' then
+      redis.call('SET', KEYS[2 * i], tostring(now + window), 'EX', window + 5)
+      if window > blocked then blocked = window end
+    elseif cur - max_requests > over then
+      over = cur - max_requests
+    end
+  end
+end
+if blocked > 0 then
+  return {0, 0, blocked, 0}
+end
+return {1, remaining, 0, over}
+"""
+
+
 class RedisRateLimiter:
     def __init__(self, *, redis_client=None, window_seconds: int = 60, max_requests: int = 5, mode: str = "block"):
         """Create a rate limiter.
@@ -36,30 +110,41 @@ class RedisRateLimiter:
         if mode not in ("block", "slowdown"):
             raise ValueError("mode must be 'block' or 'slowdown'")
         self.mode = mode
+        self._many_script = None
 
     async def _get_redis(self):
         if self._redis is not None:
             return self._redis
-        if aioredis is None:
+        # Imported on first use: redis.asyncio is slow to import and most
+        # callers pass their own client
+        try:
+            import redis.asyncio as aioredis
+        except Exception:  # pragma: no cover - import issues on systems without redis
             raise RuntimeError("redis.asyncio is not available; install redis package")
         self._redis = aioredis.Redis.from_url("redis://localhost:6379/0")
         return self._redis
 
-    def _window_start(self, now: Optional[float] = None) -> int:
+    def _window_start(self, now: Optional[float] = None, window: Optional[int] = None) -> int:
         if now is None:
             now = time.time()
-        return int(now // self.window) * self.window
+        window = window or self.window
+        return int(now // window) * window
 
-    async def increment_and_check(self, api_key: str) -> Tuple[bool, int, Optional[int], Optional[float]]:
+    async def increment_and_check(
+        self, api_key: str, policy: Optional[RateLimitPolicy] = None
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
         """Increment counter for api_key and check status.
 
+        `policy` overrides the limiter's own window/limit/mode for this call.
+
         Returns (allowed, remaining, retry_after_seconds_or_None, slowdown_seconds_or_None)
         - If `mode=='block'` and limit exceeded: returns (False, 0, retry_after, None)
         - If `mode=='slowdown'` and limit exceeded: returns (True, 0, None, slowdown_seconds)
         """
+        window, max_requests, mode = self._resolve(policy)
         redis = await self._get_redis()
         now = int(time.time())
-        window_start = self._window_start(now)
+        window_start = self._window_start(now, window)
         count_key = f"rl:{api_key}:count:{window_start}"
         blocked_key = f"rl:{api_key}:blocked"
 
@@ -79,24 +164,59 @@ class RedisRateLimiter:
         # Increment the counter for current window
         cur = await redis.incr(count_key)
         # Set TTL so window expires
-        await redis.expire(count_key, self.window + 5)
+        await redis.expire(count_key, window + 5)
 
-        remaining = max(0, self.max_requests - int(cur))
-        if int(cur) > self.max_requests:
-            if self.mode == "block":
+        remaining = max(0, max_requests - int(cur))
+        if int(cur) > max_requests:
+            if mode == "block":
                 # Block for one full window
-                blocked_until_ts = now + self.window
-                await redis.set(blocked_key, str(blocked_until_ts), ex=self.window + 5)
-                return False, 0, self.window, None
+                blocked_until_ts = now + window
+                await redis.set(blocked_key, str(blocked_until_ts), ex=window + 5)
+                return False, 0, window, None
             else:
                 # Slowdown mode: exponential backoff (base 1.5)
-                over = int(cur) - self.max_requests
-                # Formula: 0.5 * (1.5 ^ (over - 1)), capped at 10s
-                delay = min(10.0, 0.5 * (1.5 ** (over - 1)))
-                return True, 0, None, float(delay)
+                return True, 0, None, slowdown_delay(int(cur) - max_requests)
 
         return True, remaining, None, None
 
+    async def increment_and_check_many(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Evaluate several limits atomically in a single Redis round trip.
+
+        Each check counts `key` under its own `dimension` namespace. Returns
+        the most restrictive verdict in the same form as `increment_and_check`:
+        blocked if any dimension blocks (longest retry_after), otherwise the
+        smallest remaining and the largest slowdown.
+        """
+        if not checks:
+            return True, 0, None, None
+        redis = await self._get_redis()
+        if self._many_script is None:
+            self._many_script = redis.register_script(_MANY_SCRIPT)
+
+        now = int(time.time())
+        keys: List[str] = []
+        args: List[object] = [now]
+        for dimension, key, policy in checks:
+            window, max_requests, mode = self._resolve(policy)
+            name = f"{dimension}:{key}"
+            keys.append(f"rl:{name}:count:{self._window_start(now, window)}")
+            keys.append(f"rl:{name}:blocked")
+            args.extend((window, max_requests, mode))
+
+        allowed, remaining, retry_after, over = (
+            int(v) for v in await self._many_script(keys=keys, args=args)
+        )
+        if not allowed:
+            return False, 0, retry_after, None
+        return True, remaining, None, slowdown_delay(over) if over else None
+
+    def _resolve(self, policy: Optional[RateLimitPolicy]) -> Tuple[int, int, str]:
+        if policy is None:
+            return self.window, self.max_requests, self.mode
+        return policy.window_seconds, policy.max_requests, policy.mode
+
     async def is_blocked(self, api_key: str) -> Optional[int]:
         """Return seconds until unblocked or None."""
         redis = await self._get_redis()
@@ -116,4 +236,4 @@ class RedisRateLimiter:
         return None
 
 
-__all__ = ["RedisRateLimiter"]
+__all__ = ["RateLimitCheck", "RateLimitPolicy", "RedisRateLimiter", "slowdown_delay"]
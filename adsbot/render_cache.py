@@ -0,0 +1,155 @@
+"""Skip Telegram edits that would not change the message.
+
+Menu handlers re-render the message a button belongs to on every tap, often
+with exactly the same text and keyboard; Telegram then answers
+`BadRequest: Message is not modified` after a full round trip that also
+counts against our rate limits.
+
+`RenderCache` remembers, per (chat_id, message_id), a hash of the last text
+and markup we rendered together with the message's `edit_date`.
+`render_menu` consults it before calling `edit_message_text`:
+the edit is skipped when the hash matches *and* the message Telegram sent
+with the callback query still carries our `edit_date` and keyboard, i.e.
+nobody (another handler or another worker) edited it since.
+
+Usage:
+
+    await render_menu(query, context, text, reply_markup=keyboard)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = "Message is not modified"
+
+
+def _markup_digest(reply_markup) -> str:
+    if reply_markup is None:
+        return ""
+    return hashlib.blake2b(reply_markup.to_json().encode(), digest_size=12).hexdigest()
+
+
+def render_digest(text: str, reply_markup=None, **options: Any) -> str:
+    """Hash of everything an edit would send (text, markup, parse mode...)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode())
+    digest.update(b"\0" + _markup_digest(reply_markup).encode())
+    for name in sorted(options):
+        digest.update(f"\0{name}={options[name]!r}".encode())
+    return digest.hexdigest()
+
+
+class _Rendered:
+    __slots__ = ("digest", "markup", "edit_date")
+
+    def __init__(self, digest: str, markup: str, edit_date):
+        self.digest = digest
+        self.markup = markup
+        self.edit_date = edit_date
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = 10000):
+        """Create the cache.
+
+        Args:
+            max_entries: messages remembered (least recently rendered evicted)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Rendered]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.edited = 0
+        self.not_modified = 0
+
+    def is_current(self, key: Hashable, digest: str, message=None) -> bool:
+        """Whether `digest` is what message `key` shows right now."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.digest != digest:
+                return False
+            if message is not None:
+                if message.edit_date != entry.edit_date:
+                    return False
+                if _markup_digest(message.reply_markup) != entry.markup:
+                    return False
+            self._entries.move_to_end(key)
+            return True
+
+    def store(self, key: Hashable, digest: str, reply_markup=None, edit_date=None) -> None:
+        with self._lock:
+            self._entries[key] = _Rendered(digest, _markup_digest(reply_markup), edit_date)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "edited": self.edited,
+                "skipped": self.skipped,
+                "not_modified": self.not_modified,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _message_key(query) -> Optional[Tuple[int, int]]:
+    message = query.message
+    if message is None:
+        return None
+    return (message.chat_id, message.message_id)
+
+
+async def render_menu(query, context, text: str, reply_markup=None, **kwargs: Any) -> bool:
+    """`query.edit_message_text` unless the message already shows this render.
+
+    Uses the application's `RenderCache` (`bot_data["render_cache"]`) when
+    installed. Returns True if an edit was sent to Telegram.
+    """
+    cache = context.bot_data["render_cache"] if "render_cache" in context.bot_data else None
+    if not isinstance(cache, RenderCache):
+        await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+        return True
+
+    key = _message_key(query)
+    digest = render_digest(text, reply_markup, **kwargs)
+    if key is not None and cache.is_current(key, digest, query.message):
+        cache.skipped += 1
+        return False
+
+    try:
+        result = await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if NOT_MODIFIED not in str(e):
+            if key is not None:
+                cache.forget(key)
+            raise
+        # Same content, rendered elsewhere: remember it for the next tap
+        cache.not_modified += 1
+        if key is not None:
+            cache.store(key, digest, reply_markup, query.message.edit_date)
+        return False
+
+    cache.edited += 1
+    if key is not None:
+        cache.store(key, digest, reply_markup, getattr(result, "edit_date", None))
+    return True
+
+
+__all__ = ["RenderCache", "render_digest", "render_menu"]
@@ -11,11 +11,15 @@ from adsbot.models import (
     DisputeTicket, DisputeStatus, Channel
 )
 from adsbot.db import get_session
+from adsbot.metrics import timed_job
+from adsbot.settlement import settle_escrow
 
 logger = logging.getLogger(__name__)
 
 # Global scheduler instance
 scheduler: Optional[object] = None  # Will be BackgroundScheduler when initialized
+# Session factory given to init_scheduler (used by the escrow settlement job)
+_session_factory = None
 
 
 class SchedulerConfig:
@@ -59,6 +63,12 @@ class SchedulerConfig:
             "minutes": 15,  # Check every 15 minutes
             "max_instances": 1,
         },
+        "escrow_settlement": {
+            "job_func": "adsbot.scheduler.job_settle_escrow",
+            "trigger": "interval",
+            "minutes": 10,  # Release matured escrow every 10 minutes
+            "max_instances": 1,
+        },
     }
 
 
@@ -66,13 +76,20 @@ class SchedulerConfig:
 # Task 20: APScheduler Setup & Initialization
 # ============================================================================
 
-def init_scheduler():
+def init_scheduler(session_factory=None, jobs=None):
     """Initialize and configure APScheduler.
     
+    Args:
+        session_factory: factory from `create_session_factory`, used by
+            the jobs that open their own sessions (escrow settlement)
+        jobs: names from SchedulerConfig.JOBS to schedule (None = all)
+    
     Returns:
         Configured BackgroundScheduler instance
     """
-    global scheduler
+    global scheduler, _session_factory
+    
+    _session_factory = session_factory
     
     try:
         # Lazy import apscheduler to avoid import errors when not installed
@@ -84,6 +101,8 @@ def init_scheduler():
         
         # Add all configured jobs
         for job_name, job_config in SchedulerConfig.JOBS.items():
+            if jobs is not None and job_name not in jobs:
+                continue
             try:
                 trigger = job_config.get("trigger")
                 
@@ -111,6 +130,9 @@ def init_scheduler():
                 module = importlib.import_module(module_name)
                 job_func = getattr(module, func_name)
                 
+                # Record each run's duration (see adsbot.metrics)
+                job_func = timed_job(job_name, job_func)
+                
                 # Add job to scheduler
                 scheduler.add_job(
                     job_func,
@@ -400,6 +422,28 @@ def job_auto_resolve_disputes():
         session.close()
 
 
+# ============================================================================
+# Escrow Settlement Job
+# ============================================================================
+
+def job_settle_escrow():
+    """Release the escrow of matured marketplace orders.
+    
+    Settles in keyset batches with set-based statements (see
+    adsbot.settlement); a run interrupted halfway is resumed by the next
+    execution from its checkpoint.
+    """
+    if _session_factory is None:
+        logger.warning("Escrow settlement skipped: init_scheduler() was called without a session factory")
+        return
+    try:
+        summary = settle_escrow(_session_factory)
+        if summary["payments"]:
+            logger.info(f"Settled escrow of {summary['payments']} orders (run {summary['run_id']})")
+    except Exception as e:
+        logger.error(f"Error in escrow settlement job: {e}")
+
+
 # ============================================================================
 # Campaign Expiration Job
 # ============================================================================
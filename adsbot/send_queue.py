@@ -0,0 +1,253 @@
+"""Rate-aware scheduling of outbound Bot API calls.
+
+Telegram allows about 30 messages per second overall, about 1 per second in
+a private chat (short bursts are tolerated) and 20 per minute in a group or
+channel; going faster earns `RetryAfter` errors. `SendQueue` is a PTB rate
+limiter, so every API call of the application's bot goes through it:
+
+- calls addressed to a chat (those with a `chat_id`) are paced per chat,
+  then wait for a token of the global bucket;
+- waiting calls get global tokens in priority order: interactive replies
+  (the default) go ahead of bulk notifications, which are sent with
+  `rate_limit_args={"priority": "bulk"}` (see `bulk_send_kwargs`);
+- a `RetryAfter` pauses all sending for the requested time, then the call
+  is retried (up to `max_retries` times) instead of failing.
+
+Calls without a chat (answerCallbackQuery, getMe, webhook management...)
+pass straight through. Pacing is a virtual-scheduling token bucket (GCRA):
+each call reserves the next free slot, so callers never spin.
+
+Usage:
+
+    Application.builder().token(token).rate_limiter(SendQueue()).build()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"interactive": 0, "normal": 5, "bulk": 10}
+
+
+class _Pacer:
+    """GCRA: `rate` calls/second with bursts of `burst`."""
+
+    __slots__ = ("interval", "tolerance", "tat")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (max(1, burst) - 1)
+        self.tat = 0.0  # theoretical arrival time of the next call
+
+    def delay(self, now: float) -> float:
+        """Seconds until a call would conform (0 = now)."""
+        return max(0.0, max(self.tat, now) - self.tolerance - now)
+
+    def reserve(self, now: float) -> float:
+        """Take the next slot; returns the seconds to wait for it."""
+        wait = self.delay(now)
+        self.tat = max(self.tat, now) + self.interval
+        return wait
+
+    def idle(self, now: float) -> bool:
+        return self.tat <= now
+
+
+class SendQueue(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(
+        self,
+        overall_rate: float = 30.0,
+        overall_burst: int = 30,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        group_rate: float = 20 / 60,
+        group_burst: int = 3,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create the queue.
+
+        Args:
+            overall_rate: calls per second across all chats
+            overall_burst: calls allowed back to back before pacing kicks in
+            chat_rate: calls per second to one private chat
+            chat_burst: burst allowed per private chat
+            group_rate: calls per second to one group or channel
+            group_burst: burst allowed per group or channel
+            max_retries: retries of a call answered with RetryAfter
+            clock: monotonic time source (for tests)
+        """
+        self.overall_rate = overall_rate
+        self.overall_burst = overall_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = _Pacer(overall_rate, overall_burst)
+        self._chats: Dict[Union[int, str], _Pacer] = {}
+        self._paused_until = 0.0
+        # (priority, seq, future) of calls waiting for a global token
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.retried = 0
+        self.sent_by_priority: Dict[int, int] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for _, _, future in self._waiting:
+            if not future.done():
+                future.cancel()
+        self._waiting.clear()
+
+    # -------------------------
+    # Scheduling
+    # -------------------------
+
+    @staticmethod
+    def priority_of(rate_limit_args: Optional[Dict[str, Any]]) -> int:
+        priority = (rate_limit_args or {}).get("priority", "interactive")
+        if isinstance(priority, int):
+            return priority
+        return PRIORITIES.get(priority, PRIORITIES["interactive"])
+
+    def _chat_pacer(self, chat_id: Union[int, str]) -> _Pacer:
+        pacer = self._chats.get(chat_id)
+        if pacer is None:
+            # Negative ids and @usernames are groups/channels
+            if isinstance(chat_id, str) or chat_id < 0:
+                pacer = _Pacer(self.group_rate, self.group_burst)
+            else:
+                pacer = _Pacer(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = pacer
+        return pacer
+
+    def _forget_idle_chats(self, now: float) -> None:
+        if len(self._chats) > 10000:
+            for chat_id in [c for c, pacer in self._chats.items() if pacer.idle(now)]:
+                del self._chats[chat_id]
+
+    async def _global_token(self, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), future))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = loop.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """Hand out global tokens, best priority first, at the global rate."""
+        while True:
+            while self._waiting and self._waiting[0][2].done():
+                heapq.heappop(self._waiting)  # cancelled waiter
+            if not self._waiting:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    if not self._waiting:
+                        return
+                continue
+            now = self._clock()
+            wait = max(self._global.delay(now), self._paused_until - now)
+            if wait > 0:
+                # Sleep, then re-check: a better-priority call may have arrived
+                await asyncio.sleep(wait)
+                continue
+            priority, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self._global.reserve(now)
+            future.set_result(None)
+            self.sent_by_priority[priority] = self.sent_by_priority.get(priority, 0) + 1
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (e.g. after RetryAfter)."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id") if data else None
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = self.priority_of(rate_limit_args)
+        for attempt in range(self.max_retries + 1):
+            now = self._clock()
+            self._forget_idle_chats(now)
+            wait = self._chat_pacer(chat_id).reserve(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._global_token(priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                if attempt >= self.max_retries:
+                    raise
+                self.retried += 1
+                self.pause(float(retry_after))
+                logger.warning(
+                    f"{endpoint} to {chat_id} hit flood control, retrying in {retry_after}s "
+                    f"(attempt {attempt + 1}/{self.max_retries})"
+                )
+                continue
+            self.sent += 1
+            return result
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "waiting": len(self._waiting),
+            "paused_for": max(0.0, self._paused_until - self._clock()),
+            "sent_by_priority": dict(self.sent_by_priority),
+        }
+
+
+def bulk_send_kwargs(bot) -> Dict[str, Any]:
+    """Extra send_* kwargs marking a call as bulk, if the bot has a rate limiter.
+
+    `rate_limit_args` is only accepted by an ExtBot with a rate limiter, so
+    notification code can pass `**bulk_send_kwargs(bot)` unconditionally.
+    """
+    if getattr(bot, "rate_limiter", None) is None:
+        return {}
+    return {"rate_limit_args": {"priority": "bulk"}}
+
+
+__all__ = ["PRIORITIES", "SendQueue", "bulk_send_kwargs"]
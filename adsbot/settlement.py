@@ -0,0 +1,291 @@
+"""Batched escrow settlement.
+
+An order paid from the balance leaves its price in the ESCROW ledger account
+(`Payment.status == escrow_held`). Once the order has matured (completed, or
+published and past `expires_at`, with no open dispute) `settle_escrow`
+releases the money: the seller gets the price minus the platform fee, the
+platform gets the fee.
+
+Payments are taken in keyset batches (`Payment.id > last id examined`) and
+each batch is settled in one DB transaction by a fixed number of set-based
+statements, however many orders it holds:
+
+- one UPDATE marks the payments completed, guarded on `escrow_held` and on
+  the order still being mature, so a payment refunded or disputed meanwhile
+  (or settled by another run) is skipped;
+- one UPDATE completes their orders and records `seller_earned`;
+- one `ledger.post_bulk` moves the money (escrow -> sellers + platform);
+- one INSERT each writes the sellers' `MoneyTransaction` and `Transaction`
+  history rows.
+
+Each run is recorded as a `SettlementRun`. Its `last_payment_id` checkpoint
+advances in the same transaction as the batch, so a run stopped halfway
+(crash, or `max_batches` reached) is resumed from there by the next call.
+
+Usage:
+
+    summary = settle_escrow(session_factory)
+    # {"run_id": 3, "status": "completed", "payments": 1200, ...}
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import ledger
+from .db import session_scope
+from .models import (
+    DisputeStatus,
+    DisputeTicket,
+    MarketplaceOrder,
+    MoneyTransaction,
+    OrderStatus,
+    Payment,
+    PaymentStatus,
+    SettlementRun,
+    Transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+# Payments settled per DB transaction
+SETTLEMENT_BATCH_SIZE = 500
+
+# Disputes that keep an order's money in escrow
+OPEN_DISPUTE_STATUSES = (DisputeStatus.open, DisputeStatus.investigating)
+
+
+def _matured(cutoff: datetime):
+    """SQL criteria: the `MarketplaceOrder` can be settled at `cutoff`."""
+    disputed = (
+        select(DisputeTicket.id)
+        .where(DisputeTicket.order_id == MarketplaceOrder.id, DisputeTicket.status.in_(OPEN_DISPUTE_STATUSES))
+        .exists()
+    )
+    return and_(
+        or_(
+            MarketplaceOrder.status == OrderStatus.completed,
+            and_(MarketplaceOrder.status == OrderStatus.published, MarketplaceOrder.expires_at <= cutoff),
+        ),
+        ~disputed,
+    )
+
+
+def settle_escrow(
+    session_factory: sessionmaker,
+    batch_size: int = SETTLEMENT_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> dict:
+    """Settle the escrow of every order matured by now, batch by batch.
+
+    Resumes the run left unfinished by a previous call, if any (with the
+    cutoff it started with); otherwise starts a new one.
+
+    Args:
+        session_factory: factory from `create_session_factory`
+        batch_size: payments per batch (and DB transaction)
+        max_batches: stop after this many batches, leaving the run to be
+            resumed (bounds a single job execution); None = until done
+        now: maturity cutoff of a new run (default: utcnow)
+
+    Returns a dict with "run_id", "status" ("completed" or "running" when
+    stopped by `max_batches`), "batches" and "payments" (of this call) and
+    "amount" / "fees" (released by the whole run, in currency units).
+    """
+    with session_scope(session_factory) as session:
+        run = session.scalar(
+            select(SettlementRun).where(SettlementRun.status == "running").order_by(SettlementRun.id).limit(1)
+        )
+        if run is None:
+            started = datetime.utcnow()
+            run = SettlementRun(
+                status="running",
+                cutoff=now or started,
+                batch_size=batch_size,
+                last_payment_id=0,
+                batches=0,
+                payments_settled=0,
+                amount_minor=0,
+                fees_minor=0,
+                started_at=started,
+                updated_at=started,
+            )
+            session.add(run)
+            session.flush()
+        else:
+            logger.info(f"Resuming escrow settlement run {run.id} after payment {run.last_payment_id}")
+        run_id = run.id
+
+    batches = payments = 0
+    done = False
+    try:
+        while max_batches is None or batches < max_batches:
+            with session_scope(session_factory) as session:
+                settled = _settle_batch(session, run_id, batch_size)
+            if settled is None:
+                done = True
+                break
+            batches += 1
+            payments += settled
+    except Exception as e:
+        with session_scope(session_factory) as session:
+            session.execute(
+                update(SettlementRun)
+                .where(SettlementRun.id == run_id)
+                .values(status="failed", error=str(e), finished_at=datetime.utcnow())
+            )
+        raise
+
+    with session_scope(session_factory) as session:
+        run = session.get(SettlementRun, run_id)
+        if done:
+            run.status = "completed"
+            run.finished_at = datetime.utcnow()
+        summary = {
+            "run_id": run_id,
+            "status": run.status,
+            "batches": batches,
+            "payments": payments,
+            "amount": ledger.from_minor(run.amount_minor),
+            "fees": ledger.from_minor(run.fees_minor),
+        }
+    logger.info(
+        f"Escrow settlement run {run_id} ({summary['status']}): {payments} payments settled "
+        f"in {batches} batches, {summary['amount']:.2f} released so far"
+    )
+    return summary
+
+
+def _settle_batch(session: Session, run_id: int, batch_size: int) -> Optional[int]:
+    """Settle the next batch of run `run_id`; returns payments settled, None when none are left."""
+    run = session.get(SettlementRun, run_id)
+    candidates = session.execute(
+        select(Payment.id, Payment.order_id, Payment.amount, Payment.seller_amount, MarketplaceOrder.seller_id)
+        .join(MarketplaceOrder, MarketplaceOrder.id == Payment.order_id)
+        .where(
+            Payment.id > run.last_payment_id,
+            Payment.status == PaymentStatus.escrow_held,
+            _matured(run.cutoff),
+        )
+        .order_by(Payment.id)
+        .limit(batch_size)
+    ).all()
+    if not candidates:
+        return None
+
+    now = datetime.utcnow()
+    # Re-checked under the write lock: only these payments are settled here
+    settled_ids = set(
+        session.scalars(
+            update(Payment)
+            .where(
+                Payment.id.in_([row.id for row in candidates]),
+                Payment.status == PaymentStatus.escrow_held,
+                select(MarketplaceOrder.id)
+                .where(MarketplaceOrder.id == Payment.order_id, _matured(run.cutoff))
+                .exists(),
+            )
+            .values(status=PaymentStatus.completed, completed_at=now)
+            .returning(Payment.id)
+            .execution_options(synchronize_session=False)
+        )
+    )
+    rows = [row for row in candidates if row.id in settled_ids]
+
+    total = fees = 0
+    per_seller: Dict[int, int] = defaultdict(int)
+    earnings = []
+    for row in rows:
+        amount_minor = ledger.to_minor(row.amount)
+        seller_minor = ledger.to_minor(row.seller_amount)
+        total += amount_minor
+        fees += amount_minor - seller_minor
+        per_seller[row.seller_id] += seller_minor
+        earnings.append((row, seller_minor))
+
+    if rows:
+        session.execute(
+            update(MarketplaceOrder)
+            .where(MarketplaceOrder.id.in_([row.order_id for row in rows]))
+            .values(
+                status=OrderStatus.completed,
+                completed_at=func.coalesce(MarketplaceOrder.completed_at, now),
+                seller_earned=select(func.round(Payment.seller_amount, 2))
+                .where(Payment.order_id == MarketplaceOrder.id)
+                .scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    if total:
+        accounts = ledger.user_accounts(session, per_seller)
+        legs = [(ledger.system_account(session, ledger.ESCROW), -total)]
+        if fees:
+            legs.append((ledger.system_account(session, ledger.PLATFORM), fees))
+        legs.extend((accounts[seller_id], amount) for seller_id, amount in per_seller.items() if amount)
+        ledger.post_bulk(
+            session,
+            "escrow_settlement",
+            legs,
+            description=f"Liquidazione escrow: {len(rows)} ordini",
+            reference_id=run_id,
+            now=now,
+        )
+        _record_earnings(session, earnings, accounts, per_seller, now)
+
+    session.execute(
+        update(SettlementRun)
+        .where(SettlementRun.id == run_id)
+        .values(
+            last_payment_id=candidates[-1].id,
+            batches=SettlementRun.batches + 1,
+            payments_settled=SettlementRun.payments_settled + len(rows),
+            amount_minor=SettlementRun.amount_minor + total,
+            fees_minor=SettlementRun.fees_minor + fees,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return len(rows)
+
+
+def _record_earnings(session: Session, earnings, accounts, per_seller: Dict[int, int], now: datetime) -> None:
+    """Write the sellers' history rows, with the running balance after each order."""
+    # The posting already credited the whole batch: walk forward from before it
+    running = {seller_id: accounts[seller_id].balance_minor - amount for seller_id, amount in per_seller.items()}
+    money_rows, history_rows = [], []
+    for row, seller_minor in earnings:
+        running[row.seller_id] += seller_minor
+        amount = ledger.from_minor(seller_minor)
+        balance = ledger.from_minor(running[row.seller_id])
+        description = f"Guadagno ordine #{row.order_id}"
+        money_rows.append(dict(
+            user_id=row.seller_id,
+            transaction_type="earn",
+            amount=amount,
+            balance_after=balance,
+            order_id=row.order_id,
+            payment_id=row.id,
+            description=description,
+            created_at=now,
+        ))
+        history_rows.append(dict(
+            user_id=row.seller_id,
+            transaction_type="earn",
+            amount=amount,
+            balance_after=balance,
+            description=description,
+            reference_id=row.order_id,
+            created_at=now,
+        ))
+    session.execute(insert(MoneyTransaction), money_rows)
+    session.execute(insert(Transaction), history_rows)
+
+
+__all__ = ["OPEN_DISPUTE_STATUSES", "SETTLEMENT_BATCH_SIZE", "settle_escrow"]
@@ -0,0 +1,139 @@
+"""Leaky-bucket queue for requests over the limit in slowdown mode.
+
+Instead of sleeping for an ever-growing delay per request, over-limit
+requests for a key join that key's queue and are released one at a time at
+the allowed rate (`rate` requests per second, or the rate of the limit that
+slowed the request, passed to `wait`). Each key may have at most
+`max_depth` requests waiting and the whole queue at most `max_total`, and
+no request waits longer than `max_wait` seconds (the 10s cap of the old
+`slowdown_delay`); a request that does not fit is rejected immediately
+(429 with Retry-After) so a burst of slowed clients cannot hold all server
+connections.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# Longest a slowed request is held (same cap as rate_limiter.slowdown_delay)
+MAX_WAIT = 10.0
+
+
+class _Bucket:
+    __slots__ = ("next_release", "depth")
+
+    def __init__(self, next_release: float):
+        self.next_release = next_release
+        self.depth = 0
+
+
+class LeakyBucketQueue:
+    def __init__(
+        self,
+        *,
+        rate: float,
+        max_depth: int = 5,
+        max_total: int = 1000,
+        max_wait: float = MAX_WAIT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create a queue releasing `rate` requests/second per key.
+
+        Args:
+            rate: allowed requests per second for one key (> 0)
+            max_depth: requests that may wait per key before rejecting
+            max_total: requests that may wait across all keys
+            max_wait: longest wait in seconds; a request that would wait
+                longer is rejected instead
+            clock: monotonic time source, overridable in tests
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self.max_depth = int(max_depth)
+        self.max_total = int(max_total)
+        self.max_wait = float(max_wait)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        self.total = 0
+        self.rejected = 0
+
+    def reserve(self, key: Hashable, rate: Optional[float] = None) -> Tuple[bool, float]:
+        """Try to take a place in the queue of `key`.
+
+        `rate` (requests/second) overrides the queue's own rate for this
+        request, e.g. with the limit of the route that slowed it down.
+
+        Returns (True, delay) when queued: the caller must wait `delay`
+        seconds and then call `release(key)`. Returns (False, retry_after)
+        when the queue is full or the wait would exceed `max_wait`.
+        """
+        interval = 1.0 / rate if rate else self.interval
+        now = self._clock()
+        with self._lock:
+            if len(self._buckets) > 4 * self.max_total:
+                self._prune(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(now)
+            if bucket.depth >= self.max_depth or self.total >= self.max_total:
+                self.rejected += 1
+                return False, max(interval, bucket.next_release - now)
+            release_at = max(now, bucket.next_release)
+            if release_at - now > self.max_wait:
+                # By then the wait is back within max_wait
+                self.rejected += 1
+                return False, release_at - now - self.max_wait
+            bucket.next_release = release_at + interval
+            bucket.depth += 1
+            self.total += 1
+            return True, release_at - now
+
+    def release(self, key: Hashable) -> None:
+        """Leave the queue of `key` (after waiting, or when cancelled)."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return
+            bucket.depth -= 1
+            self.total -= 1
+            if bucket.depth <= 0 and bucket.next_release <= self._clock():
+                # Fully drained: forget the key
+                del self._buckets[key]
+
+    def _prune(self, now: float) -> None:
+        idle = [k for k, b in self._buckets.items() if b.depth <= 0 and b.next_release <= now]
+        for k in idle:
+            del self._buckets[k]
+
+    async def wait(self, key: Hashable, rate: Optional[float] = None) -> Tuple[bool, float]:
+        """Queue and wait for the release slot of `key` (at `rate`, see `reserve`).
+
+        Returns (True, waited_seconds) once released, or (False, retry_after)
+        immediately when the queue is full or the wait would be too long.
+        """
+        queued, delay = self.reserve(key, rate)
+        if not queued:
+            return False, delay
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self.release(key)
+        return True, delay
+
+    @staticmethod
+    def retry_after_header(seconds: float) -> int:
+        """Whole seconds for a Retry-After header (at least 1)."""
+        return max(1, math.ceil(seconds))
+
+    def __len__(self) -> int:
+        return self.total
+
+
+__all__ = ["LeakyBucketQueue", "MAX_WAIT"]
@@ -4,7 +4,12 @@ Design:
 - Nessuna connessione condivisa tra thread: ogni operazione apre la sua connessione
   (connection-per-call), che è sicuro con WAL.
 - Niente :memory: in concorrenza: di default usa un file locale.
-- Autocommit (isolation_level=None), niente BEGIN/COMMIT manuali.
+- Autocommit (isolation_level=None): i controlli su una sola chiave sono
+  singole istruzioni atomiche, niente BEGIN/COMMIT manuali.
+- Eccezione: increment_and_check_many_sync (più dimensioni in un colpo)
+  apre una transazione esplicita con BEGIN IMMEDIATE, così il lock di
+  scrittura è preso subito e tutti i contatori vengono letti e
+  incrementati insieme (COMMIT alla fine, ROLLBACK in caso di errore).
 - Retry con backoff solo su 'database is locked'.
 """
 
@@ -14,9 +19,11 @@ import asyncio
 import sqlite3
 import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 import logging
 
+from .rate_limiter import RateLimitCheck, RateLimitPolicy, slowdown_delay
+
 
 class SQLiteRateLimiter:
     def __init__(
@@ -27,6 +34,8 @@ class SQLiteRateLimiter:
     ):
         self.window = int(window_seconds)
         self.max_requests = int(max_requests)
+        # Quante volte un'operazione ha dovuto riprovare per "database is locked"
+        self.lock_retries = 0
 
         # Se non specificato, usa un file vicino al modulo
         if db_path is None:
@@ -89,17 +98,40 @@ class SQLiteRateLimiter:
             now = time.time()
         return int(now // self.window) * self.window
 
+    def _resolve(self, policy: Optional[RateLimitPolicy]) -> Tuple[int, int, str]:
+        if policy is None:
+            return self.window, self.max_requests, "block"
+        return policy.window_seconds, policy.max_requests, policy.mode
+
+    @staticmethod
+    def _result(policy: Optional[RateLimitPolicy], allowed: bool, remaining: int, retry_after: Optional[int]) -> tuple:
+        # Senza policy la forma storica a tre valori; con policy anche slowdown
+        if policy is None:
+            return allowed, remaining, retry_after
+        return allowed, remaining, retry_after, None
+
     # -------------------------
     # API Pubblica
     # -------------------------
 
-    async def increment_and_check(self, api_key: str) -> Tuple[bool, int, Optional[int]]:
-        """Wrapper async: esegue la logica su thread separato."""
-        return await asyncio.to_thread(self._increment_and_check_sync, api_key)
+    async def increment_and_check(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
+        """Wrapper async: esegue la logica su thread separato.
 
-    def _increment_and_check_sync(self, api_key: str) -> Tuple[bool, int, Optional[int]]:
+        `policy` (quota per chiave) sostituisce window/limite/modo del limiter
+        per questa chiamata; in quel caso il risultato ha anche il quarto
+        valore `slowdown`, come negli altri backend:
+        (allowed, remaining, retry_after, slowdown).
+        """
+        return await asyncio.to_thread(self._increment_and_check_sync, api_key, policy)
+
+    def increment_and_check_sync(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
+        """Variante sincrona per chiamanti senza event loop (es. Flask)."""
+        return self._increment_and_check_sync(api_key, policy)
+
+    def _increment_and_check_sync(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
         now = int(time.time())
-        window_start = self._window_start(now)
+        window, max_requests, mode = self._resolve(policy)
+        window_start = int(now // window) * window
 
         max_retries = 20
         for attempt in range(max_retries):
@@ -123,13 +155,13 @@ class SQLiteRateLimiter:
                 row = cur.fetchone()
                 if row and row["blocked_until"]:
                     retry_after = int(row["blocked_until"]) - now
-                    return False, 0, max(retry_after, 0)
+                    return self._result(policy, False, 0, max(retry_after, 0))
 
                 # 2) crea riga finestra se non esiste
                 cur.execute(
                     """
                     INSERT OR IGNORE INTO api_usage (api_key, window_start, count, blocked_until)
-                    VALUES (?, ?, 1, 0)
+                    VALUES (?, ?, 0, 0)
                     """,
                     (api_key, window_start),
                 )
@@ -156,10 +188,12 @@ class SQLiteRateLimiter:
                 row = cur.fetchone()
                 cur_count = int(row["count"]) if row and row["count"] is not None else 1
 
-                remaining = max(0, self.max_requests - cur_count)
+                remaining = max(0, max_requests - cur_count)
 
-                if cur_count > self.max_requests:
-                    blocked_ts = now + self.window
+                if cur_count > max_requests and mode == "slowdown":
+                    return True, 0, None, slowdown_delay(cur_count - max_requests)
+                if cur_count > max_requests:
+                    blocked_ts = now + window
                     cur.execute(
                         """
                         UPDATE api_usage
@@ -168,21 +202,139 @@ class SQLiteRateLimiter:
                         """,
                         (blocked_ts, api_key, window_start),
                     )
-                    return False, 0, self.window
+                    return self._result(policy, False, 0, window)
 
-                return True, remaining, None
+                return self._result(policy, True, remaining, None)
 
             except sqlite3.OperationalError as e:
                 msg = str(e).lower()
                 if "database is locked" in msg and attempt < max_retries - 1:
+                    self.lock_retries += 1
                     backoff = 0.001 * (2 ** min(attempt, 8))
                     time.sleep(backoff)
                     continue
                 logging.error(f"Rate limiter sqlite operational error: {e}")
-                return False, 0, 1
+                return self._result(policy, False, 0, 1)
+            except Exception as e:
+                logging.error(f"Rate limiter unexpected error: {e}")
+                return self._result(policy, False, 0, 1)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+        return self._result(policy, False, 0, 1)
+
+    async def increment_and_check_many(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Valuta più limiti in una sola transazione SQLite.
+
+        Vedi `RedisRateLimiter.increment_and_check_many`: ritorna il verdetto
+        più restrittivo come (allowed, remaining, retry_after, slowdown).
+        """
+        return await asyncio.to_thread(self._increment_and_check_many_sync, checks)
+
+    def increment_and_check_many_sync(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        """Variante sincrona per chiamanti senza event loop (es. Flask)."""
+        return self._increment_and_check_many_sync(checks)
+
+    def _increment_and_check_many_sync(
+        self, checks: Sequence[RateLimitCheck]
+    ) -> Tuple[bool, int, Optional[int], Optional[float]]:
+        if not checks:
+            return True, 0, None, None
+        now = int(time.time())
+        resolved = []
+        for dimension, key, policy in checks:
+            window, max_requests, mode = self._resolve(policy)
+            window_start = int(now // window) * window
+            resolved.append((f"{dimension}:{key}", window_start, window, max_requests, mode))
+
+        max_retries = 20
+        for attempt in range(max_retries):
+            conn = None
+            try:
+                conn = self._create_connection()
+                cur = conn.cursor()
+                # Una sola transazione: i lock vengono presi subito (IMMEDIATE)
+                cur.execute("BEGIN IMMEDIATE")
+
+                # 1) qualche dimensione già bloccata? Nessun contatore viene toccato
+                retry_after = 0
+                for name, _, _, _, _ in resolved:
+                    cur.execute(
+                        """
+                        SELECT MAX(blocked_until) AS blocked_until
+                        FROM api_usage
+                        WHERE api_key = ? AND blocked_until > ?
+                        """,
+                        (name, now),
+                    )
+                    row = cur.fetchone()
+                    if row and row["blocked_until"]:
+                        retry_after = max(retry_after, int(row["blocked_until"]) - now)
+                if retry_after:
+                    cur.execute("COMMIT")
+                    return False, 0, retry_after, None
+
+                # 2) incrementa tutti i contatori
+                remaining = None
+                blocked = 0
+                over = 0
+                for name, window_start, window, max_requests, mode in resolved:
+                    cur.execute(
+                        """
+                        INSERT OR IGNORE INTO api_usage (api_key, window_start, count, blocked_until)
+                        VALUES (?, ?, 0, 0)
+                        """,
+                        (name, window_start),
+                    )
+                    cur.execute(
+                        "UPDATE api_usage SET count = count + 1 WHERE api_key = ? AND window_start = ?",
+                        (name, window_start),
+                    )
+                    cur.execute(
+                        "SELECT count FROM api_usage WHERE api_key = ? AND window_start = ?",
+                        (name, window_start),
+                    )
+                    count = int(cur.fetchone()["count"])
+                    rem = max(0, max_requests - count)
+                    remaining = rem if remaining is None else min(remaining, rem)
+                    if count > max_requests:
+                        if mode == "block":
+                            cur.execute(
+                                "UPDATE api_usage SET blocked_until = ? WHERE api_key = ? AND window_start = ?",
+                                (now + window, name, window_start),
+                            )
+                            blocked = max(blocked, window)
+                        else:
+                            over = max(over, count - max_requests)
+                cur.execute("COMMIT")
+
+                if blocked:
+                    return False, 0, blocked, None
+                return True, remaining or 0, None, slowdown_delay(over) if over else None
+
+            except sqlite3.OperationalError as e:
+                if conn is not None and conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                msg = str(e).lower()
+                if ("database is locked" in msg or "busy" in msg) and attempt < max_retries - 1:
+                    self.lock_retries += 1
+                    time.sleep(0.001 * (2 ** min(attempt, 8)))
+                    continue
+                logging.error(f"Rate limiter sqlite operational error: {e}")
+                return False, 0, 1, None
             except Exception as e:
+                if conn is not None and conn.in_transaction:
+                    conn.execute("ROLLBACK")
                 logging.error(f"Rate limiter unexpected error: {e}")
-                return False, 0, 1
+                return False, 0, 1, None
             finally:
                 if conn is not None:
                     try:
@@ -190,7 +342,7 @@ class SQLiteRateLimiter:
                     except Exception:
                         pass
 
-        return False, 0, 1
+        return False, 0, 1, None
 
     async def is_blocked(self, api_key: str) -> Optional[int]:
         return await asyncio.to_thread(self._is_blocked_sync, api_key)
@@ -227,6 +379,7 @@ class SQLiteRateLimiter:
             except sqlite3.OperationalError as e:
                 msg = str(e).lower()
                 if "database is locked" in msg and attempt < max_retries - 1:
+                    self.lock_retries += 1
                     time.sleep(0.001 * (2 ** min(attempt, 8)))
                     continue
                 return None
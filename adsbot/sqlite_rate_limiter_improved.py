@@ -17,11 +17,15 @@ from typing import Optional, Tuple
 from pathlib import Path
 import logging
 
+from .rate_limiter import RateLimitPolicy, slowdown_delay
+
 
 class SQLiteRateLimiter:
     def __init__(self, db_path: Optional[str] = None, window_seconds: int = 60, max_requests: int = 5):
         self.window = int(window_seconds)
         self.max_requests = int(max_requests)
+        # Quante volte un'operazione ha dovuto riprovare per "database is locked"
+        self.lock_retries = 0
         self.db_path = db_path or ":memory:"
 
         # Connessione condivisa solo per DB in memoria
@@ -107,18 +111,41 @@ class SQLiteRateLimiter:
             now = time.time()
         return int(now // self.window) * self.window
 
+    def _resolve(self, policy: Optional[RateLimitPolicy]) -> Tuple[int, int, str]:
+        if policy is None:
+            return self.window, self.max_requests, "block"
+        return policy.window_seconds, policy.max_requests, policy.mode
+
+    @staticmethod
+    def _result(policy: Optional[RateLimitPolicy], allowed: bool, remaining: int, retry_after: Optional[int]) -> tuple:
+        # Senza policy la forma storica a tre valori; con policy anche slowdown
+        if policy is None:
+            return allowed, remaining, retry_after
+        return allowed, remaining, retry_after, None
+
     # -------------------------
     # API pubblica
     # -------------------------
 
-    async def increment_and_check(self, api_key: str) -> Tuple[bool, int, Optional[int]]:
-        """Wrapper async: esegue la logica su thread separato."""
-        return await asyncio.to_thread(self._increment_and_check_sync, api_key)
+    async def increment_and_check(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
+        """Wrapper async: esegue la logica su thread separato.
+
+        `policy` (quota per chiave) sostituisce window/limite/modo del limiter
+        per questa chiamata; in quel caso il risultato ha anche il quarto
+        valore `slowdown`, come negli altri backend:
+        (allowed, remaining, retry_after, slowdown).
+        """
+        return await asyncio.to_thread(self._increment_and_check_sync, api_key, policy)
+
+    def increment_and_check_sync(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
+        """Variante sincrona per chiamanti senza event loop (es. Flask)."""
+        return self._increment_and_check_sync(api_key, policy)
 
-    def _increment_and_check_sync(self, api_key: str) -> Tuple[bool, int, Optional[int]]:
+    def _increment_and_check_sync(self, api_key: str, policy: Optional[RateLimitPolicy] = None) -> tuple:
         """Incrementa il contatore e verifica il rate limit con operazioni atomiche."""
         now = int(time.time())
-        window_start = self._window_start(now)
+        window, max_requests, mode = self._resolve(policy)
+        window_start = int(now // window) * window
 
         max_retries = 20
         for attempt in range(max_retries):
@@ -141,7 +168,7 @@ class SQLiteRateLimiter:
                 row = cur.fetchone()
                 if row and row["blocked_until"]:
                     retry_after = int(row["blocked_until"]) - now
-                    return False, 0, max(retry_after, 0)
+                    return self._result(policy, False, 0, max(retry_after, 0))
 
                 # 2) Inserisci riga se non esiste
                 cur.execute(
@@ -174,11 +201,13 @@ class SQLiteRateLimiter:
                 row = cur.fetchone()
                 cur_count = int(row["count"]) if row and row["count"] is not None else 1
 
-                remaining = max(0, self.max_requests - cur_count)
+                remaining = max(0, max_requests - cur_count)
 
                 # 5) Se ha superato il limite → blocca fino alla fine della finestra
-                if cur_count > self.max_requests:
-                    blocked_ts = now + self.window
+                if cur_count > max_requests and mode == "slowdown":
+                    return True, 0, None, slowdown_delay(cur_count - max_requests)
+                if cur_count > max_requests:
+                    blocked_ts = now + window
                     cur.execute(
                         """
                         UPDATE api_usage
@@ -187,23 +216,24 @@ class SQLiteRateLimiter:
                         """,
                         (blocked_ts, api_key, window_start),
                     )
-                    return False, 0, self.window
+                    return self._result(policy, False, 0, window)
 
                 # Nessun blocco
-                return True, remaining, None
+                return self._result(policy, True, remaining, None)
 
             except sqlite3.OperationalError as e:
                 msg = str(e).lower()
                 if "database is locked" in msg and attempt < max_retries - 1:
+                    self.lock_retries += 1
                     # Backoff esponenziale
                     backoff = 0.001 * (2 ** min(attempt, 8))
                     time.sleep(backoff)
                     continue
                 logging.error(f"Rate limiter error after {max_retries} retries: {e}")
-                return False, 0, 1
+                return self._result(policy, False, 0, 1)
             except Exception as e:
                 logging.error(f"Rate limiter unexpected error: {e}")
-                return False, 0, 1
+                return self._result(policy, False, 0, 1)
             finally:
                 # Chiudi solo se è una connessione "usa e getta"
                 if self._shared_conn is None and "conn" in locals():
@@ -212,7 +242,7 @@ class SQLiteRateLimiter:
                     except Exception:
                         pass
 
-        return False, 0, 1
+        return self._result(policy, False, 0, 1)
 
     async def is_blocked(self, api_key: str) -> Optional[int]:
         return await asyncio.to_thread(self._is_blocked_sync, api_key)
@@ -256,6 +286,7 @@ class SQLiteRateLimiter:
             except sqlite3.OperationalError as e:
                 msg = str(e).lower()
                 if "database is locked" in msg and attempt < max_retries - 1:
+                    self.lock_retries += 1
                     time.sleep(0.001 * (2 ** min(attempt, 8)))
                     continue
                 return None
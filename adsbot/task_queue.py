@@ -0,0 +1,354 @@
+"""Background queue for side effects that must not delay the reply.
+
+A handler that has committed its own work often still has something to do
+that the user doesn't wait for: notify the other party, write an audit row,
+call a slow API. Awaiting those before answering adds their latency (and
+their failures) to the user's response. Instead the handler hands them over:
+
+    await enqueue_task(context, "notify_new_order", order_id=order.id, ...)
+
+and replies right away. `TaskQueue` runs jobs on a few asyncio workers on
+the bot's event loop; a job that raises is retried with exponential backoff
+up to `max_attempts` times, then logged and dropped (or kept as "failed" in
+the store).
+
+Tasks are `async def task(context, **kwargs)` functions registered by name
+with `@task("name")`. Workers pass the `Application` as `context` (it has
+`bot` and `bot_data`), so a task can be reused from a handler as it is.
+
+By default jobs live in memory and are lost on restart. With a
+`SQLiteTaskStore` each job is written to SQLite when enqueued and deleted
+when done, and jobs left over by a previous run are picked up on `start`.
+Store writes run in a thread, never on the event loop: an enqueue from a
+handler returns at once and the job is queued once its row is committed.
+Durable jobs must have JSON-serializable arguments.
+
+Enqueue only after the commit the side effect depends on: the job may start
+before the handler returns.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TaskFunc = Callable[..., Awaitable[Any]]
+
+# name -> task function, filled by @task
+TASKS: Dict[str, TaskFunc] = {}
+
+
+def task(name: str) -> Callable[[TaskFunc], TaskFunc]:
+    """Register an async function as the background task `name`."""
+
+    def decorator(func: TaskFunc) -> TaskFunc:
+        TASKS[name] = func
+        return func
+
+    return decorator
+
+
+class _Job:
+    __slots__ = ("name", "kwargs", "job_id", "attempts")
+
+    def __init__(self, name: str, kwargs: Dict[str, Any], job_id: Optional[int] = None, attempts: int = 0):
+        self.name = name
+        self.kwargs = kwargs
+        self.job_id = job_id
+        self.attempts = attempts
+
+
+class SQLiteTaskStore:
+    """Pending and failed jobs in one SQLite table (completed jobs are deleted)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS background_tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def add(self, name: str, kwargs: Dict[str, Any]) -> int:
+        return self.insert(name, json.dumps(kwargs))
+
+    def insert(self, name: str, payload: str) -> int:
+        """Store a job whose arguments are already JSON-encoded."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO background_tasks (name, payload, created_at) VALUES (?, ?, ?)",
+                (name, payload, time.time()),
+            )
+        return cursor.lastrowid
+
+    def pending(self) -> List[Tuple[int, str, Dict[str, Any], int]]:
+        """(id, name, kwargs, attempts) of unfinished jobs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, payload, attempts FROM background_tasks WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+        return [(job_id, name, json.loads(payload), attempts) for job_id, name, payload, attempts in rows]
+
+    def attempted(self, job_id: int, attempts: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE background_tasks SET attempts = ?, last_error = ? WHERE id = ?", (attempts, error, job_id)
+            )
+
+    def done(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM background_tasks WHERE id = ?", (job_id,))
+
+    def failed(self, job_id: int, attempts: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE background_tasks SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, error, job_id),
+            )
+
+    def count(self, status: str = "pending") -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM background_tasks WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TaskQueue:
+    def __init__(
+        self,
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+        store: Optional[SQLiteTaskStore] = None,
+        tasks: Optional[Dict[str, TaskFunc]] = None,
+    ):
+        """Create a queue; jobs run once `start` is awaited.
+
+        Args:
+            workers: jobs running at the same time
+            max_attempts: runs of a failing job before it is given up
+            retry_delay: wait before the first retry, doubled on each retry
+            max_retry_delay: upper bound of the retry wait (seconds)
+            store: durable job storage (default: in memory only)
+            tasks: name -> task registry (default: the `@task` registry)
+        """
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.store = store
+        self.tasks = TASKS if tasks is None else tasks
+
+        self._context: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._delayed: Dict[int, asyncio.TimerHandle] = {}
+        # Enqueued before start: handed to the workers by `start`
+        self._backlog: List[_Job] = []
+        # Jobs being written to the store, queued once written
+        self._storing: Set[asyncio.Task] = set()
+
+        # Metrics
+        self.enqueued = 0
+        self.running = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, context: Any) -> None:
+        """Start the workers; `context` (usually the Application) is passed to every task."""
+        if self.started:
+            return
+        self._context = context
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        if self.store is not None:
+            queued = {job.job_id for job in self._backlog}
+            leftovers = [
+                _Job(name, kwargs, job_id, attempts)
+                for job_id, name, kwargs, attempts in await asyncio.to_thread(self.store.pending)
+                if job_id not in queued
+            ]
+            if leftovers:
+                logger.info(f"Resuming {len(leftovers)} background task(s) from a previous run")
+            self._backlog[:0] = leftovers
+        for job in self._backlog:
+            self._queue.put_nowait(job)
+        self._backlog.clear()
+        self._workers = [asyncio.create_task(self._work(), name=f"task-worker-{i}") for i in range(self.workers)]
+
+    def enqueue(self, name: str, **kwargs: Any) -> None:
+        """Queue task `name` with `kwargs`; safe to call from any thread.
+
+        With a store, on the queue's event loop the job's row is written by
+        a thread and the job queued afterwards, so the caller never waits
+        for the SQLite commit; from other threads (or before `start`) the
+        row is written right away.
+        """
+        if name not in self.tasks:
+            raise KeyError(f"Unknown background task {name!r}")
+        job = _Job(name, kwargs)
+        try:
+            in_loop = self.started and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if self.store is not None:
+            # Encoded here: arguments that can't be stored fail in the caller
+            payload = json.dumps(kwargs)
+            if in_loop:
+                storing = self._loop.create_task(self._store_and_queue(job, payload))
+                self._storing.add(storing)
+                storing.add_done_callback(self._storing.discard)
+                self.enqueued += 1
+                return
+            job.job_id = self.store.insert(name, payload)
+        self.enqueued += 1
+        if not self.started:
+            self._backlog.append(job)
+            return
+        if in_loop:
+            self._queue.put_nowait(job)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+
+    async def _store_and_queue(self, job: _Job, payload: str) -> None:
+        try:
+            job.job_id = await asyncio.to_thread(self.store.insert, job.name, payload)
+        except Exception as e:
+            # Still run it, just not durably
+            logger.error(f"Could not store background task {job.name}: {e}")
+        self._queue.put_nowait(job)
+
+    async def _store(self, method: Callable[..., None], *args: Any) -> None:
+        """Record a job's outcome in the store, off the event loop."""
+        try:
+            await asyncio.to_thread(method, *args)
+        except Exception as e:
+            logger.error(f"Could not update background task store: {e}")
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: _Job) -> None:
+        job.attempts += 1
+        self.running += 1
+        try:
+            await self.tasks[job.name](self._context, **job.kwargs)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error(f"Background task {job.name} failed after {job.attempts} attempt(s): {error}")
+                if self.store is not None and job.job_id is not None:
+                    await self._store(self.store.failed, job.job_id, job.attempts, error)
+                return
+            self.retried += 1
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (job.attempts - 1))
+            logger.warning(f"Background task {job.name} failed ({error}), retry in {delay:.1f}s")
+            if self.store is not None and job.job_id is not None:
+                await self._store(self.store.attempted, job.job_id, job.attempts, error)
+            self._delayed[id(job)] = self._loop.call_later(delay, self._requeue, job)
+        else:
+            self.completed += 1
+            if self.store is not None and job.job_id is not None:
+                await self._store(self.store.done, job.job_id)
+        finally:
+            self.running -= 1
+
+    def _requeue(self, job: _Job) -> None:
+        self._delayed.pop(id(job), None)
+        self._queue.put_nowait(job)
+
+    async def join(self) -> None:
+        """Wait until every queued job, retries included, has finished."""
+        if not self.started:
+            return
+        while True:
+            if self._storing:
+                await asyncio.gather(*self._storing, return_exceptions=True)
+            await self._queue.join()
+            if not self._delayed and not self._storing:
+                return
+            await asyncio.sleep(min(0.05, self.retry_delay))
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Drain the queue for up to `timeout` seconds, then stop the workers.
+
+        Jobs still waiting are lost, unless the queue has a store: they are
+        run again by the next `start`.
+        """
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self.depth()} background task(s) still queued")
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def depth(self) -> int:
+        """Jobs waiting to run (including those waiting for a retry)."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + len(self._delayed) + len(self._backlog) + len(self._storing)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self.depth(),
+            "running": self.running,
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+async def enqueue_task(context, name: str, **kwargs: Any) -> None:
+    """Run side effect `name` in the background for a handler.
+
+    Uses the application's `TaskQueue` (`bot_data["task_queue"]`) when
+    installed; otherwise awaits the task inline, as before.
+    """
+    queue = context.bot_data["task_queue"] if "task_queue" in context.bot_data else None
+    if isinstance(queue, TaskQueue):
+        queue.enqueue(name, **kwargs)
+        return
+    await TASKS[name](context, **kwargs)
+
+
+__all__ = ["SQLiteTaskStore", "TASKS", "TaskQueue", "enqueue_task", "task"]
@@ -0,0 +1,112 @@
+"""Concurrent update processing that keeps each chat's updates in order.
+
+PTB's `concurrent_updates=N` runs any N updates at once, so two messages of
+the same user can race through a ConversationHandler (and its
+`context.user_data`). `PerChatUpdateProcessor` runs updates of different
+chats concurrently, up to `max_concurrent_updates` at a time, while updates
+of one chat run strictly one after another in arrival order.
+
+A chat may have at most `max_chat_queue` updates waiting or running;
+further updates of that chat are dropped (a client spamming one chat can't
+occupy every pending slot). Updates without a chat or user (e.g. polls) are
+not serialized.
+
+Usage:
+
+    Application.builder().concurrent_updates(PerChatUpdateProcessor(16)).build()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    __slots__ = ("concurrency", "max_chat_queue", "_running", "_chats", "dropped", "processed")
+
+    def __init__(self, max_concurrent_updates: int, max_chat_queue: int = 20):
+        """Create the processor.
+
+        Args:
+            max_concurrent_updates: updates handled at the same time (across chats)
+            max_chat_queue: updates one chat may have waiting or running
+        """
+        if max_chat_queue < 1:
+            raise ValueError("max_chat_queue must be a positive integer")
+        # The base class semaphore bounds updates in flight (waiting for their
+        # chat included); the real concurrency limit is `_running`, taken only
+        # once an update is at the head of its chat, so a busy chat's backlog
+        # doesn't hold execution slots.
+        super().__init__(max_concurrent_updates * max_chat_queue)
+        self.concurrency = int(max_concurrent_updates)
+        self.max_chat_queue = int(max_chat_queue)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats: Dict[Any, _ChatQueue] = {}
+        self.dropped = 0
+        self.processed = 0
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            self.processed += 1
+            return
+
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        if queue.pending >= self.max_chat_queue:
+            self.dropped += 1
+            coroutine.close()  # type: ignore[attr-defined]
+            logger.warning(f"Chat {key} has {queue.pending} pending updates, dropping update")
+            return
+
+        queue.pending += 1
+        try:
+            async with queue.lock:
+                async with self._running:
+                    await coroutine
+            self.processed += 1
+        finally:
+            queue.pending -= 1
+            if queue.pending == 0:
+                del self._chats[key]
+
+    def pending(self) -> int:
+        """Updates waiting for or holding their chat."""
+        return sum(queue.pending for queue in self._chats.values())
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+__all__ = ["PerChatUpdateProcessor"]
@@ -0,0 +1,130 @@
+"""Webhook serving mode for the bot (Starlette + uvicorn).
+
+Telegram POSTs each update to our endpoint; the endpoint only validates it
+and puts it on `application.update_queue`. That queue is bounded (see
+`Config.update_queue_size`): when handlers fall behind, the endpoint waits
+up to `queue_timeout` seconds for a free slot and then answers 503, so
+Telegram retries later instead of us buffering without limit. Handlers
+consume the queue with `Config.concurrent_updates` updates in flight.
+
+Usage:
+
+    asyncio.run(run_webhook(application, config))
+
+or mount `create_webhook_app(application)` in an existing ASGI server.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def create_webhook_app(
+    application: Application,
+    *,
+    path: str = "/telegram",
+    secret_token: Optional[str] = None,
+    queue_timeout: float = 1.0,
+) -> Starlette:
+    """Return an ASGI app feeding POSTed updates into `application.update_queue`.
+
+    Args:
+        application: an initialized and started PTB Application
+        path: URL path Telegram posts to
+        secret_token: expected X-Telegram-Bot-Api-Secret-Token (optional)
+        queue_timeout: seconds to wait for room in a full queue before 503
+    """
+    queue = application.update_queue
+    stats = {"accepted": 0, "rejected": 0}
+
+    async def receive_update(request: Request) -> Response:
+        if secret_token and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return Response(status_code=403)
+        try:
+            data = json.loads(await request.body())
+            update = Update.de_json(data, application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid update payload: {e}")
+            return Response(status_code=400)
+
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Back-pressure: hold the connection briefly, then let Telegram retry
+            try:
+                await asyncio.wait_for(queue.put(update), queue_timeout)
+            except asyncio.TimeoutError:
+                stats["rejected"] += 1
+                return Response(status_code=503, headers={"Retry-After": "1"})
+        stats["accepted"] += 1
+        return Response(status_code=200)
+
+    async def health(request: Request) -> Response:
+        return JSONResponse({"queue_size": queue.qsize(), "queue_max": queue.maxsize, **stats})
+
+    app = Starlette(
+        routes=[
+            Route(path, receive_update, methods=["POST"]),
+            Route("/healthz", health, methods=["GET"]),
+        ]
+    )
+    app.state.webhook_stats = stats
+    return app
+
+
+async def run_webhook(application: Application, config: Config) -> None:
+    """Register the webhook with Telegram and serve it until interrupted."""
+    import uvicorn
+
+    app = create_webhook_app(
+        application,
+        path=config.webhook_path,
+        secret_token=config.webhook_secret or None,
+    )
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=config.webhook_listen, port=config.webhook_port, log_level="warning")
+    )
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await application.bot.set_webhook(
+            url=config.webhook_url.rstrip("/") + config.webhook_path,
+            secret_token=config.webhook_secret or None,
+            max_connections=config.webhook_max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(
+            f"Webhook listening on {config.webhook_listen}:{config.webhook_port}{config.webhook_path} "
+            f"(concurrent_updates={config.concurrent_updates}, queue={config.update_queue_size})"
+        )
+        await server.serve()
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+__all__ = ["create_webhook_app", "run_webhook"]
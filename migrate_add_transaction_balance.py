@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Migrazione: Aggiunge balance_after e l'indice (user_id, created_at, id) alla tabella transactions.
+
+Le righe esistenti vengono riempite a ritroso partendo dal saldo attuale
+dell'utente (user_balances), così l'estratto conto paginato mostra il saldo
+anche per lo storico.
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+# Trova il percorso del database
+db_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "adsbot.db"
+
+if not db_path.exists():
+    print(f"Database non trovato: {db_path}")
+    sys.exit(1)
+
+print(f"Connecting to: {db_path}")
+conn = sqlite3.connect(str(db_path))
+cursor = conn.cursor()
+
+# Controlla se la colonna esiste già
+cursor.execute("PRAGMA table_info(transactions)")
+columns = {row[1] for row in cursor.fetchall()}
+
+if not columns:
+    print("Tabella transactions non presente: verrà creata dal bot con lo schema aggiornato")
+    conn.close()
+    sys.exit(0)
+
+if 'balance_after' not in columns:
+    print("Aggiungendo colonna balance_after...")
+    cursor.execute("""
+        ALTER TABLE transactions ADD COLUMN balance_after FLOAT NULL
+    """)
+    print("✓ balance_after aggiunto")
+else:
+    print("✓ balance_after già esiste")
+
+print("Creando indice ix_transactions_user_id_created_at_id...")
+cursor.execute("""
+    CREATE INDEX IF NOT EXISTS ix_transactions_user_id_created_at_id
+    ON transactions (user_id, created_at, id)
+""")
+print("✓ indice presente")
+
+# Riempie balance_after a ritroso: il saldo dopo l'ultima transazione è il
+# saldo attuale, ogni riga precedente toglie l'effetto di quella successiva
+SIGNS = {"earn": 1, "refund": 1, "spend": -1, "withdrawal": -1}
+balances = dict(cursor.execute("SELECT user_id, balance FROM user_balances").fetchall())
+user_ids = [row[0] for row in cursor.execute("SELECT DISTINCT user_id FROM transactions WHERE balance_after IS NULL")]
+
+filled = 0
+for user_id in user_ids:
+    running = balances.get(user_id) or 0.0
+    rows = cursor.execute(
+        "SELECT id, transaction_type, amount, balance_after FROM transactions "
+        "WHERE user_id = ? ORDER BY created_at DESC, id DESC",
+        (user_id,),
+    ).fetchall()
+    updates = []
+    for tx_id, tx_type, amount, balance_after in rows:
+        if balance_after is not None:
+            running = balance_after
+        else:
+            updates.append((round(running, 2), tx_id))
+        running -= SIGNS.get(tx_type, 0) * (amount or 0.0)
+    cursor.executemany("UPDATE transactions SET balance_after = ? WHERE id = ?", updates)
+    filled += len(updates)
+
+print(f"✓ balance_after calcolato per {filled} transazioni di {len(user_ids)} utenti")
+
+conn.commit()
+conn.close()
+
+print("\n✅ Migrazione completata!")
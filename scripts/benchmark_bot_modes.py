@@ -0,0 +1,212 @@
+"""Polling vs. webhook throughput comparison against the fake Bot API.
+
+Pushes a burst of message updates through a PTB Application in both
+delivery modes and measures how fast they are answered:
+
+- polling: updates are queued on the fake server and fetched with getUpdates
+- webhook: updates are POSTed to `adsbot.webhook.create_webhook_app`
+  (served by uvicorn) by `--senders` concurrent connections, retrying on 503
+
+The handler simulates a typical Adsbot handler: `--work-ms` of async work
+(DB/API wait) and one sendMessage to the fake server (`--latency-ms` each).
+Latency is measured from the moment an update is offered (queued on the
+fake server / first POST attempt) until its reply reaches the fake server.
+
+Usage:
+    python scripts/benchmark_bot_modes.py --updates 2000 --concurrent-updates 1 16 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from scripts.fake_bot_api import FakeBotAPI, make_message_update
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_app(api: FakeBotAPI, concurrent_updates: int, queue_size: int, work: float) -> Application:
+    async def handle(update: Update, context) -> None:
+        if work:
+            await asyncio.sleep(work)
+        await update.message.reply_text(str(update.update_id))
+
+    application = (
+        Application.builder()
+        .token("123456:BENCHMARK")
+        .base_url(api.base_url)
+        .concurrent_updates(concurrent_updates)
+        .update_queue(asyncio.Queue(maxsize=queue_size))
+        .connection_pool_size(max(8, concurrent_updates * 2))
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.ALL, handle))
+    return application
+
+
+async def _wait_for_replies(api: FakeBotAPI, count: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while api.calls["sendMessage"] < count:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"only {api.calls['sendMessage']}/{count} replies after {timeout}s")
+        await asyncio.sleep(0.01)
+
+
+async def run_polling(api: FakeBotAPI, args, concurrent_updates: int) -> Dict[str, float]:
+    application = build_app(api, concurrent_updates, args.queue_size, args.work_ms / 1000)
+    offered: Dict[int, float] = {}
+    await application.initialize()
+    await application.start()
+    try:
+        started = time.perf_counter()
+        for update_id in range(1, args.updates + 1):
+            offered[update_id] = time.perf_counter()
+            api.enqueue(make_message_update(update_id, chat_id=1000 + update_id % args.chats))
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await _wait_for_replies(api, args.updates, args.timeout)
+        elapsed = time.perf_counter() - started
+        await application.updater.stop()
+    finally:
+        await application.stop()
+        await application.shutdown()
+    return {"elapsed": elapsed, "offered": offered, "rejected": 0}
+
+
+async def run_webhook(api: FakeBotAPI, args, concurrent_updates: int) -> Dict[str, float]:
+    import httpx
+    import uvicorn
+
+    from adsbot.webhook import create_webhook_app
+
+    application = build_app(api, concurrent_updates, args.queue_size, args.work_ms / 1000)
+    port = _free_port()
+    webhook_app = create_webhook_app(application, path="/telegram", queue_timeout=args.queue_timeout)
+    server = uvicorn.Server(uvicorn.Config(webhook_app, host="127.0.0.1", port=port, log_level="error"))
+    offered: Dict[int, float] = {}
+    rejected = 0
+
+    await application.initialize()
+    await application.start()
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        url = f"http://127.0.0.1:{port}/telegram"
+        pending = list(range(args.updates, 0, -1))
+        limits = httpx.Limits(max_connections=args.senders, max_keepalive_connections=args.senders)
+
+        async def sender(client: httpx.AsyncClient) -> None:
+            nonlocal rejected
+            while pending:
+                update_id = pending.pop()
+                offered.setdefault(update_id, time.perf_counter())
+                payload = make_message_update(update_id, chat_id=1000 + update_id % args.chats)
+                while True:
+                    response = await client.post(url, json=payload)
+                    if response.status_code != 503:
+                        break
+                    # Telegram backs off and redelivers; do the same
+                    rejected += 1
+                    await asyncio.sleep(0.05)
+
+        async def send_all() -> None:
+            async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+                await asyncio.gather(*(sender(client) for _ in range(args.senders)))
+
+        started = time.perf_counter()
+        # Own thread and loop, like Telegram's servers: the load generator
+        # must not compete with the bot for its event loop
+        await asyncio.to_thread(asyncio.run, send_all())
+        await _wait_for_replies(api, args.updates, args.timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+        await serve_task
+        await application.stop()
+        await application.shutdown()
+    return {"elapsed": elapsed, "offered": offered, "rejected": rejected}
+
+
+async def run_case(mode: str, concurrent_updates: int, args) -> Dict[str, object]:
+    api = FakeBotAPI(latency=args.latency_ms / 1000).start()
+    try:
+        runner = run_polling if mode == "polling" else run_webhook
+        outcome = await runner(api, args, concurrent_updates)
+        replies = api.calls_to("sendMessage")
+    finally:
+        api.stop()
+
+    offered = outcome["offered"]
+    latencies = sorted(ts - offered[int(params["text"])] for ts, params in replies)
+    return {
+        "mode": mode,
+        "concurrent_updates": concurrent_updates,
+        "updates": len(replies),
+        "elapsed_s": round(outcome["elapsed"], 3),
+        "updates_per_sec": round(len(replies) / outcome["elapsed"], 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "rejected_503": outcome["rejected"],
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=["polling", "webhook"], default=["polling", "webhook"])
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrent-updates", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--queue-size", type=int, default=200, help="bounded update queue size")
+    parser.add_argument("--queue-timeout", type=float, default=0.5, help="webhook wait before 503")
+    parser.add_argument("--senders", type=int, default=40, help="concurrent webhook connections")
+    parser.add_argument("--chats", type=int, default=100, help="distinct chats sending updates")
+    parser.add_argument("--work-ms", type=float, default=5.0, help="simulated handler work")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake Bot API latency per call")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> List[Dict[str, object]]:
+    args = parse_args(argv)
+    results = [
+        asyncio.run(run_case(mode, concurrent, args))
+        for concurrent in args.concurrent_updates
+        for mode in args.modes
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'mode':<8} {'conc':>5} {'upd/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'503s':>6}")
+        for r in results:
+            print(
+                f"{r['mode']:<8} {r['concurrent_updates']:>5} {r['updates_per_sec']:>9} "
+                f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['rejected_503']:>6}"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Load and contention benchmark harness for the rate limiter backends.
+
+Drives each backend from N threads, N processes or N asyncio tasks over a
+hot-key/cold-key distribution and reports, per (backend, driver):
+
+- ops/sec and p50/p99 latency
+- lock retries (SQLite "database is locked" retries)
+- false blocks: requests denied although their key had not used up its
+  quota yet (contention errors surface here, since the SQLite backends
+  fail closed)
+- over-admits: requests allowed beyond the quota (lost updates)
+
+Usage:
+    python scripts/benchmark_rate_limiters.py
+    python scripts/benchmark_rate_limiters.py --backends memory sqlite --drivers threads asyncio \\
+        --workers 16 --requests 20000 --output results.json
+
+Redis runs against REDIS_URL when set, otherwise against fakeredis if
+installed (fakeredis is process-local, so it is skipped for the process
+driver, as is the in-memory backend). Correctness figures assume the run
+fits in one limiter window; `window_rollover` is set when it did not.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from adsbot.flask_decorator import check_sync
+from adsbot.memory_rate_limiter import InMemoryRateLimiter
+from adsbot.rate_limiter import RedisRateLimiter
+from adsbot.sqlite_rate_limiter import SQLiteRateLimiter
+from adsbot.sqlite_rate_limiter_improved import SQLiteRateLimiter as SQLiteRateLimiterImproved
+from adsbot.sqlite_rate_limiter_v2 import SQLiteRateLimiter as SQLiteRateLimiterV2
+
+BACKENDS = ["memory", "sqlite", "sqlite_improved", "sqlite_v2", "redis"]
+DRIVERS = ["threads", "processes", "asyncio"]
+# Backends whose state lives in one process only
+PROCESS_LOCAL = {"memory"}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_limiter(backend: str, window: int, max_requests: int, workdir: str):
+    """Build a limiter; every call for the same workdir shares the same store."""
+    if backend == "memory":
+        return InMemoryRateLimiter(window_seconds=window, max_requests=max_requests)
+    if backend == "sqlite":
+        return SQLiteRateLimiter(os.path.join(workdir, "sqlite.db"), window, max_requests)
+    if backend == "sqlite_improved":
+        return SQLiteRateLimiterImproved(os.path.join(workdir, "sqlite_improved.db"), window, max_requests)
+    if backend == "sqlite_v2":
+        return SQLiteRateLimiterV2(os.path.join(workdir, "sqlite_v2.db"), window, max_requests)
+    if backend == "redis":
+        url = os.getenv("REDIS_URL")
+        if url:
+            import redis.asyncio as aioredis
+
+            client = aioredis.Redis.from_url(url)
+        else:
+            import fakeredis
+
+            client = fakeredis.FakeAsyncRedis()
+        return RedisRateLimiter(redis_client=client, window_seconds=window, max_requests=max_requests)
+    raise ValueError(f"unknown backend: {backend}")
+
+
+def backend_available(backend: str, driver: str) -> Optional[str]:
+    """Return a skip reason, or None when the combination can run."""
+    if driver == "processes" and backend in PROCESS_LOCAL:
+        return "state is process-local"
+    if backend == "redis" and not os.getenv("REDIS_URL"):
+        try:
+            import fakeredis  # noqa: F401
+        except ImportError:
+            return "REDIS_URL not set and fakeredis not installed"
+        if driver == "processes":
+            return "fakeredis is process-local; set REDIS_URL"
+    return None
+
+
+class KeyChooser:
+    """Hot/cold key distribution: `hot_fraction` of requests hit `hot` keys."""
+
+    def __init__(self, hot: int, cold: int, hot_fraction: float, seed: int):
+        self._rng = random.Random(seed)
+        self._hot = [f"hot-{i}" for i in range(max(1, hot))]
+        self._cold = [f"cold-{i}" for i in range(max(1, cold))]
+        self._hot_fraction = hot_fraction
+
+    def __call__(self) -> str:
+        pool = self._hot if self._rng.random() < self._hot_fraction else self._cold
+        return self._rng.choice(pool)
+
+
+class _Tally:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.attempts: Counter = Counter()
+        self.allowed: Counter = Counter()
+        self.errors = 0
+
+    def record(self, key: str, started: float, allowed: Optional[bool]) -> None:
+        self.latencies.append(time.perf_counter() - started)
+        self.attempts[key] += 1
+        if allowed is None:
+            self.errors += 1
+        elif allowed:
+            self.allowed[key] += 1
+
+    def merge(self, other: "_Tally") -> None:
+        self.latencies.extend(other.latencies)
+        self.attempts.update(other.attempts)
+        self.allowed.update(other.allowed)
+        self.errors += other.errors
+
+
+def _sync_loop(limiter, count: int, chooser: KeyChooser) -> _Tally:
+    tally = _Tally()
+    for _ in range(count):
+        key = chooser()
+        started = time.perf_counter()
+        try:
+            allowed = check_sync(limiter, key)[0]
+        except Exception:
+            allowed = None
+        tally.record(key, started, allowed)
+    return tally
+
+
+def _process_worker(backend, window, max_requests, workdir, count, seed, hot, cold, hot_fraction):
+    limiter = make_limiter(backend, window, max_requests, workdir)
+    tally = _sync_loop(limiter, count, KeyChooser(hot, cold, hot_fraction, seed))
+    return tally, getattr(limiter, "lock_retries", 0)
+
+
+def run_threads(limiter, args, per_worker: int) -> _Tally:
+    tallies = [None] * args.workers
+
+    def worker(i: int) -> None:
+        chooser = KeyChooser(args.hot_keys, args.cold_keys, args.hot_fraction, args.seed + i)
+        tallies[i] = _sync_loop(limiter, per_worker, chooser)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = _Tally()
+    for tally in tallies:
+        total.merge(tally)
+    return total
+
+
+def run_asyncio(limiter, args, per_worker: int) -> _Tally:
+    async def worker(i: int, tally: _Tally) -> None:
+        chooser = KeyChooser(args.hot_keys, args.cold_keys, args.hot_fraction, args.seed + i)
+        for _ in range(per_worker):
+            key = chooser()
+            started = time.perf_counter()
+            try:
+                allowed = (await limiter.increment_and_check(key))[0]
+            except Exception:
+                allowed = None
+            tally.record(key, started, allowed)
+
+    async def main() -> _Tally:
+        tally = _Tally()
+        await asyncio.gather(*(worker(i, tally) for i in range(args.workers)))
+        return tally
+
+    return asyncio.run(main())
+
+
+def run_processes(backend, args, per_worker: int, workdir: str):
+    total = _Tally()
+    retries = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(
+                _process_worker, backend, args.window, args.max_requests, workdir,
+                per_worker, args.seed + i, args.hot_keys, args.cold_keys, args.hot_fraction,
+            )
+            for i in range(args.workers)
+        ]
+        for future in futures:
+            tally, worker_retries = future.result()
+            total.merge(tally)
+            retries += worker_retries
+    return total, retries
+
+
+def run_case(backend: str, driver: str, args) -> Dict[str, object]:
+    result: Dict[str, object] = {"backend": backend, "driver": driver, "workers": args.workers}
+    skip = backend_available(backend, driver)
+    if skip:
+        result["skipped"] = skip
+        return result
+
+    per_worker = max(1, args.requests // args.workers)
+    with tempfile.TemporaryDirectory() as workdir:
+        limiter = make_limiter(backend, args.window, args.max_requests, workdir)
+        window_before = int(time.time() // args.window)
+        started = time.perf_counter()
+        if driver == "threads":
+            tally = run_threads(limiter, args, per_worker)
+            retries = getattr(limiter, "lock_retries", 0)
+        elif driver == "asyncio":
+            tally = run_asyncio(limiter, args, per_worker)
+            retries = getattr(limiter, "lock_retries", 0)
+        else:
+            tally, retries = run_processes(backend, args, per_worker, workdir)
+        elapsed = time.perf_counter() - started
+        window_after = int(time.time() // args.window)
+
+    ops = len(tally.latencies)
+    false_blocks = sum(
+        max(0, min(attempts, args.max_requests) - tally.allowed[key]) for key, attempts in tally.attempts.items()
+    )
+    over_admits = sum(max(0, allowed - args.max_requests) for allowed in tally.allowed.values())
+    latencies = sorted(tally.latencies)
+    result.update(
+        {
+            "ops": ops,
+            "elapsed_s": round(elapsed, 4),
+            "ops_per_sec": round(ops / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 4),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 4),
+            "lock_retries": retries,
+            "errors": tally.errors,
+            "false_blocks": false_blocks,
+            "false_block_rate": round(false_blocks / ops, 6) if ops else 0.0,
+            "over_admits": over_admits,
+            "window_rollover": window_before != window_after,
+        }
+    )
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--drivers", nargs="+", choices=DRIVERS, default=DRIVERS)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4000, help="total requests per case")
+    parser.add_argument("--hot-keys", type=int, default=5)
+    parser.add_argument("--cold-keys", type=int, default=500)
+    parser.add_argument("--hot-fraction", type=float, default=0.8)
+    parser.add_argument("--max-requests", type=int, default=200, help="limit per key and window")
+    parser.add_argument("--window", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> List[Dict[str, object]]:
+    args = parse_args(argv)
+    results = [run_case(backend, driver, args) for backend in args.backends for driver in args.drivers]
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Minimal fake Telegram Bot API server for local tests and benchmarks.
+
+Implements just enough of the Bot API for python-telegram-bot to run
+against it: getMe, getUpdates (long polling from an in-memory queue),
+setWebhook/deleteWebhook, sendMessage/editMessageText (echoing a message
+object), getChat/getChatMember/getChatMemberCount (every chat is a channel
+the caller owns) and a generic `true` for every other method. Every call is
+recorded with its arrival time, and an artificial latency (optionally with
+random jitter) can be injected to simulate a slow Telegram.
+
+Usage:
+    python scripts/fake_bot_api.py --port 8081 --latency 0.05
+
+    application = Application.builder().token("123:TEST").base_url(api.base_url).build()
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import zlib
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "FakeBot",
+    "username": "fake_adsbot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+def _decode_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode("utf-8"), keep_blank_values=True):
+        # PTB sends form fields whose values are JSON-encoded
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def make_message_update(update_id: int, chat_id: int, text: Optional[str] = "hello", **fields: Any) -> Dict[str, Any]:
+    """A private-chat message update, as Telegram would send it.
+
+    Extra `fields` go into the message (e.g. `chat_shared={...}` with
+    `text=None` for a channel picked with the native chat picker).
+    """
+    user = _user(chat_id)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        **fields,
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, chat_id: int, data: str, message: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """A button tap on `message` (a message sent by the bot, as returned by `last_message`)."""
+    message = dict(message or {"message_id": 1, "text": "menu"})
+    message.setdefault("date", int(time.time()))
+    message["chat"] = {"id": chat_id, "type": "private"}
+    message["from"] = BOT_USER
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            # The chat is part of the id, so answers can be told apart per user
+            "id": f"{chat_id}:{update_id}",
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": message,
+        },
+    }
+
+
+def channel_id_for(username: str) -> int:
+    """Stable (negative) channel id for a @username."""
+    return -(1000000000000 + zlib.crc32(username.lstrip("@").lower().encode()))
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0):
+        """Create the server (call `start()` to serve in a background thread).
+
+        Args:
+            host: interface to bind
+            port: TCP port (0 = pick a free one)
+            latency: seconds added to every call except getUpdates
+            jitter: up to this many extra seconds, drawn uniformly per call
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter = Counter()
+        # Calls addressed to each private chat (messages, edits, callback answers)
+        self.replies: Counter = Counter()
+        # (perf_counter timestamp, method, params) of every non-polling call
+        self.log: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.webhook_url: Optional[str] = None
+        # Last message sent or edited in each chat
+        self._last_messages: Dict[int, Dict[str, Any]] = {}
+        self._updates: deque = deque()
+        self._cond = threading.Condition()
+        self._message_id = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def enqueue(self, *updates: Dict[str, Any]) -> None:
+        """Make updates available to getUpdates."""
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def calls_to(self, method: str) -> List[Tuple[float, Dict[str, Any]]]:
+        with self._cond:
+            return [(ts, params) for ts, name, params in self.log if name == method]
+
+    def last_message(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """The message the user of `chat_id` currently sees last (text, buttons)."""
+        with self._cond:
+            return self._last_messages.get(int(chat_id))
+
+    def start(self) -> "FakeBotAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # -------------------------
+    # Bot API methods
+    # -------------------------
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 5.0)
+        with self._cond:
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return list(self._updates)[:limit]
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message = {
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id", 0), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        markup = params.get("reply_markup")
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        with self._cond:
+            self._message_id += 1
+            message["message_id"] = params.get("message_id") or self._message_id
+            try:
+                self._last_messages[int(params.get("chat_id"))] = message
+            except (TypeError, ValueError):
+                pass
+        return message
+
+    @staticmethod
+    def _chat(params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = params.get("chat_id")
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            username = chat_id[1:]
+            chat_id = channel_id_for(username)
+        else:
+            chat_id = int(chat_id)
+            username = f"channel{abs(chat_id) % 10**9}"
+        return {"id": chat_id, "type": "channel", "title": f"Channel {username}", "username": username}
+
+    @staticmethod
+    def _chat_member(params: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = int(params.get("user_id") or 0)
+        user = BOT_USER if user_id == BOT_USER["id"] else _user(user_id)
+        return {"status": "creator", "user": user, "is_anonymous": False}
+
+    def dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return self._get_updates(params)
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        with self._cond:
+            self.log.append((time.perf_counter(), method, params))
+            chat = params.get("chat_id") or str(params.get("callback_query_id", "")).partition(":")[0]
+            try:
+                self.replies[int(chat)] += 1
+            except (TypeError, ValueError):
+                pass
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "getChat":
+            return self._chat(params)
+        if method == "getChatMember":
+            return self._chat_member(params)
+        if method == "getChatMemberCount":
+            return 1000 + abs(self._chat(params)["id"]) % 50000
+        return True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Small JSON replies on keep-alive connections: don't wait for ACKs
+            disable_nagle_algorithm = True
+
+            def do_POST(self):  # noqa: N802 - http.server API
+                parts = self.path.strip("/").split("/")
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                params = _decode_params(self.headers.get("Content-Type", ""), body)
+                result = api.dispatch(parts[1], params)
+                self._reply(200, {"ok": True, "result": result})
+
+            do_GET = do_POST
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client gave up (e.g. a long poll cancelled on shutdown)
+                    pass
+
+            def log_message(self, format, *args):  # noqa: A002 - silence request log
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per call (0..jitter)")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.host, args.port, args.latency, args.jitter)
+    print(f"Fake Bot API listening on {api.base_url}<token>/<method>")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Minimal fake Stripe + PayPal REST server for local tests and benchmarks.
+
+Implements the calls made by `adsbot.payments.AsyncStripeClient` and
+`AsyncPayPalClient`:
+
+- Stripe: POST /v1/payment_intents, GET /v1/payment_intents/<id>,
+  POST /v1/refunds (Bearer auth, form-encoded bodies);
+- PayPal: POST /v1/oauth2/token, POST /v1/payments/payment,
+  GET /v1/payments/payment/<id>, POST /v1/payments/payment/<id>/execute
+  (Bearer token from /oauth2/token).
+
+POSTs honour idempotency keys (`Idempotency-Key` / `PayPal-Request-Id`): a
+repeated key gets the first response back and creates nothing. Latency
+(with jitter) and failures (`fail_next`) can be injected to exercise
+timeouts and retries.
+
+Usage:
+    python scripts/fake_payment_provider.py --port 8082 --latency 0.1
+
+    STRIPE_API_KEY=sk_test_x STRIPE_API_BASE=http://127.0.0.1:8082 \
+    PAYPAL_CLIENT_ID=id PAYPAL_CLIENT_SECRET=secret PAYPAL_API_BASE=http://127.0.0.1:8082 \
+    python main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+ACCESS_TOKEN = "fake-paypal-token"
+# Object ids: "pi_000001", "re_000001", "PAYID_000001"
+ID_PREFIXES = ("pi_", "re_", "PAYID_")
+
+
+class FakePaymentProvider:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0):
+        """Create the server (call `start()` to serve in a background thread).
+
+        Args:
+            host: interface to bind
+            port: TCP port (0 = pick a free one)
+            latency: seconds added to every call
+            jitter: up to this many extra seconds, drawn uniformly per call
+        """
+        self.latency = latency
+        self.jitter = jitter
+        # "METHOD /path/template" -> requests received (retries included)
+        self.calls: Counter = Counter()
+        # Objects actually created (idempotent replays don't count)
+        self.created: Counter = Counter()
+        self.payment_intents: Dict[str, Dict[str, Any]] = {}
+        self.paypal_payments: Dict[str, Dict[str, Any]] = {}
+        self._idempotent: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+        self._failures: List[Tuple[int, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        self._keyed_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count: int = 1, status: int = 503, retry_after: Optional[float] = None) -> None:
+        """Answer the next `count` requests with `status` (before doing anything)."""
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        with self._lock:
+            self._failures.extend([(status, headers)] * count)
+
+    def start(self) -> "FakePaymentProvider":
+        threading.Thread(target=self._server.serve_forever, name="fake-payments", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # -------------------------
+    # API
+    # -------------------------
+
+    def dispatch(self, method: str, path: str, headers, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        parts = path.strip("/").split("/")
+        template = "/".join("<id>" if part.startswith(ID_PREFIXES) else part for part in parts)
+        with self._lock:
+            self.calls[f"{method} /{template}"] += 1
+            if self._failures:
+                status, extra = self._failures.pop(0)
+                return status, {"error": {"message": "injected failure"}}, extra
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        if parts[:3] == ["v1", "oauth2", "token"]:
+            return self._token(headers)
+        auth = headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or auth == "Bearer ":
+            return 401, {"error": {"message": "missing credentials"}}, {}
+
+        key_header = "PayPal-Request-Id" if parts[:2] == ["v1", "payments"] else "Idempotency-Key"
+        key = headers.get(key_header) if method == "POST" else None
+        if not key:
+            status, payload = self._route(method, parts, params)
+            return status, payload, {}
+        # Requests with a key run one at a time, so duplicates sent
+        # concurrently still create a single object
+        with self._keyed_lock:
+            replay = self._idempotent.get((path, key))
+            if replay is not None:
+                return replay[0], replay[1], {"Idempotent-Replayed": "true"}
+            status, payload = self._route(method, parts, params)
+            self._idempotent[(path, key)] = (status, payload)
+        return status, payload, {}
+
+    def _route(self, method: str, parts: List[str], params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if method == "POST" and parts == ["v1", "payment_intents"]:
+            return 200, self._create_intent(params)
+        if method == "GET" and len(parts) == 3 and parts[:2] == ["v1", "payment_intents"]:
+            intent = self.payment_intents.get(parts[2])
+            return (200, intent) if intent else (404, {"error": {"message": "No such payment_intent"}})
+        if method == "POST" and parts == ["v1", "refunds"]:
+            if params.get("payment_intent") not in self.payment_intents:
+                return 404, {"error": {"message": "No such payment_intent"}}
+            return 200, self._new("re", {"object": "refund", "status": "succeeded", **params})
+        if method == "POST" and parts == ["v1", "payments", "payment"]:
+            return 201, self._create_paypal_payment(params)
+        if method == "GET" and len(parts) == 4 and parts[:3] == ["v1", "payments", "payment"]:
+            payment = self.paypal_payments.get(parts[3])
+            return (200, payment) if payment else (404, {"name": "INVALID_RESOURCE_ID", "message": "Payment not found"})
+        if method == "POST" and len(parts) == 5 and parts[:3] == ["v1", "payments", "payment"] and parts[4] == "execute":
+            payment = self.paypal_payments.get(parts[3])
+            if payment is None:
+                return 404, {"name": "INVALID_RESOURCE_ID", "message": "Payment not found"}
+            payment["state"] = "approved"
+            payment["payer"] = {"payer_info": {"payer_id": params.get("payer_id")}}
+            return 200, payment
+        return 404, {"error": {"message": f"Unknown endpoint {method} /{'/'.join(parts)}"}}
+
+    def _new(self, prefix: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.created[prefix] += 1
+            return {"id": f"{prefix}_{self.created[prefix]:06d}", "created": int(time.time()), **fields}
+
+    def _create_intent(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        intent = self._new("pi", {
+            "object": "payment_intent",
+            "amount": int(params.get("amount", 0)),
+            "currency": params.get("currency", "usd"),
+            "description": params.get("description"),
+            "receipt_email": params.get("receipt_email"),
+            "status": "requires_payment_method",
+        })
+        intent["client_secret"] = f"{intent['id']}_secret_fake"
+        self.payment_intents[intent["id"]] = intent
+        return intent
+
+    def _create_paypal_payment(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        payment = self._new("PAYID", {"intent": params.get("intent"), "state": "created", "transactions": params.get("transactions", [])})
+        payment["links"] = [
+            {"rel": "self", "href": f"{self.base_url}/v1/payments/payment/{payment['id']}", "method": "GET"},
+            {"rel": "approval_url", "href": f"{self.base_url}/checkoutnow?token={payment['id']}", "method": "REDIRECT"},
+        ]
+        self.paypal_payments[payment["id"]] = payment
+        return payment
+
+    @staticmethod
+    def _token(headers) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        auth = headers.get("Authorization", "")
+        try:
+            client_id, _, secret = base64.b64decode(auth.split(" ", 1)[1]).decode().partition(":")
+        except (IndexError, ValueError):
+            client_id, secret = "", ""
+        if not client_id or not secret:
+            return 401, {"error": "invalid_client", "error_description": "Client Authentication failed"}, {}
+        return 200, {"access_token": ACCESS_TOKEN, "token_type": "Bearer", "expires_in": 32400}, {}
+
+    def _handler_class(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                path = self.path.split("?")[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+                status, payload, extra = provider.dispatch(self.command, path, self.headers, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client gave up (e.g. a timeout)
+                    pass
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):  # noqa: A002 - silence request log
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Stripe/PayPal REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per call (0..jitter)")
+    args = parser.parse_args()
+
+    provider = FakePaymentProvider(args.host, args.port, args.latency, args.jitter)
+    print(f"Fake payment provider listening on {provider.base_url}")
+    try:
+        provider._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
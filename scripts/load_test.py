@@ -0,0 +1,404 @@
+"""Simulated-user load test of the whole bot against the fake Bot API.
+
+Builds the real application (`build_application`: handlers, flood guard,
+send queue, DB executor, listing index...) with its Bot API endpoint
+pointed at `FakeBotAPI`, then lets thousands of simulated users walk
+realistic flows concurrently, each reading the bot's last message and
+tapping its buttons like a person would:
+
+- add_channel: /start, /addchannel, pick a channel, confirm
+- create_offer: an editor puts one of their channels on sale
+- browse_catalog: open the advertiser catalog, page through it, open a listing
+- place_order: catalog, listing, duration, ad text, confirm and pay
+
+Updates are put on the application's update queue (what polling and the
+webhook do once an update has arrived; those delivery paths are measured
+by benchmark_bot_modes.py). A step lasts from that moment until the
+update has been fully processed, replies included, so Bot API latency
+(`--latency-ms`, `--jitter-ms`) and the send queue's pacing are part of it.
+A step fails when a handler raises, when it times out, when the bot does
+not answer at all (no handler took the update), or when the button the
+user wants to tap is not in the bot's reply; the user's flow stops there.
+
+The report gives throughput, p50/p95/p99 latency per step, error rates per
+flow, the most frequent errors and the Bot API calls made.
+
+Usage:
+    python scripts/load_test.py --users 2000 --ramp-up 10 --latency-ms 40 --jitter-ms 60
+    python scripts/load_test.py --users 500 --mix browse_catalog=3,place_order=1 --output report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Update
+
+from adsbot.config import Config
+from scripts.fake_bot_api import (
+    FakeBotAPI,
+    channel_id_for,
+    make_callback_update,
+    make_message_update,
+)
+
+FIRST_USER_ID = 500000000
+AD_TEXT = "Scopri la nuova app di fotografia: filtri professionali gratis per 30 giorni su example.com"
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class FlowError(Exception):
+    """The simulated user cannot go on with their flow."""
+
+
+# -------------------------
+# Simulated users and flows
+# -------------------------
+
+
+class SimulatedUser:
+    def __init__(self, harness: "LoadTest", user_id: int, flow: str, rng: random.Random):
+        self.harness = harness
+        self.user_id = user_id
+        self.flow = flow
+        self.rng = rng
+
+    async def command(self, text: str) -> None:
+        await self._step(text.split()[0], make_message_update(0, self.user_id, text))
+
+    async def send_text(self, text: str) -> None:
+        await self._step("text", make_message_update(0, self.user_id, text))
+
+    async def share_chat(self, chat_id: int) -> None:
+        update = make_message_update(0, self.user_id, None, chat_shared={"request_id": 1, "chat_id": chat_id})
+        await self._step("chat_shared", update)
+
+    async def open(self, data: str) -> None:
+        """Tap a menu button (`data`) on the last message, as if it was there."""
+        message = self.harness.api.last_message(self.user_id)
+        await self._step(data, make_callback_update(0, self.user_id, data, message))
+
+    async def tap(self, prefix: str) -> None:
+        """Tap one of the buttons of the bot's last message starting with `prefix`."""
+        message = self.harness.api.last_message(self.user_id) or {}
+        rows = (message.get("reply_markup") or {}).get("inline_keyboard", [])
+        choices = [b["callback_data"] for row in rows for b in row if b.get("callback_data", "").startswith(prefix)]
+        if not choices:
+            self.harness.error_messages[f"{self.flow}: no {prefix!r} button in reply {message.get('text', '')[:60]!r}"] += 1
+            raise FlowError(f"no {prefix!r} button")
+        data = self.rng.choice(choices)
+        await self._step(prefix.rstrip(":"), make_callback_update(0, self.user_id, data, message))
+
+    async def _step(self, label: str, update: Dict[str, Any]) -> None:
+        error = await self.harness.deliver(f"{self.flow}:{label}", update, self.user_id)
+        if error:
+            raise FlowError(error)
+        await asyncio.sleep(self.harness.think_time(self.rng))
+
+
+async def flow_add_channel(user: SimulatedUser) -> None:
+    await user.command("/start")
+    await user.command("/addchannel")
+    await user.share_chat(channel_id_for(f"load{user.user_id}"))
+    await user.tap("confirm_add_channel:")
+
+
+async def flow_create_offer(user: SimulatedUser) -> None:
+    await user.open("marketplace:editor:menu")
+    await user.tap("marketplace:editor:register_channel")
+    await user.tap("marketplace:editor:set_price:")
+    await user.tap("marketplace:editor:confirm_price:")
+
+
+async def flow_browse_catalog(user: SimulatedUser) -> None:
+    await user.open("marketplace:advertiser:catalog")
+    for _ in range(user.rng.randint(1, 3)):
+        await user.tap("marketplace:advertiser:catalog:next:")
+    await user.tap("marketplace:advertiser:view:")
+
+
+async def flow_place_order(user: SimulatedUser) -> None:
+    await user.open("marketplace:advertiser:catalog")
+    await user.tap("marketplace:advertiser:view:")
+    await user.tap("marketplace:advertiser:order:start:")
+    await user.tap("marketplace:advertiser:order:duration:")
+    await user.send_text(AD_TEXT)
+    await user.tap("marketplace:advertiser:order:confirm")
+
+
+FLOWS: Dict[str, Callable[[SimulatedUser], Any]] = {
+    "add_channel": flow_add_channel,
+    "create_offer": flow_create_offer,
+    "browse_catalog": flow_browse_catalog,
+    "place_order": flow_place_order,
+}
+
+
+# -------------------------
+# Seeding
+# -------------------------
+
+
+def seed(session_factory, users: Dict[int, str], listings: int, rng: random.Random) -> None:
+    """Catalog listings, plus what each flow needs (a channel to sell, money to spend)."""
+    from adsbot.db import session_scope
+    from adsbot.inside_ads_services import get_or_create_balance
+    from adsbot.models import Channel, ChannelListing
+    from adsbot.services import ensure_user
+
+    categories = ["tech", "crypto", "lifestyle", "news", "gaming"]
+    with session_scope(session_factory) as session:
+        for i in range(listings):
+            editor = ensure_user(session, telegram_id=FIRST_USER_ID - 1 - i, username=f"editor{i}", first_name="Editor", language_code="it")
+            channel = Channel(user_id=editor.id, handle=f"catalog{i}", title=f"Catalog {i}", subscribers=rng.randint(1000, 100000))
+            session.add(channel)
+            session.flush()
+            session.add(ChannelListing(
+                channel_id=channel.id,
+                user_id=editor.id,
+                price=round(rng.uniform(1, 50), 2),
+                category=rng.choice(categories),
+                subscribers=channel.subscribers,
+                reach_24h=channel.subscribers // 5,
+                quality_score=round(rng.uniform(0.3, 1.0), 2),
+            ))
+        for user_id, flow in users.items():
+            if flow not in ("create_offer", "place_order"):
+                continue
+            user = ensure_user(session, telegram_id=user_id, username=f"user{user_id}", first_name=f"User{user_id}", language_code="it")
+            if flow == "create_offer":
+                session.add(Channel(user_id=user.id, handle=f"load{user_id}", title=f"Load {user_id}", subscribers=5000))
+            else:
+                get_or_create_balance(session, user).balance = 1000.0
+
+
+# -------------------------
+# Harness
+# -------------------------
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeBotAPI(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+        self.application = None
+        self._update_id = 0
+        # update_id -> (future, enqueued at)
+        self._pending: Dict[int, Any] = {}
+        self._errors: Dict[int, str] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.step_errors: Counter = Counter()
+        self.error_messages: Counter = Counter()
+        self.flows: Dict[str, Counter] = defaultdict(Counter)
+
+    def think_time(self, rng: random.Random) -> float:
+        return rng.uniform(0.5, 1.5) * self.args.think_ms / 1000
+
+    def build(self, database_url: str, users: Dict[int, str]) -> None:
+        from adsbot.bot import build_application
+        from adsbot.db import create_session_factory
+
+        config = Config(
+            bot_token="123456:LOADTEST",
+            database_url=database_url,
+            concurrent_updates=self.args.concurrent_updates,
+            bot_api_url=self.api.base_url,
+        )
+        seed(create_session_factory(config), users, self.args.listings, random.Random(self.args.seed))
+        application = build_application(config)
+
+        process_update = application.process_update
+
+        async def tracked_process_update(update: object) -> None:
+            try:
+                await process_update(update)
+            finally:
+                entry = self._pending.pop(getattr(update, "update_id", None), None)
+                if entry is not None and not entry[0].done():
+                    entry[0].set_result(time.perf_counter() - entry[1])
+
+        async def on_error(update: object, context) -> None:
+            if isinstance(update, Update):
+                self._errors[update.update_id] = f"{type(context.error).__name__}: {context.error}"
+
+        application.process_update = tracked_process_update
+        application.add_error_handler(on_error)
+        self.application = application
+
+    async def deliver(self, step: str, payload: Dict[str, Any], user_id: int) -> Optional[str]:
+        """Hand an update to the bot and wait for it to be processed; returns the error, if any."""
+        replies = self.api.replies[user_id]
+        self._update_id += 1
+        update_id = payload["update_id"] = self._update_id
+        if "message" in payload:
+            payload["message"]["message_id"] = update_id
+        update = Update.de_json(payload, self.application.bot)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[update_id] = (future, time.perf_counter())
+        await self.application.update_queue.put(update)
+        try:
+            elapsed = await asyncio.wait_for(future, timeout=self.args.step_timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(update_id, None)
+            error = f"timeout after {self.args.step_timeout}s"
+        else:
+            self.latencies[step].append(elapsed)
+            error = self._errors.pop(update_id, None)
+            if error is None and self.api.replies[user_id] == replies:
+                error = "no answer (unhandled update)"
+        if error:
+            self.step_errors[step] += 1
+            self.error_messages[f"{step}: {error[:120]}"] += 1
+        return error
+
+    async def run_user(self, user_id: int, flow: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        user = SimulatedUser(self, user_id, flow, random.Random(self.args.seed + user_id))
+        self.flows[flow]["started"] += 1
+        try:
+            await FLOWS[flow](user)
+        except FlowError:
+            self.flows[flow]["failed"] += 1
+            return
+        self.flows[flow]["completed"] += 1
+
+    async def run(self, users: Dict[int, str]) -> float:
+        self.api.start()
+        await self.application.initialize()
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+        try:
+            started = time.perf_counter()
+            ramp = self.args.ramp_up
+            await asyncio.gather(*(
+                self.run_user(user_id, flow, ramp * i / max(1, len(users)))
+                for i, (user_id, flow) in enumerate(users.items())
+            ))
+            return time.perf_counter() - started
+        finally:
+            await self.application.stop()
+            if self.application.post_stop:
+                await self.application.post_stop(self.application)
+            await self.application.shutdown()
+            self.application.bot_data["db_executor"].shutdown()
+            self.api.stop()
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        all_latencies = sorted(v for values in self.latencies.values() for v in values)
+        steps = {}
+        for step, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            steps[step] = {
+                "count": len(values),
+                "errors": self.step_errors[step],
+                "p50_ms": round(_percentile(values, 50) * 1000, 1),
+                "p95_ms": round(_percentile(values, 95) * 1000, 1),
+                "p99_ms": round(_percentile(values, 99) * 1000, 1),
+            }
+        flows = {}
+        for flow, counts in sorted(self.flows.items()):
+            flows[flow] = {
+                "users": counts["started"],
+                "completed": counts["completed"],
+                "failed": counts["failed"],
+                "error_rate": round(counts["failed"] / counts["started"], 4) if counts["started"] else 0.0,
+            }
+        bot_data = self.application.bot_data
+        return {
+            "users": sum(f["users"] for f in flows.values()),
+            "elapsed_s": round(elapsed, 2),
+            "updates": len(all_latencies),
+            "updates_per_sec": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(_percentile(all_latencies, 50) * 1000, 1),
+            "p95_ms": round(_percentile(all_latencies, 95) * 1000, 1),
+            "p99_ms": round(_percentile(all_latencies, 99) * 1000, 1),
+            "step_errors": sum(self.step_errors.values()),
+            "flows": flows,
+            "steps": steps,
+            "top_errors": dict(self.error_messages.most_common(10)),
+            "bot_api_calls": dict(self.api.calls.most_common()),
+            "flood_guard_dropped": bot_data["flood_guard"].dropped,
+            "send_queue": self.application.bot.rate_limiter.stats(),
+            "task_queue": bot_data["task_queue"].stats(),
+        }
+
+
+def assign_flows(users: int, mix: Dict[str, float], rng: random.Random) -> Dict[int, str]:
+    """{telegram user id: flow}, flows drawn with the weights of `mix`."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    return {FIRST_USER_ID + i: rng.choices(names, weights)[0] for i in range(users)}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name!r} (choose from {', '.join(FLOWS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="simulated users, one flow each")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=parse_mix("add_channel=1,create_offer=1,browse_catalog=4,place_order=2"),
+        help="flow weights, e.g. browse_catalog=3,place_order=1",
+    )
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which users arrive")
+    parser.add_argument("--think-ms", type=float, default=1000.0, help="mean pause between a user's steps")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake Bot API latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra latency per call (0..jitter)")
+    parser.add_argument("--concurrent-updates", type=int, default=64, help="BOT_CONCURRENT_UPDATES of the bot")
+    parser.add_argument("--listings", type=int, default=200, help="channels seeded in the catalog")
+    parser.add_argument("--database-url", default=None, help="default: a fresh SQLite file")
+    parser.add_argument("--step-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    database_url = args.database_url or f"sqlite:///{Path(tempfile.mkdtemp()) / 'loadtest.db'}"
+    users = assign_flows(args.users, args.mix, random.Random(args.seed))
+
+    harness = LoadTest(args)
+    harness.build(database_url, users)
+    elapsed = asyncio.run(harness.run(users))
+    report = harness.report(elapsed)
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+    return report
+
+
+if __name__ == "__main__":
+    main()
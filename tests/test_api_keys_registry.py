@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from adsbot import api_keys
+from adsbot.api_keys import KeyRegistry, hash_key
+from adsbot.rate_limiter import RateLimitPolicy
+
+
+def write_registry(path, keys, tiers=None):
+    path.write_text(json.dumps({"tiers": tiers or {}, "keys": keys}), encoding="utf-8")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def registry_file(tmp_path):
+    path = tmp_path / "keys.json"
+    write_registry(
+        path,
+        [
+            {"sha256": hash_key("sk-partner"), "role": "user", "tier": "partner", "name": "acme"},
+            {"key": "sk-custom", "role": "user", "tier": "partner", "max_requests": 7},
+            {"sha256": hash_key("sk-ops"), "role": "admin"},
+        ],
+        tiers={"partner": {"max_requests": 600, "window_seconds": 60, "mode": "slowdown"}},
+    )
+    return path
+
+
+def test_registry_resolves_roles_and_tiers(registry_file):
+    registry = KeyRegistry(str(registry_file))
+
+    partner = registry.lookup("sk-partner")
+    assert partner.role == "user"
+    assert partner.tier == "partner"
+    assert partner.policy == RateLimitPolicy(600, 60, "slowdown")
+    # per-key override keeps the tier's window and mode
+    assert registry.lookup("sk-custom").policy == RateLimitPolicy(7, 60, "slowdown")
+    assert registry.lookup("sk-ops").role == "admin"
+    assert registry.lookup("sk-unknown") is None
+
+
+def test_registry_reloads_on_change_and_bumps_version(registry_file):
+    clock = FakeClock()
+    registry = KeyRegistry(str(registry_file), check_interval=5, clock=clock)
+    version = api_keys.KEYS_VERSION
+
+    write_registry(registry_file, [{"sha256": hash_key("sk-new"), "role": "user"}])
+    stat = os.stat(registry_file)
+    os.utime(registry_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert registry.maybe_reload()
+    assert registry.lookup("sk-new").policy is None
+    assert registry.lookup("sk-partner") is None
+    assert api_keys.KEYS_VERSION == version + 1
+
+    # within the check interval the file is not even stat'ed
+    clock.now += 1
+    assert not registry.maybe_reload()
+
+
+def test_invalid_registry_keeps_previous_keys(registry_file):
+    registry = KeyRegistry(str(registry_file))
+    registry_file.write_text("{not json", encoding="utf-8")
+    assert not registry.reload()
+    assert registry.lookup("sk-partner") is not None
+
+
+def test_get_key_info_prefers_environment_keys(registry_file, monkeypatch):
+    monkeypatch.setattr(api_keys, "REGISTRY", KeyRegistry(str(registry_file)))
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-env"})
+    monkeypatch.setattr(api_keys, "ADMIN_KEYS", set())
+
+    assert api_keys.get_key_info("sk-env").policy is None
+    assert api_keys.get_role("sk-partner") == "user"
+    assert api_keys.get_role("sk-ops") == "admin"
+    assert api_keys.get_role("sk-unknown") is None
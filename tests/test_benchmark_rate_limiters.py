@@ -0,0 +1,20 @@
+from scripts.benchmark_rate_limiters import main
+
+
+def test_harness_reports_contention_metrics(tmp_path):
+    out = tmp_path / "results.json"
+    results = main([
+        "--backends", "memory", "sqlite",
+        "--drivers", "threads", "asyncio",
+        "--workers", "4", "--requests", "200",
+        "--hot-keys", "2", "--cold-keys", "10", "--max-requests", "20",
+        "--output", str(out),
+    ])
+
+    assert out.exists()
+    assert len(results) == 4
+    for result in results:
+        assert result["ops"] == 200
+        assert result["errors"] == 0
+        assert result["over_admits"] == 0
+        assert {"ops_per_sec", "p50_ms", "p99_ms", "lock_retries", "false_block_rate"} <= result.keys()
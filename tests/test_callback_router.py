@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import CallbackQuery, Update, User
+
+from adsbot.callback_router import CallbackRouter
+from adsbot.config import Config
+
+
+async def _noop(update, context):
+    return None
+
+
+def _callback_update(data):
+    user = User(id=1, first_name="Test", is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=user, chat_instance="1", data=data))
+
+
+def test_resolves_literal_and_typed_routes():
+    router = CallbackRouter(
+        {
+            "admin:main": _noop,
+            "admin:approve_channel:{channel_id:int}": _noop,
+            "marketplace:editor:confirm_price:{channel_id:int}:{price:float}": _noop,
+            "offer:deposit:{action:increase|decrease}": _noop,
+        }
+    )
+    route, args = router.resolve("admin:approve_channel:42")
+    assert route.template == "admin:approve_channel:{channel_id:int}"
+    assert args == {"channel_id": 42}
+    assert router.resolve("marketplace:editor:confirm_price:7:19.5")[1] == {"channel_id": 7, "price": 19.5}
+    assert router.resolve("offer:deposit:decrease")[1] == {"action": "decrease"}
+    assert router.resolve("admin:main")[1] == {}
+
+    for data in ("admin:approve_channel:x", "admin:approve_channel:1:2", "admin", "offer:deposit:other", "nope:main"):
+        assert router.resolve(data) is None
+
+
+def test_overlapping_routes_are_rejected():
+    router = CallbackRouter({"admin:approve_channel:{channel_id:int}": _noop, "ai:{kind:menu|help}": _noop})
+    with pytest.raises(ValueError, match="overlaps"):
+        router.add("admin:approve_channel:{name:str}", _noop)
+    with pytest.raises(ValueError, match="overlaps"):
+        router.add("admin:approve_channel:7", _noop)
+    with pytest.raises(ValueError, match="overlaps"):
+        router.add("ai:menu", _noop)
+    router.add("admin:approve_channel:all", _noop)  # "all" is not an int
+    router.add("ai:generate", _noop)
+    assert len(router) == 4
+
+
+@pytest.mark.parametrize("template", ["", "admin::x", "{id:int}:admin", "admin:{id:int}:{id:int}", "a:{x:}"])
+def test_invalid_templates(template):
+    with pytest.raises(ValueError):
+        CallbackRouter().add(template, _noop)
+
+
+def test_dispatches_with_typed_args():
+    seen = []
+
+    async def approve(update, context):
+        seen.append(context.callback_args)
+
+    router = CallbackRouter({"admin:approve_channel:{channel_id:int}": approve})
+    update = _callback_update("admin:approve_channel:5")
+    check = router.check_update(update)
+    assert check is not None
+    context = SimpleNamespace()
+    asyncio.run(router.handle_update(update, None, check, context))
+    assert seen == [{"channel_id": 5}]
+    assert router.check_update(_callback_update("admin:other")) is None
+    assert router.check_update(object()) is None
+
+
+def test_application_routes_are_valid(tmp_path):
+    from adsbot.bot import build_application
+
+    config = Config(bot_token="123456:TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}")
+    application = build_application(config)
+    routers = [h for h in application.handlers[0] if isinstance(h, CallbackRouter)]
+    assert len(routers) == 2
+    assert routers[0].resolve("marketplace:advertiser:catalog:next:12.5:3")[1]["listing_id"] == 3
+    assert routers[1].resolve("admin:approve_channel:9")[1] == {"channel_id": 9}
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from adsbot.config import Config
+from adsbot.db import create_session_factory
+from adsbot.db_executor import DBExecutor, pool_size_for, run_in_session
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def test_workers_default_to_pool_size(session_factory):
+    executor = DBExecutor(session_factory)
+    try:
+        assert executor.max_workers == pool_size_for(session_factory) == 5
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_runs_off_loop_and_serializes_per_user(session_factory):
+    executor = DBExecutor(session_factory, max_workers=4)
+    loop_thread = threading.get_ident()
+    order = []
+
+    def work(tag, delay):
+        assert threading.get_ident() != loop_thread
+        time.sleep(delay)
+        order.append(tag)
+        return tag
+
+    try:
+        results = await asyncio.gather(
+            executor.run(work, "a1", 0.05, user_id=1),
+            executor.run(work, "b1", 0.0, user_id=2),
+            executor.run(work, "a2", 0.0, user_id=1),
+        )
+    finally:
+        executor.shutdown()
+
+    assert results == ["a1", "b1", "a2"]
+    # user 2 is not held up by user 1's slow call; user 1 stays ordered
+    assert order.index("b1") < order.index("a1") < order.index("a2")
+    stats = executor.stats()
+    assert stats["completed"] == 3
+    assert stats["queue_depth"] == 0 and stats["running"] == 0
+    assert executor._user_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_run_in_session_uses_executor_or_runs_inline(session_factory):
+    def query(session):
+        return session.execute(text("SELECT 1")).scalar()
+
+    inline = SimpleNamespace(bot_data={"session_factory": session_factory})
+    assert await run_in_session(inline, query) == 1
+
+    executor = DBExecutor(session_factory, max_workers=1)
+    pooled = SimpleNamespace(bot_data={"session_factory": session_factory, "db_executor": executor})
+    try:
+        assert await run_in_session(pooled, query, user_id=7) == 1
+        with pytest.raises(ZeroDivisionError):
+            await run_in_session(pooled, lambda session: 1 / 0)
+    finally:
+        executor.shutdown()
+    assert executor.stats()["failed"] == 1
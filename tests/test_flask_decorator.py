@@ -0,0 +1,106 @@
+import pytest
+
+flask = pytest.importorskip("flask")
+
+from adsbot import api_keys
+from adsbot.flask_decorator import check_sync, rate_limit
+from adsbot.memory_rate_limiter import InMemoryRateLimiter
+from adsbot.rate_limiter import RedisRateLimiter
+from adsbot.sqlite_rate_limiter import SQLiteRateLimiter
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex: int = None):
+        self.store[key] = value
+
+    async def incr(self, key):
+        cur = int(self.store.get(key, 0)) + 1
+        self.store[key] = str(cur)
+        return cur
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+
+@pytest.fixture
+def user_key(monkeypatch):
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-user-flask"})
+    monkeypatch.setattr(api_keys, "ADMIN_KEYS", {"sk-admin-flask"})
+    return "sk-user-flask"
+
+
+def make_app(limiter):
+    app = flask.Flask(__name__)
+
+    @app.route("/test")
+    @rate_limit(limiter)
+    def endpoint():
+        return "ok"
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize(
+    "limiter",
+    [
+        InMemoryRateLimiter(window_seconds=60, max_requests=2),
+        RedisRateLimiter(redis_client=FakeRedis(), window_seconds=60, max_requests=2),
+    ],
+    ids=["sync", "async"],
+)
+def test_flask_rate_limit_blocks_after_limit(user_key, limiter):
+    client = make_app(limiter)
+
+    for expected_remaining in (1, 0):
+        resp = client.get("/test", headers={"X-API-Key": user_key})
+        assert resp.status_code == 200
+        assert resp.headers["X-Rate-Limit-Remaining"] == str(expected_remaining)
+
+    resp = client.get("/test", headers={"X-API-Key": user_key})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "60"
+
+    # admins are exempt
+    resp = client.get("/test", headers={"X-API-Key": "sk-admin-flask"})
+    assert resp.status_code == 200
+
+
+def test_flask_tiered_key_is_limited_by_its_tier_on_sqlite(tmp_path, monkeypatch):
+    path = tmp_path / "keys.json"
+    path.write_text(
+        '{"tiers": {"partner": {"max_requests": 3, "window_seconds": 60}},'
+        ' "keys": [{"key": "sk-partner-flask", "tier": "partner"}]}',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(api_keys, "REGISTRY", api_keys.KeyRegistry(str(path)))
+    client = make_app(SQLiteRateLimiter(db_path=str(tmp_path / "rl.db"), window_seconds=60, max_requests=1))
+
+    statuses = [client.get("/test", headers={"X-API-Key": "sk-partner-flask"}).status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+
+def test_flask_rate_limit_slowdown_header(user_key, monkeypatch):
+    monkeypatch.setattr("adsbot.flask_decorator.time.sleep", lambda seconds: None)
+    client = make_app(InMemoryRateLimiter(window_seconds=60, max_requests=1, mode="slowdown"))
+
+    client.get("/test", headers={"X-API-Key": user_key})
+    resp = client.get("/test", headers={"X-API-Key": user_key})
+    assert resp.status_code == 200
+    assert float(resp.headers["X-Rate-Limit-Slowdown"]) == pytest.approx(0.5)
+
+
+def test_check_sync_pads_three_value_results():
+    class ThreeValueLimiter:
+        def increment_and_check_sync(self, api_key):
+            return True, 4, None
+
+    assert check_sync(ThreeValueLimiter(), "k") == (True, 4, None, None)
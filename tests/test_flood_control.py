@@ -0,0 +1,104 @@
+import pytest
+from telegram import CallbackQuery, Message, Chat, Update, User
+from telegram.ext import ApplicationHandlerStop
+
+from adsbot.flood_control import FLOOD_NOTICE, FloodGuard
+from adsbot.memory_rate_limiter import TokenBucketRateLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    def __init__(self):
+        self.answered = []
+
+        self.sent = []
+
+    async def answer_callback_query(self, callback_query_id, **kwargs):
+        self.answered.append(callback_query_id)
+        return True
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return True
+
+
+def callback_update(update_id, user_id=42, bot=None):
+    user = User(id=user_id, first_name="u", is_bot=False)
+    query = CallbackQuery(id=str(update_id), from_user=user, chat_instance="ci", data="offer:deposit:increase")
+    if bot is not None:
+        query.set_bot(bot)
+    return Update(update_id=update_id, callback_query=query)
+
+
+def message_update(update_id, user_id=42, bot=None):
+    user = User(id=user_id, first_name="u", is_bot=False)
+    message = Message(message_id=update_id, date=None, chat=Chat(id=user_id, type="private"), from_user=user, text="ciao")
+    if bot is not None:
+        message.set_bot(bot)
+    return Update(update_id=update_id, message=message)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = TokenBucketRateLimiter(capacity=3, refill_rate=0.5, clock=clock)
+
+    assert [limiter.increment_and_check_sync("k")[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.increment_and_check_sync("k")[2] == 2
+
+    clock.now += 2
+    assert limiter.increment_and_check_sync("k")[0]
+    assert not limiter.increment_and_check_sync("k")[0]
+    # other keys have their own bucket
+    assert limiter.increment_and_check_sync("other")[0]
+
+
+@pytest.mark.asyncio
+async def test_flood_guard_answers_and_stops_excess_callbacks():
+    bot = FakeBot()
+    guard = FloodGuard(TokenBucketRateLimiter(capacity=2, refill_rate=1.0, clock=FakeClock()))
+
+    await guard(callback_update(1, bot=bot), None)
+    await guard(callback_update(2, bot=bot), None)
+    with pytest.raises(ApplicationHandlerStop):
+        await guard(callback_update(3, bot=bot), None)
+
+    assert bot.answered == ["3"]
+    assert guard.dropped == 1
+    # a different user is unaffected
+    await guard(callback_update(4, user_id=7, bot=bot), None)
+
+
+@pytest.mark.asyncio
+async def test_flood_guard_ignores_updates_without_user():
+    guard = FloodGuard(TokenBucketRateLimiter(capacity=1, refill_rate=1.0, clock=FakeClock()))
+    chat = Chat(id=-100, type="channel")
+    post = Message(message_id=1, date=None, chat=chat)
+    for update_id in range(3):
+        await guard(Update(update_id=update_id, channel_post=post), None)
+    assert guard.dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_flood_guard_tells_fast_typers_to_slow_down_once_per_window():
+    bot = FakeBot()
+    clock = FakeClock()
+    guard = FloodGuard(TokenBucketRateLimiter(capacity=1, refill_rate=0.01, clock=clock), notice_interval=10, clock=clock)
+
+    await guard(message_update(1, bot=bot), None)
+    for update_id in range(2, 5):
+        with pytest.raises(ApplicationHandlerStop):
+            await guard(message_update(update_id, bot=bot), None)
+    assert bot.sent == [(42, FLOOD_NOTICE)]
+    assert guard.dropped == 3
+
+    clock.now += 10
+    with pytest.raises(ApplicationHandlerStop):
+        await guard(message_update(5, bot=bot), None)
+    assert len(bot.sent) == 2
@@ -0,0 +1,77 @@
+"""Cold-import budget for the bot entrypoint.
+
+Runs `python -X importtime -c "import adsbot.bot"` in a fresh interpreter and
+checks that feature modules stay out of startup (they're imported by the
+handlers that use them) and that the whole import stays under a budget.
+The budget is generous because CI machines vary; override it with
+ADSBOT_IMPORT_BUDGET_MS.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_MS = float(os.getenv("ADSBOT_IMPORT_BUDGET_MS", "1500"))
+
+# Loaded on first use only
+LAZY_MODULES = [
+    "adsbot.ai_content",
+    "adsbot.analytics",
+    "adsbot.campaign_analyzer",
+    "adsbot.campaigns",
+    "adsbot.notifications",
+    "adsbot.payments",
+    "adsbot.scheduler",
+    "adsbot.verification",
+    "redis",
+    "stripe",
+    "paypalrestsdk",
+]
+
+
+def _importtime():
+    """{module: cumulative microseconds} for a cold `import adsbot.bot`."""
+    # Warm the bytecode cache so the measurement is about imports, not compiling
+    subprocess.run([sys.executable, "-c", "import adsbot.bot"], cwd=ROOT, check=True, capture_output=True)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import adsbot.bot"],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | <indent>module"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.fixture(scope="module")
+def import_times():
+    try:
+        import telegram  # noqa: F401
+    except ImportError:  # pragma: no cover
+        pytest.skip("python-telegram-bot not installed")
+    return _importtime()
+
+
+def test_feature_modules_are_not_imported_at_startup(import_times):
+    eager = [name for name in LAZY_MODULES if name in import_times]
+    assert eager == [], f"imported at startup: {eager}"
+
+
+def test_cold_import_within_budget(import_times):
+    total_ms = import_times["adsbot.bot"] / 1000
+    slowest = sorted(
+        ((us, name) for name, us in import_times.items() if name.count(".") == 0 or name.startswith("adsbot.")),
+        reverse=True,
+    )[:5]
+    assert total_ms <= BUDGET_MS, f"import adsbot.bot took {total_ms:.0f} ms (budget {BUDGET_MS:.0f} ms); slowest: {slowest}"
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from adsbot import ledger
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.inside_ads_services import add_transaction
+from adsbot.models import LedgerCheckpoint, LedgerEntry, LedgerTransaction, UserBalance
+from adsbot.services import ensure_user
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def _user(session, telegram_id=1):
+    return ensure_user(session, telegram_id=telegram_id, username=f"u{telegram_id}", first_name="U", language_code="it")
+
+
+def test_minor_units_round_half_up():
+    assert ledger.to_minor(10) == 1000
+    assert ledger.to_minor(0.1 + 0.2) == 30
+    assert ledger.to_minor(1.005) == 101
+    assert ledger.to_minor(-2.5) == -250
+    assert ledger.from_minor(1999) == 19.99
+
+
+def test_postings_must_balance(session_factory):
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, _user(session).id)
+        external = ledger.system_account(session, ledger.EXTERNAL)
+        for legs in ([(wallet, 100)], [(wallet, 100), (external, -99)], [(wallet, 1.5), (external, -1.5)], [(wallet, 0), (external, 0)]):
+            with pytest.raises(ledger.LedgerError):
+                ledger.post(session, "deposit", legs)
+        assert session.scalar(select(func.count(LedgerTransaction.id))) == 0
+
+
+def test_post_updates_cached_balances_and_user_balance(session_factory):
+    with session_scope(session_factory) as session:
+        user_id = _user(session).id
+        wallet = ledger.user_account(session, user_id)
+        external = ledger.system_account(session, ledger.EXTERNAL)
+        ledger.post(session, "deposit", [(external, -2500), (wallet, 2500)], description="Ricarica")
+        ledger.post(session, "withdrawal", [(wallet, -1000), (external, 1000)])
+
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, user_id)
+        assert ledger.balance_of(session, wallet.id) == 1500 == ledger.replay_balance(session, wallet.id)
+        assert ledger.balance_of(session, ledger.system_account(session, ledger.EXTERNAL).id) == -1500
+        assert session.scalar(select(UserBalance.balance).where(UserBalance.user_id == user_id)) == 15.0
+        # Every transaction sums to zero
+        sums = session.execute(select(func.sum(LedgerEntry.amount_minor)).group_by(LedgerEntry.transaction_id)).scalars()
+        assert set(sums) == {0}
+
+
+def test_user_accounts_cannot_overdraw(session_factory):
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, _user(session).id)
+        platform = ledger.system_account(session, ledger.PLATFORM)
+        ledger.post(session, "earn", [(platform, -500), (wallet, 500)])
+        session.commit()
+        with pytest.raises(ledger.InsufficientFunds):
+            ledger.post(session, "spend", [(wallet, -501), (platform, 501)])
+        session.rollback()
+        assert ledger.balance_of(session, wallet.id) == 500
+
+
+def test_opening_balance_is_carried_over_from_user_balance(session_factory):
+    with session_scope(session_factory) as session:
+        user_id = _user(session).id
+        session.add(UserBalance(user_id=user_id, balance=42.5))
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, user_id)
+        assert wallet.balance_minor == 4250
+        assert ledger.user_account(session, user_id).id == wallet.id
+        assert session.scalar(select(LedgerTransaction.kind)) == "opening_balance"
+
+
+def test_historical_balance_replays_from_the_nearest_checkpoint(session_factory, monkeypatch):
+    monkeypatch.setattr(ledger, "CHECKPOINT_INTERVAL", 10)
+    start = datetime(2026, 1, 1)
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, _user(session).id)
+        external = ledger.system_account(session, ledger.EXTERNAL)
+        for day in range(35):
+            ledger.post(session, "deposit", [(external, -100), (wallet, 100)], now=start + timedelta(days=day))
+        wallet_id = wallet.id
+
+    with session_scope(session_factory) as session:
+        checkpoints = session.scalars(
+            select(LedgerCheckpoint.balance_minor).where(LedgerCheckpoint.account_id == wallet_id)
+        ).all()
+        assert checkpoints == [1000, 2000, 3000]
+        assert ledger.balance_at(session, wallet_id, start - timedelta(days=1)) == 0
+        assert ledger.balance_at(session, wallet_id, start + timedelta(days=4, hours=1)) == 500
+        assert ledger.balance_at(session, wallet_id, start + timedelta(days=25)) == 2600
+        assert ledger.balance_at(session, wallet_id, start + timedelta(days=100)) == 3500
+
+
+def test_entries_are_append_only(session_factory):
+    with session_scope(session_factory) as session:
+        wallet = ledger.user_account(session, _user(session).id)
+        ledger.post(session, "earn", [(ledger.system_account(session, ledger.PLATFORM), -100), (wallet, 100)])
+    with pytest.raises(ledger.LedgerError):
+        with session_scope(session_factory) as session:
+            session.scalars(select(LedgerEntry)).first().amount_minor = 1_000_000
+    with pytest.raises(ledger.LedgerError):
+        with session_scope(session_factory) as session:
+            session.delete(session.scalars(select(LedgerEntry)).first())
+
+
+def test_add_transaction_posts_to_the_ledger(session_factory):
+    with session_scope(session_factory) as session:
+        user = _user(session)
+        add_transaction(session, user, "earn", 30.0, "Guadagno")
+        add_transaction(session, user, "spend", 12.25, "Spesa")
+        with pytest.raises(ledger.InsufficientFunds):
+            add_transaction(session, user, "withdrawal", 100.0, "Prelievo")
+        session.rollback()
+        wallet = ledger.user_account(session, user.id)
+        assert wallet.balance_minor == 1775
+        assert session.scalar(select(UserBalance.balance).where(UserBalance.user_id == user.id)) == 17.75
+
+
+def test_bulk_posting_credits_many_accounts_at_once(session_factory):
+    with session_scope(session_factory) as session:
+        user_ids = [_user(session, telegram_id=i).id for i in range(1, 4)]
+        session.add(UserBalance(user_id=user_ids[0], balance=5.0))
+    with session_scope(session_factory) as session:
+        wallets = ledger.user_accounts(session, user_ids)
+        assert wallets[user_ids[0]].balance_minor == 500
+        platform = ledger.system_account(session, ledger.PLATFORM)
+        legs = [(platform, -600)] + [(wallets[user_id], 200) for user_id in user_ids]
+        ledger.post_bulk(session, "earn", legs)
+        for bad in ([(wallets[user_ids[0]], -100), (platform, 100)], legs[:2] + [(platform, 200), (wallets[user_ids[1]], -200)]):
+            with pytest.raises(ledger.LedgerError):
+                ledger.post_bulk(session, "earn", bad)
+    with session_scope(session_factory) as session:
+        balances = session.execute(select(UserBalance.user_id, UserBalance.balance).order_by(UserBalance.user_id)).all()
+        assert balances == [(user_ids[0], 7.0), (user_ids[1], 2.0), (user_ids[2], 2.0)]
+        for wallet in ledger.user_accounts(session, user_ids).values():
+            assert wallet.balance_minor == ledger.replay_balance(session, wallet.id)
+
+
+def test_refused_posting_writes_nothing(session_factory):
+    with session_scope(session_factory) as session:
+        external = ledger.system_account(session, ledger.EXTERNAL)
+        escrow = ledger.system_account(session, ledger.ESCROW)
+        wallet = ledger.user_account(session, _user(session).id)
+        ledger.post(session, "deposit", [(external, -300), (wallet, 300)])
+        # The escrow leg (lower account id) is applied before the wallet's is refused
+        with pytest.raises(ledger.InsufficientFunds):
+            ledger.post(session, "order_payment", [(wallet, -500), (escrow, 500)])
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(func.count(LedgerTransaction.id))) == 1
+        for account in (escrow, wallet):
+            stored = session.get(type(account), account.id)
+            assert stored.balance_minor == ledger.replay_balance(session, account.id)
+            assert stored.entry_count == session.scalar(
+                select(func.count(LedgerEntry.id)).where(LedgerEntry.account_id == account.id)
+            )
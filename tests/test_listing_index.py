@@ -0,0 +1,156 @@
+import random
+
+import pytest
+from sqlalchemy import update
+
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.listing_index import ListingEntry, ListingIndex, decode_cursor, encode_cursor
+from adsbot.models import Channel, ChannelListing, User
+
+
+def _entry(listing_id, price, reach=0, category=None):
+    return ListingEntry(listing_id, channel_id=listing_id, user_id=1, price=price, reach=reach, category=category)
+
+
+def _walk(index, **kwargs):
+    """Every entry reached by following "next" cursors from the first page."""
+    seen, after = [], None
+    while True:
+        page = index.page(after=after, limit=3, **kwargs)
+        seen.extend(page.entries)
+        if not page.has_next:
+            return seen
+        after = page.last_key
+
+
+def test_pages_follow_sort_order_without_gaps():
+    rng = random.Random(7)
+    entries = [_entry(i, rng.choice([5.0, 9.5, 12.0, 30.0]), rng.randint(0, 5000)) for i in range(1, 41)]
+    index = ListingIndex(entries)
+
+    by_price = _walk(index, sort="price")
+    assert [e.id for e in by_price] == [e.id for e in sorted(entries, key=lambda e: (e.price, e.id))]
+    by_reach = _walk(index, sort="reach")
+    assert [e.id for e in by_reach] == [e.id for e in sorted(entries, key=lambda e: (-e.reach, e.id))]
+
+
+def test_prev_returns_the_previous_page():
+    index = ListingIndex(_entry(i, float(i)) for i in range(1, 11))
+    first = index.page(limit=3)
+    second = index.page(after=first.last_key, limit=3)
+    assert [e.id for e in second.entries] == [4, 5, 6]
+    assert second.has_prev and second.has_next
+
+    back = index.page(before=second.first_key, limit=3)
+    assert [e.id for e in back.entries] == [1, 2, 3]
+    assert not back.has_prev
+
+
+def test_filters_and_categories():
+    index = ListingIndex(
+        [
+            _entry(1, 10.0, reach=100, category="tech"),
+            _entry(2, 20.0, reach=900, category="tech"),
+            _entry(3, 30.0, reach=500, category="crypto"),
+            _entry(4, 40.0, reach=800, category="tech"),
+        ]
+    )
+    assert [e.id for e in _walk(index, category="tech", min_price=15)] == [2, 4]
+    assert [e.id for e in _walk(index, sort="reach", min_reach=500)] == [2, 4, 3]
+    assert [e.id for e in _walk(index, max_price=25, min_reach=500)] == [2]
+    assert index.page(category="food").entries == []
+    assert index.count(category="tech") == 3
+    assert index.count(min_price=15, max_price=35, min_reach=600) == 1
+
+
+def test_cursor_stays_valid_across_changes():
+    index = ListingIndex(_entry(i, float(i)) for i in range(1, 7))
+    first = index.page(limit=3)
+    index.remove(2)
+    index.upsert(_entry(7, 1.5))  # lands before the cursor
+    index.upsert(_entry(4, 4.5))  # price change after the cursor
+    assert [e.id for e in index.page(after=first.last_key, limit=3).entries] == [4, 5, 6]
+
+
+def test_cursor_round_trip():
+    key = (12.345678901, 42)
+    assert decode_cursor(encode_cursor(key)) == key
+    assert len(f"marketplace:advertiser:catalog:next:{encode_cursor((-123456789, 2**31))}") <= 64
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def test_index_follows_committed_listings(session_factory):
+    with session_scope(session_factory) as session:
+        user = User(telegram_id=1)
+        session.add(user)
+        session.flush()
+        for n in range(3):
+            channel = Channel(user_id=user.id, handle=f"chan{n}")
+            session.add(channel)
+            session.flush()
+            session.add(ChannelListing(channel_id=channel.id, user_id=user.id, price=10.0 + n, reach_24h=100 * n))
+
+    index = ListingIndex.load(session_factory())
+    index.install(session_factory)
+    assert [e.handle for e in index.page().entries] == ["chan0", "chan1", "chan2"]
+
+    with session_scope(session_factory) as session:
+        listing = session.query(ChannelListing).filter_by(price=10.0).one()
+        listing.price = 50.0
+        session.query(ChannelListing).filter_by(price=11.0).one().is_available = False
+    assert [(e.handle, e.price) for e in index.page().entries] == [("chan2", 12.0), ("chan0", 50.0)]
+
+    # Rolled back changes never reach the index
+    session = session_factory()
+    session.query(ChannelListing).filter_by(price=12.0).one().price = 1.0
+    session.flush()
+    session.rollback()
+    session.close()
+    assert [e.price for e in index.page().entries] == [12.0, 50.0]
+
+    with session_scope(session_factory) as session:
+        session.delete(session.query(ChannelListing).filter_by(price=12.0).one())
+    assert [e.handle for e in index.page().entries] == ["chan0"]
+
+
+def test_refresh_picks_up_changes_made_outside_this_process(session_factory):
+    with session_scope(session_factory) as session:
+        user = User(telegram_id=1)
+        session.add(user)
+        session.flush()
+        for n in range(2):
+            channel = Channel(user_id=user.id, handle=f"chan{n}")
+            session.add(channel)
+            session.flush()
+            session.add(ChannelListing(channel_id=channel.id, user_id=user.id, price=10.0 + n))
+
+    now = [0.0]
+    with session_scope(session_factory) as session:
+        index = ListingIndex.load(session, check_interval=30, reload_interval=600, clock=lambda: now[0])
+    index.install(session_factory)
+
+    # Another worker (or a bulk UPDATE) changes a price: no session event here
+    other = create_session_factory(Config(bot_token="TEST", database_url=str(session_factory.kw["bind"].url)))
+    with session_scope(other) as session:
+        session.execute(update(ChannelListing).where(ChannelListing.price == 10.0).values(price=99.0))
+
+    with session_scope(session_factory) as session:
+        assert not index.refresh_due() and not index.refresh(session)
+        now[0] = 30
+        assert index.refresh_due()
+        assert index.refresh(session)
+        assert [e.price for e in index.page().entries] == [11.0, 99.0]
+        # Nothing changed since: the next check doesn't reload
+        now[0] = 60
+        assert not index.refresh(session)
+        # Changes that leave the stamp alone are picked up by the periodic reload
+        session.connection().exec_driver_sql("UPDATE channels SET handle = 'renamed'")
+        now[0] = 700
+        assert index.refresh(session)
+        assert {e.handle for e in index.page().entries} == {"renamed"}
+    assert index.reloads == 2
@@ -0,0 +1,19 @@
+from scripts.load_test import main
+
+
+def test_harness_walks_flows_and_reports(tmp_path):
+    report = main([
+        "--users", "8", "--mix", "browse_catalog", "--ramp-up", "0", "--think-ms", "0",
+        "--listings", "12", "--latency-ms", "2", "--jitter-ms", "2",
+        "--database-url", f"sqlite:///{tmp_path / 'load.db'}",
+        "--output", str(tmp_path / "report.json"),
+    ])
+
+    assert (tmp_path / "report.json").exists()
+    assert report["users"] == 8
+    assert report["flows"]["browse_catalog"]["users"] == 8
+    catalog = report["steps"]["browse_catalog:marketplace:advertiser:catalog"]
+    assert catalog["count"] == 8 and catalog["errors"] == 0
+    assert report["steps"]["browse_catalog:marketplace:advertiser:catalog:next"]["count"] >= 8
+    assert {"updates_per_sec", "p50_ms", "p95_ms", "p99_ms", "top_errors", "send_queue"} <= report.keys()
+    assert report["bot_api_calls"]["editMessageText"] >= 16
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from adsbot.memory_rate_limiter import InMemoryRateLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limiter_blocks_after_limit():
+    clock = FakeClock()
+    limiter = InMemoryRateLimiter(window_seconds=2, max_requests=3, clock=clock)
+    api_key = "sk-user-test-memory"
+
+    for i in range(3):
+        allowed, remaining, retry, slowdown = await limiter.increment_and_check(api_key)
+        assert allowed
+        assert remaining == 2 - i
+        assert retry is None
+        assert slowdown is None
+
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check(api_key)
+    assert not allowed
+    assert retry == 2
+    assert await limiter.is_blocked(api_key) == 2
+
+    clock.now += 2.1
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check(api_key)
+    assert allowed
+    assert await limiter.is_blocked(api_key) is None
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limiter_slowdown_returns_delay():
+    limiter = InMemoryRateLimiter(window_seconds=60, max_requests=3, mode="slowdown", clock=FakeClock())
+    for _ in range(3):
+        allowed, _, _, slowdown = await limiter.increment_and_check("slow")
+        assert allowed and slowdown is None
+
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check("slow")
+    assert allowed
+    assert remaining == 0
+    assert slowdown == pytest.approx(0.5)
+
+
+def test_timer_wheel_sweeps_expired_keys():
+    clock = FakeClock()
+    limiter = InMemoryRateLimiter(window_seconds=5, max_requests=10, wheel_slots=4, clock=clock)
+    for i in range(50):
+        limiter.increment_and_check_sync(f"key-{i}")
+    assert len(limiter) == 50
+
+    # Window size exceeds the wheel span: keys survive a full revolution.
+    clock.now += 3
+    limiter.sweep()
+    assert len(limiter) == 50
+
+    clock.now += 6
+    limiter.sweep()
+    assert len(limiter) == 0
+
+
+def test_concurrent_threads_never_exceed_limit():
+    limiter = InMemoryRateLimiter(window_seconds=3600, max_requests=100, stripes=4)
+    allowed = []
+
+    def worker():
+        for _ in range(100):
+            ok, _, _, _ = limiter.increment_and_check_sync("hot")
+            allowed.append(ok)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(allowed) == 100
+
+
+def test_snapshot_restores_blocks(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "limiter.json")
+    limiter = InMemoryRateLimiter(window_seconds=60, max_requests=1, snapshot_path=path, clock=clock)
+    limiter.increment_and_check_sync("a")
+    limiter.increment_and_check_sync("a")
+    limiter.increment_and_check_sync("b")
+    limiter.close()
+
+    clock.now += 10
+    restored = InMemoryRateLimiter(window_seconds=60, max_requests=1, snapshot_path=path, clock=clock)
+    assert len(restored) == 2
+    allowed, _, retry, _ = restored.increment_and_check_sync("a")
+    assert not allowed
+    assert retry == 50
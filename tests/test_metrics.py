@@ -0,0 +1,153 @@
+import asyncio
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from sqlalchemy import text
+
+from adsbot.config import Config
+from adsbot.db import create_session_factory
+from adsbot.db_executor import DBExecutor
+from adsbot.metrics import (
+    Histogram,
+    MetricsRegistry,
+    install_db_timing,
+    measure,
+    start_metrics_server,
+    timed_handler,
+    timed_job,
+    track_time,
+)
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram(buckets=(0.1, 0.2, 0.5))
+    for _ in range(50):
+        histogram.observe(0.05)
+    for _ in range(50):
+        histogram.observe(0.15)
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert 0.1 < histogram.quantile(0.95) <= 0.2
+    histogram.observe(3.0)  # beyond the last bucket
+    assert histogram.quantile(1.0) == 0.5
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_measure_attributes_io_to_the_running_handler():
+    registry = MetricsRegistry()
+    with measure("outer", registry):
+        with track_time("openai"):
+            time.sleep(0.01)
+        with measure("inner", registry):
+            with track_time("telegram"):
+                time.sleep(0.01)
+    with track_time("db"):  # no handler running: not recorded anywhere
+        time.sleep(0.001)
+
+    assert registry.histogram("outer", "openai").total >= 0.01
+    # Nested measurements charge I/O to every enclosing handler
+    assert registry.histogram("outer", "telegram").total >= 0.01
+    assert registry.histogram("inner", "telegram").total >= 0.01
+    assert registry.histogram("inner", "openai").total == 0
+    assert registry.histogram("outer", "wall").total >= 0.02
+    assert registry.histogram("outer", "db").total == 0
+
+
+def test_concurrent_handlers_do_not_mix_their_numbers():
+    registry = MetricsRegistry()
+
+    async def slow(update, context):
+        with track_time("telegram"):
+            await asyncio.sleep(0.05)
+
+    async def fast(update, context):
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(
+            timed_handler(slow, registry=registry)(None, None),
+            timed_handler(fast, registry=registry)(None, None),
+        )
+
+    asyncio.run(scenario())
+    assert registry.histogram("slow", "telegram").total >= 0.05
+    assert registry.histogram("fast", "telegram").total == 0
+
+
+def test_timed_handler_is_idempotent_and_timed_job_is_named():
+    registry = MetricsRegistry()
+
+    async def handler(update, context):
+        return "ok"
+
+    wrapped = timed_handler(handler, registry=registry)
+    assert timed_handler(wrapped, registry=registry) is wrapped
+    assert asyncio.run(wrapped(None, None)) == "ok"
+    assert timed_job("cleanup", lambda: 42, registry=registry)() == 42
+    assert registry.histogram("handler").count == 1
+    assert registry.histogram("job:cleanup").count == 1
+
+
+def test_db_time_follows_the_handler_into_the_executor(tmp_path):
+    install_db_timing()
+    factory = create_session_factory(Config(bot_token="x", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+    executor = DBExecutor(factory, max_workers=2)
+    registry = MetricsRegistry()
+
+    def query(session):
+        return session.execute(text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 20000) SELECT count(*) FROM c")).scalar()
+
+    async def handler(update, context):
+        return await executor.run_in_session(query)
+
+    try:
+        assert asyncio.run(timed_handler(handler, registry=registry)(None, None)) == 20000
+    finally:
+        executor.shutdown()
+    assert registry.histogram("handler", "db").total > 0
+
+
+def test_render_exposes_histograms_quantiles_and_gauges():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe('say "hi"', "wall", 0.05)
+    registry.observe('say "hi"', "wall", 0.5)
+    registry.add_collector("queue", lambda: {"adsbot_waiting": 3})
+    registry.add_collector("broken", lambda: 1 / 0)
+
+    output = registry.render()
+    labels = 'handler="say \\"hi\\"",component="wall"'
+    assert f'adsbot_handler_seconds_bucket{{{labels},le="0.1"}} 1' in output
+    assert f'adsbot_handler_seconds_bucket{{{labels},le="1.0"}} 2' in output
+    assert f'adsbot_handler_seconds_bucket{{{labels},le="+Inf"}} 2' in output
+    assert f"adsbot_handler_seconds_count{{{labels}}} 2" in output
+    assert f'adsbot_handler_seconds_quantile{{{labels},quantile="0.99"}}' in output
+    assert "adsbot_waiting 3.0" in output
+
+
+def test_application_handlers_are_instrumented(tmp_path):
+    from adsbot.bot import build_application
+    from adsbot.callback_router import CallbackRouter
+
+    config = Config(bot_token="123456:TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}")
+    application = build_application(config)
+    routers = [h for h in application.handlers[0] if isinstance(h, CallbackRouter)]
+    plain = [h for h in application.handlers[0] if hasattr(h, "callback") and h not in routers]
+    assert plain and all(getattr(h.callback, "__adsbot_timed__", False) for h in plain)
+    assert all(route.callback.__adsbot_timed__ for router in routers for route in router.routes)
+
+
+def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.observe("start", "wall", 0.01)
+    server = start_metrics_server("127.0.0.1", 0, registry)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+            assert response.status == 200
+            assert 'handler="start"' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/other", timeout=5)
+    finally:
+        server.shutdown()
@@ -0,0 +1,170 @@
+import pytest
+
+pytest.importorskip("starlette")
+
+from adsbot import api_keys
+from adsbot.memory_rate_limiter import InMemoryRateLimiter
+from adsbot.middleware_fastapi import RateLimitMiddleware, RoutePolicy, compile_routes
+from adsbot.rate_limiter import RateLimitPolicy
+from adsbot.sqlite_rate_limiter import SQLiteRateLimiter
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware, path="/test", headers=None, query_string=b""):
+    scope = {
+        "type": "http",
+        "path": path,
+        "headers": headers or [],
+        "query_string": query_string,
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start.get("headers", []))
+
+
+@pytest.fixture(autouse=True)
+def keys(monkeypatch):
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-user-mw"})
+    monkeypatch.setattr(api_keys, "ADMIN_KEYS", {"sk-admin-mw"})
+
+
+@pytest.mark.asyncio
+async def test_global_limit_from_header_and_query():
+    mw = RateLimitMiddleware(ok_app, limiter=InMemoryRateLimiter(window_seconds=60, max_requests=2))
+
+    status, headers = await call(mw, headers=[(b"x-api-key", b"sk-user-mw")])
+    assert status == 200
+    assert headers[b"x-rate-limit-remaining"] == b"1"
+
+    status, _ = await call(mw, query_string=b"foo=1&api_key=sk-user-mw")
+    assert status == 200
+
+    status, headers = await call(mw, headers=[(b"x-api-key", b"sk-user-mw")])
+    assert status == 429
+    assert headers[b"retry-after"] == b"60"
+
+    # admins and unknown keys pass through
+    assert (await call(mw, headers=[(b"x-api-key", b"sk-admin-mw")]))[0] == 200
+    assert (await call(mw, headers=[(b"x-api-key", b"sk-unknown")]))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_query_key_is_percent_decoded(monkeypatch):
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-user+mw/1"})
+    mw = RateLimitMiddleware(ok_app, limiter=InMemoryRateLimiter(window_seconds=60, max_requests=1))
+
+    assert (await call(mw, query_string=b"api_key=sk-user%2Bmw%2F1"))[0] == 200
+    # Same key whichever way it is sent
+    assert (await call(mw, headers=[(b"x-api-key", b"sk-user+mw/1")]))[0] == 429
+
+
+@pytest.mark.asyncio
+async def test_route_policies_have_their_own_limits():
+    mw = RateLimitMiddleware(
+        ok_app,
+        limiter=InMemoryRateLimiter(window_seconds=60, max_requests=100),
+        routes=[
+            RoutePolicy("/ai", max_requests=1, window_seconds=60),
+            RoutePolicy("/ai/cheap", max_requests=5, window_seconds=60),
+            RoutePolicy("/admin-only", max_requests=1, window_seconds=60, exempt_roles=frozenset()),
+        ],
+    )
+    user = [(b"x-api-key", b"sk-user-mw")]
+    admin = [(b"x-api-key", b"sk-admin-mw")]
+
+    assert (await call(mw, "/ai/generate", user))[0] == 200
+    assert (await call(mw, "/ai/generate", user))[0] == 429
+    # longest prefix wins, and route counters are independent
+    assert (await call(mw, "/ai/cheap/x", user))[0] == 200
+    # segment-aligned matching: /aix is not under /ai
+    assert (await call(mw, "/aix", user))[0] == 200
+
+    assert (await call(mw, "/admin-only", admin))[0] == 200
+    assert (await call(mw, "/admin-only", admin))[0] == 429
+
+
+def test_compile_routes_rejects_duplicates():
+    with pytest.raises(ValueError):
+        compile_routes([RoutePolicy("/a", 1, 60), RoutePolicy("/a/", 2, 60)])
+
+
+@pytest.mark.asyncio
+async def test_ip_and_global_dimensions_checked_together():
+    limiter = InMemoryRateLimiter(window_seconds=60, max_requests=100)
+    mw = RateLimitMiddleware(
+        ok_app,
+        limiter=limiter,
+        ip_policy=RateLimitPolicy(max_requests=2, window_seconds=60),
+        global_policy=RateLimitPolicy(max_requests=4, window_seconds=30),
+    )
+
+    async def call_from(ip, key=None):
+        scope = {"type": "http", "path": "/x", "headers": [], "query_string": b"", "client": (ip, 1234)}
+        if key:
+            scope["headers"] = [(b"x-api-key", key)]
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await mw(scope, None, send)
+        return messages[0]["status"]
+
+    # unknown keys are still limited per IP
+    assert await call_from("10.0.0.1") == 200
+    assert await call_from("10.0.0.1", b"sk-user-mw") == 200
+    assert await call_from("10.0.0.1") == 429
+    # ...and the global budget is shared by every client
+    assert await call_from("10.0.0.2") == 200
+    assert await call_from("10.0.0.3") == 429
+    # admins bypass all dimensions
+    assert await call_from("10.0.0.4", b"sk-admin-mw") == 200
+
+
+@pytest.mark.asyncio
+async def test_registry_tier_overrides_default_limit(tmp_path, monkeypatch):
+    path = tmp_path / "keys.json"
+    path.write_text(
+        '{"tiers": {"partner": {"max_requests": 3, "window_seconds": 60}},'
+        ' "keys": [{"key": "sk-partner-mw", "tier": "partner"}]}',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(api_keys, "REGISTRY", api_keys.KeyRegistry(str(path)))
+    mw = RateLimitMiddleware(ok_app, limiter=InMemoryRateLimiter(window_seconds=60, max_requests=1))
+    partner = [(b"x-api-key", b"sk-partner-mw")]
+
+    assert [(await call(mw, headers=partner))[0] for _ in range(4)] == [200, 200, 200, 429]
+    # env keys keep the limiter default
+    user = [(b"x-api-key", b"sk-user-mw")]
+    assert [(await call(mw, headers=user))[0] for _ in range(2)] == [200, 429]
+
+
+@pytest.mark.asyncio
+async def test_registry_tier_on_sqlite_limiter(tmp_path, monkeypatch):
+    path = tmp_path / "keys.json"
+    path.write_text(
+        '{"tiers": {"partner": {"max_requests": 2, "window_seconds": 60}},'
+        ' "keys": [{"key": "sk-partner-sqlite", "tier": "partner"}]}',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(api_keys, "REGISTRY", api_keys.KeyRegistry(str(path)))
+    limiter = SQLiteRateLimiter(db_path=str(tmp_path / "rl.db"), window_seconds=60, max_requests=1)
+    mw = RateLimitMiddleware(ok_app, limiter=limiter)
+
+    partner = [(b"x-api-key", b"sk-partner-sqlite")]
+    assert [(await call(mw, headers=partner))[0] for _ in range(3)] == [200, 200, 429]
+    # Keys without a tier: the limiter's own three-value result
+    user = [(b"x-api-key", b"sk-user-mw")]
+    assert [(await call(mw, headers=user))[0] for _ in range(2)] == [200, 429]
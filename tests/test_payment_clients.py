@@ -0,0 +1,254 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from adsbot import ledger
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.models import CampaignPayment, Channel, PaymentStatus, Transaction
+from adsbot.payments import (
+    AsyncPaymentProcessor,
+    AsyncPayPalClient,
+    AsyncStripeClient,
+    PaymentError,
+    ProviderHTTP,
+)
+from adsbot.services import ensure_user
+from scripts.fake_payment_provider import FakePaymentProvider
+
+
+@pytest.fixture
+def provider():
+    server = FakePaymentProvider().start()
+    yield server
+    server.stop()
+
+
+def _run(scenario, **http_kwargs):
+    async def main():
+        http = ProviderHTTP(backoff=0.01, **http_kwargs)
+        try:
+            return await scenario(http)
+        finally:
+            await http.aclose()
+
+    return asyncio.run(main())
+
+
+def test_stripe_intent_lifecycle(provider):
+    async def scenario(http):
+        stripe = AsyncStripeClient("sk_test", http, provider.base_url)
+        intent = await stripe.create_payment_intent(1999, "a@example.com", "Campaign")
+        status = await stripe.retrieve_payment_intent(intent["payment_intent_id"])
+        refunded = await stripe.refund_payment(intent["payment_intent_id"], 500)
+        return intent, status, refunded
+
+    intent, status, refunded = _run(scenario)
+    assert intent["payment_intent_id"].startswith("pi_") and intent["client_secret"]
+    assert status == {"status": "requires_payment_method", "amount": 1999, "currency": "usd"}
+    assert refunded is True
+
+
+def test_retries_reuse_the_idempotency_key(provider):
+    provider.fail_next(2, status=503, retry_after=0)
+
+    async def scenario(http):
+        stripe = AsyncStripeClient("sk_test", http, provider.base_url)
+        first = await stripe.create_payment_intent(1000, "", "x", idempotency_key="order-1")
+        again = await stripe.create_payment_intent(1000, "", "x", idempotency_key="order-1")
+        return first, again, http.retried
+
+    first, again, retried = _run(scenario)
+    assert retried == 2
+    assert first["payment_intent_id"] == again["payment_intent_id"]
+    assert provider.calls["POST /v1/payment_intents"] == 4
+    assert provider.created["pi"] == 1
+
+
+def test_concurrent_duplicates_create_one_payment(provider):
+    async def scenario(http):
+        stripe = AsyncStripeClient("sk_test", http, provider.base_url)
+        return await asyncio.gather(*(
+            stripe.create_payment_intent(500, "", "tap", idempotency_key="tap-1") for _ in range(5)
+        ))
+
+    results = _run(scenario)
+    assert len({r["payment_intent_id"] for r in results}) == 1
+    assert provider.created["pi"] == 1
+
+
+def test_errors_and_timeouts_raise_payment_error(provider):
+    provider.fail_next(3, status=500)
+
+    async def failing(http):
+        stripe = AsyncStripeClient("sk_test", http, provider.base_url)
+        await stripe.retrieve_payment_intent("pi_missing")
+
+    with pytest.raises(PaymentError) as excinfo:
+        _run(failing)
+    assert excinfo.value.status == 500
+
+    with pytest.raises(PaymentError) as excinfo:
+        _run(failing)  # not retried: a client error
+    assert excinfo.value.status == 404
+
+    provider.latency = 0.5
+
+    async def slow(http):
+        stripe = AsyncStripeClient("sk_test", http, provider.base_url)
+        await stripe.create_payment_intent(100, "", "slow")
+
+    started = time.perf_counter()
+    with pytest.raises(PaymentError):
+        _run(slow, timeout=0.1, attempts=2)
+    # Two attempts cut at the read timeout, not the provider's latency
+    assert time.perf_counter() - started < 0.45
+
+
+def test_paypal_token_is_cached_and_payment_executes(provider):
+    async def scenario(http):
+        paypal = AsyncPayPalClient("id", "secret", http, base_url=provider.base_url)
+        created = await paypal.create_payment(12.5, "eur", "Campaign", "https://r", "https://c")
+        executed = await paypal.execute_payment(created["payment_id"], "PAYER1")
+        return created, executed
+
+    created, executed = _run(scenario)
+    assert created["status"] == "created" and "checkoutnow" in created["approval_url"]
+    assert executed == {"payment_id": created["payment_id"], "status": "approved", "amount": "12.50"}
+    assert provider.calls["POST /v1/oauth2/token"] == 1
+
+
+def test_processor_from_env_reports_failures_as_none(provider, monkeypatch):
+    monkeypatch.setenv("STRIPE_API_KEY", "sk_test")
+    monkeypatch.setenv("STRIPE_API_BASE", provider.base_url)
+    monkeypatch.delenv("PAYPAL_CLIENT_ID", raising=False)
+
+    async def scenario():
+        processor = AsyncPaymentProcessor.from_env(ProviderHTTP(attempts=1))
+        try:
+            ok = await processor.process_payment("stripe", 10.0, "usd", "a@example.com", "x")
+            verified = await processor.verify_payment("stripe", ok["payment_intent_id"])
+            provider.fail_next(1, status=503)
+            failed = await processor.process_payment("stripe", 10.0, "usd", "a@example.com", "x")
+            unavailable = await processor.process_payment("paypal", 10.0, "usd", "a@example.com", "x")
+            return ok, verified, failed, unavailable
+        finally:
+            await processor.aclose()
+
+    ok, verified, failed, unavailable = asyncio.run(scenario())
+    assert ok["status"] == "requires_payment_method" and verified["amount"] == 1000
+    assert failed is None and unavailable is None
+
+
+class _FakeQuery:
+    def __init__(self, data):
+        self.id = "q1"
+        self.data = data
+        self.message = SimpleNamespace(message_id=42)
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+class _FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_campaign_is_booked_once_and_only_when_the_provider_confirms(provider, monkeypatch, tmp_path):
+    from adsbot.bot import (
+        SELECT_PAYMENT_PROVIDER,
+        purchase_campaign_confirm,
+        purchase_campaign_provider,
+        purchase_campaign_verify,
+    )
+
+    monkeypatch.setenv("PAYPAL_CLIENT_ID", "id")
+    monkeypatch.setenv("PAYPAL_CLIENT_SECRET", "secret")
+    monkeypatch.setenv("PAYPAL_API_BASE", provider.base_url)
+    monkeypatch.delenv("STRIPE_API_KEY", raising=False)
+    session_factory = create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+    with session_scope(session_factory) as session:
+        editor = ensure_user(session, telegram_id=100, username="editor", first_name="E", language_code="it")
+        channel = Channel(user_id=editor.id, handle="news", title="News")
+        session.add(channel)
+        session.flush()
+        channel_id, editor_id = channel.id, editor.id
+
+    buyer = SimpleNamespace(id=7, username="buyer", first_name="B", language_code="it")
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    bot = _FakeBot()
+    context = SimpleNamespace(
+        bot=bot,
+        bot_data={"session_factory": session_factory},
+        user_data={"selected_channel_id": channel_id, "selected_channel_handle": "news", "campaign_name": "Lancio"},
+    )
+    query = _FakeQuery("purchase:payment:paypal")
+
+    def _booked():
+        with session_scope(session_factory) as session:
+            history = session.execute(
+                select(Transaction.transaction_type, Transaction.amount).order_by(Transaction.id)
+            ).all()
+            payments = session.execute(
+                select(CampaignPayment.id, CampaignPayment.provider_payment_id, CampaignPayment.status)
+            ).all()
+            return history, payments, ledger.user_account(session, editor_id).balance_minor
+
+    async def scenario():
+        processor = None
+        try:
+            budget_message = SimpleNamespace(text="25", reply_text=reply_text)
+            state = await purchase_campaign_provider(
+                SimpleNamespace(message=budget_message, effective_user=buyer), context
+            )
+            assert state != SELECT_PAYMENT_PROVIDER and replies[-1].startswith("💳 Scegli")
+
+            # Created, not paid: nothing is booked, a repeated tap reuses the payment
+            confirm = SimpleNamespace(callback_query=query, effective_user=buyer)
+            await purchase_campaign_confirm(confirm, context)
+            await purchase_campaign_confirm(confirm, context)
+            processor = context.bot_data["payment_processor"]
+            created = _booked()
+
+            # The buyer approves on PayPal and the payment is executed: the next check books it once
+            (campaign_payment_id, paypal_id, _), = created[1]
+            await processor.paypal.execute_payment(paypal_id, "PAYER1")
+            verify = SimpleNamespace(
+                callback_query=_FakeQuery(f"purchase:verify:{campaign_payment_id}"), effective_user=buyer
+            )
+            context.callback_args = {"payment_id": campaign_payment_id}
+            await purchase_campaign_verify(verify, context)
+            await purchase_campaign_verify(verify, context)
+            return created, _booked(), verify.callback_query.edits
+        finally:
+            if processor is not None:
+                await processor.aclose()
+
+    created, executed, verify_edits = asyncio.run(scenario())
+    assert query.edits[-1].startswith("⏳ Pagamento creato")
+    assert provider.created["PAYID"] == 1
+    history, payments, editor_balance = created
+    assert history == [] and editor_balance == 0
+    assert len(payments) == 1 and payments[0][2] == PaymentStatus.pending
+
+    history, payments, editor_balance = executed
+    assert history == [("spend", 25.0), ("earn", 20.0)]
+    assert payments[0][2] == PaymentStatus.completed
+    assert editor_balance == 2000
+    assert verify_edits[-1].startswith("✅ Campagna acquistata")
+    assert bot.sent == [7, 100]
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+
+from adsbot.persistence import SQLiteStateStore, StatePersistence, RedisStateStore
+
+
+# One fake Redis server per test, shared by the "workers" of that test
+SHARED_SERVERS = {}
+
+
+def sqlite_store(tmp_path):
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+def redis_store(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateStore(fakeredis.FakeRedis(server=SHARED_SERVERS.setdefault(str(tmp_path), fakeredis.FakeServer())))
+
+
+@pytest.fixture(params=[sqlite_store, redis_store], ids=["sqlite", "redis"])
+def make_store(request, tmp_path):
+    return lambda: request.param(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(make_store):
+    persistence = StatePersistence(make_store(), flush_interval=60)
+    await persistence.update_user_data(1, {"order_channel_id": 5, "order_duration": 24})
+    await persistence.update_chat_data(-10, {"x": 1})
+    await persistence.update_conversation("offer", (1, 1), "OFFER_DEPOSIT")
+    await persistence.update_conversation("offer", (2, 2), "OFFER_PAYMENT")
+    await persistence.update_conversation("offer", (2, 2), None)
+    # nothing written until the flush
+    assert persistence.writes == 0
+    await persistence.flush()
+    assert persistence.flushes == 1
+
+    restarted = StatePersistence(make_store())
+    assert await restarted.get_user_data() == {1: {"order_channel_id": 5, "order_duration": 24}}
+    assert await restarted.get_chat_data() == {-10: {"x": 1}}
+    assert await restarted.get_conversations("offer") == {(1, 1): "OFFER_DEPOSIT"}
+    assert await restarted.get_bot_data() == {}
+    assert await restarted.get_callback_data() is None
+
+
+@pytest.mark.asyncio
+async def test_write_behind_batches_updates(make_store):
+    persistence = StatePersistence(make_store(), flush_interval=0.01)
+    for step in range(5):
+        await persistence.update_user_data(1, {"step": step})
+    await persistence.update_user_data(2, {"step": 0})
+    await asyncio.sleep(0.05)
+
+    # five hand-overs of user 1 collapse into one write
+    assert persistence.flushes == 1
+    assert persistence.writes == 2
+    assert (await StatePersistence(make_store()).get_user_data())[1] == {"step": 4}
+
+
+@pytest.mark.asyncio
+async def test_refresh_picks_up_other_workers_writes(make_store):
+    worker_a = StatePersistence(make_store(), refresh=True)
+    worker_b = StatePersistence(make_store(), refresh=True)
+    user_data = (await worker_a.get_user_data()).get(1, {})
+
+    await worker_b.update_user_data(1, {"campaign_step": 2})
+    await worker_b.flush()
+
+    await worker_a.refresh_user_data(1, user_data)
+    assert user_data == {"campaign_step": 2}
+    # no newer version: local data is left alone
+    user_data["local"] = True
+    await worker_a.refresh_user_data(1, user_data)
+    assert user_data["local"]
+
+
+@pytest.mark.asyncio
+async def test_refresh_reads_the_store_off_the_event_loop(tmp_path):
+    store = sqlite_store(tmp_path)
+    threads = []
+    load_one = store.load_one
+
+    def recording_load_one(kind, key):
+        threads.append(threading.current_thread())
+        return load_one(kind, key)
+
+    store.load_one = recording_load_one
+    persistence = StatePersistence(store, refresh=True)
+    await persistence.refresh_user_data(1, {})
+    await persistence.refresh_chat_data(-10, {})
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+
+def test_application_refreshes_shared_state_when_configured(tmp_path, monkeypatch):
+    from adsbot.bot import build_application
+    from adsbot.config import Config
+
+    monkeypatch.setenv("BOT_TOKEN", "123456:TEST")
+    monkeypatch.setenv("PERSISTENCE_URL", f"sqlite:///{tmp_path / 'state.db'}")
+    monkeypatch.setenv("PERSISTENCE_REFRESH", "true")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'db.sqlite'}")
+    config = Config.load()
+    assert config.persistence_refresh
+
+    application = build_application(config)
+    assert isinstance(application.persistence, StatePersistence)
+    assert application.persistence.refresh
@@ -0,0 +1,181 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from adsbot import ledger
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.inside_ads_services import purchase_listing
+from adsbot.models import (
+    Channel,
+    ChannelListing,
+    MarketplaceOrder,
+    MoneyTransaction,
+    Payment,
+    PaymentStatus,
+    Transaction,
+    User,
+    UserBalance,
+)
+from adsbot.services import ensure_user
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def _setup(session_factory, balance=100.0, price=10.0):
+    with session_scope(session_factory) as session:
+        editor = ensure_user(session, telegram_id=1, username="editor", first_name="E", language_code="it")
+        buyer = ensure_user(session, telegram_id=2, username="buyer", first_name="B", language_code="it")
+        channel = Channel(user_id=editor.id, handle="news", title="News")
+        session.add(channel)
+        session.flush()
+        listing = ChannelListing(channel_id=channel.id, user_id=editor.id, price=price)
+        session.add(listing)
+        if balance is not None:
+            session.add(UserBalance(user_id=buyer.id, balance=balance))
+        session.flush()
+        return buyer.id, listing.id
+
+
+def _buy(session_factory, buyer_id, listing_id, **kwargs):
+    with session_scope(session_factory) as session:
+        buyer = session.get(User, buyer_id)
+        return purchase_listing(session, buyer, listing_id, content="Promo", duration_hours=12, **kwargs)
+
+
+def test_purchase_writes_order_payment_and_ledger(session_factory):
+    buyer_id, listing_id = _setup(session_factory)
+
+    result = _buy(session_factory, buyer_id, listing_id)
+
+    assert result["outcome"] == "ok" and result["balance"] == 90.0
+    with session_scope(session_factory) as session:
+        order = session.get(MarketplaceOrder, result["order_id"])
+        assert (order.buyer_id, order.price, order.duration_hours) == (buyer_id, 10.0, 12)
+        payment = session.scalar(select(Payment).where(Payment.order_id == order.id))
+        assert payment.status == PaymentStatus.escrow_held
+        assert (payment.platform_fee, payment.seller_amount) == (1.0, 9.0)
+        ledger = session.scalar(select(MoneyTransaction).where(MoneyTransaction.order_id == order.id))
+        assert (ledger.amount, ledger.balance_after, ledger.payment_id) == (-10.0, 90.0, payment.id)
+        assert session.scalar(select(Transaction.amount).where(Transaction.reference_id == order.id)) == 10.0
+
+
+def test_insufficient_balance_writes_nothing(session_factory):
+    buyer_id, listing_id = _setup(session_factory, balance=5.0)
+    result = _buy(session_factory, buyer_id, listing_id)
+    assert result["outcome"] == "insufficient_balance" and result["balance"] == 5.0
+
+    # No balance row at all counts as an empty balance
+    with session_scope(session_factory) as session:
+        session.query(UserBalance).delete()
+    assert _buy(session_factory, buyer_id, listing_id)["outcome"] == "insufficient_balance"
+
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(func.count(MarketplaceOrder.id))) == 0
+        assert session.scalar(select(func.count(MoneyTransaction.id))) == 0
+
+
+def test_unknown_or_inactive_listing(session_factory):
+    buyer_id, listing_id = _setup(session_factory)
+    assert _buy(session_factory, buyer_id, listing_id + 100)["outcome"] == "not_found"
+    with session_scope(session_factory) as session:
+        session.get(ChannelListing, listing_id).is_active = False
+    assert _buy(session_factory, buyer_id, listing_id)["outcome"] == "not_found"
+
+
+def test_concurrent_purchases_never_overdraw(session_factory):
+    buyer_id, listing_id = _setup(session_factory, balance=100.0, price=10.0)
+    outcomes = []
+    errors = []
+    barrier = threading.Barrier(16)
+
+    def worker():
+        barrier.wait()
+        for _ in range(4):
+            try:
+                outcomes.append(_buy(session_factory, buyer_id, listing_id)["outcome"])
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert outcomes.count("ok") == 10
+    assert outcomes.count("insufficient_balance") == 54
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(UserBalance.balance).where(UserBalance.user_id == buyer_id)) == 0.0
+        assert session.scalar(select(func.count(MarketplaceOrder.id))) == 10
+        assert session.scalar(select(func.count(Payment.id))) == 10
+        assert session.scalar(select(func.sum(MoneyTransaction.amount))) == -100.0
+        assert session.scalar(select(func.min(MoneyTransaction.balance_after))) == 0.0
+        escrow = ledger.system_account(session, ledger.ESCROW)
+        assert ledger.balance_of(session, escrow.id) == 10000 == ledger.replay_balance(session, escrow.id)
+
+
+def test_order_handler_helper_reads_seller_and_channel(session_factory):
+    from adsbot.bot import _create_marketplace_order
+
+    buyer_id, listing_id = _setup(session_factory)
+    user_data = SimpleNamespace(id=2, username="buyer", first_name="B", language_code="it")
+    with session_scope(session_factory) as session:
+        result = _create_marketplace_order(session, user_data, {"channel_id": listing_id, "content": "Promo", "duration": 6})
+    assert result["outcome"] == "ok"
+    assert (result["channel_handle"], result["seller_chat_id"], result["user"].telegram_id) == ("news", 1, 2)
+
+
+def test_price_changed_since_confirmation_charges_nothing(session_factory):
+    buyer_id, listing_id = _setup(session_factory, price=10.0)
+    with session_scope(session_factory) as session:
+        session.get(ChannelListing, listing_id).price = 12.0
+
+    result = _buy(session_factory, buyer_id, listing_id, expected_price=10.0)
+    assert result["outcome"] == "price_changed" and result["listing"].price == 12.0
+    assert _buy(session_factory, buyer_id, listing_id, expected_price=12.0)["outcome"] == "ok"
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(MarketplaceOrder.price)) == 12.0
+        assert session.scalar(select(func.count(MarketplaceOrder.id))) == 1
+
+
+def test_purchase_joins_the_callers_unit_of_work(session_factory):
+    buyer_id, listing_id = _setup(session_factory, balance=5.0)
+
+    # Too expensive: the purchase is undone, the caller's earlier write is kept
+    with session_scope(session_factory) as session:
+        session.get(User, buyer_id).username = "renamed"
+        result = purchase_listing(session, session.get(User, buyer_id), listing_id, content="Promo")
+        assert result["outcome"] == "insufficient_balance"
+    with session_scope(session_factory) as session:
+        assert session.get(User, buyer_id).username == "renamed"
+        wallet = ledger.user_account(session, buyer_id)
+        ledger.post(session, "deposit", [(ledger.system_account(session, ledger.EXTERNAL), -4500), (wallet, 4500)])
+
+    # Nothing is committed by the service: rolling back the caller discards the order
+    session = session_factory()
+    try:
+        assert purchase_listing(session, session.get(User, buyer_id), listing_id, content="Promo")["outcome"] == "ok"
+        session.rollback()
+    finally:
+        session.close()
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(func.count(MarketplaceOrder.id))) == 0
+        assert session.scalar(select(UserBalance.balance).where(UserBalance.user_id == buyer_id)) == 50.0
+
+
+def test_order_handler_helper_passes_the_confirmed_price(session_factory):
+    from adsbot.bot import _create_marketplace_order
+
+    buyer_id, listing_id = _setup(session_factory, price=10.0)
+    user_data = SimpleNamespace(id=2, username="buyer", first_name="B", language_code="it")
+    request = {"channel_id": listing_id, "content": "Promo", "duration": 6, "price": 8.0}
+    with session_scope(session_factory) as session:
+        result = _create_marketplace_order(session, user_data, request)
+    assert result["outcome"] == "price_changed" and result["listing"].price == 10.0
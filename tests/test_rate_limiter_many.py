@@ -0,0 +1,58 @@
+import pytest
+
+from adsbot.memory_rate_limiter import InMemoryRateLimiter
+from adsbot.rate_limiter import RateLimitPolicy, RedisRateLimiter
+from adsbot.sqlite_rate_limiter import SQLiteRateLimiter
+
+
+def memory_limiter(tmp_path):
+    return InMemoryRateLimiter(window_seconds=60, max_requests=10)
+
+
+def sqlite_limiter(tmp_path):
+    return SQLiteRateLimiter(db_path=str(tmp_path / "rl.db"), window_seconds=60, max_requests=10)
+
+
+def redis_limiter(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisRateLimiter(redis_client=fakeredis.FakeAsyncRedis(), window_seconds=60, max_requests=10)
+
+
+@pytest.fixture(params=[memory_limiter, sqlite_limiter, redis_limiter], ids=["memory", "sqlite", "redis"])
+def limiter(request, tmp_path):
+    return request.param(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_most_restrictive_dimension_wins(limiter):
+    checks = [
+        ("key", "sk-user", None),
+        ("ip", "10.0.0.1", RateLimitPolicy(max_requests=2, window_seconds=30)),
+    ]
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check_many(checks)
+    assert allowed
+    assert remaining == 1  # min(10 - 1, 2 - 1)
+    assert slowdown is None
+
+    assert (await limiter.increment_and_check_many(checks))[0]
+
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check_many(checks)
+    assert not allowed
+    assert retry == 30
+
+    # a blocked dimension rejects without consuming the others
+    other_ip = [("key", "sk-user", None), ("ip", "10.0.0.2", RateLimitPolicy(2, 30))]
+    allowed, remaining, _, _ = await limiter.increment_and_check_many(other_ip)
+    assert allowed
+    assert remaining == 1
+
+
+@pytest.mark.asyncio
+async def test_slowdown_dimension_reports_delay(limiter):
+    checks = [("route", "sk-user@/ai", RateLimitPolicy(max_requests=1, window_seconds=60, mode="slowdown"))]
+    assert (await limiter.increment_and_check_many(checks))[3] is None
+    allowed, remaining, retry, slowdown = await limiter.increment_and_check_many(checks)
+    assert allowed
+    assert remaining == 0
+    assert slowdown == pytest.approx(0.5)
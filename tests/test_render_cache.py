@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from telegram import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest
+
+from adsbot.render_cache import RenderCache, render_digest, render_menu
+
+KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("Stats", callback_data="menu:stats")]])
+OTHER_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("Home", callback_data="menu:home")]])
+
+
+def _message(text, markup, edit_second=None):
+    edit_date = datetime(2024, 1, 1, 12, 0, edit_second, tzinfo=timezone.utc) if edit_second is not None else None
+    # Round-trip like a message coming from Telegram
+    message = Message(
+        message_id=10,
+        date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        chat=Chat(id=5, type="private"),
+        text=text,
+        reply_markup=markup,
+        edit_date=edit_date,
+    )
+    return Message.de_json(message.to_dict(), bot=None)
+
+
+class FakeQuery:
+    """Callback query whose message reflects the last edit, like Telegram."""
+
+    def __init__(self, message):
+        self.message = message
+        self.calls = 0
+        self.clock = 0
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.calls += 1
+        if text == self.message.text and reply_markup == self.message.reply_markup:
+            raise BadRequest("Message is not modified: specified new message content is the same")
+        self.clock += 1
+        self.message = _message(text, reply_markup, edit_second=self.clock)
+        return self.message
+
+
+def _context(cache):
+    return SimpleNamespace(bot_data={"render_cache": cache} if cache is not None else {})
+
+
+def test_digest_covers_text_markup_and_options():
+    base = render_digest("hi", KEYBOARD)
+    assert base == render_digest("hi", InlineKeyboardMarkup([[InlineKeyboardButton("Stats", callback_data="menu:stats")]]))
+    assert base != render_digest("hi!", KEYBOARD)
+    assert base != render_digest("hi", OTHER_KEYBOARD)
+    assert base != render_digest("hi", KEYBOARD, parse_mode="Markdown")
+
+
+def test_repeated_render_is_skipped():
+    cache = RenderCache()
+    query = FakeQuery(_message("start", None))
+    context = _context(cache)
+
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is True
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is False
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is False
+    assert query.calls == 1
+    assert cache.stats() == {"entries": 1, "edited": 1, "skipped": 2, "not_modified": 0}
+
+    assert asyncio.run(render_menu(query, context, "other", reply_markup=KEYBOARD)) is True
+    assert query.calls == 2
+
+
+def test_edit_made_elsewhere_invalidates_the_entry():
+    cache = RenderCache()
+    query = FakeQuery(_message("start", None))
+    context = _context(cache)
+    asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD))
+
+    # Another handler edits the message without going through the cache
+    asyncio.run(query.edit_message_text("details", reply_markup=OTHER_KEYBOARD))
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is True
+    assert query.message.text == "menu"
+
+
+def test_not_modified_is_swallowed_and_remembered():
+    cache = RenderCache()
+    query = FakeQuery(_message("menu", KEYBOARD))
+    context = _context(cache)
+
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is False
+    assert cache.not_modified == 1
+    assert asyncio.run(render_menu(query, context, "menu", reply_markup=KEYBOARD)) is False
+    assert query.calls == 1 and cache.skipped == 1
+
+
+def test_other_errors_propagate():
+    class Broken(FakeQuery):
+        async def edit_message_text(self, text, reply_markup=None, **kwargs):
+            raise BadRequest("Message to edit not found")
+
+    with pytest.raises(BadRequest):
+        asyncio.run(render_menu(Broken(_message("a", None)), _context(RenderCache()), "menu"))
+
+
+def test_without_cache_always_edits():
+    query = FakeQuery(_message("start", None))
+    asyncio.run(render_menu(query, _context(None), "menu"))
+    assert query.calls == 1
+
+
+def test_cache_is_bounded():
+    cache = RenderCache(max_entries=2)
+    for message_id in range(3):
+        cache.store((1, message_id), "digest")
+    assert len(cache) == 2
+    assert not cache.is_current((1, 0), "digest")
+    assert cache.is_current((1, 2), "digest")
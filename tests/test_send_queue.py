@@ -0,0 +1,128 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import RetryAfter
+
+from adsbot.send_queue import SendQueue, bulk_send_kwargs
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _send(queue, log, chat_id, tag, priority=None, endpoint="sendMessage"):
+    async def callback(*args, **kwargs):
+        log.append((tag, time.perf_counter()))
+        return {"ok": tag}
+
+    args = {"priority": priority} if priority else None
+    return await queue.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, args)
+
+
+def test_interactive_calls_overtake_queued_bulk():
+    async def scenario():
+        queue = SendQueue(overall_rate=50, overall_burst=1, chat_burst=10)
+        log = []
+        bulk = [asyncio.create_task(_send(queue, log, 1000 + i, f"bulk{i}", "bulk")) for i in range(6)]
+        await asyncio.sleep(0.03)  # the bulk backlog is waiting for global tokens
+        await _send(queue, log, 1, "reply")
+        await asyncio.gather(*bulk)
+        await queue.shutdown()
+        return [tag for tag, _ in log], queue
+
+    order, queue = _run(scenario())
+    assert order.index("reply") < 4
+    assert queue.sent == 7
+    assert queue.sent_by_priority == {0: 1, 10: 6}
+
+
+def test_global_rate_is_respected():
+    async def scenario():
+        queue = SendQueue(overall_rate=100, overall_burst=5, chat_burst=10)
+        log = []
+        start = time.perf_counter()
+        await asyncio.gather(*(_send(queue, log, 1000 + i, i) for i in range(25)))
+        await queue.shutdown()
+        return time.perf_counter() - start
+
+    # 5 immediately, then 20 more at 100/s
+    assert _run(scenario()) >= 0.18
+
+
+def test_chat_pacing_only_slows_the_same_chat():
+    async def scenario():
+        queue = SendQueue(overall_rate=1000, overall_burst=100, chat_rate=20, chat_burst=1)
+        log = []
+        start = time.perf_counter()
+        await asyncio.gather(*(_send(queue, log, 7, f"same{i}") for i in range(4)))
+        same = time.perf_counter() - start
+        start = time.perf_counter()
+        await asyncio.gather(*(_send(queue, log, 100 + i, f"other{i}") for i in range(4)))
+        other = time.perf_counter() - start
+        await queue.shutdown()
+        return same, other
+
+    same, other = _run(scenario())
+    assert same >= 0.14  # 3 intervals of 50ms
+    assert other < 0.05
+
+
+def test_retry_after_pauses_and_retries():
+    attempts = []
+
+    async def flaky(*args, **kwargs):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise RetryAfter(0.1)
+        return True
+
+    async def scenario():
+        queue = SendQueue()
+        result = await queue.process_request(flaky, (), {}, "sendMessage", {"chat_id": 5}, None)
+        await queue.shutdown()
+        return result, queue
+
+    result, queue = _run(scenario())
+    assert result is True
+    assert queue.retried == 1
+    assert attempts[1] - attempts[0] >= 0.09
+
+
+def test_gives_up_after_max_retries():
+    async def always_flooded(*args, **kwargs):
+        raise RetryAfter(0.01)
+
+    async def scenario():
+        queue = SendQueue(max_retries=2)
+        try:
+            await queue.process_request(always_flooded, (), {}, "sendMessage", {"chat_id": 5}, None)
+        finally:
+            await queue.shutdown()
+
+    with pytest.raises(RetryAfter):
+        _run(scenario())
+
+
+def test_calls_without_chat_pass_through():
+    async def scenario():
+        queue = SendQueue(overall_rate=1, overall_burst=1)
+        log = []
+
+        async def callback(*args, **kwargs):
+            log.append(endpoint)
+            return True
+
+        for endpoint in ("answerCallbackQuery", "getMe", "setWebhook"):
+            await queue.process_request(callback, (), {}, endpoint, {"callback_query_id": "1"}, None)
+        return log, queue
+
+    log, queue = _run(scenario())
+    assert len(log) == 3 and queue.sent == 0
+
+
+def test_bulk_kwargs_only_with_rate_limiter():
+    assert bulk_send_kwargs(SimpleNamespace(rate_limiter=None)) == {}
+    assert bulk_send_kwargs(object()) == {}
+    assert bulk_send_kwargs(SimpleNamespace(rate_limiter=SendQueue())) == {"rate_limit_args": {"priority": "bulk"}}
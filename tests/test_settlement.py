@@ -0,0 +1,199 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, insert, select
+
+from adsbot import ledger
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.inside_ads_services import purchase_listing
+from adsbot.models import (
+    Channel,
+    ChannelListing,
+    DisputeStatus,
+    DisputeTicket,
+    LedgerAccount,
+    MarketplaceOrder,
+    MoneyTransaction,
+    OrderStatus,
+    Payment,
+    PaymentStatus,
+    SettlementRun,
+    User,
+    UserBalance,
+)
+from adsbot.services import ensure_user
+from adsbot.settlement import settle_escrow
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def _user(session, telegram_id):
+    return ensure_user(session, telegram_id=telegram_id, username=f"u{telegram_id}", first_name="U", language_code="it")
+
+
+def _seed_escrow(session_factory, orders, sellers=1, price=10.0):
+    """`orders` completed orders with their price held in escrow, spread over `sellers`."""
+    with session_scope(session_factory) as session:
+        buyer = _user(session, 1)
+        seller_ids = [_user(session, 100 + i).id for i in range(sellers)]
+        now = datetime.utcnow()
+        order_ids = session.scalars(
+            insert(MarketplaceOrder).returning(MarketplaceOrder.id),
+            [
+                dict(seller_id=seller_ids[i % sellers], buyer_id=buyer.id, channel_id=1, channel_listing_id=1,
+                     price=price, status=OrderStatus.completed, platform_fee=1.0, created_at=now)
+                for i in range(orders)
+            ],
+        ).all()
+        session.execute(insert(Payment), [
+            dict(order_id=order_id, amount=price, platform_fee=1.0, seller_amount=price - 1.0, payment_method="balance",
+                 status=PaymentStatus.escrow_held, created_at=now)
+            for order_id in order_ids
+        ])
+        total = ledger.to_minor(price * orders)
+        ledger.post(session, "deposit", [(ledger.system_account(session, ledger.EXTERNAL), -total),
+                                         (ledger.system_account(session, ledger.ESCROW), total)])
+        return seller_ids
+
+
+def _balance(session, code):
+    return session.scalar(select(LedgerAccount.balance_minor).where(LedgerAccount.code == code))
+
+
+def _assert_ledger_consistent(session):
+    for account in session.scalars(select(LedgerAccount)):
+        assert account.balance_minor == ledger.replay_balance(session, account.id)
+
+
+def test_only_matured_undisputed_orders_are_settled(session_factory):
+    with session_scope(session_factory) as session:
+        editor = _user(session, 1)
+        buyer = _user(session, 2)
+        channel = Channel(user_id=editor.id, handle="news", title="News")
+        session.add(channel)
+        session.flush()
+        listing = ChannelListing(channel_id=channel.id, user_id=editor.id, price=10.0)
+        session.add_all([listing, UserBalance(user_id=buyer.id, balance=100.0)])
+        session.flush()
+        editor_id, buyer_id, listing_id = editor.id, buyer.id, listing.id
+
+    order_ids = []
+    for _ in range(4):
+        with session_scope(session_factory) as session:
+            order_ids.append(purchase_listing(session, session.get(User, buyer_id), listing_id, "Promo")["order_id"])
+
+    now = datetime.utcnow()
+    with session_scope(session_factory) as session:
+        completed, expired, running, disputed = (session.get(MarketplaceOrder, i) for i in order_ids)
+        completed.status = OrderStatus.completed
+        expired.status = running.status = OrderStatus.published
+        expired.expires_at = now - timedelta(hours=1)
+        running.expires_at = now + timedelta(hours=1)
+        disputed.status = OrderStatus.completed
+        session.add(DisputeTicket(order_id=disputed.id, initiator_id=buyer_id, initiator_role="advertiser",
+                                  description="Post rimosso", status=DisputeStatus.open))
+
+    summary = settle_escrow(session_factory, now=now)
+    assert summary["status"] == "completed" and summary["payments"] == 2
+    assert summary["amount"] == 20.0 and summary["fees"] == 2.0
+
+    with session_scope(session_factory) as session:
+        statuses = [session.scalar(select(Payment.status).where(Payment.order_id == i)) for i in order_ids]
+        assert statuses == [PaymentStatus.completed, PaymentStatus.completed,
+                            PaymentStatus.escrow_held, PaymentStatus.escrow_held]
+        expired = session.get(MarketplaceOrder, order_ids[1])
+        assert expired.status == OrderStatus.completed and expired.seller_earned == 9.0 and expired.completed_at
+        assert _balance(session, f"user:{editor_id}") == 1800
+        assert _balance(session, ledger.PLATFORM) == 200
+        assert _balance(session, ledger.ESCROW) == 2000
+        assert session.scalar(select(UserBalance.balance).where(UserBalance.user_id == editor_id)) == 18.0
+        earnings = session.execute(
+            select(MoneyTransaction.order_id, MoneyTransaction.amount, MoneyTransaction.balance_after)
+            .where(MoneyTransaction.user_id == editor_id)
+            .order_by(MoneyTransaction.id)
+        ).all()
+        assert earnings == [(order_ids[0], 9.0, 9.0), (order_ids[1], 9.0, 18.0)]
+        _assert_ledger_consistent(session)
+
+    assert settle_escrow(session_factory)["payments"] == 0
+
+
+def test_thousands_of_orders_settle_with_a_constant_number_of_statements(session_factory, monkeypatch):
+    monkeypatch.setattr(ledger, "CHECKPOINT_INTERVAL", 2)
+    seller_ids = _seed_escrow(session_factory, orders=3000, sellers=50)
+    statements = []
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    started = time.perf_counter()
+    summary = settle_escrow(session_factory, batch_size=500)
+    elapsed = time.perf_counter() - started
+
+    assert summary["payments"] == 3000 and summary["batches"] == 6
+    assert elapsed < 10
+    # A batch costs the same statements whether it settles 1 order or 500
+    assert len(statements) < 30 * summary["batches"]
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(func.count(Payment.id)).where(Payment.status == PaymentStatus.completed)) == 3000
+        assert session.scalar(select(func.count(MoneyTransaction.id))) == 3000
+        assert _balance(session, ledger.ESCROW) == 0
+        assert _balance(session, ledger.PLATFORM) == 3000 * 100
+        assert {_balance(session, f"user:{seller_id}") for seller_id in seller_ids} == {60 * 900}
+        # One entry per account and batch: checkpoints every 2 entries
+        wallet = session.scalar(select(LedgerAccount).where(LedgerAccount.code == f"user:{seller_ids[0]}"))
+        assert ledger.balance_at(session, wallet.id, datetime.utcnow()) == 60 * 900
+        _assert_ledger_consistent(session)
+
+
+def test_interrupted_run_resumes_from_its_checkpoint(session_factory):
+    _seed_escrow(session_factory, orders=10)
+
+    first = settle_escrow(session_factory, batch_size=4, max_batches=1)
+    assert first["status"] == "running" and first["payments"] == 4
+
+    with session_scope(session_factory) as session:
+        run = session.get(SettlementRun, first["run_id"])
+        checkpoint = run.last_payment_id
+        assert checkpoint == session.scalars(select(Payment.id).order_by(Payment.id)).all()[3]
+
+    second = settle_escrow(session_factory, batch_size=4)
+    assert second["run_id"] == first["run_id"]
+    assert second["status"] == "completed" and second["payments"] == 6
+    with session_scope(session_factory) as session:
+        run = session.get(SettlementRun, first["run_id"])
+        assert (run.batches, run.payments_settled, run.amount_minor, run.fees_minor) == (3, 10, 10000, 1000)
+        assert run.finished_at is not None
+        _assert_ledger_consistent(session)
+
+
+def test_bot_starts_the_settlement_job_with_its_session_factory(tmp_path):
+    import asyncio
+
+    from adsbot import scheduler
+    from adsbot.bot import build_application
+
+    config = Config(bot_token="123456:TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}")
+    application = build_application(config)
+    session_factory = application.bot_data["session_factory"]
+    _seed_escrow(session_factory, orders=3)
+
+    async def scenario():
+        await application.post_init(application)
+        try:
+            jobs = [job.id for job in scheduler.scheduler.get_jobs()]
+            await asyncio.to_thread(scheduler.scheduler.get_job("escrow_settlement").func)
+        finally:
+            await application.post_stop(application)
+        return jobs
+
+    assert asyncio.run(scenario()) == ["escrow_settlement"]
+    assert scheduler.scheduler is None
+
+    with session_scope(session_factory) as session:
+        assert session.scalar(select(func.count(Payment.id)).where(Payment.status == PaymentStatus.completed)) == 3
+        assert _balance(session, ledger.ESCROW) == 0
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from adsbot.slowdown_queue import LeakyBucketQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_are_released_at_allowed_rate():
+    clock = FakeClock()
+    queue = LeakyBucketQueue(rate=2, max_depth=3, clock=clock)
+
+    assert queue.reserve("k") == (True, 0.0)
+    assert queue.reserve("k") == (True, 0.5)
+    assert queue.reserve("k") == (True, 1.0)
+    # per-key depth reached: rejected without waiting
+    queued, retry_after = queue.reserve("k")
+    assert not queued
+    assert retry_after == pytest.approx(1.5)
+    assert queue.rejected == 1
+
+    # other keys have their own bucket
+    assert queue.reserve("other") == (True, 0.0)
+
+    queue.release("k")
+    clock.now += 0.5
+    assert queue.reserve("k") == (True, 1.0)
+
+
+def test_total_cap_and_cleanup():
+    clock = FakeClock()
+    queue = LeakyBucketQueue(rate=1, max_depth=10, max_total=2, clock=clock)
+    assert queue.reserve("a")[0]
+    assert queue.reserve("b")[0]
+    assert not queue.reserve("c")[0]
+
+    queue.release("a")
+    queue.release("b")
+    clock.now += 5
+    queue.release("missing")
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_queues_then_rejects_when_full(monkeypatch):
+    pytest.importorskip("starlette")
+    from adsbot import api_keys
+    from adsbot.memory_rate_limiter import InMemoryRateLimiter
+    from adsbot.middleware_fastapi import RateLimitMiddleware
+
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-user-slow"})
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    limiter = InMemoryRateLimiter(window_seconds=60, max_requests=1, mode="slowdown")
+    mw = RateLimitMiddleware(app, limiter=limiter, slowdown_queue=LeakyBucketQueue(rate=20, max_depth=2))
+
+    async def request():
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "path": "/", "headers": [(b"x-api-key", b"sk-user-slow")], "query_string": b""}
+        await mw(scope, None, send)
+        return messages[0]["status"], dict(messages[0]["headers"])
+
+    assert (await request())[0] == 200  # under the limit
+    results = await asyncio.gather(*(request() for _ in range(4)))
+    statuses = sorted(status for status, _ in results)
+    # the first is released at once, two wait in the queue, the last is rejected
+    assert statuses == [200, 200, 200, 429]
+    slowed = [h for status, h in results if status == 200]
+    assert any(b"x-rate-limit-slowdown" in h for h in slowed)
+
+
+def test_wait_is_capped_at_max_wait():
+    clock = FakeClock()
+    # Limiter defaults: 5 requests per 60s -> one release every 12s
+    queue = LeakyBucketQueue(rate=5 / 60, max_depth=5, clock=clock)
+    assert queue.max_wait == 10.0
+
+    assert queue.reserve("k") == (True, 0.0)
+    queued, retry_after = queue.reserve("k")
+    assert not queued and retry_after == pytest.approx(2.0)
+    assert LeakyBucketQueue.retry_after_header(retry_after) == 2
+
+    clock.now += 2
+    queued, delay = queue.reserve("k")
+    assert queued and delay == pytest.approx(10.0)
+
+
+def test_rate_can_be_set_per_request():
+    clock = FakeClock()
+    queue = LeakyBucketQueue(rate=1 / 60, max_depth=5, clock=clock)
+
+    assert queue.reserve(("k", "/fast"), rate=2) == (True, 0.0)
+    assert queue.reserve(("k", "/fast"), rate=2) == (True, pytest.approx(0.5))
+    # Another route of the same key has its own queue
+    assert queue.reserve(("k", "/reports")) == (True, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_middleware_paces_slowed_requests_at_the_route_rate(monkeypatch):
+    pytest.importorskip("starlette")
+    from adsbot import api_keys
+    from adsbot.memory_rate_limiter import InMemoryRateLimiter
+    from adsbot.middleware_fastapi import RateLimitMiddleware, RoutePolicy
+
+    monkeypatch.setattr(api_keys, "USER_KEYS", {"sk-user-slow"})
+    waits = []
+
+    class RecordingQueue(LeakyBucketQueue):
+        async def wait(self, key, rate=None):
+            waits.append((key, rate))
+            return True, 0.01
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    mw = RateLimitMiddleware(
+        app,
+        limiter=InMemoryRateLimiter(window_seconds=60, max_requests=100),
+        routes=[RoutePolicy("/reports", max_requests=1, window_seconds=2, mode="slowdown")],
+        slowdown_queue=RecordingQueue(rate=100 / 60),
+    )
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "path": "/reports/daily", "headers": [(b"x-api-key", b"sk-user-slow")], "query_string": b""}
+    for _ in range(2):
+        await mw(scope, None, send)
+    assert waits == [(("sk-user-slow", "/reports"), 0.5)]
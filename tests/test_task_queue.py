@@ -0,0 +1,211 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from adsbot.task_queue import SQLiteTaskStore, TaskQueue, enqueue_task
+
+
+def _context():
+    return SimpleNamespace(bot=None, bot_data={})
+
+
+def test_jobs_run_in_background_and_failures_are_retried():
+    calls = []
+
+    async def flaky(context, order_id, fail_times):
+        calls.append(order_id)
+        if calls.count(order_id) <= fail_times:
+            raise ConnectionError("network down")
+
+    queue = TaskQueue(workers=2, max_attempts=3, retry_delay=0.01, tasks={"flaky": flaky})
+
+    async def scenario():
+        await queue.start(_context())
+        queue.enqueue("flaky", order_id=1, fail_times=0)
+        queue.enqueue("flaky", order_id=2, fail_times=2)  # succeeds on the last attempt
+        queue.enqueue("flaky", order_id=3, fail_times=5)  # gives up
+        assert queue.depth() == 3
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert (calls.count(1), calls.count(2), calls.count(3)) == (1, 3, 3)
+    stats = queue.stats()
+    assert (stats["enqueued"], stats["completed"], stats["failed"], stats["retried"]) == (3, 2, 1, 4)
+    assert stats["depth"] == 0 and stats["running"] == 0
+
+
+def test_enqueue_does_not_wait_for_the_job():
+    async def slow(context, done):
+        await context.gate.wait()
+        done.append(True)
+
+    queue = TaskQueue(tasks={"slow": slow})
+
+    async def scenario():
+        context = SimpleNamespace(bot=None, bot_data={}, gate=asyncio.Event())
+        context.bot_data["task_queue"] = queue
+        await queue.start(context)
+        done = []
+        await asyncio.wait_for(enqueue_task(context, "slow", done=done), 0.1)
+        assert done == []
+        context.gate.set()
+        await queue.stop()
+        return done
+
+    assert asyncio.run(scenario()) == [True]
+
+
+def test_enqueue_from_other_threads_and_before_start():
+    seen = []
+
+    async def record(context, n):
+        seen.append(n)
+
+    queue = TaskQueue(tasks={"record": record})
+    queue.enqueue("record", n=0)  # buffered until start
+
+    async def scenario():
+        await queue.start(_context())
+        threads = [threading.Thread(target=queue.enqueue, args=("record",), kwargs={"n": n}) for n in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(0)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert sorted(seen) == list(range(9))
+    with pytest.raises(KeyError):
+        queue.enqueue("missing")
+
+
+def test_durable_jobs_survive_a_restart(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    seen = []
+
+    async def broken(context, n):
+        raise RuntimeError("not yet")
+
+    async def working(context, n):
+        seen.append(n)
+
+    async def first_run():
+        queue = TaskQueue(max_attempts=5, retry_delay=60, store=SQLiteTaskStore(path), tasks={"job": broken})
+        await queue.start(_context())
+        queue.enqueue("job", n=1)
+        queue.enqueue("job", n=2)
+        await asyncio.sleep(0.05)
+        await queue.stop(timeout=0.05)  # both jobs are waiting for a retry
+
+    asyncio.run(first_run())
+    store = SQLiteTaskStore(path)
+    assert store.count("pending") == 2
+
+    async def second_run():
+        queue = TaskQueue(store=store, tasks={"job": working})
+        await queue.start(_context())
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(second_run())
+    assert seen == [1, 2]
+    assert store.count("pending") == 0
+
+    async def give_up():
+        queue = TaskQueue(max_attempts=1, store=store, tasks={"job": broken})
+        await queue.start(_context())
+        queue.enqueue("job", n=3)
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(give_up())
+    assert store.count("failed") == 1
+
+
+def test_store_writes_stay_off_the_event_loop(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path / "tasks.db"))
+    store_threads = set()
+    for method in ("insert", "attempted", "done", "failed", "pending"):
+        def wrapped(*args, _original=getattr(store, method)):
+            store_threads.add(threading.get_ident())
+            return _original(*args)
+
+        setattr(store, method, wrapped)
+    seen = []
+
+    async def job(context, n):
+        seen.append(n)
+
+    async def scenario():
+        queue = TaskQueue(store=store, tasks={"job": job})
+        await queue.start(_context())
+        queue.enqueue("job", n=1)
+        assert queue.depth() == 1
+        with pytest.raises(TypeError):
+            queue.enqueue("job", n=object())  # still rejected by the caller
+        await queue.join()
+        await queue.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert seen == [1]
+    assert store_threads and loop_thread not in store_threads
+    assert store.count("pending") == 0
+
+
+def test_without_a_queue_the_task_runs_inline():
+    from adsbot.task_queue import TASKS
+
+    seen = []
+
+    async def inline(context, n):
+        seen.append(n)
+
+    TASKS["test_inline"] = inline
+    try:
+        asyncio.run(enqueue_task(_context(), "test_inline", n=7))
+    finally:
+        del TASKS["test_inline"]
+    assert seen == [7]
+
+
+def test_application_registers_queue_and_bot_tasks(tmp_path):
+    from adsbot.bot import build_application
+    from adsbot.config import Config
+    from adsbot.db import session_scope
+    from adsbot.models import AdminAuditLog
+    from adsbot.services import ensure_user
+
+    config = Config(bot_token="123456:TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}")
+    application = build_application(config)
+    queue = application.bot_data["task_queue"]
+    assert {"notify_new_order", "audit_log"} <= set(queue.tasks)
+    assert application.post_init is not None and application.post_stop is not None
+
+    factory = application.bot_data["session_factory"]
+    with session_scope(factory) as session:
+        user_id = ensure_user(session, telegram_id=5, username="a", first_name="A", language_code="it").id
+
+    async def scenario():
+        await queue.start(application)
+        queue.enqueue(
+            "audit_log",
+            user_id=user_id,
+            action="CHANNEL_ADMIN_VERIFICATION",
+            details="{}",
+            status="SUCCESS",
+            created_at="2026-01-02T03:04:05",
+        )
+        await queue.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        application.bot_data["db_executor"].shutdown()
+    with session_scope(factory) as session:
+        audit = session.query(AdminAuditLog).one()
+        assert (audit.action, audit.created_at.year) == ("CHANNEL_ADMIN_VERIFICATION", 2026)
@@ -0,0 +1,110 @@
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from adsbot.config import Config
+from adsbot.db import create_session_factory, session_scope
+from adsbot.inside_ads_services import add_transaction, get_transactions_page
+from adsbot.models import Transaction
+from adsbot.services import ensure_user
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    return create_session_factory(Config(bot_token="TEST", database_url=f"sqlite:///{tmp_path / 'db.sqlite'}"))
+
+
+def _user(session, telegram_id=1):
+    return ensure_user(session, telegram_id=telegram_id, username=f"u{telegram_id}", first_name="U", language_code="it")
+
+
+def test_keyset_pages_cover_the_history_once_in_order(session_factory):
+    start = datetime(2026, 1, 1)
+    with session_scope(session_factory) as session:
+        user = _user(session)
+        other = _user(session, telegram_id=2)
+        for i in range(25):
+            # Pairs of rows share a timestamp: the id breaks the tie
+            session.add(Transaction(user_id=user.id, transaction_type="earn", amount=1.0, description=f"t{i}",
+                                    created_at=start + timedelta(minutes=i // 2)))
+            session.add(Transaction(user_id=other.id, transaction_type="earn", amount=1.0, description="x",
+                                    created_at=start))
+
+    with session_scope(session_factory) as session:
+        user = _user(session)
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            rows, cursor = get_transactions_page(session, user, before_id=cursor, limit=10)
+            pages += 1
+            seen.extend(rows)
+            if cursor is None:
+                break
+        assert pages == 3
+        assert [tx.description for tx in seen] == [f"t{i}" for i in reversed(range(25))]
+        keys = [(tx.created_at, tx.id) for tx in seen]
+        assert keys == sorted(keys, reverse=True)
+
+
+def test_rows_carry_the_running_balance(session_factory):
+    with session_scope(session_factory) as session:
+        user = _user(session)
+        add_transaction(session, user, "earn", 50.0, "Guadagno")
+        add_transaction(session, user, "spend", 20.0, "Spesa")
+        add_transaction(session, user, "earn", 5.5, "Guadagno")
+        rows, cursor = get_transactions_page(session, user, limit=2)
+        assert [tx.balance_after for tx in rows] == [35.5, 30.0]
+        rows, cursor = get_transactions_page(session, user, before_id=cursor, limit=2)
+        assert [tx.balance_after for tx in rows] == [50.0] and cursor is None
+
+
+def test_statement_query_uses_the_keyset_index(session_factory):
+    with session_scope(session_factory) as session:
+        user = _user(session)
+        add_transaction(session, user, "earn", 1.0, "a")
+        plan = session.connection().exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM transactions WHERE user_id = ? AND (created_at, id) < (?, ?) "
+            "ORDER BY created_at DESC, id DESC LIMIT 11",
+            (user.id, "2030-01-01 00:00:00", 1),
+        ).fetchall()
+    detail = " ".join(str(row[-1]) for row in plan)
+    assert "ix_transactions_user_id_created_at_id" in detail
+    assert "TEMP B-TREE" not in detail
+
+
+def test_migration_adds_column_index_and_backfills(tmp_path):
+    db = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db)
+    conn.executescript(
+        """
+        CREATE TABLE user_balances (id INTEGER PRIMARY KEY, user_id INTEGER, balance FLOAT);
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, user_id INTEGER, transaction_type VARCHAR(50), amount FLOAT,
+            description TEXT, reference_id INTEGER, created_at DATETIME
+        );
+        INSERT INTO user_balances (user_id, balance) VALUES (1, 25.0);
+        INSERT INTO transactions (user_id, transaction_type, amount, description, created_at) VALUES
+            (1, 'earn', 40.0, 'a', '2026-01-01 10:00:00'),
+            (1, 'spend', 20.0, 'b', '2026-01-02 10:00:00'),
+            (1, 'earn', 5.0, 'c', '2026-01-03 10:00:00');
+        """
+    )
+    conn.close()
+
+    for _ in range(2):  # idempotent
+        subprocess.run([sys.executable, "migrate_add_transaction_balance.py", str(db)], cwd=ROOT, check=True,
+                       capture_output=True)
+
+    conn = sqlite3.connect(db)
+    balances = [row[0] for row in conn.execute("SELECT balance_after FROM transactions ORDER BY id")]
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(transactions)")}
+    conn.close()
+    assert balances == [40.0, 20.0, 25.0]
+    assert "ix_transactions_user_id_created_at_id" in indexes
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+from adsbot.update_processor import PerChatUpdateProcessor
+
+
+def message_update(update_id, chat_id):
+    chat = Chat(id=chat_id, type="private")
+    user = User(id=chat_id, first_name="u", is_bot=False)
+    return Update(update_id=update_id, message=Message(message_id=update_id, date=None, chat=chat, from_user=user))
+
+
+class Recorder:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.order = []
+
+    async def handle(self, update, delay):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(delay)
+        self.order.append((update.effective_chat.id, update.update_id))
+        self.running -= 1
+
+
+async def feed(processor, recorder, updates):
+    # Same pattern as Application: one task per update, in arrival order
+    tasks = [
+        asyncio.create_task(processor.process_update(u, recorder.handle(u, delay)))
+        for u, delay in updates
+    ]
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_chats_run_concurrently_but_each_chat_in_order():
+    processor = PerChatUpdateProcessor(4)
+    recorder = Recorder()
+    updates = [
+        (message_update(1, chat_id=10), 0.05),
+        (message_update(2, chat_id=10), 0.0),
+        (message_update(3, chat_id=20), 0.0),
+        (message_update(4, chat_id=10), 0.0),
+    ]
+    async with processor:
+        await feed(processor, recorder, updates)
+
+    assert [uid for chat, uid in recorder.order if chat == 10] == [1, 2, 4]
+    # chat 20 did not wait behind chat 10's slow update
+    assert recorder.order[0] == (20, 3)
+    assert processor.processed == 4
+    assert processor.pending() == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_applies_across_chats():
+    processor = PerChatUpdateProcessor(2)
+    recorder = Recorder()
+    await feed(processor, recorder, [(message_update(i, chat_id=i), 0.01) for i in range(10)])
+    assert recorder.max_running == 2
+    assert processor.concurrency == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_queue_cap_drops_excess_updates():
+    processor = PerChatUpdateProcessor(4, max_chat_queue=2)
+    recorder = Recorder()
+    await feed(processor, recorder, [(message_update(i, chat_id=10), 0.01) for i in range(5)])
+    assert [uid for _, uid in recorder.order] == [0, 1]
+    assert processor.dropped == 3
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("starlette")
+httpx = pytest.importorskip("httpx")
+
+from telegram.ext import Application, MessageHandler, filters
+
+from adsbot.webhook import create_webhook_app
+from scripts.fake_bot_api import FakeBotAPI, make_message_update
+
+
+@pytest.fixture
+def api():
+    server = FakeBotAPI().start()
+    yield server
+    server.stop()
+
+
+def build(api, queue_size):
+    async def echo(update, context):
+        await update.message.reply_text(f"echo {update.update_id}")
+
+    application = (
+        Application.builder()
+        .token("123456:TEST")
+        .base_url(api.base_url)
+        .update_queue(asyncio.Queue(maxsize=queue_size))
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+    return application
+
+
+def client_for(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bot")
+
+
+@pytest.mark.asyncio
+async def test_webhook_updates_reach_handlers(api):
+    application = build(api, queue_size=10)
+    app = create_webhook_app(application, secret_token="s3cret")
+    async with application:
+        await application.start()
+        async with client_for(app) as client:
+            forbidden = await client.post("/telegram", json=make_message_update(1, 42))
+            assert forbidden.status_code == 403
+            headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+            for update_id in (1, 2):
+                response = await client.post("/telegram", json=make_message_update(update_id, 42), headers=headers)
+                assert response.status_code == 200
+            assert (await client.post("/telegram", content=b"not json", headers=headers)).status_code == 400
+
+            for _ in range(200):
+                if api.calls["sendMessage"] == 2:
+                    break
+                await asyncio.sleep(0.01)
+        await application.stop()
+
+    assert sorted(params["text"] for _, params in api.calls_to("sendMessage")) == ["echo 1", "echo 2"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_answers_503(api):
+    # Application not started: nothing consumes the queue
+    application = build(api, queue_size=1)
+    app = create_webhook_app(application, queue_timeout=0.05)
+    async with client_for(app) as client:
+        assert (await client.post("/telegram", json=make_message_update(1, 42))).status_code == 200
+        full = await client.post("/telegram", json=make_message_update(2, 42))
+        assert full.status_code == 503
+        assert full.headers["retry-after"] == "1"
+        health = (await client.get("/healthz")).json()
+    assert health == {"queue_size": 1, "queue_max": 1, "accepted": 1, "rejected": 1}